@@ -9,11 +9,27 @@ docker_run_vcf="$2"
 docker_ref_bed="$3"
 docker_out_dir="$4"
 
+# Limites ressources — aucune par défaut : Docker n'est limité que si
+# TRUVARI_CPUS / TRUVARI_MEMORY sont définies. run_pipeline les fixe toujours
+# (part du budget HAPPY_CPUS / HAPPY_MEMORY, tout le budget si Truvari est seul).
+docker_limits=()
+if [ -n "${TRUVARI_CPUS:-}" ]; then
+    docker_limits+=(--cpus="$TRUVARI_CPUS")
+fi
+if [ -n "${TRUVARI_MEMORY:-}" ]; then
+    docker_limits+=(--memory="$TRUVARI_MEMORY")
+fi
+# Override via TRUVARI_IMAGE si une autre image est nécessaire.
+TRUVARI_IMAGE="${TRUVARI_IMAGE:-quay.io/biocontainers/truvari:4.0.0--pyhdfd78af_0}"
+# Journal distinct par shard quand plusieurs bench tournent en parallèle.
+TRUVARI_LOG="${TRUVARI_LOG:-./truvari.log}"
+
 docker run \
     --rm \
+    "${docker_limits[@]}" \
     --user "$(id -u):$(id -g)" \
     -v "$(pwd):/wgs" \
-    quay.io/biocontainers/truvari:4.0.0--pyhdfd78af_0 \
+    "$TRUVARI_IMAGE" \
     truvari bench \
     -b "${docker_ref_vcf}" \
     -c "${docker_run_vcf}" \
@@ -29,4 +45,4 @@ docker run \
     --sizemax=50000 \
     --pick=ac \
     --chunksize=5000 \
-    > ./truvari.log 2>&1
+    > "$TRUVARI_LOG" 2>&1
@@ -56,7 +56,8 @@ async def get_download_logs(
 @router.post("/download/cleanup")
 async def cleanup_old_logs():
     """
-    Manually trigger cleanup of old logs.
+    Manually trigger cleanup of old logs. Finished samples are also dropped
+    automatically once LOG_RETENTION_HOURS old.
     
     Returns:
         Success message
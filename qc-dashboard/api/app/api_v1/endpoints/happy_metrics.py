@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from api.app import crud, schemas
@@ -28,10 +30,32 @@ def store_happy_metrics(
         raise HTTPException(status_code=400, detail=str(e))
     return metric
 
-# File read GET for happy metrics
+@router.get("/runs/{run_name}/happy_metrics/stratified", response_model=list[schemas.HappyStratifiedMetricResponse])
+def get_happy_stratified_metrics(
+    run_name: str,
+    type: Optional[str] = Query(default=None, description="SNP or INDEL"),
+    filter: Optional[str] = Query(default=None, description="ALL or PASS"),
+    subset: Optional[str] = Query(default=None, description="Stratification region, '*' for the whole genome"),
+    source: Optional[str] = Query(default=None, pattern="^(summary|extended)$"),
+    db: Session = Depends(get_db),
+):
+    """Get the stored hap.py summary/extended rows of a run."""
+    lab_run = crud.get_lab_run_by_name(db, run_name)
+    if not lab_run:
+        raise HTTPException(status_code=404, detail=f"Run {run_name} not found")
+    return crud.get_happy_stratified_metrics(db, lab_run.id, type=type, filter=filter, subset=subset, source=source)
+
+# GET for happy metrics, from the DB when ingested, otherwise read from the file
 @router.get("/runs/{run_name}/happy_metrics", response_model=schemas.HappyMetricBase)
-def get_happy_metrics(run_name: str):
+def get_happy_metrics(run_name: str, db: Session = Depends(get_db)):
     """Get happy metrics for a specific run."""
+    lab_run = crud.get_lab_run_by_name(db, run_name)
+    if lab_run:
+        # First summary.csv row, as when the file is read
+        rows = crud.get_happy_stratified_metrics(db, lab_run.id, source="summary")
+        if rows:
+            values = {field: getattr(rows[0], field) for field in schemas.HappyMetricBase.model_fields}
+            return schemas.HappyMetricBase(**{field: 0 if value is None else value for field, value in values.items()})
     try:
         metric = get_metric(run_name, "summary.csv")
         return schemas.HappyMetricBase(**map_summary_metric(metric))
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from api.app import job_service, models, schemas
+from api.app import job_feed, job_service, models, schemas
 from api.app.database import get_db
 from api.app.security import Role, require_role
 
@@ -46,6 +47,25 @@ def get_jobs_summary(db: Session = Depends(get_db)):
     return job_service.get_job_summary(db)
 
 
+@router.get("/jobs/feed")
+async def stream_job_feed(
+    request: Request,
+    since: int | None = Query(default=None, ge=0),
+    last_event_id: int | None = Header(default=None),
+):
+    """
+    Server-sent events of job changes: one "job" event per transfer event,
+    with the job as it is now, and a "summary" event after each batch. Resume
+    after an event id with ?since= or the Last-Event-ID header.
+    """
+    cursor = since if since is not None else last_event_id
+    return StreamingResponse(
+        job_feed.feed.stream(cursor, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/jobs/{job_id}", response_model=schemas.TransferJobResponse)
 def get_job(job_id: str, db: Session = Depends(get_db)):
     job = job_service.get_job(db, job_id)
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from api.app import crud, schemas
@@ -30,6 +32,32 @@ def create_qc_metric(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
+@router.get("/qc_metrics", response_model=list[schemas.QCMetricResponse])
+def list_qc_metrics(
+    response: Response,
+    file_type: Optional[str] = Query(default=None, description="Reformatted CSV type, e.g. mapping_metrics"),
+    metric_name: Optional[str] = Query(default=None, description="DRAGEN parameter"),
+    section: Optional[str] = Query(default=None, description="DRAGEN section, e.g. VARIANT CALLER POSTFILTER"),
+    limit: int = Query(default=1000, ge=1, le=10000, description="Page size"),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor of the previous page"),
+    db: Session = Depends(get_db),
+):
+    """
+    QC metrics across all runs, filtered in SQL; file_type or metric_name is
+    required. Keyset-paginated: the cursor of the next page is returned in
+    the X-Next-Cursor header.
+    """
+    if file_type is None and metric_name is None:
+        raise HTTPException(status_code=400, detail="Filter on file_type or metric_name")
+    try:
+        metrics, next_cursor = crud.query_qc_metrics(
+            db, file_type=file_type, metric_name=metric_name, section=section, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return metrics
+
 @router.get("/qc_metrics/{run_id}/{metric_name}", response_model=schemas.QCMetricResponse)
 def get_qc_metric(run_id: int, metric_name: str, db: Session = Depends(get_db)):
     db_run = crud.get_lab_run(db, run_id)
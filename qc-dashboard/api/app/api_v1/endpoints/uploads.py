@@ -1,7 +1,13 @@
 import asyncio
+import concurrent.futures
+import importlib.util
+import logging
 import os
+import re
 import subprocess
-from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPException, Depends
+import tarfile
+import time
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Request
 from fastapi.responses import HTMLResponse
 from pathlib import Path
 from typing import Optional
@@ -11,17 +17,41 @@ from sqlalchemy.orm import Session
 from api.app import crud, job_service, models, schemas, settings
 from api.app import websocket as ws_manager
 from api.app.database import SessionLocal, get_db
+from api.app.multipart_upload import form_bool, multipart_body, receive_upload, stream_to_thread
 from api.app.security import Role, require_role
-from api.tasks.upload_run import upload_run, unique_upload_path, sanitize_upload_filename
-from api.tasks.process_run import run_pipeline
+from api.tasks import digests, run_catalog, s3_download
+from api.tasks.chunked_upload import ChunkedUpload, UploadChecksumError, upload_of
+from api.tasks.upload_run import (
+    DIGEST_SUFFIXES,
+    GrowingFile,
+    archive_stem,
+    extract_tar_stream,
+    is_tar_bundle,
+    sanitize_upload_filename,
+    unique_upload_path,
+)
 from api.tasks.setup_reference import ensure_references
 from api.tasks.utils import split_run_name
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 LAB_RUNS_DIR = settings.LAB_RUNS_DIR
 UPLOAD_DIR = settings.UPLOAD_DIR
 AWS_DOWNLOAD_SCRIPT = settings.AWS_DOWNLOAD_SCRIPT
+# Line printed by aws_download_gvcf.sh once a file is fully downloaded
+DOWNLOADED_FILE = re.compile(r"✅ (\S+) téléchargé avec succès")
+# Script output is stored as job events in batches: every LOG_EVENT_BATCH_LINES
+# lines or LOG_EVENT_FLUSH_SECONDS, whichever comes first.
+LOG_EVENT_BATCH_LINES = 100
+LOG_EVENT_FLUSH_SECONDS = 1
+EVENT_LEVELS = {
+    ws_manager.LogLevel.INFO: models.TransferEventLevel.INFO,
+    ws_manager.LogLevel.SUCCESS: models.TransferEventLevel.SUCCESS,
+    ws_manager.LogLevel.WARNING: models.TransferEventLevel.WARNING,
+    ws_manager.LogLevel.ERROR: models.TransferEventLevel.ERROR,
+    ws_manager.LogLevel.PROGRESS: models.TransferEventLevel.PROGRESS,
+}
 
 
 class AWSUploadRequest(BaseModel):
@@ -29,57 +59,27 @@ class AWSUploadRequest(BaseModel):
     benchmarking: Optional[str] = ""
     auto_process: bool = True
 
-# FILES -------------------------------------------------------------------------------------------
 
-def process_run_background(
-    zip_path: Path,
-    sample: str,
-    lab_run_id: int,
-    benchmarking_options: str = "",
-    job_id: str | None = None,
-):
-    """Background task to process the uploaded run"""
-    db = SessionLocal()
-    try:
-        if job_id:
-            job_service.mark_phase(db, job_id, models.TransferJobPhase.EXTRACT, "Extracting uploaded archive")
-        crud.update_lab_run_status(db, lab_run_id, models.RunStatus.PROCESSING)
-        # Extract the run using existing upload_run function
-        parsed_sample, run = upload_run(zip_path)
-        run_name = f"{parsed_sample}_{run}"
-        crud.update_lab_run_name(db, lab_run_id, run_name)
-
-        # Parse benchmarking options
-        happy = "happy" in benchmarking_options
-        stratified = "stratified" in benchmarking_options
-        truvari = "truvari" in benchmarking_options
-        csv_reformat = "csv" in benchmarking_options
-
-        # Run the pipeline
-        if job_id:
-            job_service.mark_phase(db, job_id, models.TransferJobPhase.PROCESS, "Starting benchmarking pipeline")
-        run_pipeline(
-            parsed_sample,
-            run,
-            happy=happy,
-            stratified=stratified,
-            truvari=truvari,
-            csv_reformat=csv_reformat
-        )
-        crud.update_lab_run_status(db, lab_run_id, models.RunStatus.AWAITING_APPROVAL)
-        if job_id:
-            job_service.complete_job(db, job_id, "Upload processing completed")
+class AWSBatchUploadRequest(BaseModel):
+    sample_ids: list[str]
+    benchmarking: Optional[str] = ""
+    auto_process: bool = True
 
-    except Exception as e:
-        db.rollback()
-        crud.update_lab_run_status(db, lab_run_id, models.RunStatus.FAILED, error_message=str(e))
-        if job_id:
-            try:
-                job_service.fail_job(db, job_id, str(e), error_code="upload_processing_failed")
-            except Exception:
-                db.rollback()
-    finally:
-        db.close()
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: int
+    sample: str
+    benchmarking: Optional[str] = ""
+    auto_process: bool = True
+    sha256: Optional[str] = None  # of the whole archive, checked when the session completes
+
+# FILES -------------------------------------------------------------------------------------------
+
+def _flush_log_events(db: Session, job_id: str, pending: list[dict]) -> None:
+    if pending:
+        job_service.append_events(db, job_id, pending)
+        pending.clear()
 
 
 def _get_or_create_lab_run(db: Session, run_name: str, status: models.RunStatus) -> models.LabRun:
@@ -93,10 +93,135 @@ def _get_or_create_lab_run(db: Session, run_name: str, status: models.RunStatus)
     )
 
 
+def _accepted_upload_name(filename: str) -> str:
+    try:
+        filename = sanitize_upload_filename(filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    if filename.lower().endswith(".tar.zst") and importlib.util.find_spec("zstandard") is None:
+        raise HTTPException(status_code=400, detail=".tar.zst bundles need the zstandard package on the server")
+    return filename
+
+
+def _hand_over_stored_upload(db: Session, job: models.TransferJob, benchmarking: str, auto_process: bool) -> None:
+    """Register the lab run of a stored archive and queue its job for the workers (or complete it)."""
+    lab_run = crud.get_lab_run_by_name(db, job.subject_id)
+    if lab_run is None:
+        lab_run = crud.create_lab_run(
+            db,
+            schemas.LabRunCreate(
+                run_name=job.subject_id,
+                status=models.RunStatus.PENDING_PROCESSING,
+            ),
+        )
+    else:
+        crud.update_lab_run_status(db, lab_run.id, models.RunStatus.PENDING_PROCESSING)
+
+    if auto_process:
+        job_service.queue_job(
+            db,
+            job.id,
+            phase=models.TransferJobPhase.EXTRACT,
+            metadata_json={"benchmarking": benchmarking or "", "lab_run_id": lab_run.id},
+            message="Upload stored; queued for extraction and benchmarking",
+        )
+    else:
+        job_service.complete_job(db, job.id, "Upload stored successfully")
+
+
+async def _download_natively(db: Session, sample_id: str, run_name: str, job_id: str) -> None:
+    """Download with api.tasks.s3_download; it caches each file's digests as it lands."""
+    message = (
+        f"Downloading from s3://{settings.AWS_BUCKET} "
+        f"({settings.S3_DOWNLOAD_WORKERS} parallel range requests of {settings.S3_PART_SIZE // (1024 * 1024)} MB)"
+    )
+    await ws_manager.broadcast_log(sample_id, message, ws_manager.LogLevel.INFO)
+    job_service.append_event(
+        db, job_id, message, level=models.TransferEventLevel.INFO, phase=models.TransferJobPhase.DOWNLOAD
+    )
+    # Only used from the download thread, which is the one calling log()
+    events_db = SessionLocal()
+
+    def log(message: str, level: str) -> None:
+        ws_manager.add_log(sample_id, message, level)
+        job_service.append_event(
+            events_db, job_id, message, level=EVENT_LEVELS[level], phase=models.TransferJobPhase.DOWNLOAD
+        )
+
+    try:
+        await asyncio.to_thread(
+            s3_download.download_sample, sample_id, dest_dir=LAB_RUNS_DIR / run_name, job_id=job_id, log=log
+        )
+    finally:
+        events_db.close()
+
+
+async def _download_with_script(db: Session, sample_id: str, run_name: str, job_id: str, digest_futures: list) -> None:
+    """Run aws_download_gvcf.sh, relaying its output; used when boto3 is not installed."""
+    await ws_manager.broadcast_log(sample_id, f"Executing download script: {AWS_DOWNLOAD_SCRIPT}", ws_manager.LogLevel.INFO)
+    job_service.append_event(
+        db,
+        job_id,
+        f"Executing download script: {AWS_DOWNLOAD_SCRIPT}",
+        level=models.TransferEventLevel.INFO,
+        phase=models.TransferJobPhase.DOWNLOAD,
+    )
+    process = await asyncio.create_subprocess_exec(
+        str(AWS_DOWNLOAD_SCRIPT),
+        sample_id,
+        cwd=settings.PROJECT_ROOT,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        env={**os.environ, "AWS_PROFILE": settings.AWS_PROFILE},
+    )
+
+    assert process.stdout is not None
+    pending_events: list[dict] = []
+    flushed_at = time.monotonic()
+    while True:
+        try:
+            line = await asyncio.wait_for(process.stdout.readline(), LOG_EVENT_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            # Quiet script: store what is buffered (readline keeps partial lines)
+            _flush_log_events(db, job_id, pending_events)
+            flushed_at = time.monotonic()
+            continue
+        if not line:
+            break
+        decoded_line = line.decode("utf-8", errors="replace").strip()
+        if decoded_line:
+            level = ws_manager.LogLevel.INFO
+            if any(marker in decoded_line for marker in ["[SUCCESS]", "téléchargé avec succès"]):
+                level = ws_manager.LogLevel.SUCCESS
+            elif any(marker in decoded_line for marker in ["[WARNING]", "ignoré"]):
+                level = ws_manager.LogLevel.WARNING
+            elif any(marker in decoded_line for marker in ["[ERROR]", "Erreur"]):
+                level = ws_manager.LogLevel.ERROR
+            elif any(marker in decoded_line for marker in ["[PROGRESS]", "Téléchargement"]):
+                level = ws_manager.LogLevel.PROGRESS
+            await ws_manager.broadcast_log(sample_id, decoded_line, level)
+            downloaded = DOWNLOADED_FILE.search(decoded_line)
+            if downloaded and downloaded.group(1).endswith(DIGEST_SUFFIXES):
+                # Hash each variant file while the next one downloads.
+                digest_futures.append(digests.digest_async(LAB_RUNS_DIR / run_name / downloaded.group(1)))
+            pending_events.append(
+                {"message": decoded_line, "level": EVENT_LEVELS[level], "phase": models.TransferJobPhase.DOWNLOAD}
+            )
+            if len(pending_events) >= LOG_EVENT_BATCH_LINES or time.monotonic() - flushed_at >= LOG_EVENT_FLUSH_SECONDS:
+                _flush_log_events(db, job_id, pending_events)
+                flushed_at = time.monotonic()
+    _flush_log_events(db, job_id, pending_events)
+
+    await process.wait()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, str(AWS_DOWNLOAD_SCRIPT))
+
+
 async def process_aws_run_background(sample_id: str, benchmarking_options: str = "", job_id: str | None = None):
-    """Download an AWS run, then process it while publishing polling/WebSocket logs."""
+    """Download an AWS run, then queue its benchmarking while publishing polling/WebSocket logs."""
     run_name = f"{sample_id}_R001"
     lab_run_id: int | None = None
+    digest_futures = []
     db = SessionLocal()
 
     ws_manager.init_log_store(sample_id)
@@ -120,57 +245,10 @@ async def process_aws_run_background(sample_id: str, benchmarking_options: str =
         lab_run = _get_or_create_lab_run(db, run_name, models.RunStatus.PROCESSING)
         lab_run_id = lab_run.id
 
-        await ws_manager.broadcast_log(sample_id, f"Executing download script: {AWS_DOWNLOAD_SCRIPT}", ws_manager.LogLevel.INFO)
-        job_service.append_event(
-            db,
-            job_id,
-            f"Executing download script: {AWS_DOWNLOAD_SCRIPT}",
-            level=models.TransferEventLevel.INFO,
-            phase=models.TransferJobPhase.DOWNLOAD,
-        )
-        process = await asyncio.create_subprocess_exec(
-            str(AWS_DOWNLOAD_SCRIPT),
-            sample_id,
-            cwd=settings.PROJECT_ROOT,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT,
-            env={**os.environ, "AWS_PROFILE": settings.AWS_PROFILE},
-        )
-
-        assert process.stdout is not None
-        while True:
-            line = await process.stdout.readline()
-            if not line:
-                break
-            decoded_line = line.decode("utf-8", errors="replace").strip()
-            if decoded_line:
-                level = ws_manager.LogLevel.INFO
-                if any(marker in decoded_line for marker in ["[SUCCESS]", "téléchargé avec succès"]):
-                    level = ws_manager.LogLevel.SUCCESS
-                elif any(marker in decoded_line for marker in ["[WARNING]", "ignoré"]):
-                    level = ws_manager.LogLevel.WARNING
-                elif any(marker in decoded_line for marker in ["[ERROR]", "Erreur"]):
-                    level = ws_manager.LogLevel.ERROR
-                elif any(marker in decoded_line for marker in ["[PROGRESS]", "Téléchargement"]):
-                    level = ws_manager.LogLevel.PROGRESS
-                await ws_manager.broadcast_log(sample_id, decoded_line, level)
-                event_level = {
-                    ws_manager.LogLevel.SUCCESS: models.TransferEventLevel.SUCCESS,
-                    ws_manager.LogLevel.WARNING: models.TransferEventLevel.WARNING,
-                    ws_manager.LogLevel.ERROR: models.TransferEventLevel.ERROR,
-                    ws_manager.LogLevel.PROGRESS: models.TransferEventLevel.PROGRESS,
-                }.get(level, models.TransferEventLevel.INFO)
-                job_service.append_event(
-                    db,
-                    job_id,
-                    decoded_line,
-                    level=event_level,
-                    phase=models.TransferJobPhase.DOWNLOAD,
-                )
-
-        await process.wait()
-        if process.returncode != 0:
-            raise subprocess.CalledProcessError(process.returncode, str(AWS_DOWNLOAD_SCRIPT))
+        if s3_download.available():
+            await _download_natively(db, sample_id, run_name, job_id)
+        else:
+            await _download_with_script(db, sample_id, run_name, job_id, digest_futures)
 
         await ws_manager.broadcast_log(sample_id, "AWS download completed successfully", ws_manager.LogLevel.SUCCESS)
         job_service.append_event(
@@ -184,35 +262,43 @@ async def process_aws_run_background(sample_id: str, benchmarking_options: str =
         if not run_dir.exists():
             raise FileNotFoundError(f"Expected run directory not found: {run_dir}")
 
-        parsed_sample, run = split_run_name(run_dir.name)
+        parsed_sample, _run = split_run_name(run_dir.name)
         if lab_run_id is not None and run_dir.name != run_name:
             crud.update_lab_run_name(db, lab_run_id, run_dir.name)
+        run_catalog.refresh_run(run_dir.name)
 
         await ws_manager.broadcast_log(sample_id, "Verifying reference files", ws_manager.LogLevel.INFO)
         job_service.mark_phase(db, job_id, models.TransferJobPhase.REFERENCE_SETUP, "Verifying reference files")
         ready, message = ensure_references(parsed_sample, auto_download=True)
         if not ready:
             raise FileNotFoundError(message)
-
-        happy = "happy" in benchmarking_options
-        stratified = "stratified" in benchmarking_options
-        truvari = "truvari" in benchmarking_options
-        csv_reformat = "csv" in benchmarking_options
-
-        await ws_manager.broadcast_log(sample_id, "Starting benchmarking pipeline", ws_manager.LogLevel.INFO)
-        job_service.mark_phase(db, job_id, models.TransferJobPhase.PROCESS, "Starting benchmarking pipeline")
-        run_pipeline(
-            parsed_sample,
-            run,
-            happy=happy,
-            stratified=stratified,
-            truvari=truvari,
-            csv_reformat=csv_reformat,
-        )
-        if lab_run_id is not None:
-            crud.update_lab_run_status(db, lab_run_id, models.RunStatus.AWAITING_APPROVAL)
-        await ws_manager.broadcast_log(sample_id, "Benchmarking pipeline completed successfully", ws_manager.LogLevel.SUCCESS)
-        job_service.complete_job(db, job_id, "Benchmarking pipeline completed successfully")
+        # Digests are only a cache for the pipeline's checksum; a failure here
+        # just means the pipeline hashes the file itself.
+        for result in await asyncio.gather(*map(asyncio.wrap_future, digest_futures), return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.warning(f"Could not hash downloaded file: {result}")
+
+        if benchmarking_options:
+            pipeline_job = job_service.enqueue_job(
+                db,
+                job_type=models.TransferJobType.PIPELINE,
+                subject_id=run_dir.name,
+                phase=models.TransferJobPhase.PROCESS,
+                source_uri=str(run_dir),
+                destination_path=str(settings.PROCESSED_DIR),
+                metadata_json={
+                    "benchmarking": benchmarking_options,
+                    "lab_run_id": lab_run_id,
+                    "parent_job_id": job_id,
+                },
+            )
+            message = f"Benchmarking queued as job {pipeline_job.id}"
+        else:
+            if lab_run_id is not None:
+                crud.update_lab_run_status(db, lab_run_id, models.RunStatus.AWAITING_APPROVAL)
+            message = "AWS import completed"
+        await ws_manager.broadcast_log(sample_id, message, ws_manager.LogLevel.SUCCESS)
+        job_service.complete_job(db, job_id, message)
         ws_manager.set_status(sample_id, ws_manager.DownloadStatus.COMPLETED)
 
     except Exception as e:
@@ -233,103 +319,354 @@ async def process_aws_run_background(sample_id: str, benchmarking_options: str =
     finally:
         db.close()
 
-@router.post("/upload/runs")
+@router.post(
+    "/upload/runs",
+    openapi_extra=multipart_body({
+        "sample": "Sample name (required)",
+        "benchmarking": "Comma-separated benchmarking options",
+        "auto_process": "Queue extraction and benchmarking (default true)",
+    }),
+)
 async def upload_run_endpoint(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
-    sample: str = Form(...),
-    benchmarking: Optional[str] = Form(default=""),
-    auto_process: bool = Form(default=True),
+    request: Request,
     db: Session = Depends(get_db),
     _role: Role = Depends(require_role(Role.OPERATOR)),
 ):
-    """Upload a run file with streaming to avoid memory issues"""
+    """
+    Upload a run archive, parsed from the request stream and written straight
+    to the upload directory. Tar bundles (.tar, .tar.gz, .tar.zst) are also
+    extracted while they arrive, unless an auto_process=0 field comes before
+    the file; the run is then ready when the upload ends.
+    """
+    job: models.TransferJob | None = None
+    dest: Path | None = None
+    growing: GrowingFile | None = None
+    extraction: concurrent.futures.Future | None = None
+    # open_destination and on_progress run in receive_upload's worker thread
+    loop = asyncio.get_running_loop()
+    bytes_total = int(request.headers["content-length"]) if request.headers.get("content-length", "").isdigit() else None
+
+    def open_destination(filename: str, fields: dict[str, str]) -> Path:
+        nonlocal job, dest, growing, extraction
+        filename = _accepted_upload_name(filename)
+
+        UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        dest = unique_upload_path(filename)
+        job = job_service.create_job(
+            db,
+            job_type=models.TransferJobType.UPLOAD_ZIP,
+            subject_id=archive_stem(filename),
+            phase=models.TransferJobPhase.UPLOAD,
+            source_uri=filename,
+            destination_path=str(dest),
+            # The request size; within a few hundred bytes of the archive's
+            bytes_total=bytes_total,
+        )
+        job_service.append_event(
+            db,
+            job.id,
+            f"Receiving upload archive: {filename}",
+            level=models.TransferEventLevel.INFO,
+            phase=models.TransferJobPhase.UPLOAD,
+        )
+        if is_tar_bundle(filename) and form_bool(fields.get("auto_process"), default=True):
+            # Read the archive back as it is written and extract it member by member
+            growing = GrowingFile(dest)
+            extraction = asyncio.run_coroutine_threadsafe(
+                asyncio.to_thread(extract_tar_stream, growing, filename), loop)
+            job_service.append_event(
+                db,
+                job.id,
+                "Extracting the bundle as it arrives",
+                level=models.TransferEventLevel.INFO,
+                phase=models.TransferJobPhase.EXTRACT,
+            )
+        return dest
+
+    def on_progress(bytes_done: int) -> None:
+        if growing is not None:
+            growing.advance(bytes_done)
+            if extraction.done() and extraction.exception() is not None:
+                # A bad bundle stops the upload instead of waiting for its end
+                raise extraction.exception()
+        # Accumulated in memory; written every few seconds at most
+        job_service.update_progress(db, job.id, bytes_done=bytes_done, bytes_total=bytes_total)
+
     try:
-        filename = sanitize_upload_filename(file.filename)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e)) from e
+        try:
+            # Flushed for the extraction's reader only; a plain upload is closed at its end
+            upload = await receive_upload(
+                request, open_destination, on_progress, flush_when=lambda: growing is not None)
+        except BaseException:
+            if growing is not None:
+                # The extraction removes what it wrote once it sees the abort
+                growing.abort()
+                await asyncio.gather(asyncio.wrap_future(extraction), return_exceptions=True)
+            raise
+        if not upload.fields.get("sample"):
+            raise HTTPException(status_code=422, detail="Missing form field: sample")
+        benchmarking = upload.fields.get("benchmarking", "")
+        auto_process = form_bool(upload.fields.get("auto_process"), default=True)
+        bytes_written = upload.size
+        run_name = job.subject_id
+        job_service.update_progress(db, job.id, bytes_done=bytes_written, bytes_total=bytes_written)
+
+        if extraction is not None:
+            growing.finish()
+            try:
+                sample, run = await asyncio.wrap_future(extraction)
+            finally:
+                growing.close()
+            run_name = f"{sample}_{run}"
+            dest.unlink(missing_ok=True)
+            lab_run = _get_or_create_lab_run(db, run_name, models.RunStatus.PENDING_PROCESSING)
+            run_catalog.refresh_run(run_name)
+            if auto_process:
+                pipeline_job = job_service.enqueue_job(
+                    db,
+                    job_type=models.TransferJobType.PIPELINE,
+                    subject_id=run_name,
+                    phase=models.TransferJobPhase.PROCESS,
+                    source_uri=str(LAB_RUNS_DIR / run_name),
+                    destination_path=str(settings.PROCESSED_DIR),
+                    metadata_json={"benchmarking": benchmarking, "lab_run_id": lab_run.id, "parent_job_id": job.id},
+                )
+                message = f"Run extracted during upload; benchmarking queued as job {pipeline_job.id}"
+            else:
+                # auto_process=0 came after the file, too late to skip extraction
+                crud.update_lab_run_status(db, lab_run.id, models.RunStatus.AWAITING_APPROVAL)
+                message = "Run extracted during upload"
+            job_service.complete_job(db, job.id, message)
+        else:
+            _hand_over_stored_upload(db, job, benchmarking, auto_process)
+
+        return {
+            "ok": True,
+            "run_name": run_name,
+            "job_id": job.id,
+            "bytes_received": bytes_written,
+            "sha256": upload.hexdigests["sha256"],
+            "extracted": extraction is not None,
+            "status": models.RunStatus.PENDING_PROCESSING,
+            "auto_process": auto_process,
+            "benchmarking": benchmarking
+        }
+
+    except (ValueError, tarfile.TarError) as e:
+        # Bundle rejected by the extraction (unsafe member, bad layout, corrupt data)
+        if job is not None:
+            dest.unlink(missing_ok=True)
+            job_service.fail_job(db, job.id, str(e), error_code="upload_failed")
+        raise HTTPException(status_code=400, detail=f"Invalid run bundle: {e}")
+    except HTTPException:
+        if job is not None:
+            dest.unlink(missing_ok=True)
+            job_service.fail_job(db, job.id, "Upload failed", error_code="upload_failed")
+        raise
+    except Exception as e:
+        # Clean up on error
+        if job is not None:
+            dest.unlink(missing_ok=True)
+            job_service.fail_job(db, job.id, str(e), error_code="upload_failed")
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+def _get_upload_session(db: Session, job_id: str) -> tuple[models.TransferJob, ChunkedUpload]:
+    job = job_service.get_job(db, job_id)
+    upload = upload_of(job) if job is not None else None
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return job, upload
+
 
-    if not filename.lower().endswith(".zip"):
-        raise HTTPException(status_code=400, detail="Expected a .zip file")
+def _require_open_session(job: models.TransferJob, upload: ChunkedUpload) -> None:
+    if job.status != models.TransferJobStatus.RUNNING or job.phase != models.TransferJobPhase.UPLOAD or not upload.exists():
+        raise HTTPException(status_code=409, detail=f"Upload session is no longer open ({job.status.value})")
+
+
+def _upload_session_status(job: models.TransferJob, upload: ChunkedUpload) -> dict:
+    if upload.exists():
+        received = upload.received()
+    elif job.status != models.TransferJobStatus.FAILED and job.phase != models.TransferJobPhase.UPLOAD:
+        # Finalized: the chunk bitmap is gone with the .part file
+        received = list(range(upload.chunk_count))
+    else:
+        received = []
+    return {
+        "job_id": job.id,
+        "filename": job.source_uri,
+        "status": job.status,
+        "phase": job.phase,
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "chunk_count": upload.chunk_count,
+        "received": received,
+        "bytes_received": upload.bytes_received(received),
+    }
+
+
+@router.post("/upload/sessions")
+async def create_upload_session(
+    request: UploadSessionRequest,
+    db: Session = Depends(get_db),
+    _role: Role = Depends(require_role(Role.OPERATOR)),
+):
+    """
+    Start a resumable upload. The archive is then sent as numbered chunks of
+    chunk_size bytes (PUT /upload/sessions/{job_id}/chunks/{index}), in any
+    order and several at a time, and handed over to the workers by
+    POST /upload/sessions/{job_id}/complete. After a dropped connection,
+    GET /upload/sessions/{job_id} lists the chunks already stored. When
+    sha256 is given, the assembled archive must match it. Sessions that
+    receive no chunk for UPLOAD_SESSION_TTL_SECONDS expire.
+    """
+    filename = _accepted_upload_name(request.filename)
+    if not request.sample:
+        raise HTTPException(status_code=422, detail="Missing field: sample")
+    if request.size <= 0:
+        raise HTTPException(status_code=400, detail="Upload size must be positive")
+    if request.size > settings.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Upload exceeds configured size limit")
 
-    # Create upload directory
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
     dest = unique_upload_path(filename)
-    run_name = Path(filename).stem
+    upload = ChunkedUpload(dest, request.size, settings.UPLOAD_CHUNK_BYTES)
+    try:
+        await asyncio.to_thread(upload.create)
+    except OSError as e:
+        upload.discard()
+        raise HTTPException(status_code=507, detail=f"Could not allocate {request.size} bytes for the upload: {e}")
     job = job_service.create_job(
         db,
         job_type=models.TransferJobType.UPLOAD_ZIP,
-        subject_id=run_name,
+        subject_id=archive_stem(filename),
         phase=models.TransferJobPhase.UPLOAD,
         source_uri=filename,
         destination_path=str(dest),
-        bytes_total=getattr(file, "size", None),
+        bytes_total=request.size,
+        metadata_json={
+            "chunk_size": upload.chunk_size,
+            "sha256": request.sha256,
+            "sample": request.sample,
+            "benchmarking": request.benchmarking or "",
+            "auto_process": request.auto_process,
+        },
     )
     job_service.append_event(
         db,
         job.id,
-        f"Receiving upload archive: {filename}",
+        f"Resumable upload started: {filename} in {upload.chunk_count} chunks",
         level=models.TransferEventLevel.INFO,
         phase=models.TransferJobPhase.UPLOAD,
     )
+    return _upload_session_status(job, upload)
+
+
+@router.get("/upload/sessions/{job_id}")
+def get_upload_session(
+    job_id: str,
+    db: Session = Depends(get_db),
+    _role: Role = Depends(require_role(Role.OPERATOR)),
+):
+    """Size, chunk layout and received chunk indexes (offset = index * chunk_size) of an upload session."""
+    job, upload = _get_upload_session(db, job_id)
+    return _upload_session_status(job, upload)
 
-    # Stream to disk in chunks (no full read into memory)
+
+@router.put("/upload/sessions/{job_id}/chunks/{index}")
+async def upload_chunk(
+    job_id: str,
+    index: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    _role: Role = Depends(require_role(Role.OPERATOR)),
+):
+    """
+    Store chunk index of an upload session, sent as the raw request body.
+    It is written at its offset as it arrives and only counts as received
+    once complete; an X-Chunk-SHA256 header, when sent, must match it.
+    Sending a chunk again replaces it: it stops counting as received as soon
+    as its first new bytes are written, until they are complete.
+    """
+    job, upload = _get_upload_session(db, job_id)
+    _require_open_session(job, upload)
     try:
-        bytes_written = 0
-        with dest.open("wb") as out:
-            while True:
-                chunk = await file.read(8 * 1024 * 1024)  # 8 MB chunks
-                if not chunk:
-                    break
-                bytes_written += len(chunk)
-                if bytes_written > settings.MAX_UPLOAD_BYTES:
-                    raise HTTPException(status_code=413, detail="Upload exceeds configured size limit")
-                out.write(chunk)
-                job_service.update_progress(
-                    db,
-                    job.id,
-                    bytes_done=bytes_written,
-                    bytes_total=getattr(file, "size", None) or bytes_written,
-                )
+        writer = upload.open_chunk(index)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    content_length = request.headers.get("content-length", "")
+    try:
+        if content_length.isdigit() and int(content_length) > writer.length:
+            raise HTTPException(status_code=413, detail=f"Chunk {index} is {writer.length} bytes")
+        # Written and hashed in a worker thread, off the event loop
+        await stream_to_thread(request, writer.write)
+        sha256 = await asyncio.to_thread(writer.commit, request.headers.get("x-chunk-sha256"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    finally:
+        writer.close()
 
-        lab_run = crud.get_lab_run_by_name(db, run_name)
-        if lab_run is None:
-            lab_run = crud.create_lab_run(
-                db,
-                schemas.LabRunCreate(
-                    run_name=run_name,
-                    status=models.RunStatus.PENDING_PROCESSING,
-                ),
-            )
-        else:
-            crud.update_lab_run_status(db, lab_run.id, models.RunStatus.PENDING_PROCESSING)
+    received = upload.received()
+    bytes_received = upload.bytes_received(received)
+    # Accumulated in memory; written every few seconds at most
+    job_service.update_progress(db, job.id, bytes_done=bytes_received, bytes_total=upload.size)
+    return {
+        "job_id": job.id,
+        "index": index,
+        "sha256": sha256,
+        "chunks_received": len(received),
+        "bytes_received": bytes_received,
+    }
 
-        if auto_process and background_tasks:
-            background_tasks.add_task(process_run_background, dest, sample, lab_run.id, benchmarking, job.id)
-        else:
-            job_service.complete_job(db, job.id, "Upload stored successfully")
 
-        return {
-            "ok": True,
-            "run_name": run_name,
-            "job_id": job.id,
-            "bytes_received": bytes_written,
-            "status": models.RunStatus.PENDING_PROCESSING,
-            "auto_process": auto_process,
-            "benchmarking": benchmarking
-        }
+@router.post("/upload/sessions/{job_id}/complete")
+async def complete_upload_session(
+    job_id: str,
+    db: Session = Depends(get_db),
+    _role: Role = Depends(require_role(Role.OPERATOR)),
+):
+    """
+    Check the fully received archive (SHA-256 of the whole file, against the
+    one given when the session was created), move it into place and queue
+    it like a /upload/runs upload. A mismatch fails the session.
+    """
+    job, upload = _get_upload_session(db, job_id)
+    _require_open_session(job, upload)
+    metadata = job.metadata_json
+    try:
+        await asyncio.to_thread(upload.finalize, metadata.get("sha256"))
+    except UploadChecksumError as e:
+        await asyncio.to_thread(upload.discard)
+        job_service.fail_job(db, job.id, str(e), error_code="upload_corrupt")
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
 
-    except HTTPException:
-        if dest.exists():
-            dest.unlink()
-        job_service.fail_job(db, job.id, "Upload failed", error_code="upload_failed")
-        raise
-    except Exception as e:
-        # Clean up on error
-        if dest.exists():
-            dest.unlink()
-        job_service.fail_job(db, job.id, str(e), error_code="upload_failed")
-        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    job_service.update_progress(db, job.id, bytes_done=upload.size, bytes_total=upload.size)
+    _hand_over_stored_upload(db, job, metadata["benchmarking"], metadata["auto_process"])
+    return {
+        "ok": True,
+        "run_name": job.subject_id,
+        "job_id": job.id,
+        "bytes_received": upload.size,
+        "extracted": False,
+        "status": models.RunStatus.PENDING_PROCESSING,
+        "auto_process": metadata["auto_process"],
+        "benchmarking": metadata["benchmarking"],
+    }
+
+
+@router.delete("/upload/sessions/{job_id}")
+async def abandon_upload_session(
+    job_id: str,
+    db: Session = Depends(get_db),
+    _role: Role = Depends(require_role(Role.OPERATOR)),
+):
+    """Give up an upload session and free its preallocated space."""
+    job, upload = _get_upload_session(db, job_id)
+    _require_open_session(job, upload)
+    await asyncio.to_thread(upload.discard)
+    job = job_service.fail_job(db, job.id, "Upload abandoned by the client", error_code="upload_abandoned")
+    return _upload_session_status(job, upload)
 
 @router.get("/upload/form")
 def upload_form():
@@ -564,7 +901,7 @@ def upload_form():
                         <div class="file-input" id="file-input">
                             <button type="button" class="file-input__button" id="file-pick-btn">Choose file</button>
                             <span class="file-input__name" id="file-name">No file selected</span>
-                            <input type="file" id="file" name="file" accept=".zip" required class="visually-hidden" aria-labelledby="file-label">
+                            <input type="file" id="file" name="file" accept=".zip,.tar,.tar.gz,.tar.zst" required class="visually-hidden" aria-labelledby="file-label">
                         </div>
                     </div>
 
@@ -672,29 +1009,126 @@ def upload_form():
                 }
             });
 
-            // Handle form submission with browser upload progress.
+            // Uploads go through a resumable session: the file is sent as numbered
+            // chunks, CHUNK_PARALLELISM at a time. The session id is remembered per
+            // file, so submitting the same file again after a failure only sends the
+            // chunks the server does not have yet.
+            const SESSIONS_URL = '/api/v1/upload/sessions';
+            const CHUNK_PARALLELISM = 4;
+            const CHUNK_ATTEMPTS = 3;
+
+            async function apiRequest(method, url, apiKey, body, headers = {}) {
+                if (apiKey) {
+                    headers['X-VCBench-API-Key'] = apiKey;
+                }
+                const response = await fetch(url, {method, headers, body});
+                let parsed;
+                try {
+                    parsed = await response.json();
+                } catch (parseError) {
+                    throw new Error('Invalid server response');
+                }
+                if (!response.ok) {
+                    const detail = typeof parsed.detail === 'string' ? parsed.detail : JSON.stringify(parsed.detail);
+                    throw new Error(detail || `Request failed (${response.status})`);
+                }
+                return parsed;
+            }
+
+            async function chunkChecksum(blob) {
+                // crypto.subtle only exists on secure origins (https, localhost)
+                if (!window.crypto || !window.crypto.subtle) {
+                    return null;
+                }
+                const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+                return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+            }
+
+            async function openSession(file, fields, apiKey) {
+                const key = `vcbench-upload:${file.name}:${file.size}:${file.lastModified}`;
+                const previous = localStorage.getItem(key);
+                if (previous) {
+                    try {
+                        const session = await apiRequest('GET', `${SESSIONS_URL}/${previous}`, apiKey);
+                        if (session.status === 'running' && session.phase === 'upload') {
+                            return {key, session};
+                        }
+                    } catch (error) {
+                        // Unknown or expired session: start a new one
+                    }
+                }
+                const session = await apiRequest('POST', SESSIONS_URL, apiKey, JSON.stringify({
+                    filename: file.name,
+                    size: file.size,
+                    ...fields,
+                }), {'Content-Type': 'application/json'});
+                localStorage.setItem(key, session.job_id);
+                return {key, session};
+            }
+
+            async function sendChunks(file, session, apiKey) {
+                const received = new Set(session.received);
+                const pending = [];
+                for (let index = 0; index < session.chunk_count; index++) {
+                    if (!received.has(index)) {
+                        pending.push(index);
+                    }
+                }
+                let loaded = session.bytes_received;
+                setProgress(loaded, file.size);
+
+                async function sendChunk(index) {
+                    const start = index * session.chunk_size;
+                    const blob = file.slice(start, Math.min(start + session.chunk_size, file.size));
+                    const checksum = await chunkChecksum(blob);
+                    const headers = {'Content-Type': 'application/octet-stream'};
+                    if (checksum) {
+                        headers['X-Chunk-SHA256'] = checksum;
+                    }
+                    for (let attempt = 1; ; attempt++) {
+                        try {
+                            await apiRequest('PUT', `${SESSIONS_URL}/${session.job_id}/chunks/${index}`, apiKey, blob, {...headers});
+                            loaded += blob.size;
+                            setProgress(loaded, file.size);
+                            return;
+                        } catch (error) {
+                            if (attempt >= CHUNK_ATTEMPTS) {
+                                throw error;
+                            }
+                            await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+                        }
+                    }
+                }
+
+                async function worker() {
+                    while (pending.length > 0) {
+                        await sendChunk(pending.shift());
+                    }
+                }
+                await Promise.all(Array.from({length: CHUNK_PARALLELISM}, worker));
+            }
+
             document.getElementById('uploadForm').addEventListener('submit', async function(e) {
                 e.preventDefault();
 
                 const form = e.target;
-                const formData = new FormData();
                 const submitButton = form.querySelector('button[type="submit"]');
                 const progress = document.getElementById('progress');
                 const result = document.getElementById('result');
                 const selectedFile = form.querySelector('#file').files[0];
+                const apiKey = form.querySelector('#api_key').value;
 
                 // Manually collect form data to handle multiple checkboxes properly
-                formData.append('sample', form.querySelector('#sample').value);
-                formData.append('file', selectedFile);
-                formData.append('auto_process', form.querySelector('#auto_process').checked ? '1' : '0');
-
-                // Collect all checked benchmarking options
                 const benchmarkingOptions = [];
                 const checkboxes = form.querySelectorAll('input[name="benchmarking"]:checked');
                 checkboxes.forEach(checkbox => {
                     benchmarkingOptions.push(checkbox.value);
                 });
-                formData.append('benchmarking', benchmarkingOptions.join(','));
+                const fields = {
+                    sample: form.querySelector('#sample').value,
+                    benchmarking: benchmarkingOptions.join(','),
+                    auto_process: form.querySelector('#auto_process').checked,
+                };
 
                 // Show progress, disable button
                 progress.style.display = 'block';
@@ -703,44 +1137,11 @@ def upload_form():
                 setProgress(0, selectedFile ? selectedFile.size : 0);
 
                 try {
-                    const data = await new Promise((resolve, reject) => {
-                        const xhr = new XMLHttpRequest();
-                        xhr.open('POST', form.action);
-
-                        const apiKey = form.querySelector('#api_key').value;
-                        if (apiKey) {
-                            xhr.setRequestHeader('X-VCBench-API-Key', apiKey);
-                        }
-
-                        xhr.upload.addEventListener('progress', event => {
-                            if (event.lengthComputable) {
-                                setProgress(event.loaded, event.total);
-                            } else {
-                                setProgress(event.loaded, selectedFile ? selectedFile.size : 0);
-                            }
-                        });
-
-                        xhr.addEventListener('load', () => {
-                            let parsed;
-                            try {
-                                parsed = JSON.parse(xhr.responseText || '{}');
-                            } catch (parseError) {
-                                reject(new Error('Invalid server response'));
-                                return;
-                            }
-
-                            if (xhr.status >= 200 && xhr.status < 300) {
-                                setProgress(selectedFile ? selectedFile.size : 1, selectedFile ? selectedFile.size : 1);
-                                resolve(parsed);
-                            } else {
-                                reject(new Error(parsed.detail || 'Upload failed'));
-                            }
-                        });
-
-                        xhr.addEventListener('error', () => reject(new Error('Network error during upload')));
-                        xhr.addEventListener('abort', () => reject(new Error('Upload aborted')));
-                        xhr.send(formData);
-                    });
+                    const {key, session} = await openSession(selectedFile, fields, apiKey);
+                    await sendChunks(selectedFile, session, apiKey);
+                    const data = await apiRequest('POST', `${SESSIONS_URL}/${session.job_id}/complete`, apiKey);
+                    localStorage.removeItem(key);
+                    setProgress(selectedFile.size, selectedFile.size);
 
                     result.innerHTML = `
                         <div class="success">
@@ -757,6 +1158,7 @@ def upload_form():
                         <div class="error">
                             <h4>Upload failed</h4>
                             <p><strong>Error:</strong> ${error.message}</p>
+                            <p>Submit the same file again to resume where the upload stopped.</p>
                         </div>
                     `;
                 }
@@ -771,21 +1173,7 @@ def upload_form():
     """)
 
 
-@router.post("/upload/aws")
-async def upload_aws_run_endpoint(
-    background_tasks: BackgroundTasks,
-    request: AWSUploadRequest,
-    db: Session = Depends(get_db),
-    _role: Role = Depends(require_role(Role.OPERATOR)),
-):
-    """Import a run from AWS S3 using the configured download script."""
-    if not AWS_DOWNLOAD_SCRIPT.exists():
-        raise HTTPException(status_code=500, detail=f"AWS download script not found: {AWS_DOWNLOAD_SCRIPT}")
-
-    sample_id = request.sample_id.strip() if request.sample_id else ""
-    if not sample_id:
-        raise HTTPException(status_code=400, detail="sample_id cannot be empty")
-
+def _queue_aws_import(db: Session, sample_id: str, benchmarking: str, message: str = "AWS import queued") -> models.TransferJob:
     job = job_service.create_job(
         db,
         job_type=models.TransferJobType.AWS_IMPORT,
@@ -794,15 +1182,56 @@ async def upload_aws_run_endpoint(
         status=models.TransferJobStatus.QUEUED,
         source_uri=f"s3://{sample_id}",
         destination_path=str(LAB_RUNS_DIR / f"{sample_id}_R001"),
-        metadata_json={"benchmarking": request.benchmarking or ""},
+        metadata_json={"benchmarking": benchmarking},
     )
     job_service.append_event(
         db,
         job.id,
-        "AWS import queued",
+        message,
         level=models.TransferEventLevel.INFO,
         phase=models.TransferJobPhase.DOWNLOAD,
     )
+    return job
+
+
+async def process_aws_batch_background(sample_jobs: list[tuple[str, str]], benchmarking_options: str = ""):
+    """
+    Import several AWS samples. With the native downloader they all start at
+    once and s3_download.governor shares out the object and bandwidth limits;
+    each sample queues its benchmarking as soon as its own files are in. The
+    download script has no such limits, so without boto3 samples go one by one.
+    """
+    imports = [process_aws_run_background(sample_id, benchmarking_options, job_id) for sample_id, job_id in sample_jobs]
+    if s3_download.available():
+        results = await asyncio.gather(*imports, return_exceptions=True)
+    else:
+        results = []
+        for coroutine in imports:
+            try:
+                results.append(await coroutine)
+            except Exception as e:
+                results.append(e)
+    for (sample_id, _job_id), result in zip(sample_jobs, results):
+        if isinstance(result, Exception):
+            logger.warning(f"AWS import of {sample_id} failed: {result}")
+
+
+@router.post("/upload/aws")
+async def upload_aws_run_endpoint(
+    background_tasks: BackgroundTasks,
+    request: AWSUploadRequest,
+    db: Session = Depends(get_db),
+    _role: Role = Depends(require_role(Role.OPERATOR)),
+):
+    """Import a run from AWS S3, natively with boto3 or else with the configured download script."""
+    if not s3_download.available() and not AWS_DOWNLOAD_SCRIPT.exists():
+        raise HTTPException(status_code=500, detail=f"AWS download script not found: {AWS_DOWNLOAD_SCRIPT}")
+
+    sample_id = request.sample_id.strip() if request.sample_id else ""
+    if not sample_id:
+        raise HTTPException(status_code=400, detail="sample_id cannot be empty")
+
+    job = _queue_aws_import(db, sample_id, request.benchmarking or "")
 
     if request.auto_process:
         background_tasks.add_task(process_aws_run_background, sample_id, request.benchmarking or "", job.id)
@@ -816,3 +1245,44 @@ async def upload_aws_run_endpoint(
         "benchmarking": request.benchmarking,
         "message": "AWS download initiated" if request.auto_process else "AWS download will be triggered manually",
     }
+
+
+@router.post("/upload/aws/batch")
+async def upload_aws_batch_endpoint(
+    background_tasks: BackgroundTasks,
+    request: AWSBatchUploadRequest,
+    db: Session = Depends(get_db),
+    _role: Role = Depends(require_role(Role.OPERATOR)),
+):
+    """Import several runs from AWS S3, one AWS import job per sample."""
+    if not s3_download.available() and not AWS_DOWNLOAD_SCRIPT.exists():
+        raise HTTPException(status_code=500, detail=f"AWS download script not found: {AWS_DOWNLOAD_SCRIPT}")
+
+    # Blank and repeated IDs are dropped, keeping the given order.
+    sample_ids = list(dict.fromkeys(sample_id.strip() for sample_id in request.sample_ids if sample_id.strip()))
+    if not sample_ids:
+        raise HTTPException(status_code=400, detail="sample_ids cannot be empty")
+
+    benchmarking = request.benchmarking or ""
+    jobs = [
+        _queue_aws_import(db, sample_id, benchmarking, f"AWS import queued in a batch of {len(sample_ids)}")
+        for sample_id in sample_ids
+    ]
+    if request.auto_process:
+        background_tasks.add_task(
+            process_aws_batch_background, [(job.subject_id, job.id) for job in jobs], benchmarking
+        )
+
+    return {
+        "ok": True,
+        "imports": [
+            {"sample_id": job.subject_id, "run_name": f"{job.subject_id}_R001", "job_id": job.id} for job in jobs
+        ],
+        "auto_process": request.auto_process,
+        "benchmarking": request.benchmarking,
+        "message": (
+            f"AWS download initiated for {len(jobs)} samples"
+            if request.auto_process
+            else "AWS downloads will be triggered manually"
+        ),
+    }
@@ -1,7 +1,11 @@
+import base64
+import csv
+import io
+import json
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import DateTime, Integer, String, case, cast, exists, func, insert, literal, null, select, tuple_, union_all, update
 
 from api.app import models
 from api.app import schemas
@@ -58,6 +62,116 @@ def get_lab_runs(db: Session) -> list[models.LabRun]:
     """Get all lab runs."""
     return db.query(models.LabRun).order_by(models.LabRun.created_at.desc()).all()
 
+RUN_SORTS = ("created_desc", "created_asc", "name_asc", "name_desc")
+
+def _runs_listing():
+    """
+    Lab runs plus catalogued lab run directories without a lab_runs row, with
+    the columns GET /runs returns and a sort_time that never changes once the
+    row exists: lab_runs.created_at and run_catalog.discovered_at.
+    """
+    lab_runs = select(
+        models.LabRun.id,
+        models.LabRun.run_name,
+        cast(models.LabRun.status, String).label("status"),
+        models.LabRun.created_at,
+        models.LabRun.updated_at,
+        models.LabRun.approved_at,
+        models.LabRun.error_message,
+        models.LabRun.created_at.label("sort_time"),
+    )
+    directories_only = select(
+        cast(null(), Integer).label("id"),
+        models.RunCatalogEntry.run_name,
+        case(
+            (models.RunCatalogEntry.processed_dir.is_not(None), literal(models.RunStatus.AWAITING_APPROVAL.value)),
+            else_=literal(models.RunStatus.PENDING_PROCESSING.value),
+        ).label("status"),
+        cast(null(), DateTime).label("created_at"),
+        cast(null(), DateTime).label("updated_at"),
+        cast(null(), DateTime).label("approved_at"),
+        cast(null(), String).label("error_message"),
+        models.RunCatalogEntry.discovered_at.label("sort_time"),
+    ).where(
+        models.RunCatalogEntry.lab_dir.is_not(None),
+        ~exists().where(models.LabRun.run_name == models.RunCatalogEntry.run_name),
+    )
+    return union_all(lab_runs, directories_only).subquery("runs")
+
+def encode_run_cursor(key: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, default=str).encode()).decode().rstrip("=")
+
+def decode_run_cursor(cursor: str) -> list:
+    """Raises ValueError for a cursor that was not produced by encode_run_cursor."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(key, list) or not key:
+        raise ValueError("Invalid cursor")
+    return key
+
+def list_runs_page(
+    db: Session,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: str = "created_desc",
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    sample_prefix: Optional[str] = None,
+) -> tuple[list[dict], Optional[str]]:
+    """
+    One page of the run listing, keyset-paginated: the cursor encodes the sort
+    key of the last row returned, and sort keys never change, so a run is
+    neither repeated nor skipped while someone pages. Both halves of the
+    listing have an index on their (sort_time, run_name) key, which lets
+    PostgreSQL push the cursor condition into each and merge two index range
+    scans rather than sort the whole listing (SQLite sorts it). Returns the
+    rows and the cursor of the next page (None on the last page). Without
+    limit, every matching row is returned.
+    """
+    if sort not in RUN_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(RUN_SORTS)}")
+    runs = _runs_listing()
+    by_time = sort.startswith("created")
+    descending = sort.endswith("desc")
+    key_columns = (runs.c.sort_time, runs.c.run_name) if by_time else (runs.c.run_name,)
+
+    query = select(runs)
+    if status:
+        query = query.where(runs.c.status == status)
+    if created_from:
+        query = query.where(runs.c.sort_time >= created_from)
+    if created_to:
+        query = query.where(runs.c.sort_time < created_to)
+    if sample_prefix:
+        escaped = sample_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.where(runs.c.run_name.like(f"{escaped}%", escape="\\"))
+    if cursor:
+        key = decode_run_cursor(cursor)
+        if len(key) != len(key_columns):
+            raise ValueError("Cursor does not match the sort order")
+        if by_time:
+            key[0] = datetime.fromisoformat(key[0])
+        position = tuple_(*key_columns)
+        query = query.where(position < tuple_(*key) if descending else position > tuple_(*key))
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in key_columns])
+    if limit is not None:
+        query = query.limit(limit + 1)
+
+    rows = [dict(row._mapping) for row in db.execute(query)]
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_run_cursor(
+            [last["sort_time"].isoformat(), last["run_name"]] if by_time else [last["run_name"]]
+        )
+    for row in rows:
+        del row["sort_time"]
+    return rows, next_cursor
+
 def get_lab_run(db: Session, run_id: int) -> Optional[models.LabRun]:
     """Get a lab run by ID."""
     return db.query(models.LabRun).filter(models.LabRun.id == run_id).first()
@@ -120,6 +234,72 @@ def update_lab_run_name(db: Session, run_id: int, run_name: str) -> Optional[mod
             raise
     return None
 
+# Run Catalog
+
+def get_run_catalog(db: Session, limit: Optional[int] = None) -> list[models.RunCatalogEntry]:
+    """Get catalogued runs, ordered by name."""
+    return db.query(models.RunCatalogEntry).order_by(models.RunCatalogEntry.run_name).limit(limit).all()
+
+def get_run_catalog_entry(db: Session, run_name: str) -> Optional[models.RunCatalogEntry]:
+    return db.query(models.RunCatalogEntry).filter(models.RunCatalogEntry.run_name == run_name).first()
+
+def last_run_catalog_rescan(db: Session) -> Optional[datetime]:
+    """When the whole catalog was last rescanned (UTC), None if it never was."""
+    return db.query(models.RunCatalogRescan.rescanned_at).filter(models.RunCatalogRescan.id == 1).scalar()
+
+def record_run_catalog_rescan(db: Session, rescanned_at: datetime) -> None:
+    row = db.get(models.RunCatalogRescan, 1)
+    if row is None:
+        db.add(models.RunCatalogRescan(id=1, rescanned_at=rescanned_at))
+    else:
+        row.rescanned_at = rescanned_at
+    db.commit()
+
+def upsert_run_catalog_entries(db: Session, entries: list[dict], scanned_at: Optional[datetime] = None) -> None:
+    """
+    Create or update catalog entries (dicts keyed by column name) in one
+    transaction, stamping them with scanned_at (UTC, now by default): the time
+    the scan started, so a change made while it ran still looks newer.
+    """
+    if not entries:
+        return
+    scanned_at = scanned_at or datetime.utcnow()
+    try:
+        names = [entry["run_name"] for entry in entries]
+        existing = {
+            row.run_name: row
+            for row in db.query(models.RunCatalogEntry).filter(models.RunCatalogEntry.run_name.in_(names))
+        }
+        for entry in entries:
+            row = existing.get(entry["run_name"])
+            if row is None:
+                db.add(models.RunCatalogEntry(**entry, scanned_at=scanned_at, discovered_at=scanned_at))
+            else:
+                for field, value in entry.items():
+                    setattr(row, field, value)
+                row.scanned_at = scanned_at
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+
+def delete_run_catalog_entries(db: Session, run_names) -> int:
+    """Delete the catalog entries of run_names. Returns the number deleted."""
+    names = list(run_names)
+    if not names:
+        return 0
+    try:
+        deleted = (
+            db.query(models.RunCatalogEntry)
+            .filter(models.RunCatalogEntry.run_name.in_(names))
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return deleted
+    except Exception as e:
+        db.rollback()
+        raise e
+
 # QC Metrics
 
 def create_qc_metric(db: Session, qc_metric: schemas.QCMetricCreate) -> models.QCMetric:
@@ -128,6 +308,9 @@ def create_qc_metric(db: Session, qc_metric: schemas.QCMetricCreate) -> models.Q
         db_qc_metric = models.QCMetric(
             metric_name=qc_metric.metric_name,
             metric_value=qc_metric.metric_value,
+            percentage=qc_metric.percentage,
+            section=qc_metric.section,
+            file_type=qc_metric.file_type,
             file_source=qc_metric.file_source,
             run_id=qc_metric.run_id
         )
@@ -151,6 +334,46 @@ def get_qc_metric_by_name(db: Session, run_id: int, metric_name: str) -> Optiona
         .first()
     )
 
+def query_qc_metrics(
+    db: Session,
+    file_type: Optional[str] = None,
+    metric_name: Optional[str] = None,
+    section: Optional[str] = None,
+    run_ids: Optional[list[int]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> tuple[list[models.QCMetric], Optional[str]]:
+    """
+    Get QC metrics across runs, e.g. one parameter of one file type for the
+    whole cohort, ordered by (run_id, id). Keyset-paginated when limit is
+    set, like list_runs_page: returns the rows and the cursor of the next
+    page (None on the last page).
+    """
+    query = db.query(models.QCMetric)
+    if run_ids is not None:
+        query = query.filter(models.QCMetric.run_id.in_(run_ids))
+    if file_type is not None:
+        query = query.filter(models.QCMetric.file_type == file_type)
+    if metric_name is not None:
+        query = query.filter(models.QCMetric.metric_name == metric_name)
+    if section is not None:
+        query = query.filter(models.QCMetric.section == section)
+    position = tuple_(models.QCMetric.run_id, models.QCMetric.id)
+    if cursor:
+        key = decode_run_cursor(cursor)
+        if len(key) != 2 or not all(isinstance(value, int) for value in key):
+            raise ValueError("Invalid cursor")
+        query = query.filter(position > tuple_(*key))
+    query = query.order_by(models.QCMetric.run_id, models.QCMetric.id)
+    if limit is None:
+        return query.all(), None
+
+    metrics = query.limit(limit + 1).all()
+    if len(metrics) <= limit:
+        return metrics, None
+    metrics = metrics[:limit]
+    return metrics, encode_run_cursor([metrics[-1].run_id, metrics[-1].id])
+
 def delete_qc_metric(db: Session, metric_id: int) -> bool:
     """Delete a QC metric by ID. Returns True if deleted, False if not found."""
     qc_metric = db.query(models.QCMetric).filter(models.QCMetric.id == metric_id).first()
@@ -215,13 +438,117 @@ def list_transfer_jobs(
     )
 
 
-def next_transfer_event_sequence(db: Session, job_id: str) -> int:
-    current = (
-        db.query(func.max(models.TransferEvent.sequence))
-        .filter(models.TransferEvent.job_id == job_id)
-        .scalar()
+def claim_next_transfer_job(
+    db: Session,
+    *,
+    job_types: list[models.TransferJobType],
+    worker_id: str | None = None,
+) -> Optional[models.TransferJob]:
+    """Atomically move the oldest queued job of the given types to RUNNING.
+
+    Uses ``SELECT ... FOR UPDATE SKIP LOCKED`` so concurrent workers never
+    claim the same row (SQLite ignores the locking clause).
+    """
+    try:
+        job = (
+            db.query(models.TransferJob)
+            .filter(
+                models.TransferJob.status == models.TransferJobStatus.QUEUED,
+                models.TransferJob.type.in_(job_types),
+                models.TransferJob.cancel_requested.is_(False),
+            )
+            .order_by(models.TransferJob.started_at.asc(), models.TransferJob.id.asc())
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            db.rollback()
+            return None
+        now = datetime.utcnow()
+        job.status = models.TransferJobStatus.RUNNING
+        job.started_at = now
+        job.updated_at = now
+        job.heartbeat_at = now
+        if worker_id:
+            job.worker_id = worker_id
+            job.metadata_json = {**(job.metadata_json or {}), "worker_id": worker_id}
+        db.commit()
+        db.refresh(job)
+        return job
+    except Exception:
+        db.rollback()
+        raise
+
+
+def heartbeat_transfer_job(db: Session, job_id: str, worker_id: str) -> bool:
+    """Extend the lease of a job held by worker_id. False if another worker holds it now."""
+    try:
+        updated = db.execute(
+            update(models.TransferJob)
+            .where(models.TransferJob.id == job_id, models.TransferJob.worker_id == worker_id)
+            .values(heartbeat_at=datetime.utcnow())
+        ).rowcount
+        db.commit()
+        return updated == 1
+    except Exception:
+        db.rollback()
+        raise
+
+
+def lock_expired_transfer_jobs(
+    db: Session,
+    *,
+    job_types: list[models.TransferJobType],
+    heartbeat_before: datetime,
+) -> list[models.TransferJob]:
+    """
+    RUNNING jobs claimed by a worker that has not heartbeated since
+    heartbeat_before, locked (FOR UPDATE SKIP LOCKED) until the caller
+    commits, so two workers never recover the same job.
+    """
+    return (
+        db.query(models.TransferJob)
+        .filter(
+            models.TransferJob.status == models.TransferJobStatus.RUNNING,
+            models.TransferJob.type.in_(job_types),
+            models.TransferJob.worker_id.is_not(None),
+            func.coalesce(models.TransferJob.heartbeat_at, models.TransferJob.started_at) < heartbeat_before,
+        )
+        .with_for_update(skip_locked=True)
+        .all()
     )
-    return (current or 0) + 1
+
+
+TRANSFER_EVENT_DEFAULTS = {
+    "level": models.TransferEventLevel.INFO,
+    "phase": None,
+    "bytes_done": None,
+    "bytes_total": None,
+    "rate_bps": None,
+    "metadata_json": None,
+}
+
+
+def reserve_transfer_event_sequences(db: Session, job_id: str, count: int = 1) -> int:
+    """
+    Reserve the next count event sequences of a job and return the first.
+    One UPDATE ... RETURNING on the job's counter: no read of transfer_events,
+    and concurrent writers queue on the job row instead of racing for the
+    same sequence. Also bumps the job's updated_at. Not committed.
+    """
+    last = db.execute(
+        update(models.TransferJob)
+        .where(models.TransferJob.id == job_id)
+        .values(
+            last_event_sequence=models.TransferJob.last_event_sequence + count,
+            updated_at=datetime.utcnow(),
+        )
+        .returning(models.TransferJob.last_event_sequence)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if last is None:
+        raise ValueError(f"Transfer job not found: {job_id}")
+    return last - count + 1
 
 
 def create_transfer_event(
@@ -236,26 +563,53 @@ def create_transfer_event(
     rate_bps: int | None = None,
     metadata_json: dict | None = None,
 ) -> models.TransferEvent:
-    event = models.TransferEvent(
-        job_id=job_id,
-        sequence=next_transfer_event_sequence(db, job_id),
-        message=message,
-        level=level,
-        phase=phase,
-        bytes_done=bytes_done,
-        bytes_total=bytes_total,
-        rate_bps=rate_bps,
-        metadata_json=metadata_json,
-    )
-    job = get_transfer_job(db, job_id)
-    if job:
-        job.updated_at = datetime.utcnow()
-    db.add(event)
-    db.commit()
+    try:
+        event = models.TransferEvent(
+            job_id=job_id,
+            sequence=reserve_transfer_event_sequences(db, job_id),
+            message=message,
+            level=level,
+            phase=phase,
+            bytes_done=bytes_done,
+            bytes_total=bytes_total,
+            rate_bps=rate_bps,
+            metadata_json=metadata_json,
+        )
+        db.add(event)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
     db.refresh(event)
     return event
 
 
+def create_transfer_events(db: Session, job_id: str, events: list[dict]) -> list[int]:
+    """
+    Insert many events of one job in a single statement and commit. Each dict
+    holds TransferEvent fields (message, level, phase, ...). Returns the new
+    event ids, in order.
+    """
+    if not events:
+        return []
+    try:
+        first = reserve_transfer_event_sequences(db, job_id, len(events))
+        # Same keys in every row, so the rows go out as one multi-row INSERT
+        rows = [
+            {**TRANSFER_EVENT_DEFAULTS, **event, "job_id": job_id, "sequence": first + i}
+            for i, event in enumerate(events)
+        ]
+        ids = db.execute(
+            insert(models.TransferEvent).returning(models.TransferEvent.id, sort_by_parameter_order=True),
+            rows,
+        ).scalars().all()
+        db.commit()
+        return ids
+    except Exception as e:
+        db.rollback()
+        raise e
+
+
 def list_transfer_events(db: Session, job_id: str, since: int = 0) -> list[models.TransferEvent]:
     query = db.query(models.TransferEvent).filter(models.TransferEvent.job_id == job_id)
     if since:
@@ -267,6 +621,27 @@ def count_transfer_events(db: Session, job_id: str) -> int:
     return db.query(models.TransferEvent).filter(models.TransferEvent.job_id == job_id).count()
 
 
+def latest_transfer_event_id(db: Session) -> int:
+    return db.query(func.coalesce(func.max(models.TransferEvent.id), 0)).scalar()
+
+
+def list_transfer_events_after(db: Session, after_id: int, limit: int = 1000) -> list[models.TransferEvent]:
+    """Events of every job with an id above after_id, oldest first."""
+    return (
+        db.query(models.TransferEvent)
+        .filter(models.TransferEvent.id > after_id)
+        .order_by(models.TransferEvent.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def get_transfer_jobs(db: Session, job_ids) -> list[models.TransferJob]:
+    if not job_ids:
+        return []
+    return db.query(models.TransferJob).filter(models.TransferJob.id.in_(list(job_ids))).all()
+
+
 def update_transfer_job(
     db: Session,
     job_id: str,
@@ -360,6 +735,27 @@ def delete_happy_metric(db: Session, metric_id: int) -> bool:
     return False
 
 
+def get_happy_stratified_metrics(
+    db: Session,
+    run_id: int,
+    type: Optional[str] = None,
+    filter: Optional[str] = None,
+    subset: Optional[str] = None,
+    source: Optional[str] = None,
+) -> list[models.HappyStratifiedMetric]:
+    """Get the hap.py summary/extended rows of a run, optionally narrowed to a type, filter or subset."""
+    query = db.query(models.HappyStratifiedMetric).filter(models.HappyStratifiedMetric.run_id == run_id)
+    if type is not None:
+        query = query.filter(models.HappyStratifiedMetric.type == type)
+    if filter is not None:
+        query = query.filter(models.HappyStratifiedMetric.filter == filter)
+    if subset is not None:
+        query = query.filter(models.HappyStratifiedMetric.subset == subset)
+    if source is not None:
+        query = query.filter(models.HappyStratifiedMetric.source == source)
+    return query.order_by(models.HappyStratifiedMetric.id).all()
+
+
 # Truvari Metrics
 
 def create_truvari_metric(db: Session, truvari_metric: schemas.TruvariMetricCreate) -> models.TruvariMetric:
@@ -409,3 +805,93 @@ def delete_truvari_metric(db: Session, metric_id: int) -> bool:
         db.commit()
         return True
     return False
+
+
+# Bulk metric ingestion
+
+COPY_NULL = "\\N"
+
+
+def get_run_ids(db: Session, run_names) -> dict[str, int]:
+    """Map run names to lab run IDs in a single query. Unknown names are left out."""
+    names = set(run_names)
+    if not names:
+        return {}
+    rows = db.query(models.LabRun.run_name, models.LabRun.id).filter(models.LabRun.run_name.in_(names)).all()
+    return {run_name: run_id for run_name, run_id in rows}
+
+
+def _copy_rows(db: Session, table, columns: list[str], records: list[dict]) -> None:
+    """Stream records into table with PostgreSQL COPY on the session's connection."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        writer.writerow([COPY_NULL if record.get(column) is None else record[column] for column in columns])
+    buffer.seek(0)
+    quote = db.get_bind().dialect.identifier_preparer.quote
+    statement = (
+        f"COPY {quote(table.name)} ({', '.join(quote(column) for column in columns)}) "
+        f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    )
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
+
+
+def bulk_create_metrics(db: Session, model, rows: list[dict], replace: bool = False) -> int:
+    """
+    Insert many metric rows for many runs in one transaction.
+
+    Each row holds a "run_name" and the model's column values. Run IDs are
+    resolved in one query; rows are then written with COPY on PostgreSQL and
+    a single executemany INSERT elsewhere. With replace, the existing rows of
+    every run in the batch are deleted first, in the same transaction.
+    Returns the number of rows inserted.
+    """
+    if not rows:
+        return 0
+    run_ids = get_run_ids(db, (row["run_name"] for row in rows))
+    missing = sorted({row["run_name"] for row in rows} - run_ids.keys())
+    if missing:
+        raise ValueError(f"Run ID not found for run_name(s): {', '.join(missing)}")
+    records = [
+        {**{key: value for key, value in row.items() if key != "run_name"}, "run_id": run_ids[row["run_name"]]}
+        for row in rows
+    ]
+    # Columns left out (id, server defaults) are filled in by the database.
+    columns = list(dict.fromkeys(column for record in records for column in record))
+    try:
+        if replace:
+            db.query(model).filter(model.run_id.in_(list(run_ids.values()))).delete(synchronize_session=False)
+        dialect = db.get_bind().dialect
+        if dialect.name == "postgresql" and dialect.driver == "psycopg2":
+            _copy_rows(db, model.__table__, columns, records)
+        else:
+            db.execute(insert(model.__table__), [{column: record.get(column) for column in columns} for record in records])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    return len(records)
+
+
+def bulk_create_happy_metrics(db: Session, rows: list[dict]) -> int:
+    """Replace the Happy metrics of every run in rows."""
+    return bulk_create_metrics(db, models.HappyMetric, rows, replace=True)
+
+
+def bulk_create_happy_stratified_metrics(db: Session, rows: list[dict]) -> int:
+    """Replace the hap.py summary/extended rows of every run in rows."""
+    return bulk_create_metrics(db, models.HappyStratifiedMetric, rows, replace=True)
+
+
+def bulk_create_truvari_metrics(db: Session, rows: list[dict]) -> int:
+    """Replace the Truvari metric of every run in rows (one row per run)."""
+    return bulk_create_metrics(db, models.TruvariMetric, rows, replace=True)
+
+
+def bulk_create_qc_metrics(db: Session, rows: list[dict], replace: bool = False) -> int:
+    """Insert QC metrics for many runs, optionally replacing their existing rows."""
+    return bulk_create_metrics(db, models.QCMetric, rows, replace=replace)
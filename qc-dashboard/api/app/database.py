@@ -1,3 +1,5 @@
+import select
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
@@ -19,3 +21,27 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def iter_notifications(channel: str, timeout: float, stop_event, bind=None):
+    """
+    Postgres LISTEN on channel. Yields the NOTIFY payloads received at each
+    wake-up, or [] after timeout seconds without any, until stop_event is set.
+    Uses a connection of its own, out of the pool, left in autocommit.
+    """
+    connection = (bind or engine).raw_connection()
+    connection.detach()
+    try:
+        dbapi_connection = connection.dbapi_connection
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {channel}")
+        while not stop_event.is_set():
+            payloads = []
+            if select.select([dbapi_connection], [], [], timeout) != ([], [], []):
+                dbapi_connection.poll()
+                payloads = [notification.payload for notification in dbapi_connection.notifies]
+                dbapi_connection.notifies.clear()
+            yield payloads
+    finally:
+        connection.close()
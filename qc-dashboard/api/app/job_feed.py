@@ -0,0 +1,231 @@
+"""
+Push feed of transfer job changes, served as server-sent events by
+GET /api/v1/jobs/feed.
+
+Every job_service change appends a transfer event, and on Postgres it
+NOTIFYs job_service.JOB_CHANNEL. One thread per API process LISTENs on that
+channel, reads the new events (and the jobs they belong to) once, and keeps
+them as deltas in a bounded buffer that every open stream reads from. The
+database load is one query per change per process, whatever the number of
+viewers. Without NOTIFY (SQLite) the thread polls every JOB_FEED_POLL_SECONDS.
+
+Deltas are identified by the global event id, so a client resumes with
+?since=<id> or the Last-Event-ID header that EventSource sends on reconnect;
+ids older than the buffer are read back from the database.
+
+Postgres hands out event ids when a transaction inserts, not when it
+commits, so id 9 can become visible after id 10. Deltas after such a gap are
+held back for GAP_GRACE_SECONDS, until the missing id shows up or is taken
+to belong to a transaction that rolled back.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from api.app import crud, job_service, schemas, settings
+from api.app.database import SessionLocal, iter_notifications
+
+logger = logging.getLogger(__name__)
+
+GAP_GRACE_SECONDS = 10
+HEARTBEAT_SECONDS = 15
+
+
+def _sse(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+def _delta(event, job) -> dict:
+    return {
+        "id": event.id,
+        "event": schemas.TransferEventResponse.model_validate(event).model_dump(mode="json"),
+        "job": schemas.TransferJobResponse.model_validate(job).model_dump(mode="json") if job else None,
+    }
+
+
+class JobFeed:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        buffer_size: Optional[int] = None,
+        poll_seconds: Optional[int] = None,
+        gap_grace_seconds: float = GAP_GRACE_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.buffer_size = buffer_size or settings.JOB_FEED_BUFFER_EVENTS
+        self.poll_seconds = poll_seconds or settings.JOB_FEED_POLL_SECONDS
+        self.gap_grace_seconds = gap_grace_seconds
+        self.summary: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._pull_lock = threading.Lock()
+        self._deltas: deque[dict] = deque(maxlen=self.buffer_size)
+        self._pending: dict[int, dict] = {}
+        self._head: Optional[int] = None
+        self._gap_since: Optional[float] = None
+        self._subscribers: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def head(self) -> int:
+        """Id of the last published delta."""
+        if self._head is None:
+            self.pull()
+        return self._head
+
+    def pull(self) -> int:
+        """Read new events from the database and publish them. Returns the number published."""
+        with self._pull_lock:
+            db = self.session_factory()
+            try:
+                if self._head is None:
+                    self._head = crud.latest_transfer_event_id(db)
+                    return 0
+                events = [
+                    event for event in crud.list_transfer_events_after(db, self._head, limit=self.buffer_size)
+                    if event.id not in self._pending
+                ]
+                jobs = {job.id: job for job in crud.get_transfer_jobs(db, {event.job_id for event in events})}
+                with self._lock:
+                    for event in events:
+                        self._pending[event.id] = _delta(event, jobs.get(event.job_id))
+                    published = self._publish()
+                if published:
+                    self.summary = job_service.get_job_summary(db)
+            finally:
+                db.close()
+        if published:
+            self._wake()
+        return published
+
+    def _publish(self) -> int:
+        published = 0
+        while self._pending:
+            next_id = min(self._pending)
+            if next_id != self._head + 1:
+                now = time.monotonic()
+                if self._gap_since is None:
+                    self._gap_since = now
+                if now - self._gap_since < self.gap_grace_seconds:
+                    break
+            self._gap_since = None
+            self._head = next_id
+            self._deltas.append(self._pending.pop(next_id))
+            published += 1
+        return published
+
+    def deltas_after(self, after_id: int) -> list[dict]:
+        """Published deltas with an id above after_id, from the buffer or else the database."""
+        head = self.head
+        with self._lock:
+            if after_id >= head:
+                return []
+            if self._deltas and self._deltas[0]["id"] <= after_id + 1:
+                return [delta for delta in self._deltas if delta["id"] > after_id]
+        db = self.session_factory()
+        try:
+            events = [
+                event for event in crud.list_transfer_events_after(db, after_id, limit=self.buffer_size)
+                if event.id <= head
+            ]
+            jobs = {job.id: job for job in crud.get_transfer_jobs(db, {event.job_id for event in events})}
+            return [_delta(event, jobs.get(event.job_id)) for event in events]
+        finally:
+            db.close()
+
+    def subscribe(self) -> asyncio.Event:
+        """An asyncio.Event of the running loop, set whenever deltas are published."""
+        self.start()
+        waiter = asyncio.Event()
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), waiter))
+        return waiter
+
+    def unsubscribe(self, waiter: asyncio.Event) -> None:
+        with self._lock:
+            self._subscribers = {(loop, w) for loop, w in self._subscribers if w is not waiter}
+
+    def _wake(self) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, waiter in subscribers:
+            try:
+                loop.call_soon_threadsafe(waiter.set)
+            except RuntimeError:
+                # The loop of a finished request; drop it.
+                self.unsubscribe(waiter)
+
+    async def stream(self, since: Optional[int], is_disconnected: Callable[[], Awaitable[bool]]):
+        """
+        Server-sent events: "ready" with the starting id, then one "job" event
+        per delta and a "summary" event after each batch, with comment
+        heartbeats while idle.
+        """
+        waiter = self.subscribe()
+        try:
+            cursor = since if since is not None else await asyncio.to_thread(lambda: self.head)
+            yield _sse("ready", {"id": cursor})
+            while not await is_disconnected():
+                waiter.clear()
+                deltas = await asyncio.to_thread(self.deltas_after, cursor)
+                for delta in deltas:
+                    cursor = delta["id"]
+                    yield _sse("job", delta, cursor)
+                if deltas:
+                    if self.summary is not None:
+                        yield _sse("summary", self.summary)
+                    continue
+                try:
+                    await asyncio.wait_for(waiter.wait(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(waiter)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="job-feed", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds + 1)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                db = self.session_factory()
+                try:
+                    engine = db.get_bind()
+                finally:
+                    db.close()
+                if engine.dialect.name == "postgresql":
+                    self._listen(engine)
+                else:
+                    self.pull()
+                    self._stop.wait(self.poll_seconds)
+            except Exception as e:
+                logger.warning(f"Job feed error, retrying in {self.poll_seconds}s: {e}")
+                self._stop.wait(self.poll_seconds)
+
+    def _listen(self, engine) -> None:
+        self.pull()
+        # Re-poll on timeout too: it releases deltas held behind a gap
+        for _payloads in iter_notifications(job_service.JOB_CHANNEL, self.poll_seconds, self._stop, bind=engine):
+            self.pull()
+
+
+feed = JobFeed()
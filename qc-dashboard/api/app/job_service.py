@@ -1,13 +1,30 @@
 from __future__ import annotations
 
+import json
+import logging
 import shutil
-from datetime import datetime
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from pathlib import Path
 
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
 from api.app import crud, models, settings
 
+logger = logging.getLogger(__name__)
+
+# Postgres channel notified on every job event; api.app.job_feed listens on it.
+JOB_CHANNEL = "vcbench_jobs"
+
+# update_progress estimates rate_bps over this window, and keeps at most one
+# series point per SERIES_MIN_INTERVAL_SECONDS between two writes.
+RATE_WINDOW_SECONDS = 10
+SERIES_MIN_INTERVAL_SECONDS = 0.5
+
 
 def create_job(
     db: Session,
@@ -35,6 +52,146 @@ def create_job(
     return job
 
 
+def enqueue_job(
+    db: Session,
+    *,
+    job_type: models.TransferJobType,
+    subject_id: str,
+    phase: models.TransferJobPhase | None = None,
+    source_uri: str | None = None,
+    destination_path: str | None = None,
+    metadata_json: dict | None = None,
+    message: str | None = None,
+) -> models.TransferJob:
+    job = create_job(
+        db,
+        job_type=job_type,
+        subject_id=subject_id,
+        phase=phase,
+        status=models.TransferJobStatus.QUEUED,
+        source_uri=source_uri,
+        destination_path=destination_path,
+        metadata_json=metadata_json,
+    )
+    append_event(
+        db,
+        job.id,
+        message or f"Queued {job_type.value} job for {subject_id}",
+        level=models.TransferEventLevel.INFO,
+        phase=phase,
+    )
+    return job
+
+
+def queue_job(
+    db: Session,
+    job_id: str,
+    *,
+    phase: models.TransferJobPhase | None = None,
+    metadata_json: dict | None = None,
+    message: str | None = None,
+) -> models.TransferJob:
+    """Hand an existing job (e.g. a finished upload) over to the worker queue."""
+    _forget_progress(job_id)
+    job = crud.get_transfer_job(db, job_id)
+    if not job:
+        raise ValueError(f"Transfer job not found: {job_id}")
+    job = crud.update_transfer_job(
+        db,
+        job_id,
+        status=models.TransferJobStatus.QUEUED,
+        phase=phase or job.phase,
+        metadata_json={**(job.metadata_json or {}), **(metadata_json or {})},
+    )
+    append_event(
+        db,
+        job_id,
+        message or "Queued for processing",
+        level=models.TransferEventLevel.INFO,
+        phase=job.phase,
+    )
+    return job
+
+
+def claim_job(
+    db: Session,
+    job_types: list[models.TransferJobType],
+    worker_id: str | None = None,
+) -> models.TransferJob | None:
+    job = crud.claim_next_transfer_job(db, job_types=job_types, worker_id=worker_id)
+    if job:
+        append_event(
+            db,
+            job.id,
+            f"Claimed by worker {worker_id}" if worker_id else "Claimed by worker",
+            level=models.TransferEventLevel.INFO,
+            phase=job.phase,
+        )
+    return job
+
+
+def heartbeat(db: Session, job_id: str, worker_id: str) -> bool:
+    """Extend worker_id's lease on a running job. False if the job was recovered meanwhile."""
+    return crud.heartbeat_transfer_job(db, job_id, worker_id)
+
+
+def recover_expired_jobs(
+    db: Session,
+    job_types: list[models.TransferJobType],
+    lease_seconds: int | None = None,
+    max_recoveries: int | None = None,
+) -> tuple[list[models.TransferJob], list[models.TransferJob]]:
+    """
+    Requeue the running jobs whose worker stopped heartbeating for
+    lease_seconds (killed, or its host went down). A job recovered
+    max_recoveries times is failed instead, so one that keeps killing its
+    worker does not loop forever. Returns (requeued, failed).
+    """
+    lease_seconds = settings.JOB_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    max_recoveries = settings.JOB_MAX_RECOVERIES if max_recoveries is None else max_recoveries
+    now = datetime.utcnow()
+    requeued, failed, lost_workers = [], [], {}
+    try:
+        jobs = crud.lock_expired_transfer_jobs(
+            db, job_types=job_types, heartbeat_before=now - timedelta(seconds=lease_seconds)
+        )
+        for job in jobs:
+            recoveries = (job.metadata_json or {}).get("recoveries", 0)
+            lost_workers[job.id] = job.worker_id
+            job.worker_id = None
+            job.heartbeat_at = None
+            job.updated_at = now
+            if recoveries >= max_recoveries:
+                job.status = models.TransferJobStatus.FAILED
+                job.completed_at = now
+                job.error_code = "worker_lost"
+                job.error_message = (
+                    f"Worker {lost_workers[job.id]} stopped responding (lease expired {recoveries + 1} times)"
+                )
+                failed.append(job)
+            else:
+                job.status = models.TransferJobStatus.QUEUED
+                job.metadata_json = {**(job.metadata_json or {}), "recoveries": recoveries + 1}
+                requeued.append(job)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    for job in requeued:
+        _forget_progress(job.id)
+        append_event(
+            db,
+            job.id,
+            f"Worker {lost_workers[job.id]} stopped responding; requeued",
+            level=models.TransferEventLevel.WARNING,
+            phase=job.phase,
+        )
+    for job in failed:
+        _forget_progress(job.id)
+        append_event(db, job.id, job.error_message, level=models.TransferEventLevel.ERROR, phase=job.phase)
+    return requeued, failed
+
+
 def get_job(db: Session, job_id: str) -> models.TransferJob | None:
     return crud.get_transfer_job(db, job_id)
 
@@ -72,9 +229,39 @@ def append_event(
         rate_bps=rate_bps,
         metadata_json=metadata_json,
     )
+    notify(db, event.job_id, event.id)
     return event
 
 
+def append_events(db: Session, job_id: str, events: list[dict]) -> int:
+    """
+    Append many events to a job in one INSERT and one commit, e.g. buffered
+    log lines. Each dict takes the keyword arguments of append_event
+    (message, level, phase, ...). Returns the number of events written.
+    """
+    event_ids = crud.create_transfer_events(db, job_id, events)
+    if event_ids:
+        notify(db, job_id, event_ids[-1])
+    return len(event_ids)
+
+
+def notify(db: Session, job_id: str, event_id: int) -> None:
+    """
+    NOTIFY listeners of JOB_CHANNEL that a job has a new event. A no-op on
+    databases other than Postgres, where the feed polls instead. Failures are
+    logged, not raised: the feed also re-polls, and job work must not fail on it.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    payload = json.dumps({"job_id": job_id, "event_id": event_id})
+    try:
+        db.execute(select(func.pg_notify(JOB_CHANNEL, payload)))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Could not notify {JOB_CHANNEL} for job {job_id}: {e}")
+
+
 def list_events(db: Session, job_id: str, since: int = 0) -> list[models.TransferEvent]:
     return crud.list_transfer_events(db, job_id, since=since)
 
@@ -83,6 +270,26 @@ def count_events(db: Session, job_id: str) -> int:
     return crud.count_transfer_events(db, job_id)
 
 
+@dataclass
+class _Progress:
+    """Progress of one job since it was last written to the database."""
+
+    started_at: float
+    bytes_total: int | None = None
+    flushed_at: float | None = None
+    flushed_bytes: int = 0
+    bytes_done: int = 0
+    # (time, bytes_done) samples of the last RATE_WINDOW_SECONDS, for rate_bps
+    window: deque = field(default_factory=deque)
+    # [seconds since started_at, bytes_done] points since the last flush
+    series: list = field(default_factory=list)
+
+
+_progress: dict[str, _Progress] = {}
+_progress_lock = threading.Lock()
+_clock = time.monotonic
+
+
 def update_progress(
     db: Session,
     job_id: str,
@@ -92,12 +299,70 @@ def update_progress(
     rate_bps: int | None = None,
     eta_seconds: int | None = None,
     message: str | None = None,
-) -> models.TransferJob:
-    job = crud.get_transfer_job(db, job_id)
-    if not job:
-        raise ValueError(f"Transfer job not found: {job_id}")
-
-    total = bytes_total if bytes_total is not None else job.bytes_total
+) -> models.TransferJob | None:
+    """
+    Record progress of a running job. Calls are accumulated in memory and
+    written (job row + one PROGRESS event) at most every
+    JOB_PROGRESS_FLUSH_SECONDS, unless progress moved by
+    JOB_PROGRESS_FLUSH_PERCENT, or bytes_done reached the total. The event
+    carries the samples since the previous write as metadata_json["series"].
+    rate_bps and eta_seconds default to a sliding-window estimate.
+
+    Returns the updated job when it was written, None when only accumulated.
+    """
+    now = _clock()
+    with _progress_lock:
+        progress = _progress.get(job_id)
+        if progress is None:
+            progress = _progress[job_id] = _Progress(started_at=now)
+        if bytes_total is not None:
+            progress.bytes_total = bytes_total
+        progress.bytes_done = bytes_done
+        _add_sample(progress, now, bytes_done)
+        total = progress.bytes_total
+        due = (
+            progress.flushed_at is None
+            or now - progress.flushed_at >= settings.JOB_PROGRESS_FLUSH_SECONDS
+            or bool(total and bytes_done >= total)
+            or bool(total and (bytes_done - progress.flushed_bytes) * 100 >= total * settings.JOB_PROGRESS_FLUSH_PERCENT)
+        )
+        if not due:
+            return None
+        if rate_bps is None:
+            rate_bps = _window_rate(progress)
+        series, progress.series = progress.series, []
+        first_flush = progress.flushed_at is None
+        progress.flushed_at, progress.flushed_bytes = now, bytes_done
+
+    if first_flush and total is None:
+        job = crud.get_transfer_job(db, job_id)
+        if not job:
+            raise ValueError(f"Transfer job not found: {job_id}")
+        total = progress.bytes_total = job.bytes_total
+    return _write_progress(db, job_id, bytes_done, total, rate_bps, eta_seconds, message, series)
+
+
+def _add_sample(progress: _Progress, now: float, bytes_done: int) -> None:
+    progress.window.append((now, bytes_done))
+    while len(progress.window) > 2 and now - progress.window[0][0] > RATE_WINDOW_SECONDS:
+        progress.window.popleft()
+    offset = round(now - progress.started_at, 1)
+    if progress.series and offset - progress.series[-1][0] < SERIES_MIN_INTERVAL_SECONDS:
+        progress.series[-1] = [progress.series[-1][0], bytes_done]
+    else:
+        progress.series.append([offset, bytes_done])
+
+
+def _window_rate(progress: _Progress) -> int | None:
+    if len(progress.window) < 2:
+        return None
+    (t0, b0), (t1, b1) = progress.window[0], progress.window[-1]
+    if t1 <= t0:
+        return None
+    return max(int((b1 - b0) / (t1 - t0)), 0)
+
+
+def _write_progress(db, job_id, bytes_done, total, rate_bps, eta_seconds, message, series) -> models.TransferJob:
     if eta_seconds is None and rate_bps and total:
         remaining = max(total - bytes_done, 0)
         eta_seconds = int(remaining / rate_bps) if rate_bps > 0 else None
@@ -111,19 +376,27 @@ def update_progress(
         eta_seconds=eta_seconds,
         status=models.TransferJobStatus.RUNNING,
     )
+    if not updated:
+        raise ValueError(f"Transfer job not found: {job_id}")
     append_event(
         db,
         job_id,
         message or _progress_message(bytes_done, total),
         level=models.TransferEventLevel.PROGRESS,
-        phase=updated.phase if updated else None,
+        phase=updated.phase,
         bytes_done=bytes_done,
         bytes_total=total,
         rate_bps=rate_bps,
+        metadata_json={"series": series} if len(series) > 1 else None,
     )
     return updated
 
 
+def _forget_progress(job_id: str) -> None:
+    with _progress_lock:
+        _progress.pop(job_id, None)
+
+
 def mark_phase(
     db: Session,
     job_id: str,
@@ -149,6 +422,7 @@ def mark_phase(
 
 
 def complete_job(db: Session, job_id: str, message: str = "Job completed") -> models.TransferJob:
+    _forget_progress(job_id)
     job = crud.update_transfer_job(
         db,
         job_id,
@@ -178,6 +452,7 @@ def fail_job(
     *,
     error_code: str | None = None,
 ) -> models.TransferJob:
+    _forget_progress(job_id)
     job = crud.update_transfer_job(
         db,
         job_id,
@@ -199,9 +474,14 @@ def fail_job(
 
 
 def request_cancel(db: Session, job_id: str) -> models.TransferJob:
-    job = crud.update_transfer_job(db, job_id, cancel_requested=True)
+    job = crud.get_transfer_job(db, job_id)
     if not job:
         raise ValueError(f"Transfer job not found: {job_id}")
+    values = {"cancel_requested": True}
+    if job.status == models.TransferJobStatus.QUEUED:
+        # Nothing is running yet, so workers simply never pick it up.
+        values.update(status=models.TransferJobStatus.CANCELED, completed_at=datetime.utcnow())
+    job = crud.update_transfer_job(db, job_id, **values)
     append_event(
         db,
         job_id,
@@ -216,7 +496,7 @@ def retry_job(db: Session, job_id: str) -> models.TransferJob:
     original = crud.get_transfer_job(db, job_id)
     if not original:
         raise ValueError(f"Transfer job not found: {job_id}")
-    return create_job(
+    job = create_job(
         db,
         job_type=original.type,
         subject_id=original.subject_id,
@@ -225,8 +505,16 @@ def retry_job(db: Session, job_id: str) -> models.TransferJob:
         source_uri=original.source_uri,
         destination_path=original.destination_path,
         bytes_total=original.bytes_total,
-        metadata_json={"retry_of": original.id},
+        metadata_json={**(original.metadata_json or {}), "retry_of": original.id},
+    )
+    append_event(
+        db,
+        job.id,
+        f"Queued as a retry of job {original.id}",
+        level=models.TransferEventLevel.INFO,
+        phase=job.phase,
     )
+    return job
 
 
 def get_job_summary(db: Session, data_dir: Path | None = None) -> dict:
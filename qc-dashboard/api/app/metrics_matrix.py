@@ -0,0 +1,186 @@
+"""
+Materialized metric matrices (metrics x samples) behind /api/v1/dash/data.
+
+Each file type keeps one entry per sample (the matching CSV of its processed
+run directory, with the mtime and size it was parsed at) and the JSON matrix
+built from them. A request is a dictionary lookup unless the cache is stale:
+
+- the pipeline touches settings.METRICS_MATRIX_STAMP_PATH after writing
+  processed files (touch()), and adding or removing a run directory changes
+  the mtime of PROCESSED_DIR;
+- otherwise the cache re-checks file mtimes every
+  METRICS_MATRIX_REVALIDATE_SECONDS, for files copied in by hand.
+
+A refresh only stats the run directories; files whose mtime and size are
+unchanged are not parsed again, and only the matrices of file types whose
+entries changed are rebuilt.
+"""
+
+from __future__ import annotations
+
+import csv
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from api.app import settings
+from api.tasks.parsers import read_metrics_csv
+from dash_app.config import FILE_TYPES
+
+logger = logging.getLogger(__name__)
+
+STAMP_PATH = settings.METRICS_MATRIX_STAMP_PATH
+
+
+def touch() -> None:
+    """Mark the cached matrices of every API process as stale."""
+    try:
+        STAMP_PATH.parent.mkdir(parents=True, exist_ok=True)
+        STAMP_PATH.touch()
+    except OSError as e:
+        logger.warning(f"Could not touch {STAMP_PATH}: {e}")
+
+
+def _mtime_ns(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _load_series(file_type: str, path: Path):
+    if FILE_TYPES[file_type].endswith("_metrics.csv"):
+        return read_metrics_csv(path)
+    from api.app.api_v1.endpoints.happy_metrics import map_summary_metric
+
+    with open(path, newline="") as f:
+        first_row = next(csv.DictReader(f), None)
+    if first_row is None:
+        raise ValueError("empty summary file")
+    return map_summary_metric(first_row)
+
+
+def build_matrix(data: dict) -> dict:
+    """Merge {sample: series} into the JSON payload of /dash/data, without NaN or inf."""
+    df = pd.DataFrame(data)
+    df = df.replace([np.inf, -np.inf], None)
+    df = df.where(pd.notnull(df), None)
+
+    cleaned_values = []
+    for row in df.values.tolist():
+        cleaned_row = [
+            None if (isinstance(v, float) and (pd.isna(v) or v in [np.inf, -np.inf]))
+            else v
+            for v in row
+        ]
+        cleaned_values.append(cleaned_row)
+
+    return {
+        "metrics": df.index.tolist(),
+        "samples": df.columns.tolist(),
+        "values": cleaned_values,
+    }
+
+
+@dataclass
+class _Entry:
+    path: Path
+    mtime_ns: int
+    size: int
+    series: object = None
+    error: Optional[str] = None
+
+
+class MetricsMatrixCache:
+    def __init__(self, processed_dir: Path, file_types: dict[str, str]):
+        self.processed_dir = processed_dir
+        self.file_types = file_types
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, _Entry]] = {file_type: {} for file_type in file_types}
+        self._matrices: dict[str, dict] = {}
+        self._stamp = None
+        self._checked_at = 0.0
+
+    def samples(self, file_type: str) -> list[str]:
+        """Samples whose processed run directory holds a file of file_type."""
+        self._refresh_if_stale()
+        return list(self._entries[file_type])
+
+    def matrix(self, file_type: str) -> dict:
+        """
+        The metrics x samples matrix of file_type. Raises ValueError naming the
+        file if one of them could not be parsed.
+        """
+        self._refresh_if_stale()
+        for entry in self._entries[file_type].values():
+            if entry.error is not None:
+                raise ValueError(f"Erreur de parsing pour '{entry.path}': {entry.error}")
+        return self._matrices[file_type]
+
+    def invalidate(self) -> None:
+        """Force a refresh on the next lookup (stat only; unchanged files are not re-read)."""
+        with self._lock:
+            self._stamp = None
+
+    def _refresh_if_stale(self) -> None:
+        with self._lock:
+            stamp = (_mtime_ns(STAMP_PATH), _mtime_ns(self.processed_dir))
+            expired = time.monotonic() - self._checked_at >= settings.METRICS_MATRIX_REVALIDATE_SECONDS
+            if stamp == self._stamp and not expired:
+                return
+            if not self.processed_dir.is_dir():
+                raise FileNotFoundError(f"{self.processed_dir} not found")
+            self._refresh()
+            self._stamp = stamp
+            self._checked_at = time.monotonic()
+
+    def _scan(self) -> dict[str, dict[str, Path]]:
+        found = {file_type: {} for file_type in self.file_types}
+        for run_dir in sorted(self.processed_dir.iterdir()):
+            if not run_dir.is_dir():
+                continue
+            # Strip the date prefix of "{date}_{sample}_{run}"
+            sample = run_dir.name.split("_", 1)[1] if "_" in run_dir.name else run_dir.name
+            names = [path.name for path in run_dir.iterdir()]
+            for file_type, suffix in self.file_types.items():
+                match = next((name for name in names if suffix.lower() in name.lower()), None)
+                if match is not None:
+                    found[file_type].setdefault(sample, run_dir / match)
+        return found
+
+    def _refresh(self) -> None:
+        for file_type, paths in self._scan().items():
+            previous = self._entries[file_type]
+            entries = {}
+            changed = list(previous) != sorted(paths)
+            for sample in sorted(paths):
+                path = paths[sample]
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    changed = True
+                    continue
+                entry = previous.get(sample)
+                if entry is None or (entry.path, entry.mtime_ns, entry.size) != (path, stat.st_mtime_ns, stat.st_size):
+                    entry = _Entry(path, stat.st_mtime_ns, stat.st_size)
+                    try:
+                        entry.series = _load_series(file_type, path)
+                    except Exception as e:
+                        logger.warning(f"Could not parse {path}: {e}")
+                        entry.error = str(e)
+                    changed = True
+                entries[sample] = entry
+            self._entries[file_type] = entries
+            if changed or file_type not in self._matrices:
+                self._matrices[file_type] = build_matrix(
+                    {sample: entry.series for sample, entry in entries.items() if entry.error is None}
+                )
+
+
+cache = MetricsMatrixCache(settings.PROCESSED_DIR, FILE_TYPES)
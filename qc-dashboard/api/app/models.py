@@ -1,6 +1,6 @@
 from sqlalchemy import (BigInteger, Boolean, Column, Integer, String, Float, DateTime,
                         Text, UniqueConstraint, ForeignKey, Enum as SQLAlchemyEnum,
-                        JSON)
+                        Index, JSON)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -72,6 +72,8 @@ class User(Base):
 
 class LabRun(Base):
     __tablename__ = "lab_runs"
+    # Keyset pagination of GET /runs by creation time (crud.list_runs_page)
+    __table_args__ = (Index("ix_lab_runs_created_at_run_name", "created_at", "run_name"),)
     id = Column(Integer, primary_key=True, index=True)
     run_name = Column(String, unique=True, index=True, nullable=False)
     status = Column(SQLAlchemyEnum(RunStatus), nullable=False, default=RunStatus.PENDING_PROCESSING)
@@ -89,6 +91,9 @@ class LabRun(Base):
     # Relations
     qc_metrics = relationship("QCMetric", back_populates="run", cascade="all, delete-orphan")
     happy_metrics = relationship("HappyMetric", back_populates="run", cascade="all, delete-orphan")
+    happy_stratified_metrics = relationship(
+        "HappyStratifiedMetric", back_populates="run", cascade="all, delete-orphan"
+    )
     truvari_metrics = relationship("TruvariMetric", back_populates="run", cascade="all, delete-orphan")
 
 
@@ -136,6 +141,13 @@ class TransferJob(Base):
     error_code = Column(String, nullable=True)
     error_message = Column(Text, nullable=True)
     cancel_requested = Column(Boolean, nullable=False, default=False)
+    # Lease of a job claimed by a pipeline worker: the worker heartbeats while
+    # it runs the job, and a RUNNING job whose heartbeat is older than
+    # JOB_LEASE_SECONDS is requeued (job_service.recover_expired_jobs).
+    worker_id = Column(String, nullable=True, index=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    # Sequence of the job's last event; incremented by UPDATE ... RETURNING
+    last_event_sequence = Column(Integer, nullable=False, default=0, server_default="0")
     metadata_json = Column("metadata", JSON, nullable=True)
 
     events = relationship(
@@ -178,11 +190,47 @@ class TransferEvent(Base):
 
     job = relationship("TransferJob", back_populates="events")
 
+class RunCatalogEntry(Base):
+    """
+    Where a run lives on disk and which benchmark outputs it has, so listing
+    runs doesn't walk data/lab_runs and data/processed (see api.tasks.run_catalog).
+    """
+    __tablename__ = "run_catalog"
+    __table_args__ = (Index("ix_run_catalog_discovered_at_run_name", "discovered_at", "run_name"),)
+    id = Column(Integer, primary_key=True, index=True)
+    run_name = Column(String, unique=True, index=True, nullable=False)
+    lab_dir = Column(String, nullable=True)
+    processed_dir = Column(String, nullable=True)
+    date_prefix = Column(String, nullable=True)
+    has_happy = Column(Boolean, nullable=False, default=False)
+    has_stratified = Column(Boolean, nullable=False, default=False)
+    has_truvari = Column(Boolean, nullable=False, default=False)
+    has_csv = Column(Boolean, nullable=False, default=False)
+    scanned_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # When the run was first catalogued; never updated, so it is a stable sort key
+    discovered_at = Column(DateTime, nullable=False, server_default=func.now())
+
+class RunCatalogRescan(Base):
+    """
+    One row: when the run catalog was last rebuilt from the filesystem.
+    Single-run refreshes don't move it, so it dates what a rescan has seen.
+    """
+    __tablename__ = "run_catalog_rescan"
+    id = Column(Integer, primary_key=True)
+    rescanned_at = Column(DateTime, nullable=False)
+
 class QCMetric(Base):
+    """One parameter of a reformatted DRAGEN CSV (long format)."""
     __tablename__ = "qc_metrics"
+    __table_args__ = (
+        Index("ix_qc_metrics_lookup", "run_id", "file_type", "metric_name"),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    metric_name = Column(String, index=True, nullable=True)
+    metric_name = Column(String, index=True, nullable=True) # DRAGEN parameter
     metric_value = Column(Float, nullable=True)
+    percentage = Column(Float, nullable=True)
+    section = Column(String, nullable=True) # ex: 'VARIANT CALLER POSTFILTER'
+    file_type = Column(String, index=True, nullable=True) # ex: 'mapping_metrics'
     file_source = Column(String, nullable=False) # ex: 'mapping_metrics.csv'
     
     run_id = Column(Integer, ForeignKey("lab_runs.id", ondelete="CASCADE"))
@@ -214,6 +262,42 @@ class HappyMetric(Base):
     run = relationship("LabRun", back_populates="happy_metrics")
 
 
+
+class HappyStratifiedMetric(Base):
+    """One row of a hap.py summary.csv or extended.csv (source "summary" / "extended")."""
+    __tablename__ = "happy_stratified_metrics"
+    __table_args__ = (
+        Index("ix_happy_stratified_metrics_lookup", "run_id", "type", "filter", "subset"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    subtype = Column(String, nullable=False, default="*")
+    subset = Column(String, nullable=False, default="*")
+    filter = Column(String, nullable=False)
+    genotype = Column(String, nullable=False, default="*")
+    truth_total = Column(BigInteger, nullable=True)
+    truth_tp = Column(BigInteger, nullable=True)
+    truth_fn = Column(BigInteger, nullable=True)
+    query_total = Column(BigInteger, nullable=True)
+    query_fp = Column(BigInteger, nullable=True)
+    query_unk = Column(BigInteger, nullable=True)
+    fp_gt = Column(Float, nullable=True)
+    fp_al = Column(Float, nullable=True)
+    metric_recall = Column(Float, nullable=True)
+    metric_precision = Column(Float, nullable=True)
+    metric_frac_na = Column(Float, nullable=True)
+    metric_f1_score = Column(Float, nullable=True)
+    truth_titv_ratio = Column(Float, nullable=True)
+    query_titv_ratio = Column(Float, nullable=True)
+    truth_het_hom_ratio = Column(Float, nullable=True)
+    query_het_hom_ratio = Column(Float, nullable=True)
+    subset_size = Column(BigInteger, nullable=True)
+    subset_is_conf_size = Column(BigInteger, nullable=True)
+
+    run_id = Column(Integer, ForeignKey("lab_runs.id", ondelete="CASCADE"), nullable=False)
+    run = relationship("LabRun", back_populates="happy_stratified_metrics")
+
 class TruvariMetric(Base):
     __tablename__ = "truvari_metrics"
     __table_args__ = (UniqueConstraint("run_id", name="unique_run_truvari"),)
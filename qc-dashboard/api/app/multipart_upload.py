@@ -0,0 +1,244 @@
+"""
+Multipart form parsing straight from the ASGI receive stream.
+
+FastAPI's UploadFile is backed by a temporary file that Starlette fills with
+the whole request body before the endpoint runs, so a large archive is
+written to disk twice before it is even extracted. receive_upload parses
+the body with python-multipart as it arrives and writes the file part
+directly to its destination, hashing it on the way (api.tasks.digests) and
+stopping as soon as it exceeds MAX_UPLOAD_BYTES.
+
+Parsing, hashing and writing run in a worker thread (stream_to_thread), on
+batches of the body, so the event loop only receives.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from fastapi import HTTPException, Request
+
+from api.app import settings
+from api.tasks import digests
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Plain form fields are small; anything bigger is not one of ours.
+MAX_FIELD_BYTES = 64 * 1024
+# Request body handed to the worker thread at a time
+BATCH_BYTES = 1024 * 1024
+
+
+@dataclass
+class ReceivedUpload:
+    filename: Optional[str] = None
+    path: Optional[Path] = None
+    size: int = 0
+    hexdigests: dict[str, str] = field(default_factory=dict)
+    fields: dict[str, str] = field(default_factory=dict)
+
+
+def multipart_body(fields: dict[str, str], file_field: str = "file") -> dict:
+    """openapi_extra documenting a form that the endpoint reads itself with receive_upload."""
+    properties = {name: {"type": "string", "description": description} for name, description in fields.items()}
+    properties[file_field] = {"type": "string", "format": "binary"}
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"multipart/form-data": {"schema": {"type": "object", "properties": properties, "required": [file_field]}}},
+        }
+    }
+
+
+async def stream_to_thread(
+    request: Request, consume: Callable[[bytes], None], batch_bytes: Optional[int] = None
+) -> None:
+    """
+    Pass the request body to consume(data) in a worker thread, in batches of
+    about batch_bytes, receiving the next batch while the previous one is
+    consumed. Returns once every batch is consumed; consume's exceptions
+    propagate, after any batch in progress has finished.
+    """
+    batch_bytes = batch_bytes if batch_bytes is not None else BATCH_BYTES
+    pending: Optional[asyncio.Future] = None
+    batch: list[bytes] = []
+    batch_size = 0
+    try:
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            batch.append(chunk)
+            batch_size += len(chunk)
+            if batch_size >= batch_bytes:
+                if pending is not None:
+                    await pending
+                pending = asyncio.ensure_future(asyncio.to_thread(consume, b"".join(batch)))
+                batch, batch_size = [], 0
+        if pending is not None:
+            await pending
+            pending = None
+        if batch:
+            await asyncio.to_thread(consume, b"".join(batch))
+    finally:
+        if pending is not None and not pending.done():
+            # The thread cannot be interrupted; let it finish before the caller cleans up
+            await asyncio.gather(pending, return_exceptions=True)
+
+
+def form_bool(value: Optional[str], default: bool) -> bool:
+    """Read a boolean form field the way FastAPI's Form(bool) does."""
+    if value is None or value == "":
+        return default
+    if value.lower() in ("1", "true", "on", "yes"):
+        return True
+    if value.lower() in ("0", "false", "off", "no"):
+        return False
+    raise HTTPException(status_code=422, detail=f"Not a boolean: {value}")
+
+
+class _FormReceiver:
+    def __init__(
+        self, boundary: bytes, file_field: str, open_destination: Callable[[str, dict[str, str]], Path], max_bytes: int
+    ):
+        self.file_field = file_field
+        self.open_destination = open_destination
+        self.max_bytes = max_bytes
+        self.upload = ReceivedUpload()
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: dict[bytes, bytes] = {}
+        self._name: Optional[str] = None
+        self._value = bytearray()
+        self._out = None
+        self._writer: Optional[digests.HashingWriter] = None
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def _part_begin(self) -> None:
+        self._headers = {}
+        self._name = None
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _headers_finished(self) -> None:
+        _disposition, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("latin-1")
+        if self._name != self.file_field:
+            return
+        if self.upload.path is not None:
+            raise HTTPException(status_code=400, detail=f"Only one '{self.file_field}' part is accepted")
+        filename = options.get(b"filename", b"").decode("utf-8", errors="replace")
+        path = self.open_destination(filename, dict(self.upload.fields))
+        self.upload.filename = filename
+        self.upload.path = path
+        self._out = open(path, "wb")
+        self._writer = digests.HashingWriter(self._out)
+
+    def _part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._writer is not None and self._name == self.file_field:
+            self.upload.size += end - start
+            if self.upload.size > self.max_bytes:
+                raise HTTPException(status_code=413, detail="Upload exceeds configured size limit")
+            self._writer.write(data[start:end])
+        else:
+            self._value += data[start:end]
+            if len(self._value) > MAX_FIELD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Form field '{self._name}' is too large")
+
+    def _part_end(self) -> None:
+        if self._name == self.file_field and self._writer is not None:
+            self.upload.hexdigests = self._writer.hexdigests()
+            self.close()
+        elif self._name:
+            self.upload.fields[self._name] = self._value.decode("utf-8", errors="replace")
+
+    def flush(self) -> None:
+        if self._out is not None:
+            self._out.flush()
+
+    def feed(
+        self,
+        data: bytes,
+        on_progress: Optional[Callable[[int], None]],
+        flush_when: Optional[Callable[[], bool]],
+    ) -> None:
+        self.parser.write(data)
+        if on_progress is not None and self.upload.size:
+            if flush_when is not None and flush_when():
+                self.flush()
+            on_progress(self.upload.size)
+
+    def close(self) -> None:
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+
+async def receive_upload(
+    request: Request,
+    open_destination: Callable[[str, dict[str, str]], Path],
+    on_progress: Optional[Callable[[int], None]] = None,
+    file_field: str = "file",
+    max_bytes: Optional[int] = None,
+    flush_when: Optional[Callable[[], bool]] = None,
+) -> ReceivedUpload:
+    """
+    Read a multipart/form-data request, writing its file part where
+    open_destination(filename, fields) says, fields being the form fields
+    that came before the file (it may raise HTTPException to refuse the
+    upload). on_progress(bytes_received) is called as the file arrives; when
+    flush_when() is true the bytes are flushed to the file first, for a
+    reader of the partial file. Both callbacks and open_destination run in
+    the worker thread. The partial file is removed if anything fails.
+    """
+    max_bytes = max_bytes if max_bytes is not None else settings.MAX_UPLOAD_BYTES
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MAX_FIELD_BYTES:
+        raise HTTPException(status_code=413, detail="Upload exceeds configured size limit")
+
+    receiver = _FormReceiver(options[b"boundary"], file_field, open_destination, max_bytes)
+    try:
+        await stream_to_thread(request, lambda data: receiver.feed(data, on_progress, flush_when))
+        receiver.parser.finalize()
+        if receiver.upload.path is None:
+            raise HTTPException(status_code=400, detail=f"Missing '{file_field}' part")
+        if not receiver.upload.hexdigests:
+            raise HTTPException(status_code=400, detail="Upload body ended before the file was complete")
+    except BaseException:
+        receiver.close()
+        if receiver.upload.path is not None:
+            receiver.upload.path.unlink(missing_ok=True)
+        raise
+
+    try:
+        digests.store(receiver.upload.path, receiver.upload.hexdigests)
+    except OSError as e:
+        logger.warning(f"Could not cache digests for {receiver.upload.path}: {e}")
+    return receiver.upload
@@ -60,6 +60,9 @@ class LabRunUpdate(BaseModel):
 class QCMetricBase(BaseModel):
     metric_name: Optional[str] = None
     metric_value: Optional[float] = None
+    percentage: Optional[float] = None
+    section: Optional[str] = None
+    file_type: Optional[str] = None
     file_source: str
     run_id: int
 
@@ -105,6 +108,38 @@ class HappyMetricResponse(HappyMetricBase):
         from_attributes = True
 
 
+class HappyStratifiedMetricResponse(BaseModel):
+    id: int
+    run_id: int
+    source: str
+    type: str
+    subtype: str
+    subset: str
+    filter: str
+    genotype: str
+    truth_total: Optional[int] = None
+    truth_tp: Optional[int] = None
+    truth_fn: Optional[int] = None
+    query_total: Optional[int] = None
+    query_fp: Optional[int] = None
+    query_unk: Optional[int] = None
+    fp_gt: Optional[float] = None
+    fp_al: Optional[float] = None
+    metric_recall: Optional[float] = None
+    metric_precision: Optional[float] = None
+    metric_frac_na: Optional[float] = None
+    metric_f1_score: Optional[float] = None
+    truth_titv_ratio: Optional[float] = None
+    query_titv_ratio: Optional[float] = None
+    truth_het_hom_ratio: Optional[float] = None
+    query_het_hom_ratio: Optional[float] = None
+    subset_size: Optional[int] = None
+    subset_is_conf_size: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
 # Truvari Metric
 
 class TruvariMetricBase(BaseModel):
@@ -159,6 +194,8 @@ class TransferJobResponse(TransferJobBase):
     started_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    worker_id: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -7,6 +7,7 @@ DATA_DIR = PROJECT_ROOT / "data"
 LAB_RUNS_DIR = DATA_DIR / "lab_runs"
 PROCESSED_DIR = DATA_DIR / "processed"
 REFERENCE_DIR = DATA_DIR / "reference"
+REFERENCE_CACHE_DIR = REFERENCE_DIR / ".cache"
 TMP_DIR = PROJECT_ROOT / "qc-dashboard" / "api" / "app" / "tmp"
 UPLOAD_DIR = TMP_DIR / "uploads"
 AWS_DOWNLOAD_SCRIPT = PROJECT_ROOT / "script" / "aws_download_gvcf.sh"
@@ -44,3 +45,92 @@ AWS_PROFILE = os.getenv("AWS_PROFILE", "vitalite")
 MAX_UPLOAD_BYTES = _int_env("VCBENCH_MAX_UPLOAD_BYTES", 20 * 1024 * 1024 * 1024)
 MAX_ZIP_MEMBERS = _int_env("VCBENCH_MAX_ZIP_MEMBERS", 5000)
 MAX_EXTRACTED_BYTES = _int_env("VCBENCH_MAX_EXTRACTED_BYTES", 100 * 1024 * 1024 * 1024)
+# Threads decompressing the members of an uploaded archive in parallel
+EXTRACT_WORKERS = _int_env("VCBENCH_EXTRACT_WORKERS", 4)
+# Chunk size of resumable uploads (/upload/sessions); a dropped connection
+# costs at most the chunks in flight.
+UPLOAD_CHUNK_BYTES = _int_env("VCBENCH_UPLOAD_CHUNK_BYTES", 16 * 1024 * 1024)
+# Upload sessions that receive no chunk for this long are failed and their
+# preallocated .part file removed by the pipeline workers.
+UPLOAD_SESSION_TTL_SECONDS = _int_env("VCBENCH_UPLOAD_SESSION_TTL_SECONDS", 24 * 3600)
+
+# Pipeline workers (python -m api.tasks.worker) claim queued jobs from the
+# transfer_jobs table; each worker process runs one job at a time.
+PIPELINE_WORKERS = _int_env("VCBENCH_PIPELINE_WORKERS", 2)
+WORKER_POLL_SECONDS = _int_env("VCBENCH_WORKER_POLL_SECONDS", 5)
+# How often each worker runs housekeeping (recovering jobs of dead workers,
+# expiring idle upload sessions).
+WORKER_MAINTENANCE_SECONDS = _int_env("VCBENCH_WORKER_MAINTENANCE_SECONDS", 300)
+# A worker heartbeats the job it runs every JOB_HEARTBEAT_SECONDS. A RUNNING
+# job without a heartbeat for JOB_LEASE_SECONDS (worker OOM-killed, host
+# restarted) is requeued, at most JOB_MAX_RECOVERIES times, then failed.
+JOB_HEARTBEAT_SECONDS = _int_env("VCBENCH_JOB_HEARTBEAT_SECONDS", 30)
+JOB_LEASE_SECONDS = _int_env("VCBENCH_JOB_LEASE_SECONDS", 300)
+JOB_MAX_RECOVERIES = _int_env("VCBENCH_JOB_MAX_RECOVERIES", 2)
+
+# Total CPU/memory budget for one run_pipeline call. hap.py and Truvari run
+# concurrently and split it; the names match the knobs of pipeline/happy.sh.
+PIPELINE_CPUS = _int_env("HAPPY_CPUS", 6)
+PIPELINE_MEMORY = os.getenv("HAPPY_MEMORY", "48g")
+TRUVARI_CPUS = _int_env("TRUVARI_CPUS", 1)
+TRUVARI_MEMORY = os.getenv("TRUVARI_MEMORY", "8g")
+# hap.py can run as parallel invocations over groups of whole contigs,
+# balanced by confident bases, whose summary/extended tables are merged
+# exactly. 1 runs a single hap.py over the whole genome.
+HAPPY_SHARDS = _int_env("VCBENCH_HAPPY_SHARDS", 1)
+# Same for truvari bench, split by included bases; the shards' summary.json
+# counters are added up and precision/recall/F1 recomputed from them.
+TRUVARI_SHARDS = _int_env("VCBENCH_TRUVARI_SHARDS", 1)
+
+# Digests of run and reference files, keyed by path + size + mtime, so a file
+# is hashed once (ideally while it is being written) and later checks are lookups.
+DIGEST_CACHE_PATH = DATA_DIR / ".digests.json"
+DIGEST_WORKERS = _int_env("VCBENCH_DIGEST_WORKERS", 2)
+
+# /api/v1/dash/data serves metric matrices cached in memory. The pipeline
+# touches the stamp file when it writes processed files; without a touch the
+# cache still re-checks file mtimes every METRICS_MATRIX_REVALIDATE_SECONDS.
+METRICS_MATRIX_STAMP_PATH = DATA_DIR / ".metrics_matrix.stamp"
+METRICS_MATRIX_REVALIDATE_SECONDS = _int_env("VCBENCH_METRICS_MATRIX_REVALIDATE_SECONDS", 30)
+
+# python -m api.tasks.run_catalog watch follows inotify events; NFS mounts
+# raise none for writes made on other hosts, so poll there instead.
+CATALOG_WATCH_POLLING = _bool_env("VCBENCH_CATALOG_WATCH_POLLING", default=False)
+
+# GET /api/v1/jobs/feed streams job events to the monitoring page. Each API
+# process reads new events once per change (Postgres LISTEN/NOTIFY) and fans
+# them out to every open tab; JOB_FEED_POLL_SECONDS is the re-poll interval,
+# the only update path on databases without NOTIFY. The last
+# JOB_FEED_BUFFER_EVENTS events are kept in memory for clients that resume.
+JOB_FEED_POLL_SECONDS = _int_env("VCBENCH_JOB_FEED_POLL_SECONDS", 5)
+JOB_FEED_BUFFER_EVENTS = _int_env("VCBENCH_JOB_FEED_BUFFER_EVENTS", 1000)
+
+# job_service.update_progress writes a job's progress at most every
+# JOB_PROGRESS_FLUSH_SECONDS, or sooner once it moved by JOB_PROGRESS_FLUSH_PERCENT.
+JOB_PROGRESS_FLUSH_SECONDS = _int_env("VCBENCH_JOB_PROGRESS_FLUSH_SECONDS", 2)
+JOB_PROGRESS_FLUSH_PERCENT = _int_env("VCBENCH_JOB_PROGRESS_FLUSH_PERCENT", 5)
+
+# Live logs of AWS imports (api/app/websocket.py). Each sample keeps its last
+# LOG_BUFFER_LINES lines; each WebSocket client gets a send queue of
+# LOG_SEND_QUEUE_SIZE lines, and a client that falls behind has its oldest
+# queued lines dropped ("drop") or is disconnected ("disconnect"). With
+# LOG_HUB_BACKEND "postgres" (the default on a Postgres DATABASE_URL) lines
+# are relayed through NOTIFY, so any API worker can serve any sample.
+LOG_HUB_BACKEND = os.getenv("VCBENCH_LOG_HUB_BACKEND", "auto")
+LOG_BUFFER_LINES = _int_env("VCBENCH_LOG_BUFFER_LINES", 5000)
+LOG_SEND_QUEUE_SIZE = _int_env("VCBENCH_LOG_SEND_QUEUE_SIZE", 1000)
+LOG_SLOW_CONSUMER_POLICY = os.getenv("VCBENCH_LOG_SLOW_CONSUMER_POLICY", "drop")
+
+# AWS imports download with api.tasks.s3_download when boto3 is installed,
+# else with script/aws_download_gvcf.sh. Objects are fetched as ranged GETs
+# of S3_PART_SIZE_MB over S3_DOWNLOAD_WORKERS threads; VCBENCH_S3_ENDPOINT_URL
+# points the downloader at an S3 stand-in such as MinIO.
+AWS_BUCKET = os.getenv("VCBENCH_AWS_BUCKET", "cac1-emg-prd-s3-auto-results")
+AWS_BASE_PATH = os.getenv("VCBENCH_AWS_BASE_PATH", "vitalite-genmol_6cb572b1-386c-3305-82ab-f05a82a5233a")
+S3_ENDPOINT_URL = os.getenv("VCBENCH_S3_ENDPOINT_URL") or None
+S3_DOWNLOAD_WORKERS = _int_env("VCBENCH_S3_DOWNLOAD_WORKERS", 8)
+S3_PART_SIZE = _int_env("VCBENCH_S3_PART_SIZE_MB", 64) * 1024 * 1024
+# Shared by every AWS import of an API process (single or batch): objects
+# downloading at once, and their aggregate rate in MB/s (0 = unlimited).
+S3_MAX_CONCURRENT_OBJECTS = _int_env("VCBENCH_S3_MAX_CONCURRENT_OBJECTS", 4)
+S3_MAX_BYTES_PER_SECOND = _int_env("VCBENCH_S3_MAX_MB_PER_SECOND", 0) * 1024 * 1024
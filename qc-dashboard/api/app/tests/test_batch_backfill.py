@@ -0,0 +1,69 @@
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+from api.tasks import batch
+
+
+class BatchBackfillTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.lab_runs = Path(self._tmpdir.name)
+        for name in ["HG002_R001", "HG002_Lib2_R002", "NA24143_Lib3_Rep1_R001", "notes"]:
+            (self.lab_runs / name).mkdir()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _record(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def _run_batch(self, run_names, failing_sample=None):
+        def prepare(sample, happy, truvari):
+            self._record(("reference", sample))
+            if sample == failing_sample:
+                raise FileNotFoundError("truth set missing")
+
+        def benchmark(run_name, options):
+            self._record(("run", run_name))
+            return batch.RunResult(run_name, True, 1.0, input_bytes=1024)
+
+        with patch.object(batch, "ProcessPoolExecutor", lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)), \
+                patch.object(batch, "prepare_references", prepare), \
+                patch.object(batch, "_benchmark_run", benchmark):
+            return batch.run_batch(run_names, workers=2, happy=True)
+
+    def test_resolve_runs_expands_globs_and_skips_invalid_names(self):
+        with patch.object(batch, "LAB_RUN_DIR", self.lab_runs):
+            runs = batch.resolve_runs(["HG002_*", "NA24143_Lib3_Rep1_R001", "HG002_R001", "note*"])
+        self.assertEqual(runs, ["HG002_Lib2_R002", "HG002_R001", "NA24143_Lib3_Rep1_R001"])
+
+    def test_references_are_prepared_once_per_base_sample_before_its_runs(self):
+        summary = self._run_batch(["HG002_R001", "HG002_Lib2_R002", "NA24143_Lib3_Rep1_R001"])
+
+        references = [event for event in self.events if event[0] == "reference"]
+        self.assertEqual(len(references), 2)
+        for run_name, base in [("HG002_R001", "HG002"), ("NA24143_Lib3_Rep1_R001", "NA24143")]:
+            reference_index = next(i for i, event in enumerate(self.events)
+                                   if event[0] == "reference" and event[1].startswith(base))
+            self.assertLess(reference_index, self.events.index(("run", run_name)))
+        self.assertEqual(len(summary.succeeded), 3)
+        self.assertIn("3 succeeded, 0 failed", summary.format())
+
+    def test_reference_failure_fails_only_that_sample(self):
+        summary = self._run_batch(["HG002_R001", "NA24143_Lib3_Rep1_R001"], failing_sample="NA24143_Lib3_Rep1")
+
+        self.assertEqual([result.run_name for result in summary.succeeded], ["HG002_R001"])
+        self.assertEqual([result.run_name for result in summary.failed], ["NA24143_Lib3_Rep1_R001"])
+        self.assertNotIn(("run", "NA24143_Lib3_Rep1_R001"), self.events)
+        self.assertIn("truth set missing", summary.format())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from api.app import crud, models, schemas
+from api.app.database import Base
+
+
+def _happy_row(run_name, type_="SNP", filter_="ALL", tp=90):
+    return {
+        "run_name": run_name, "type": type_, "filter": filter_,
+        "truth_total": 100, "truth_tp": tp, "truth_fn": 100 - tp,
+        "query_total": 95, "query_fp": 5, "query_unk": 0,
+        "fp_gt": 1.0, "fp_al": 0.0, "metric_recall": tp / 100, "metric_precision": 0.95,
+        "metric_frac_na": 0.0, "metric_f1_score": 0.92, "truth_titv_ratio": 2.1,
+        "query_titv_ratio": 2.0, "truth_het_hom_ratio": 1.5, "query_het_hom_ratio": 1.4,
+    }
+
+
+class BulkMetricIngestionTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{Path(self._tmpdir.name) / 'test.db'}")
+        self.Session = sessionmaker(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+        self.db = self.Session()
+        self.run_ids = {}
+        for name in ["HG002_R001", "HG002_R002"]:
+            lab_run = schemas.LabRunCreate(run_name=name, status=models.RunStatus.PENDING_PROCESSING)
+            self.run_ids[name] = crud.create_lab_run(self.db, lab_run).id
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._count)
+
+    def tearDown(self):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+        self.db.close()
+        Base.metadata.drop_all(bind=self.engine)
+        self._tmpdir.cleanup()
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement.split()[0].upper())
+
+    def test_rows_for_many_runs_are_inserted_with_one_statement(self):
+        rows = [
+            _happy_row(run_name, type_, filter_)
+            for run_name in self.run_ids
+            for type_ in ["SNP", "INDEL"]
+            for filter_ in ["ALL", "PASS"]
+        ]
+        self.assertEqual(crud.bulk_create_happy_metrics(self.db, rows), 8)
+
+        self.assertEqual(self.statements.count("SELECT"), 1)
+        self.assertEqual(self.statements.count("INSERT"), 1)
+        for run_id in self.run_ids.values():
+            self.assertEqual(len(crud.get_happy_metrics(self.db, run_id)), 4)
+
+    def test_replace_swaps_rows_only_for_runs_in_the_batch(self):
+        crud.bulk_create_happy_metrics(self.db, [_happy_row(name) for name in self.run_ids])
+        crud.bulk_create_happy_metrics(self.db, [_happy_row("HG002_R001", tp=99)])
+
+        [metric] = crud.get_happy_metrics(self.db, self.run_ids["HG002_R001"])
+        self.assertEqual(metric.truth_tp, 99)
+        self.assertEqual(len(crud.get_happy_metrics(self.db, self.run_ids["HG002_R002"])), 1)
+
+    def test_unknown_run_rejects_the_whole_batch(self):
+        rows = [{"run_name": "HG002_R001", "metric_name": None, "metric_value": None, "file_source": "a.csv"},
+                {"run_name": "HG002_R404", "metric_name": None, "metric_value": None, "file_source": "b.csv"}]
+        with self.assertRaisesRegex(ValueError, "HG002_R404"):
+            crud.bulk_create_qc_metrics(self.db, rows)
+        self.assertEqual(crud.get_qc_metrics(self.db, self.run_ids["HG002_R001"]), [])
+
+    def test_truvari_rows_keep_one_row_per_run(self):
+        row = {
+            "run_name": "HG002_R001", "tp_base": 10, "tp_comp": 10, "fp": 1, "fn": 2,
+            "precision": 0.9, "recall": 0.8, "f1": 0.85, "base_cnt": 12, "comp_cnt": 11,
+            "gt_concordance": 1.0, "tp_comp_tp_gt": 10, "tp_comp_fp_gt": 0,
+            "tp_base_tp_gt": 10, "tp_base_fp_gt": 0,
+        }
+        crud.bulk_create_truvari_metrics(self.db, [row])
+        crud.bulk_create_truvari_metrics(self.db, [{**row, "fp": 3}])
+
+        [metric] = crud.get_truvari_metrics(self.db, self.run_ids["HG002_R001"])
+        self.assertEqual(metric.fp, 3)
+        self.assertIsNotNone(metric.created_at)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+from concurrent.futures import Future
+from pathlib import Path
+from unittest.mock import patch
+
+from api.tasks import digests, upload_run
+
+
+class DigestCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        self.original_cache_path = digests.CACHE_PATH
+        digests.CACHE_PATH = self.tmp_path / ".digests.json"
+        self.gvcf = self.tmp_path / "HG002.gvcf.gz"
+        self.content = os.urandom(3 * 1024 * 1024)
+        self.gvcf.write_bytes(self.content)
+
+    def tearDown(self):
+        digests.CACHE_PATH = self.original_cache_path
+        self._tmpdir.cleanup()
+
+    def test_digest_is_hashed_once_then_looked_up(self):
+        with patch.object(digests, "CHUNK_SIZE", 1024 * 1024), \
+                patch("api.tasks.digests.compute", wraps=digests.compute) as compute:
+            self.assertEqual(digests.digest(self.gvcf, "md5"), hashlib.md5(self.content).hexdigest())
+            self.assertEqual(digests.digest(self.gvcf, "sha256"), hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(compute.call_count, 1)
+
+    def test_modified_file_is_rehashed(self):
+        digests.digest(self.gvcf)
+        self.gvcf.write_bytes(b"truncated")
+        self.assertIsNone(digests.lookup(self.gvcf, "md5"))
+        self.assertEqual(digests.digest(self.gvcf), hashlib.md5(b"truncated").hexdigest())
+
+    def test_deleted_files_are_dropped_by_prune_not_by_store(self):
+        digests.digest(self.gvcf)
+        self.gvcf.unlink()
+        other = self.tmp_path / "HG002.sv.vcf.gz"
+        other.write_bytes(b"sv")
+        digests.digest(other)
+        self.assertIn(str(self.gvcf.resolve()), digests._read_cache())
+
+        self.assertEqual(digests.prune(), 1)
+        self.assertEqual(list(digests._read_cache()), [str(other.resolve())])
+        self.assertEqual(digests.prune(), 0)
+
+    def test_concurrent_async_requests_share_one_hash_pass(self):
+        with patch("api.tasks.digests.compute", wraps=digests.compute) as compute:
+            futures = [digests.digest_async(self.gvcf, "md5") for _ in range(4)]
+            results = {future.result(timeout=10) for future in futures}
+        self.assertEqual(results, {hashlib.md5(self.content).hexdigest()})
+        self.assertEqual(compute.call_count, 1)
+
+    def test_async_request_for_a_cached_digest_resolves(self):
+        digests.digest(self.gvcf)
+
+        class InlineExecutor:
+            # The hash pass is done before add_done_callback is reached
+            def submit(self, fn, *args):
+                future = Future()
+                future.set_result(fn(*args))
+                return future
+
+        results = []
+        with patch.object(digests, "_executor", InlineExecutor()):
+            caller = threading.Thread(
+                target=lambda: results.append(digests.digest_async(self.gvcf).result(timeout=10)), daemon=True)
+            caller.start()
+            caller.join(timeout=5)
+        self.assertFalse(caller.is_alive(), "digest_async deadlocked")
+        self.assertEqual(results, [hashlib.md5(self.content).hexdigest()])
+        self.assertEqual(digests._pending, {})
+
+    def test_zip_extraction_records_digests_of_variant_files(self):
+        upload_dir = self.tmp_path / "uploads"
+        lab_runs_dir = self.tmp_path / "lab_runs"
+        upload_dir.mkdir()
+        zip_path = upload_dir / "HG002_R001.zip"
+        with zipfile.ZipFile(zip_path, "w") as archive:
+            archive.writestr("HG002_R001/HG002.gvcf.gz", self.content)
+            archive.writestr("HG002_R001/HG002.mapping_metrics.csv", "a,b\n")
+
+        with patch.object(upload_run, "TEMP_RUN_DIR", upload_dir), \
+                patch.object(upload_run, "LAB_RUN_DIR", lab_runs_dir):
+            self.assertEqual(upload_run.upload_run(zip_path), ("HG002", "R001"))
+
+        extracted = lab_runs_dir / "HG002_R001" / "HG002.gvcf.gz"
+        self.assertEqual(digests.lookup(extracted, "md5"), hashlib.md5(self.content).hexdigest())
+        self.assertIsNone(digests.lookup(lab_runs_dir / "HG002_R001" / "HG002.mapping_metrics.csv", "md5"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import gzip
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from api.tasks import gvcf_filter
+
+CONTIGS = ["chr1", "chr2", "chr3_KI270706v1_random", "chrM", "chrUn_GL000220v1", "hs38d1"]
+# Made with htslib 1.24: HG002.gvcf.gz by bgzip, HG002.chr2_hs38d1.gvcf.gz by
+# filter_contigs(HG002.gvcf.gz, ..., {"chr2", "hs38d1"}), each .tbi by tabix -p vcf.
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def _bgzip(text: str, path: Path, block_size: int) -> None:
+    # Small blocks so contig boundaries fall inside blocks and records span blocks.
+    data = text.encode()
+    with open(path, "wb") as f:
+        for start in range(0, len(data), block_size):
+            f.write(gvcf_filter.compress_block(data[start:start + block_size]))
+        f.write(gvcf_filter.BGZF_EOF)
+
+
+def _index_by_block(index_path: Path, bgzf_path: Path) -> tuple:
+    """
+    The index with its virtual offsets as (block number, offset in block), so
+    indexes of files whose recompressed blocks differ in size still compare.
+    """
+    blocks, offset = {}, 0
+    with open(bgzf_path, "rb") as f:
+        while True:
+            blocks[offset] = len(blocks)
+            _, size = gvcf_filter.read_block(f, offset)
+            if not size:
+                break
+            offset += size
+    at = lambda voffset: (blocks[voffset >> 16], voffset & 0xFFFF)
+    index = gvcf_filter.TabixIndex.read(index_path)
+    bins = [
+        {
+            bin_id: [(at(beg), at(end)) for beg, end in chunks[:1]] + chunks[1:] if bin_id == gvcf_filter.PSEUDO_BIN
+            else [(at(beg), at(end)) for beg, end in chunks]
+            for bin_id, chunks in ref_bins.items()
+        }
+        for ref_bins in index.bins
+    ]
+    return index.names, bins, [[at(voffset) for voffset in linear] for linear in index.linear], index.n_no_coor
+
+
+class GvcfFilterTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        rng = random.Random(7)
+        self.header = "##fileformat=VCFv4.2\n" + "".join(
+            f"##contig=<ID={contig}>\n" for contig in CONTIGS
+        ) + "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tHG002\n"
+        self.records = []
+        for contig in CONTIGS:
+            position = 1
+            for _ in range(rng.randint(20, 400)):
+                position += rng.randint(1, 3000)
+                if rng.random() < 0.5:
+                    info = f"END={position + rng.randint(0, 40000)}"
+                    self.records.append(f"{contig}\t{position}\t.\tA\t<NON_REF>\t.\tPASS\t{info}\tGT\t0/0\n")
+                else:
+                    self.records.append(f"{contig}\t{position}\t.\tAC\tA\t50\tPASS\tDP={rng.randint(1, 99)}\tGT\t0/1\n")
+        self.gvcf = self.tmp_path / "HG002.gvcf.gz"
+        _bgzip(self.header + "".join(self.records), self.gvcf, block_size=997)
+        gvcf_filter.index_vcf(self.gvcf)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _assert_filtered(self, keep):
+        out = self.tmp_path / "HG002.filtered.gvcf.gz"
+        gvcf_filter.filter_contigs(self.gvcf, out, keep)
+
+        expected = self.header + "".join(r for r in self.records if r.split("\t")[0] in keep)
+        self.assertEqual(gzip.decompress(out.read_bytes()).decode(), expected)
+
+        # The translated index must equal an index built from scratch on the output.
+        translated = gvcf_filter.TabixIndex.read(Path(f"{out}.tbi"))
+        rebuilt_copy = self.tmp_path / "rebuilt.gvcf.gz"
+        rebuilt_copy.write_bytes(out.read_bytes())
+        rebuilt = gvcf_filter.TabixIndex.read(gvcf_filter.index_vcf(rebuilt_copy))
+        self.assertEqual(translated.names, [c for c in CONTIGS if c in keep])
+        self.assertEqual(translated.bins, rebuilt.bins)
+        self.assertEqual(translated.linear, rebuilt.linear)
+
+    def test_keeps_header_and_wanted_contigs_in_order(self):
+        self._assert_filtered({"chr1", "chr2", "chrM"})
+
+    def test_handles_gaps_and_trailing_contigs(self):
+        self._assert_filtered({"chr2", "hs38d1"})
+        self._assert_filtered(set(CONTIGS))
+        self._assert_filtered({"absent"})
+
+    def test_whole_blocks_are_copied_without_recompression(self):
+        _bgzip(self.header + "".join(self.records), self.gvcf, block_size=gvcf_filter.BGZF_MAX_BLOCK)
+        gvcf_filter.index_vcf(self.gvcf)
+        out = self.tmp_path / "all.gvcf.gz"
+        gvcf_filter.filter_contigs(self.gvcf, out, set(CONTIGS))
+        self.assertEqual(out.read_bytes(), self.gvcf.read_bytes())
+
+
+class TabixCompatibilityTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_index_matches_tabix(self):
+        gvcf = self.tmp_path / "HG002.gvcf.gz"
+        gvcf.write_bytes((FIXTURES / "HG002.gvcf.gz").read_bytes())
+        ours = gvcf_filter.TabixIndex.read(gvcf_filter.index_vcf(gvcf))
+        tabix = gvcf_filter.TabixIndex.read(FIXTURES / "HG002.gvcf.gz.tbi")
+
+        self.assertEqual(ours.names, CONTIGS)
+        self.assertEqual(
+            (ours.names, ours.bins, ours.linear, ours.n_no_coor),
+            (tabix.names, tabix.bins, tabix.linear, tabix.n_no_coor),
+        )
+
+    def test_filtered_index_matches_tabix(self):
+        out = self.tmp_path / "HG002.chr2_hs38d1.gvcf.gz"
+        # Translated from tabix's index of the input
+        gvcf_filter.filter_contigs(FIXTURES / "HG002.gvcf.gz", out, {"chr2", "hs38d1"})
+        expected = FIXTURES / "HG002.chr2_hs38d1.gvcf.gz"
+
+        self.assertEqual(gzip.decompress(out.read_bytes()), gzip.decompress(expected.read_bytes()))
+        self.assertEqual(_index_by_block(Path(f"{out}.tbi"), out), _index_by_block(Path(f"{expected}.tbi"), expected))
+        if out.read_bytes() == expected.read_bytes():
+            tabix = gvcf_filter.TabixIndex.read(Path(f"{expected}.tbi"))
+            ours = gvcf_filter.TabixIndex.read(Path(f"{out}.tbi"))
+            self.assertEqual((ours.bins, ours.linear), (tabix.bins, tabix.linear))
+
+
+if __name__ == "__main__":
+    unittest.main()
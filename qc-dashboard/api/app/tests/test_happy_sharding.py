@@ -0,0 +1,252 @@
+import csv
+import random
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from api.app import settings
+from api.tasks import process_run, sharding
+from api.tasks.parsers import parse_happy_table
+
+CONTIGS = {"chr1": 50_000, "chr2": 40_000, "chr3": 30_000, "chr4": 20_000, "chrX": 25_000, "chrM": 1_000}
+# Stratification regions, genome-wide: hap.py does not cut them to the -R regions
+SUBSETS = {
+    "*": {contig: [(0, length)] for contig, length in CONTIGS.items()},
+    "lowmap": {contig: [(start, start + 1200) for start in range(500, length, 2500)] for contig, length in CONTIGS.items()},
+}
+SUMMARY_COLUMNS = [
+    "Type", "Filter", "TRUTH.TOTAL", "TRUTH.TP", "TRUTH.FN", "QUERY.TOTAL", "QUERY.FP", "QUERY.UNK", "FP.gt", "FP.al",
+    "METRIC.Recall", "METRIC.Precision", "METRIC.Frac_NA", "METRIC.F1_Score", "TRUTH.TOTAL.TiTv_ratio",
+    "QUERY.TOTAL.TiTv_ratio", "TRUTH.TOTAL.het_hom_ratio", "QUERY.TOTAL.het_hom_ratio",
+]
+COUNT_GROUPS = ["TRUTH.TOTAL", "TRUTH.TP", "TRUTH.FN", "QUERY.TOTAL", "QUERY.TP", "QUERY.FP", "QUERY.UNK"]
+EXTENDED_COLUMNS = [
+    "Type", "Subtype", "Subset", "Filter", "Genotype", "QQ.Field", "QQ", "METRIC.Recall", "METRIC.Precision",
+    "METRIC.Frac_NA", "METRIC.F1_Score", "FP.gt", "FP.al", "PCT.FP.ma",
+    *[f"{group}{suffix}" for group in COUNT_GROUPS
+      for suffix in ("", ".ti", ".tv", ".het", ".homalt", ".TiTv_ratio", ".het_hom_ratio")],
+    "Subset.Size", "Subset.IS_CONF.Size",
+]
+
+
+def overlap(intervals, other):
+    return sum(max(0, min(end, other_end) - max(start, other_start))
+               for start, end in intervals for other_start, other_end in other)
+
+
+def synthetic_variants(seed=7):
+    rng = random.Random(seed)
+    variants = []
+    for contig, length in CONTIGS.items():
+        for pos in sorted(rng.sample(range(1, length), length // 500)):
+            confident = contig != "chrM" and pos % 10 != 0
+            truth = rng.choice(["TP", "TP", "TP", "FN", None]) if confident else None
+            if truth == "TP":
+                query = "TP"
+            elif not confident:
+                query = "UNK"
+            else:
+                query = rng.choice(["FP", None])
+            variants.append({
+                "contig": contig,
+                "type": rng.choice(["SNP", "SNP", "INDEL"]),
+                "truth": truth,
+                "query": query,
+                "fp_kind": rng.choice(["gt", "al", None]) if query == "FP" else None,
+                "ti": rng.random() < 0.67,
+                "het": rng.random() < 0.6,
+                "lowmap": any(start <= pos < end for start, end in SUBSETS["lowmap"][contig]),
+                "pass": rng.random() < 0.9,
+            })
+    return variants
+
+
+def ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+def fake_happy(variants, contigs, confident_bed, prefix):
+    """Count variants of contigs the way hap.py reports them, independently of api.tasks.sharding."""
+    confident = {}
+    for contig, start, end in csv.reader(open(confident_bed), delimiter="\t"):
+        # Confident regions are evaluated within the -R regions only
+        if contig in contigs:
+            confident.setdefault(contig, []).append((int(start), int(end)))
+    extended, summary = [], []
+    for vtype in ("INDEL", "SNP"):
+        for vfilter in ("ALL", "PASS"):
+            for subset in ("*", "lowmap"):
+                for genotype in ("*", "het", "homalt"):
+                    counts = {f"{group}{suffix}": 0 for group in COUNT_GROUPS for suffix in ("", ".ti", ".tv", ".het", ".homalt")}
+                    counts.update({"FP.gt": 0, "FP.al": 0})
+                    for v in variants:
+                        if v["contig"] not in contigs or v["type"] != vtype:
+                            continue
+                        if (subset == "lowmap" and not v["lowmap"]) or (genotype != "*" and v["het"] != (genotype == "het")):
+                            continue
+                        filtered = vfilter == "PASS" and not v["pass"]
+                        classes = []
+                        if v["truth"]:
+                            classes += ["TRUTH.TOTAL", "TRUTH.FN" if filtered else f"TRUTH.{v['truth']}"]
+                        if v["query"] and not filtered:
+                            classes += ["QUERY.TOTAL", f"QUERY.{v['query']}"]
+                            if v["fp_kind"]:
+                                counts[f"FP.{v['fp_kind']}"] += 1
+                        for group in classes:
+                            counts[group] += 1
+                            if vtype == "SNP":
+                                counts[f"{group}.ti" if v["ti"] else f"{group}.tv"] += 1
+                            counts[f"{group}.het" if v["het"] else f"{group}.homalt"] += 1
+                    recall = ratio(counts["TRUTH.TP"], counts["TRUTH.TP"] + counts["TRUTH.FN"])
+                    precision = ratio(counts["QUERY.TP"], counts["QUERY.TP"] + counts["QUERY.FP"])
+                    row = {
+                        "Type": vtype, "Subtype": "*", "Subset": subset, "Filter": vfilter, "Genotype": genotype,
+                        "QQ.Field": "QUAL", "QQ": "*", **counts,
+                        "METRIC.Recall": recall,
+                        "METRIC.Precision": precision,
+                        "METRIC.Frac_NA": ratio(counts["QUERY.UNK"], counts["QUERY.TOTAL"]),
+                        "METRIC.F1_Score": (
+                            2 * recall * precision / (recall + precision)
+                            if recall is not None and precision is not None and recall + precision else None
+                        ),
+                        "PCT.FP.ma": ratio(100.0 * counts["FP.al"], counts["QUERY.FP"]),
+                        "Subset.Size": sum(end - start for regions in SUBSETS[subset].values() for start, end in regions),
+                        "Subset.IS_CONF.Size": sum(
+                            overlap(SUBSETS[subset][contig], regions) for contig, regions in confident.items()),
+                    }
+                    for group in COUNT_GROUPS:
+                        row[f"{group}.TiTv_ratio"] = ratio(counts[f"{group}.ti"], counts[f"{group}.tv"])
+                        row[f"{group}.het_hom_ratio"] = ratio(counts[f"{group}.het"], counts[f"{group}.homalt"])
+                    extended.append(row)
+                    if subset == "*" and genotype == "*":
+                        summary.append(row)
+    # hap.py writes its rows in key order
+    key = lambda row: tuple(row[column] for column in sharding.HAPPY_KEY_COLUMNS)
+    extended.sort(key=key)
+    summary.sort(key=lambda row: (row["Type"], row["Filter"]))
+    for path, columns, rows in ((f"{prefix}.extended.csv", EXTENDED_COLUMNS, extended),
+                                (f"{prefix}.summary.csv", SUMMARY_COLUMNS, summary)):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(["" if row[column] is None else row[column] for column in columns])
+
+
+class HappyShardingTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmpdir.name)
+        self.fai = self.root / "ref.fasta.fai"
+        self.fai.write_text("".join(f"{contig}\t{length}\t0\t60\t61\n" for contig, length in CONTIGS.items()))
+        self.bed = self.root / "confident.bed"
+        self.bed.write_text("".join(
+            f"{contig}\t{start}\t{start + 900}\n"
+            for contig, length in CONTIGS.items() if contig != "chrM"
+            for start in range(0, length - 900, 1000)
+        ))
+        self.variants = synthetic_variants()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_shards_are_balanced_groups_of_whole_contigs(self):
+        weights = {contig: sharding.confident_bases(self.bed).get(contig, 0) for contig in CONTIGS}
+        shards = sharding.plan_shards(weights, 3)
+
+        self.assertEqual(sorted(contig for shard in shards for contig in shard), sorted(CONTIGS))
+        # chrM has no confident bases but its calls still count as UNK
+        self.assertIn(["chr1", "chrM"], shards)
+        loads = [sum(weights[contig] for contig in shard) for shard in shards]
+        self.assertLessEqual(max(loads) - min(loads), max(weights.values()))
+        self.assertCountEqual(sharding.plan_shards(weights, 50), [[contig] for contig in CONTIGS])
+
+    def test_sharded_run_matches_a_whole_genome_run(self):
+        full = self.root / "full"
+        full.mkdir()
+        fake_happy(self.variants, set(CONTIGS), self.bed, full / "HG002_R001")
+
+        def run_shard(cmd, **kwargs):
+            local = lambda path: self.root / Path(path).relative_to("/wgs")
+            contigs = {line.split("\t")[0] for line in local(cmd[cmd.index("-R") + 1]).read_text().splitlines()}
+            fake_happy(self.variants, contigs, local(cmd[4]), local(cmd[6]))
+
+        out_dir = self.root / "processed"
+        out_dir.mkdir()
+        cmd = ["happy.sh", "truth.vcf.gz", "ref.sdf", "query.gvcf.gz", "/wgs/confident.bed", "ref.fasta",
+               "/wgs/processed/HG002_R001", "/wgs/processed/happy.log"]
+        with patch.object(process_run, "PROJECT_ROOT", self.root), \
+                patch.object(process_run.subprocess, "run", run_shard), \
+                patch.object(settings, "PIPELINE_CPUS", 4):
+            summary = process_run.run_happy_shards(cmd, self.bed, self.fai, out_dir / "HG002_R001", 3)
+
+        self.assertEqual(summary, out_dir / "HG002_R001.summary.csv")
+        self.assertEqual(len(list((out_dir / "happy_shards").iterdir())), 3)
+        for table, source in (("summary", "summary"), ("extended", "extended")):
+            merged = parse_happy_table(out_dir / f"HG002_R001.{table}.csv", source)
+            expected = parse_happy_table(full / f"HG002_R001.{table}.csv", source)
+            self.assertEqual(len(merged), len(expected))
+            for merged_row, expected_row in zip(merged, expected):
+                for column, value in expected_row.items():
+                    if isinstance(value, float):
+                        self.assertAlmostEqual(merged_row[column], value, places=12, msg=column)
+                    else:
+                        self.assertEqual(merged_row[column], value, msg=column)
+
+        # Every count column, including the ones the DB does not keep
+        merged = list(csv.DictReader(open(out_dir / "HG002_R001.extended.csv")))
+        expected = list(csv.DictReader(open(full / "HG002_R001.extended.csv")))
+        for merged_row, expected_row in zip(merged, expected):
+            for column in EXTENDED_COLUMNS:
+                if not sharding._is_derived(column):
+                    self.assertEqual(merged_row[column], expected_row[column], msg=column)
+                elif expected_row[column]:
+                    self.assertAlmostEqual(float(merged_row[column]), float(expected_row[column]), places=12, msg=column)
+                else:
+                    self.assertEqual(merged_row[column], "", msg=column)
+
+    def _rewrite(self, path, edit):
+        table = edit(list(csv.DictReader(open(path))))
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=EXTENDED_COLUMNS)
+            writer.writeheader()
+            writer.writerows(table)
+
+    def test_region_sizes_not_cut_by_the_shards_must_agree(self):
+        prefixes = []
+        for index, contigs in enumerate([{"chr1", "chrM"}, {"chr2"}]):
+            prefixes.append(self.root / f"shard{index}")
+            fake_happy(self.variants, contigs, self.bed, prefixes[-1])
+        # Rows come out in key order whatever the order of the first shard
+        self._rewrite(Path(f"{prefixes[0]}.extended.csv"), lambda table: table[::-1])
+        rows = sharding.merge_happy_table([Path(f"{prefix}.extended.csv") for prefix in prefixes], self.root / "merged.csv")
+        keys = [tuple(row[column] for column in sharding.HAPPY_KEY_COLUMNS) for row in rows]
+        self.assertEqual(keys, sorted(keys))
+        [lowmap] = [row for row in rows if (row["Type"], row["Subset"], row["Filter"], row["Genotype"]) == ("SNP", "lowmap", "PASS", "*")]
+        self.assertEqual(lowmap["Subset.Size"], sum(end - start for regions in SUBSETS["lowmap"].values() for start, end in regions))
+        confident = {}
+        for contig, start, end in csv.reader(open(self.bed), delimiter="\t"):
+            confident.setdefault(contig, []).append((int(start), int(end)))
+        self.assertEqual(lowmap["Subset.IS_CONF.Size"],
+                         sum(overlap(SUBSETS["lowmap"][contig], confident[contig]) for contig in ("chr1", "chr2")))
+
+        # A shard whose stratification differs is refused rather than added up
+        def halve_first_size(table):
+            table[0]["Subset.Size"] = str(int(table[0]["Subset.Size"]) // 2)
+            return table
+
+        self._rewrite(Path(f"{prefixes[1]}.extended.csv"), halve_first_size)
+        with self.assertRaisesRegex(ValueError, "Subset.Size"):
+            sharding.merge_happy_table([Path(f"{prefix}.extended.csv") for prefix in prefixes], self.root / "merged.csv")
+
+    def test_summary_ratios_need_extended_counts(self):
+        for index, contigs in enumerate([{"chr1"}, {"chr2"}]):
+            fake_happy(self.variants, contigs, self.bed, self.root / f"shard{index}")
+            Path(f"{self.root / f'shard{index}'}.extended.csv").unlink()
+        with self.assertRaisesRegex(ValueError, "cannot recompute"):
+            sharding.merge_happy_outputs([self.root / "shard0", self.root / "shard1"], self.root / "merged")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.app import crud, models, schemas
+from api.app.database import Base
+from api.tasks.parsers import parse_happy_table
+
+SUMMARY_CSV = """\
+Type,Filter,TRUTH.TOTAL,TRUTH.TP,TRUTH.FN,QUERY.TOTAL,QUERY.FP,QUERY.UNK,FP.gt,FP.al,METRIC.Recall,METRIC.Precision,METRIC.Frac_NA,METRIC.F1_Score,TRUTH.TOTAL.TiTv_ratio,QUERY.TOTAL.TiTv_ratio,TRUTH.TOTAL.het_hom_ratio,QUERY.TOTAL.het_hom_ratio
+INDEL,ALL,525469,523436,2033,1017411,1326,472897,530,545,0.996131,0.997564,0.464808,0.996847,,,1.5285,1.5869
+INDEL,PASS,525469,523436,2033,1017411,1326,472897,530,545,0.996131,0.997564,0.464808,0.996847,,,1.5285,1.5869
+SNP,ALL,3365127,3357635,7492,3867498,4012,505669,1054,200,0.997774,0.998807,0.130748,0.99829,2.1003,2.0265,1.5816,1.6228
+SNP,PASS,3365127,3357635,7492,3867498,4012,505669,1054,200,0.997774,0.998807,0.130748,0.99829,2.1003,2.0265,1.5816,1.6228
+"""
+
+EXTENDED_CSV = """\
+Type,Subtype,Subset,Filter,Genotype,QQ.Field,QQ,METRIC.Recall,METRIC.Precision,METRIC.Frac_NA,METRIC.F1_Score,FP.gt,FP.al,PCT.FP.ma,TRUTH.TOTAL,TRUTH.TOTAL.TiTv_ratio,TRUTH.TOTAL.het_hom_ratio,TRUTH.TP,TRUTH.FN,QUERY.TOTAL,QUERY.FP,QUERY.UNK,Subset.Size,Subset.IS_CONF.Size
+SNP,*,*,ALL,*,QUAL,*,0.997774,0.998807,0.130748,0.99829,1054,200,,3365127,2.1003,1.5816,3357635,7492,3867498,4012,505669,3099922541,2545124876
+SNP,*,GRCh38_lowmappabilityall,ALL,*,QUAL,*,0.9815,0.9902,0.31,0.9858,88,12,,120553,2.01,1.62,118324,2229,201003,1160,74410,269421032,198110345
+SNP,ti,GRCh38_lowmappabilityall,PASS,het,QUAL,*,0.98,,,,,,,80002,,,78402,1600,,,,269421032,
+"""
+
+
+class HappyStratifiedMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        self.summary = self.tmp_path / "HG002_R001.summary.csv"
+        self.extended = self.tmp_path / "HG002_R001.extended.csv"
+        self.summary.write_text(SUMMARY_CSV)
+        self.extended.write_text(EXTENDED_CSV)
+        self.engine = create_engine(f"sqlite:///{self.tmp_path / 'test.db'}")
+        self.Session = sessionmaker(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+        self.db = self.Session()
+        lab_run = schemas.LabRunCreate(run_name="HG002_R001", status=models.RunStatus.PENDING_PROCESSING)
+        self.run_id = crud.create_lab_run(self.db, lab_run).id
+
+    def tearDown(self):
+        self.db.close()
+        Base.metadata.drop_all(bind=self.engine)
+        self._tmpdir.cleanup()
+
+    def test_every_summary_row_is_parsed(self):
+        rows = parse_happy_table(self.summary, "summary")
+
+        self.assertEqual([(row["type"], row["filter"]) for row in rows],
+                         [("INDEL", "ALL"), ("INDEL", "PASS"), ("SNP", "ALL"), ("SNP", "PASS")])
+        self.assertEqual({(row["subtype"], row["subset"], row["genotype"]) for row in rows}, {("*", "*", "*")})
+        self.assertIsNone(rows[0]["truth_titv_ratio"])
+        self.assertEqual(rows[2]["truth_tp"], 3357635)
+        self.assertIsNone(rows[2]["subset_size"])
+
+    def test_extended_rows_are_stored_and_queried_by_region(self):
+        rows = parse_happy_table(self.summary, "summary") + parse_happy_table(self.extended, "extended")
+        crud.bulk_create_happy_stratified_metrics(self.db, [{"run_name": "HG002_R001", **row} for row in rows])
+
+        region = crud.get_happy_stratified_metrics(
+            self.db, self.run_id, type="SNP", filter="ALL", subset="GRCh38_lowmappabilityall"
+        )
+        self.assertEqual(len(region), 1)
+        self.assertEqual(region[0].truth_tp, 118324)
+        self.assertEqual(region[0].subset_size, 269421032)
+
+        [het] = crud.get_happy_stratified_metrics(self.db, self.run_id, filter="PASS", source="extended")
+        self.assertEqual((het.subtype, het.genotype), ("ti", "het"))
+        self.assertIsNone(het.metric_precision)
+        self.assertEqual(len(crud.get_happy_stratified_metrics(self.db, self.run_id, source="summary")), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.app import job_service, models
+from api.app.database import Base
+from api.app.job_feed import JobFeed
+
+
+class JobFeedTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{Path(self._tmpdir.name) / 'test.db'}")
+        self.Session = sessionmaker(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+        self.db = self.Session()
+        self.job = job_service.enqueue_job(
+            self.db,
+            job_type=models.TransferJobType.PIPELINE,
+            subject_id="HG002_R001",
+        )
+
+    def tearDown(self):
+        self.db.close()
+        Base.metadata.drop_all(bind=self.engine)
+        self._tmpdir.cleanup()
+
+    def _events(self, count):
+        for i in range(count):
+            job_service.append_event(self.db, self.job.id, f"step {i}")
+
+    def test_deltas_are_published_once_and_resumable(self):
+        feed = JobFeed(session_factory=self.Session, buffer_size=3)
+        head = feed.head
+        self.assertEqual(feed.pull(), 0)
+
+        self._events(2)
+        job_service.complete_job(self.db, self.job.id)
+        self.assertEqual(feed.pull(), 3)
+        self.assertEqual(feed.pull(), 0)
+
+        deltas = feed.deltas_after(head)
+        self.assertEqual([delta["event"]["message"] for delta in deltas], ["step 0", "step 1", "Job completed"])
+        self.assertEqual(deltas[-1]["job"]["status"], "completed")
+        self.assertEqual(feed.summary["queued_jobs"], 0)
+        self.assertEqual(feed.deltas_after(deltas[1]["id"]), deltas[2:])
+
+        # Older than the buffer: read back from the database, a buffer at a time
+        backfill = feed.deltas_after(0)
+        self.assertEqual([delta["event"]["sequence"] for delta in backfill], [1, 2, 3])
+        self.assertEqual(feed.deltas_after(backfill[-1]["id"]), deltas[2:])
+
+    def test_deltas_behind_a_gap_are_held_until_it_fills(self):
+        feed = JobFeed(session_factory=self.Session, gap_grace_seconds=3600)
+        head = feed.head
+        self._events(2)
+        # An id committed late, as with concurrent Postgres transactions
+        late = self.db.get(models.TransferEvent, head + 1)
+        self.db.delete(late)
+        self.db.commit()
+
+        self.assertEqual(feed.pull(), 0)
+        self.db.add(models.TransferEvent(id=head + 1, job_id=self.job.id, sequence=99, message="late"))
+        self.db.commit()
+        self.assertEqual(feed.pull(), 2)
+        self.assertEqual([delta["event"]["message"] for delta in feed.deltas_after(head)], ["late", "step 1"])
+
+    def test_stream_sends_ready_job_and_summary_events(self):
+        feed = JobFeed(session_factory=self.Session)
+        head = feed.head
+        self._events(1)
+        feed.pull()
+
+        async def collect():
+            checks = iter([False, True])
+
+            async def is_disconnected():
+                return next(checks)
+
+            messages = [message async for message in feed.stream(head, is_disconnected)]
+            feed.stop()
+            return messages
+
+        ready, job, summary = asyncio.run(collect())
+        self.assertEqual(ready, f'event: ready\ndata: {{"id": {head}}}\n\n')
+        self.assertTrue(job.startswith(f"id: {head + 1}\nevent: job\n"))
+        self.assertEqual(json.loads(job.split("data: ", 1)[1])["event"]["message"], "step 0")
+        self.assertTrue(summary.startswith("event: summary\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
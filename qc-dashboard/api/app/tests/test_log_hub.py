@@ -0,0 +1,96 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from api.app import websocket as ws_manager
+from api.app.websocket import DownloadStatus, LogHub, LogLevel
+
+
+class SlowWebSocket:
+    """Records what is sent; send_json blocks until released."""
+
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+        self.release = asyncio.Event()
+
+    async def send_json(self, entry):
+        await self.release.wait()
+        self.sent.append(entry["message"])
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+class LogHubTest(unittest.TestCase):
+    def test_ring_buffer_keeps_absolute_indexes(self):
+        hub = LogHub(buffer_lines=3, backend="local")
+        for i in range(5):
+            hub.add("NA24143", f"line {i}", LogLevel.INFO)
+
+        self.assertEqual(hub.get_status("NA24143")["log_count"], 5)
+        self.assertEqual([log["message"] for log in hub.get_logs("NA24143")], ["line 2", "line 3", "line 4"])
+        self.assertEqual([log["message"] for log in hub.get_logs("NA24143", since=4)], ["line 4"])
+        self.assertEqual(hub.get_logs("NA24143", since=5), [])
+
+    def _stream(self, policy):
+        async def run():
+            hub = LogHub(queue_size=3, policy=policy, backend="local")
+            hub.add("NA24143", "backlog", LogLevel.INFO)
+            websocket = SlowWebSocket()
+            connection = hub.connect(websocket, "NA24143")
+            sender = asyncio.create_task(connection.run())
+            await asyncio.sleep(0)
+            # The send of "backlog" is stuck; broadcasting must not wait for it
+            for i in range(6):
+                hub.add("NA24143", f"line {i}", LogLevel.INFO)
+            await asyncio.sleep(0)
+            websocket.release.set()
+            await asyncio.sleep(0.05)
+            sender.cancel()
+            return websocket
+
+        return asyncio.run(run())
+
+    def test_slow_client_has_oldest_lines_dropped(self):
+        websocket = self._stream("drop")
+        self.assertEqual(websocket.sent, ["backlog", "3 log lines skipped: connection too slow", "line 3", "line 4", "line 5"])
+        self.assertIsNone(websocket.closed_with)
+
+    def test_slow_client_is_disconnected(self):
+        websocket = self._stream("disconnect")
+        self.assertEqual(websocket.sent, ["backlog"])
+        self.assertEqual(websocket.closed_with, 1013)
+
+    def test_finished_samples_are_cleaned_up_automatically(self):
+        hub = LogHub(backend="local")
+        hub.add("done", "finished", LogLevel.SUCCESS)
+        hub.set_status("done", DownloadStatus.COMPLETED)
+        hub.add("running", "still going", LogLevel.INFO)
+        hub.subject("done").updated_at = datetime.now() - timedelta(hours=2)
+        hub.subject("running").updated_at = datetime.now() - timedelta(hours=2)
+
+        with patch.object(ws_manager, "CLEANUP_INTERVAL_SECONDS", 0):
+            hub.add("other", "new import", LogLevel.INFO)
+
+        self.assertEqual(hub.get_status("done")["log_count"], 0)
+        self.assertEqual(hub.get_status("running")["log_count"], 1)
+
+    def test_lines_from_other_workers_are_applied_once(self):
+        hub = LogHub(backend="local")
+        entry = {"timestamp": "2026-10-17T10:00:00", "message": "from worker 2", "level": "info"}
+        hub.receive(json.dumps({"origin": "worker-2", "sample_id": "NA24143", "kind": "log", "value": entry}))
+        hub.receive(json.dumps({"origin": hub.origin, "sample_id": "NA24143", "kind": "log", "value": entry}))
+        hub.receive(json.dumps({"origin": "worker-2", "sample_id": "NA24143", "kind": "status", "value": "running"}))
+
+        self.assertEqual(hub.get_logs("NA24143"), [entry])
+        self.assertEqual(hub.get_status("NA24143")["status"], "running")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from api.app import metrics_matrix
+
+FILE_TYPES = {"Summary": "summary.csv", "mapping_metrics": "mapping_metrics.csv"}
+
+
+class MetricsMatrixCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        self.processed = self.tmp_path / "processed"
+        self.processed.mkdir()
+        self._write_run("20250101_HG002_R001", total_reads=100)
+        self._write_run("20250102_HG002_R002", total_reads=200)
+        self._patches = [
+            patch.object(metrics_matrix, "STAMP_PATH", self.tmp_path / ".metrics_matrix.stamp"),
+            patch("api.app.metrics_matrix._load_series", wraps=metrics_matrix._load_series),
+        ]
+        for p in self._patches:
+            p.start()
+        self.load_series = metrics_matrix._load_series
+        self.cache = metrics_matrix.MetricsMatrixCache(self.processed, FILE_TYPES)
+
+    def tearDown(self):
+        for p in reversed(self._patches):
+            p.stop()
+        self._tmpdir.cleanup()
+
+    def _write_run(self, run_dir_name, total_reads):
+        run_dir = self.processed / run_dir_name
+        run_dir.mkdir(exist_ok=True)
+        sample = run_dir_name.split("_", 1)[1]
+        (run_dir / f"{sample}.mapping_metrics.csv").write_text(
+            f"parameter,value,percentage\nTotal reads,{total_reads},\nMapped reads,{total_reads - 1},99.0\n"
+        )
+        return run_dir
+
+    def test_matrix_is_built_once_and_then_looked_up(self):
+        matrix = self.cache.matrix("mapping_metrics")
+        self.assertEqual(matrix["samples"], ["HG002_R001", "HG002_R002"])
+        self.assertEqual(matrix["metrics"], ["Total reads", "Mapped reads"])
+        self.assertEqual(matrix["values"], [[100, 200], [99, 199]])
+        self.assertEqual(self.cache.matrix("Summary")["samples"], [])
+
+        self.assertIs(self.cache.matrix("mapping_metrics"), matrix)
+        self.assertEqual(self.load_series.call_count, 2)
+
+    def test_touch_reparses_only_changed_files(self):
+        self.cache.matrix("mapping_metrics")
+        run_dir = self._write_run("20250102_HG002_R002", total_reads=300)
+        metrics_file = run_dir / "HG002_R002.mapping_metrics.csv"
+        os.utime(metrics_file, ns=(1, 1))
+        metrics_matrix.touch()
+
+        self.assertEqual(self.cache.matrix("mapping_metrics")["values"], [[100, 300], [99, 299]])
+        self.assertEqual(self.load_series.call_count, 3)
+
+    def test_removed_run_directory_is_dropped(self):
+        self.cache.matrix("mapping_metrics")
+        for path in (self.processed / "20250101_HG002_R001").iterdir():
+            path.unlink()
+        (self.processed / "20250101_HG002_R001").rmdir()
+        os.utime(self.processed, ns=(1, 1))
+
+        self.assertEqual(self.cache.samples("mapping_metrics"), ["HG002_R002"])
+        self.assertEqual(self.cache.matrix("mapping_metrics")["values"], [[200], [199]])
+
+    def test_unparsable_file_is_reported(self):
+        (self.processed / "20250101_HG002_R001" / "HG002_R001.summary.csv").write_text("")
+        with self.assertRaisesRegex(ValueError, "HG002_R001.summary.csv"):
+            self.cache.matrix("Summary")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from api.tasks import digests, fingerprints
+from api.tasks.process_run import stage_is_current, stratification_fingerprint
+
+
+class PipelineFingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        self.out_dir = self.tmp_path / "20250101_HG002_R001"
+        self.out_dir.mkdir()
+        self.gvcf = self.tmp_path / "HG002.gvcf.gz"
+        self.gvcf.write_bytes(b"gvcf-v1")
+        self.script = self.tmp_path / "happy.sh"
+        self.script.write_text('HAPPY_IMAGE="${HAPPY_IMAGE:-quay.io/biocontainers/hap.py:0.3.15}"\n')
+        self.summary = self.out_dir / "HG002_R001.summary.csv"
+        self.original_digest_cache = digests.CACHE_PATH
+        digests.CACHE_PATH = self.tmp_path / ".digests.json"
+
+    def tearDown(self):
+        digests.CACHE_PATH = self.original_digest_cache
+        self._tmpdir.cleanup()
+
+    def _fingerprint(self, params=None):
+        return fingerprints.compute(
+            [self.gvcf],
+            fingerprints.tool_fingerprint(self.script, "HAPPY_IMAGE"),
+            params or {"stratified": False},
+        )
+
+    def _complete_stage(self):
+        fingerprint = self._fingerprint()
+        self.summary.write_text("Type,Filter\n")
+        fingerprints.record(self.out_dir, "happy", fingerprint, [self.summary])
+
+    def test_unchanged_stage_is_skipped_unless_forced(self):
+        self.assertFalse(stage_is_current(self.out_dir, "happy", self._fingerprint()))
+        self._complete_stage()
+
+        self.assertTrue(stage_is_current(self.out_dir, "happy", self._fingerprint()))
+        self.assertFalse(stage_is_current(self.out_dir, "happy", self._fingerprint(), force=True))
+        # Forcing forgets the old fingerprint until the rerun completes.
+        self.assertNotIn("happy", fingerprints.read(self.out_dir))
+
+    def test_changed_input_params_or_image_rerun_stage(self):
+        self._complete_stage()
+        self.assertFalse(stage_is_current(self.out_dir, "happy", self._fingerprint({"stratified": True})))
+
+        self._complete_stage()
+        with patch.dict(os.environ, {"HAPPY_IMAGE": "quay.io/biocontainers/hap.py:0.3.16"}):
+            self.assertFalse(stage_is_current(self.out_dir, "happy", self._fingerprint()))
+
+        self._complete_stage()
+        self.gvcf.write_bytes(b"gvcf-v2")
+        self.assertFalse(stage_is_current(self.out_dir, "happy", self._fingerprint()))
+
+    def test_missing_output_reruns_stage(self):
+        self._complete_stage()
+        self.summary.unlink()
+        self.assertFalse(stage_is_current(self.out_dir, "happy", self._fingerprint()))
+
+    def test_changed_stratification_bed_reruns_stage(self):
+        strat_dir = self.tmp_path / "GRCh38_strat"
+        (strat_dir / "LowComplexity").mkdir(parents=True)
+        strat_tsv = strat_dir / "GRCh38-all-stratifications.tsv"
+        strat_tsv.write_text("GRCh38_AllTandemRepeats\tLowComplexity/GRCh38_AllTandemRepeats.bed.gz\n")
+        bed = strat_dir / "LowComplexity" / "GRCh38_AllTandemRepeats.bed.gz"
+        bed.write_bytes(b"bed-v1")
+
+        def fingerprint():
+            return self._fingerprint({"stratified": True, "stratification": stratification_fingerprint(strat_tsv)})
+
+        self.summary.write_text("Type,Filter\n")
+        fingerprints.record(self.out_dir, "happy", fingerprint(), [self.summary])
+        self.assertTrue(stage_is_current(self.out_dir, "happy", fingerprint()))
+
+        bed.write_bytes(b"bed-v2-regions")
+        self.assertFalse(stage_is_current(self.out_dir, "happy", fingerprint()))
+
+        fingerprints.record(self.out_dir, "happy", fingerprint(), [self.summary])
+        strat_tsv.write_text("GRCh38_AllTandemRepeats\tLowComplexity/GRCh38_AllTandemRepeats.bed.gz\n# v3.1\n")
+        self.assertFalse(stage_is_current(self.out_dir, "happy", fingerprint()))
+
+        bed.unlink()
+        with self.assertRaises(FileNotFoundError):
+            stratification_fingerprint(strat_tsv)
+
+    def test_image_is_read_from_wrapper_script(self):
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("HAPPY_IMAGE", None)
+            self.assertEqual(
+                fingerprints.script_image(self.script, "HAPPY_IMAGE"),
+                "quay.io/biocontainers/hap.py:0.3.15",
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
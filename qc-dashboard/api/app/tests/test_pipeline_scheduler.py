@@ -0,0 +1,83 @@
+import threading
+import unittest
+
+from api.app import settings
+from api.tasks import scheduler
+
+
+class StageSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.original = (
+            settings.PIPELINE_CPUS,
+            settings.PIPELINE_MEMORY,
+            settings.TRUVARI_CPUS,
+            settings.TRUVARI_MEMORY,
+        )
+        settings.PIPELINE_CPUS = 32
+        settings.PIPELINE_MEMORY = "64g"
+        settings.TRUVARI_CPUS = 2
+        settings.TRUVARI_MEMORY = "8g"
+
+    def tearDown(self):
+        (
+            settings.PIPELINE_CPUS,
+            settings.PIPELINE_MEMORY,
+            settings.TRUVARI_CPUS,
+            settings.TRUVARI_MEMORY,
+        ) = self.original
+
+    def test_parse_memory_mb(self):
+        self.assertEqual(scheduler.parse_memory_mb("48g"), 48 * 1024)
+        self.assertEqual(scheduler.parse_memory_mb("512m"), 512)
+        self.assertEqual(scheduler.parse_memory_mb("1.5G"), 1536)
+        with self.assertRaises(ValueError):
+            scheduler.parse_memory_mb("lots")
+
+    def test_budget_is_split_when_stages_run_together(self):
+        budget = scheduler.stage_budget(["happy", "truvari"])
+
+        self.assertEqual(budget["truvari"], {"TRUVARI_CPUS": "2", "TRUVARI_MEMORY": "8192m"})
+        self.assertEqual(budget["happy"]["HAPPY_CPUS"], "30")
+        self.assertEqual(budget["happy"]["HAPPY_MEMORY"], f"{56 * 1024}m")
+
+    def test_single_stage_gets_whole_budget(self):
+        self.assertEqual(scheduler.stage_budget(["happy"])["happy"]["HAPPY_CPUS"], "32")
+        self.assertEqual(scheduler.stage_budget(["truvari"])["truvari"]["TRUVARI_CPUS"], "32")
+
+        # truvari.sh has no limits of its own, so a lone stage is still given one
+        received = []
+        scheduler.run_stages({"truvari": received.append})
+        self.assertEqual(received, [{"TRUVARI_CPUS": "32", "TRUVARI_MEMORY": f"{64 * 1024}m"}])
+
+    def test_stage_share_is_split_between_shards(self):
+        parallel, env = scheduler.shard_budget("happy", {"HAPPY_CPUS": "30", "HAPPY_MEMORY": "60g", "HAPPY_MEMORY_SWAP": "70g"}, 4)
+        self.assertEqual(parallel, 4)
+        self.assertEqual(env, {"HAPPY_CPUS": "7", "HAPPY_MEMORY": f"{15 * 1024}m", "HAPPY_MEMORY_SWAP": f"{17920}m"})
+
+        # Without a stage share the whole budget is split; never more shards than CPUs
+        parallel, env = scheduler.shard_budget("happy", None, 64)
+        self.assertEqual((parallel, env["HAPPY_CPUS"]), (32, "1"))
+
+    def test_stages_run_concurrently_and_errors_propagate(self):
+        barrier = threading.Barrier(2, timeout=5)
+        seen = {}
+
+        def stage(name):
+            def _run(env):
+                seen[name] = env
+                barrier.wait()
+            return _run
+
+        scheduler.run_stages({"happy": stage("happy"), "truvari": stage("truvari")})
+        self.assertIn("HAPPY_CPUS", seen["happy"])
+        self.assertIn("TRUVARI_CPUS", seen["truvari"])
+
+        def failing(env):
+            raise RuntimeError("truvari exploded")
+
+        with self.assertRaisesRegex(RuntimeError, "truvari exploded"):
+            scheduler.run_stages({"happy": lambda env: None, "truvari": failing})
+
+
+if __name__ == "__main__":
+    unittest.main()
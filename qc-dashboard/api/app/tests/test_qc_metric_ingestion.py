@@ -0,0 +1,112 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.app import crud, models, schemas
+from api.app.database import Base
+from api.tasks import process_run
+from api.tasks.parsers import reformat_csv
+
+# Raw DRAGEN CSVs: section, read group, parameter, value[, percentage]
+VC_METRICS = """\
+VARIANT CALLER SUMMARY,,Number of samples,1
+VARIANT CALLER PREFILTER,HG002,Total,5240011,100.00
+VARIANT CALLER POSTFILTER,HG002,Total,5031337,100.00
+VARIANT CALLER POSTFILTER,HG002,Ti/Tv ratio,2.03
+"""
+PLOIDY_METRICS = """\
+PLOIDY ESTIMATION,,Autosomal median coverage,33.12
+PLOIDY ESTIMATION,,Ploidy estimation,XY
+"""
+
+
+class QCMetricIngestionTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        self.engine = create_engine(f"sqlite:///{self.tmp_path / 'test.db'}")
+        self.Session = sessionmaker(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+        self.db = self.Session()
+        self.run_ids = {}
+        for name in ["HG002_R001", "HG002_R002"]:
+            lab_run = schemas.LabRunCreate(run_name=name, status=models.RunStatus.PENDING_PROCESSING)
+            self.run_ids[name] = crud.create_lab_run(self.db, lab_run).id
+
+    def tearDown(self):
+        self.db.close()
+        Base.metadata.drop_all(bind=self.engine)
+        self._tmpdir.cleanup()
+
+    def _ingest(self, run_name):
+        outputs = []
+        for name, content in [("HG002.vc_metrics.csv", VC_METRICS), ("HG002.ploidy_estimation_metrics.csv", PLOIDY_METRICS)]:
+            raw = self.tmp_path / f"{run_name}.{name}"
+            raw.write_text(content)
+            output = self.tmp_path / f"{run_name}.reformatted.{name}"
+            reformat_csv(raw, output)
+            outputs.append(output)
+        with patch.object(process_run, "SessionLocal", self.Session):
+            process_run.post_qc_metrics(outputs, run_name)
+
+    def test_every_parameter_is_stored_in_long_format(self):
+        self._ingest("HG002_R001")
+
+        metrics = crud.get_qc_metrics(self.db, self.run_ids["HG002_R001"])
+        self.assertEqual(len(metrics), 6)
+        [postfilter] = [m for m in metrics if m.section == "VARIANT CALLER POSTFILTER" and m.metric_name == "Total"]
+        self.assertEqual((postfilter.file_type, postfilter.metric_value, postfilter.percentage),
+                         ("vc_metrics", 5031337, 100.0))
+        [ploidy] = [m for m in metrics if m.metric_name == "Ploidy estimation"]
+        self.assertEqual(ploidy.file_type, "ploidy_estimation_metrics")
+        self.assertIsNone(ploidy.metric_value)
+
+    def test_reingest_replaces_rows_and_cohort_query_spans_runs(self):
+        self._ingest("HG002_R001")
+        self._ingest("HG002_R001")
+        self._ingest("HG002_R002")
+
+        titv, next_cursor = crud.query_qc_metrics(self.db, file_type="vc_metrics", metric_name="Ti/Tv ratio")
+        self.assertEqual([metric.run_id for metric in titv], sorted(self.run_ids.values()))
+        self.assertIsNone(next_cursor)
+        self.assertEqual(len(crud.get_qc_metrics(self.db, self.run_ids["HG002_R001"])), 6)
+
+    def test_cohort_query_pages_by_cursor(self):
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+
+        from api.app.api_v1.endpoints import qc_metrics
+        from api.app.database import get_db
+
+        self._ingest("HG002_R002")
+        self._ingest("HG002_R001")
+        self._ingest("HG002_R002")
+        app = FastAPI()
+        app.include_router(qc_metrics.router, prefix="/api/v1")
+        app.dependency_overrides[get_db] = lambda: self.db
+        client = TestClient(app)
+
+        self.assertEqual(client.get("/api/v1/qc_metrics").status_code, 400)
+        self.assertEqual(client.get("/api/v1/qc_metrics", params={"file_type": "vc_metrics", "cursor": "bad"}).status_code, 400)
+        pages, cursor = [], None
+        while True:
+            params = {"file_type": "vc_metrics", "limit": 2, **({"cursor": cursor} if cursor else {})}
+            response = client.get("/api/v1/qc_metrics", params=params)
+            self.assertEqual(response.status_code, 200)
+            pages.append([(metric["run_id"], metric["id"]) for metric in response.json()])
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 2])
+        rows = [row for page in pages for row in page]
+        self.assertEqual(rows, sorted(rows))
+        self.assertEqual([run_id for run_id, _ in rows], [self.run_ids["HG002_R001"]] * 4 + [self.run_ids["HG002_R002"]] * 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
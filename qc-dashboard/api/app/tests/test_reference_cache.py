@@ -0,0 +1,80 @@
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from api.tasks import digests, reference_cache
+
+
+class ReferenceCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        self.original_cache_dir = reference_cache.CACHE_DIR
+        reference_cache.CACHE_DIR = self.tmp_path / "cache"
+        self.original_digest_cache = digests.CACHE_PATH
+        digests.CACHE_PATH = self.tmp_path / ".digests.json"
+        self.source = self.tmp_path / "truth.bed"
+        self.source.write_text("1\t100\t200\n")
+        self.builds = 0
+
+    def tearDown(self):
+        reference_cache.CACHE_DIR = self.original_cache_dir
+        digests.CACHE_PATH = self.original_digest_cache
+        self._tmpdir.cleanup()
+
+    def _build(self, out_path):
+        self.builds += 1
+        time.sleep(0.05)
+        out_path.write_text("chr" + self.source.read_text())
+
+    def _ensure(self, params=None):
+        return reference_cache.ensure_artifact(
+            "truth.normalized.bed", [self.source], params or {"rename_chrs": "chr"}, self._build
+        )
+
+    def test_artifact_is_built_once_across_concurrent_callers(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self._ensure())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(results[0].read_text(), "chr1\t100\t200\n")
+        manifest = reference_cache.read_manifest()
+        self.assertEqual(len(manifest), 1)
+        entry = next(iter(manifest.values()))
+        self.assertEqual(entry["sources"][0]["path"], str(self.source))
+
+    def test_changed_source_or_params_trigger_rebuild(self):
+        first = self._ensure()
+        self.assertEqual(self._ensure(), first)
+
+        self.source.write_text("2\t100\t200\n")
+        second = self._ensure()
+        self.assertNotEqual(second, first)
+        self.assertEqual(second.read_text(), "chr2\t100\t200\n")
+
+        third = self._ensure({"rename_chrs": "none"})
+        self.assertNotEqual(third, second)
+        self.assertEqual(self.builds, 3)
+
+    def test_failed_build_publishes_nothing(self):
+        def broken(out_path):
+            out_path.write_text("partial")
+            raise RuntimeError("tool crashed")
+
+        with self.assertRaises(RuntimeError):
+            reference_cache.ensure_artifact("truth.normalized.bed", [self.source], {}, broken)
+
+        published = [path for path in reference_cache.CACHE_DIR.iterdir() if path.is_dir()]
+        self.assertEqual(published, [])
+        self.assertEqual(reference_cache.read_manifest(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
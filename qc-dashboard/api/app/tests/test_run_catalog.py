@@ -0,0 +1,186 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.app import crud
+from api.app.database import Base, get_db
+from api.tasks import run_catalog
+
+try:
+    import watchfiles
+except ImportError:
+    watchfiles = None
+
+
+class RunCatalogTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        self.lab_runs = self.tmp_path / "lab_runs"
+        self.processed = self.tmp_path / "processed"
+        for path in [
+            self.lab_runs / "HG002_R001",
+            self.lab_runs / "HG002_R002",
+            self.processed / "20250101_HG002_R001" / "truvari",
+            self.processed / "HG002_R003",
+        ]:
+            path.mkdir(parents=True)
+        (self.processed / "20250101_HG002_R001" / "HG002_R001.summary.csv").write_text("Type\n")
+        (self.processed / "20250101_HG002_R001" / "truvari" / "summary.json").write_text("{}")
+
+        self.engine = create_engine(f"sqlite:///{self.tmp_path / 'test.db'}")
+        self.Session = sessionmaker(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+        self.db = self.Session()
+
+        from api.app.api_v1.endpoints import runs
+
+        self._patches = [
+            patch.object(run_catalog, "LAB_RUNS_DIR", self.lab_runs),
+            patch.object(run_catalog, "PROCESSED_DIR", self.processed),
+            patch.object(runs, "LAB_RUNS_DIR", self.lab_runs),
+        ]
+        for p in self._patches:
+            p.start()
+
+        app = FastAPI()
+        app.include_router(runs.router, prefix="/api/v1")
+
+        def override_get_db():
+            session = self.Session()
+            try:
+                yield session
+            finally:
+                session.close()
+
+        app.dependency_overrides[get_db] = override_get_db
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        for p in reversed(self._patches):
+            p.stop()
+        self.db.close()
+        Base.metadata.drop_all(bind=self.engine)
+        self._tmpdir.cleanup()
+
+    def test_rescan_records_directories_and_artifacts(self):
+        self.assertEqual(run_catalog.rescan(self.db), 3)
+
+        entry = crud.get_run_catalog_entry(self.db, "HG002_R001")
+        self.assertEqual(entry.lab_dir, str(self.lab_runs / "HG002_R001"))
+        self.assertEqual(entry.processed_dir, str(self.processed / "20250101_HG002_R001"))
+        self.assertEqual(entry.date_prefix, "20250101")
+        self.assertTrue(entry.has_happy and entry.has_truvari and entry.has_csv)
+        self.assertFalse(entry.has_stratified)
+        self.assertIsNone(crud.get_run_catalog_entry(self.db, "HG002_R002").processed_dir)
+        self.assertIsNone(crud.get_run_catalog_entry(self.db, "HG002_R003").lab_dir)
+
+        (self.lab_runs / "HG002_R002").rmdir()
+        run_catalog.rescan(self.db)
+        self.assertIsNone(crud.get_run_catalog_entry(self.db, "HG002_R002"))
+
+    def test_endpoints_read_the_catalog(self):
+        response = self.client.get("/api/v1/runs")
+        self.assertEqual(response.status_code, 200)
+        statuses = {run["run_name"]: run["status"] for run in response.json()}
+        self.assertEqual(statuses, {"HG002_R001": "AWAITING_APPROVAL", "HG002_R002": "PENDING_PROCESSING"})
+
+        response = self.client.get("/api/v1/runs/HG002_R001/benchmarking")
+        self.assertEqual(response.json(), {"truvari": True, "happy": True, "stratified": False, "csv": True})
+
+        # A run processed after the last scan is picked up on lookup.
+        (self.processed / "20250102_HG002_R002").mkdir()
+        (self.processed / "20250102_HG002_R002" / "HG002_R002.extended.csv").write_text("Type\n")
+        response = self.client.get("/api/v1/runs/HG002_R002/benchmarking")
+        self.assertEqual(response.json()["stratified"], True)
+        self.assertEqual(self.client.get("/api/v1/runs/HG002_R404/benchmarking").status_code, 404)
+
+    def test_listing_rescans_when_run_directories_changed_without_the_watcher(self):
+        past = time.time() - 3600
+        for path in (self.lab_runs, self.processed, *self.lab_runs.iterdir(), *self.processed.iterdir()):
+            os.utime(path, (past, past))
+        self.client.get("/api/v1/runs")
+        with patch.object(run_catalog, "rescan", side_effect=AssertionError("rescanned an unchanged catalog")):
+            self.assertEqual(self.client.get("/api/v1/runs").status_code, 200)
+            self.assertEqual(self.client.get("/api/v1/runs/HG002_R001/benchmarking").json()["stratified"], False)
+
+        # Copied in by hand, and outputs written outside run_pipeline
+        (self.lab_runs / "NA24143_R001").mkdir()
+        (self.processed / "20250101_HG002_R001" / "HG002_R001.extended.csv").write_text("Type\n")
+        self.assertIn("NA24143_R001", [run["run_name"] for run in self.client.get("/api/v1/runs").json()])
+        self.assertEqual(self.client.get("/api/v1/runs/HG002_R001/benchmarking").json()["stratified"], True)
+
+    def test_catalog_and_pipeline_pick_the_same_processed_directory(self):
+        from api.tasks import process_run
+
+        for name in ("HG002_R001", "20250301_HG002_R001", "X_HG002_R001"):
+            (self.processed / name).mkdir()
+        expected = self.processed / "20250101_HG002_R001"
+        run_catalog.rescan(self.db)
+        self.assertEqual(crud.get_run_catalog_entry(self.db, "HG002_R001").processed_dir, str(expected))
+        self.assertEqual(run_catalog.refresh(self.db, "HG002_R001").processed_dir, str(expected))
+        with patch.object(process_run, "PROCESSED_DIR", self.processed):
+            self.assertEqual(process_run.find_output_dir("HG002_R001"), expected)
+
+    def test_refreshing_one_run_does_not_hide_runs_copied_in_by_hand(self):
+        class ThreeHoursAgo(datetime):
+            @classmethod
+            def utcnow(cls):
+                return datetime.utcnow() - timedelta(hours=3)
+
+        past = time.time() - 4 * 3600
+        for path in (self.lab_runs, self.processed):
+            os.utime(path, (past, past))
+        with patch.object(run_catalog, "datetime", ThreeHoursAgo):
+            run_catalog.rescan(self.db)
+        self.assertFalse(run_catalog.catalog_is_stale(self.db))
+        # Copied in two hours ago; another run was refreshed since
+        (self.lab_runs / "NA24143_R001").mkdir()
+        os.utime(self.lab_runs, (time.time() - 2 * 3600,) * 2)
+        run_catalog.refresh(self.db, "HG002_R001")
+
+        self.assertTrue(run_catalog.catalog_is_stale(self.db))
+        self.assertIn("NA24143_R001", [run["run_name"] for run in self.client.get("/api/v1/runs").json()])
+
+    @unittest.skipIf(watchfiles is None, "watchfiles is not installed")
+    def test_watcher_follows_new_run_directories(self):
+        stop = threading.Event()
+        watcher = threading.Thread(
+            target=run_catalog.watch,
+            kwargs={"stop_event": stop, "force_polling": True, "session_factory": self.Session},
+        )
+        watcher.start()
+        try:
+            deadline = time.monotonic() + 2
+            while crud.get_run_catalog_entry(self.db, "HG002_R001") is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+            (self.lab_runs / "NA24143_R001").mkdir()
+            entry = None
+            deadline = time.monotonic() + 10
+            attempt = 0
+            while entry is None and time.monotonic() < deadline:
+                time.sleep(0.1)
+                self.db.expire_all()
+                entry = crud.get_run_catalog_entry(self.db, "NA24143_R001")
+                attempt += 1
+                if entry is None and attempt % 10 == 0:
+                    # The mkdir may land before the watcher's first snapshot
+                    (self.lab_runs / "NA24143_R001" / f"upload_{attempt}.txt").touch()
+            self.assertIsNotNone(entry)
+        finally:
+            stop.set()
+            watcher.join(timeout=10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.app import models
+from api.app.database import Base, get_db
+
+
+class RunsPaginationTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        self.engine = create_engine(f"sqlite:///{self.tmp_path / 'test.db'}")
+        self.Session = sessionmaker(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+        self.db = self.Session()
+
+        start = datetime(2025, 1, 1)
+        for i in range(23):
+            sample = "HG002" if i % 2 else "NA24143_Lib3_Rep1"
+            self.db.add(models.LabRun(
+                run_name=f"{sample}_R{i:03d}",
+                status=models.RunStatus.APPROVED if i % 3 == 0 else models.RunStatus.AWAITING_APPROVAL,
+                # Two runs per day, so the sort key needs run_name as a tie-breaker.
+                created_at=start + timedelta(days=i // 2),
+            ))
+        self.db.add(models.RunCatalogEntry(
+            run_name="HG002_R900", lab_dir="/data/lab_runs/HG002_R900", discovered_at=start + timedelta(days=30),
+        ))
+        self.db.commit()
+
+        from api.tasks import run_catalog
+
+        # No data directories: the listing is the rows above, never rescanned
+        self._patches = [
+            patch.object(run_catalog, "LAB_RUNS_DIR", self.tmp_path / "missing"),
+            patch.object(run_catalog, "PROCESSED_DIR", self.tmp_path / "missing"),
+        ]
+        for p in self._patches:
+            p.start()
+        from api.app.api_v1.endpoints import runs
+
+        app = FastAPI()
+        app.include_router(runs.router, prefix="/api/v1")
+
+        def override_get_db():
+            session = self.Session()
+            try:
+                yield session
+            finally:
+                session.close()
+
+        app.dependency_overrides[get_db] = override_get_db
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        for p in reversed(self._patches):
+            p.stop()
+        self.db.close()
+        Base.metadata.drop_all(bind=self.engine)
+        self._tmpdir.cleanup()
+
+    def _all_pages(self, **params):
+        names, cursor, pages = [], None, 0
+        while True:
+            response = self.client.get("/api/v1/runs", params={**params, **({"cursor": cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200, response.text)
+            names += [run["run_name"] for run in response.json()]
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return names, pages
+
+    def test_pages_cover_every_run_once_in_sort_order(self):
+        unpaged = [run["run_name"] for run in self.client.get("/api/v1/runs").json()]
+        self.assertEqual(len(unpaged), 24)
+        self.assertEqual(unpaged[0], "HG002_R900")
+
+        for sort in ["created_desc", "created_asc", "name_asc", "name_desc"]:
+            names, pages = self._all_pages(limit=5, sort=sort)
+            self.assertEqual(pages, 5)
+            self.assertEqual(len(names), len(set(names)))
+            self.assertEqual(names, [run["run_name"] for run in self.client.get("/api/v1/runs", params={"sort": sort}).json()])
+        self.assertEqual(self._all_pages(limit=5, sort="name_asc")[0], sorted(unpaged))
+
+    def test_rescans_do_not_move_runs_between_pages(self):
+        from api.app import crud
+
+        first = self.client.get("/api/v1/runs", params={"limit": 5, "sort": "created_asc"})
+        # The directory-only run is catalogued again while the listing is paged
+        crud.upsert_run_catalog_entries(
+            self.db, [{"run_name": "HG002_R900", "lab_dir": "/data/lab_runs/HG002_R900"}], datetime(2024, 1, 1)
+        )
+        names = [run["run_name"] for run in first.json()]
+        cursor = first.headers["X-Next-Cursor"]
+        while cursor:
+            response = self.client.get("/api/v1/runs", params={"limit": 5, "sort": "created_asc", "cursor": cursor})
+            names += [run["run_name"] for run in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+        self.assertEqual(len(names), 24)
+        self.assertEqual(names[-1], "HG002_R900")
+
+    def test_filters(self):
+        names, _ = self._all_pages(limit=4, sample_prefix="HG002_", status="APPROVED")
+        self.assertEqual(names, ["HG002_R021", "HG002_R015", "HG002_R009", "HG002_R003"])
+
+        names, _ = self._all_pages(created_from="2025-01-03T00:00:00", created_to="2025-01-04T00:00:00")
+        self.assertEqual(sorted(names), ["HG002_R005", "NA24143_Lib3_Rep1_R004"])
+
+        runs = self.client.get("/api/v1/runs", params={"status": "PENDING_PROCESSING"}).json()
+        self.assertEqual([(run["run_name"], run["id"]) for run in runs], [("HG002_R900", None)])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get("/api/v1/runs", params={"limit": 5, "cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+import hashlib
+import importlib.util
+import io
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.app import job_service, models, settings
+from api.app.database import Base
+from api.tasks import digests, s3_download
+
+BUCKET = "vcbench-test"
+PREFIX = f"{settings.AWS_BASE_PATH}/HG002/vcf/dragen/1234/varcaller"
+
+
+class FakeS3:
+    """In-memory stand-in for the list, HEAD and ranged GET calls of an S3 client."""
+
+    def __init__(self, objects, encryption=None):
+        self.objects = objects
+        self.ranges = []
+        self.fail = set()
+        self.encryption = encryption or {"ServerSideEncryption": "AES256"}
+
+    def get_paginator(self, _name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        yield {"Contents": [
+            {"Key": key, "Size": len(data), "ETag": f'"{hashlib.md5(data).hexdigest()}"'}
+            for key, data in self.objects.items() if key.startswith(Prefix)
+        ]}
+
+    def get_object(self, Bucket, Key, Range, IfMatch):
+        start, end = (int(value) for value in Range.removeprefix("bytes=").split("-"))
+        self.ranges.append((Key, start))
+        if (Key, start) in self.fail:
+            raise ConnectionError("connection reset")
+        return {"Body": io.BytesIO(self.objects[Key][start:end + 1]), **self.encryption}
+
+    def head_object(self, Bucket, Key, IfMatch):
+        return {"ContentLength": len(self.objects[Key]), **self.encryption}
+
+
+class S3DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        self.dest = self.tmp_path / "HG002_R001"
+        self._patch = patch.object(digests, "CACHE_PATH", self.tmp_path / "digests.json")
+        self._patch.start()
+        self.gvcf = bytes(range(256)) * 4000 + b"tail"
+        self.objects = {
+            f"{PREFIX}/HG002.hard-filtered.gvcf.gz": self.gvcf,
+            f"{PREFIX}/HG002.sv.vcf.gz": b"sv",
+            f"{PREFIX}/HG002.mapping_metrics.csv": b"metric,value\n",
+            f"{PREFIX}/HG002.time_metrics.csv": b"skipped",
+            f"{PREFIX}/HG002.bam": b"skipped",
+            f"{PREFIX}/HG002.empty.gvcf.gz": b"",
+        }
+
+    def tearDown(self):
+        self._patch.stop()
+        self._tmpdir.cleanup()
+
+    def _download(self, client, **kwargs):
+        return s3_download.download_sample(
+            "HG002", client=client, dest_dir=self.dest, bucket=BUCKET, part_size=100_000, **kwargs
+        )
+
+    def test_selects_renames_and_hashes_files(self):
+        paths = self._download(FakeS3(self.objects), workers=4)
+
+        self.assertEqual(sorted(path.name for path in paths), [
+            "HG002_R001.empty.gvcf.gz",
+            "HG002_R001.hard-filtered.gvcf.gz",
+            "HG002_R001.mapping_metrics.csv",
+            "HG002_R001.sv.vcf.gz",
+        ])
+        gvcf = self.dest / "HG002_R001.hard-filtered.gvcf.gz"
+        self.assertEqual(gvcf.read_bytes(), self.gvcf)
+        self.assertEqual(digests.lookup(gvcf, "sha256"), hashlib.sha256(self.gvcf).hexdigest())
+        self.assertEqual(sorted(path.name for path in self.dest.iterdir()), sorted(path.name for path in paths))
+
+    def test_interrupted_download_resumes_missing_parts(self):
+        key = f"{PREFIX}/HG002.hard-filtered.gvcf.gz"
+        client = FakeS3(self.objects)
+        client.fail = {(key, 500_000)}
+        with self.assertRaises(ConnectionError):
+            self._download(client, workers=1)
+        self.assertTrue((self.dest / "HG002_R001.hard-filtered.gvcf.gz.part.json").exists())
+
+        client = FakeS3(self.objects)
+        self._download(client, workers=2)
+        self.assertNotIn((key, 0), client.ranges)
+        self.assertIn((key, 500_000), client.ranges)
+        gvcf = self.dest / "HG002_R001.hard-filtered.gvcf.gz"
+        self.assertEqual(gvcf.read_bytes(), self.gvcf)
+        self.assertEqual(digests.lookup(gvcf, "md5"), hashlib.md5(self.gvcf).hexdigest())
+
+        # Complete files are not fetched again
+        client = FakeS3(self.objects)
+        self._download(client)
+        self.assertEqual(client.ranges, [])
+
+    def test_etag_is_checked_unless_the_object_is_kms_or_customer_encrypted(self):
+        client = FakeS3({key: data for key, data in self.objects.items() if "sv.vcf" in key})
+        real_paginate = client.paginate
+        # An ETag that is not the MD5 of the content
+        client.paginate = lambda **kwargs: (
+            {"Contents": [dict(item, ETag='"0123456789abcdef0123456789abcdef"') for item in page["Contents"]]}
+            for page in real_paginate(**kwargs)
+        )
+        with self.assertRaisesRegex(IOError, "does not match ETag"):
+            self._download(client)
+
+        for encryption in [{"ServerSideEncryption": "aws:kms"}, {"SSECustomerAlgorithm": "AES256"}]:
+            client.encryption = encryption
+            with self.assertLogs(s3_download.logger, "INFO") as logs:
+                [path] = self._download(client)
+            self.assertEqual(path.read_bytes(), b"sv")
+            self.assertIn("not checked", "\n".join(logs.output))
+            path.unlink()
+
+    def test_progress_is_reported_to_the_job(self):
+        engine = create_engine(f"sqlite:///{self.tmp_path / 'test.db'}")
+        Session = sessionmaker(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        db = Session()
+        try:
+            job = job_service.create_job(db, job_type=models.TransferJobType.AWS_IMPORT, subject_id="HG002")
+            self._download(FakeS3(self.objects), job_id=job.id, session_factory=Session)
+            db.refresh(job)
+            self.assertEqual(job.bytes_done, len(self.gvcf) + len(b"sv") + len(b"metric,value\n"))
+            self.assertEqual(job.bytes_total, job.bytes_done)
+        finally:
+            db.close()
+            engine.dispose()
+
+
+class TransferGovernorTest(unittest.TestCase):
+    def test_aggregate_rate_is_capped_after_a_burst(self):
+        now = [100.0]
+        sleeps = []
+
+        class Clock:
+            @staticmethod
+            def monotonic():
+                return now[0]
+
+            @staticmethod
+            def sleep(seconds):
+                sleeps.append(seconds)
+                now[0] += seconds
+
+        governor = s3_download.TransferGovernor(max_objects=2, max_bytes_per_second=1000)
+        with patch.object(s3_download, "time", Clock):
+            governor.throttle(500)
+            self.assertEqual(sleeps, [])
+            for _ in range(4):
+                governor.throttle(500)
+        self.assertEqual(sleeps, [0.5, 0.5, 0.5, 0.5])
+
+    def test_object_slots_are_shared(self):
+        governor = s3_download.TransferGovernor(max_objects=2)
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def fetch():
+            with governor.object_slot():
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.01)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=fetch) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+
+
+@unittest.skipUnless(importlib.util.find_spec("moto") and importlib.util.find_spec("boto3"), "needs moto and boto3")
+class S3DownloadMotoTest(unittest.TestCase):
+    def test_download_from_mocked_s3(self):
+        import boto3
+        from moto import mock_aws
+
+        with mock_aws(), tempfile.TemporaryDirectory() as tmp, \
+                patch.object(digests, "CACHE_PATH", Path(tmp) / "digests.json"):
+            client = boto3.client("s3", region_name="us-east-1")
+            client.create_bucket(Bucket=BUCKET)
+            data = b"ACGT" * 300_000
+            client.put_object(Bucket=BUCKET, Key=f"{PREFIX}/HG002.hard-filtered.gvcf.gz", Body=data)
+
+            paths = s3_download.download_sample(
+                "HG002", client=client, dest_dir=Path(tmp) / "HG002_R001", bucket=BUCKET, part_size=256 * 1024
+            )
+            self.assertEqual(paths[0].read_bytes(), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,22 @@
+import asyncio
+import hashlib
 import io
+import tarfile
 import tempfile
 import unittest
 import zipfile
+from datetime import datetime, timedelta
 from pathlib import Path
+from unittest.mock import patch
 
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-from api.app import job_service, models, settings
+from api.app import crud, job_service, models, settings
 from api.app.database import Base, get_db
+from api.tasks import digests
 
 
 class TransferCommandApiTest(unittest.TestCase):
@@ -27,17 +33,20 @@ class TransferCommandApiTest(unittest.TestCase):
 
         from api.app.api_v1.endpoints import runs, uploads
         from api.tasks import upload_run as upload_task
+        from api.tasks import worker
 
         self.original_upload_dir = uploads.UPLOAD_DIR
         self.original_lab_runs_dir = uploads.LAB_RUNS_DIR
         self.original_settings_upload_dir = settings.UPLOAD_DIR
         self.original_temp_run_dir = upload_task.TEMP_RUN_DIR
-        self.original_run_pipeline = runs.run_pipeline
+        self.original_run_pipeline = worker.run_pipeline
         uploads.UPLOAD_DIR = self.tmp_path / "uploads"
         uploads.LAB_RUNS_DIR = self.tmp_path / "lab_runs"
         settings.UPLOAD_DIR = uploads.UPLOAD_DIR
         upload_task.TEMP_RUN_DIR = uploads.UPLOAD_DIR
-        runs.run_pipeline = lambda *args, **kwargs: None
+        worker.run_pipeline = lambda *args, **kwargs: None
+        self._digest_patch = patch.object(digests, "CACHE_PATH", self.tmp_path / "digests.json")
+        self._digest_patch.start()
 
         app = FastAPI()
         app.include_router(uploads.router, prefix="/api/v1")
@@ -54,14 +63,16 @@ class TransferCommandApiTest(unittest.TestCase):
         self.client = TestClient(app)
 
     def tearDown(self):
-        from api.app.api_v1.endpoints import runs, uploads
+        from api.app.api_v1.endpoints import uploads
         from api.tasks import upload_run as upload_task
+        from api.tasks import worker
 
         uploads.UPLOAD_DIR = self.original_upload_dir
         uploads.LAB_RUNS_DIR = self.original_lab_runs_dir
         settings.UPLOAD_DIR = self.original_settings_upload_dir
         upload_task.TEMP_RUN_DIR = self.original_temp_run_dir
-        runs.run_pipeline = self.original_run_pipeline
+        worker.run_pipeline = self.original_run_pipeline
+        self._digest_patch.stop()
         self.db.close()
         Base.metadata.drop_all(bind=self.engine)
         self._tmpdir.cleanup()
@@ -88,6 +99,33 @@ class TransferCommandApiTest(unittest.TestCase):
         self.assertEqual(job.status, models.TransferJobStatus.COMPLETED)
         self.assertEqual(job.phase, models.TransferJobPhase.COMPLETE)
         self.assertEqual(job.bytes_done, len(payload))
+        self.assertEqual(body["sha256"], hashlib.sha256(payload).hexdigest())
+        self.assertEqual(digests.lookup(job.destination_path, "sha256"), body["sha256"])
+
+    def test_streamed_upload_stops_at_size_limit_and_removes_partial_file(self):
+        # Under the Content-Length precheck (limit + field allowance), over the limit itself
+        payload = b"PK" + b"\0" * 150_000
+        with patch.object(settings, "MAX_UPLOAD_BYTES", 100_000):
+            response = self.client.post(
+                "/api/v1/upload/runs",
+                # Fields after the file: they are only known once the body is read
+                files=[
+                    ("file", ("big_run.zip", payload, "application/zip")),
+                    ("sample", (None, "big_run")),
+                ],
+            )
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(list((self.tmp_path / "uploads").iterdir()), [])
+        job = job_service.list_jobs(self.db)[0]
+        self.assertEqual(job.status, models.TransferJobStatus.FAILED)
+
+        response = self.client.post(
+            "/api/v1/upload/runs",
+            files=[("file", ("run.zip", b"PK", "application/zip"))],
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(list((self.tmp_path / "uploads").iterdir()), [])
 
     def test_aws_import_without_auto_process_returns_queued_transfer_job(self):
         response = self.client.post(
@@ -109,7 +147,247 @@ class TransferCommandApiTest(unittest.TestCase):
         self.assertEqual(job.phase, models.TransferJobPhase.DOWNLOAD)
         self.assertEqual(job.subject_id, "NA24143_Lib3_Rep1")
 
-    def test_manual_benchmarking_returns_completed_pipeline_job(self):
+    def test_tar_bundle_is_extracted_during_upload(self):
+        from api.app.api_v1.endpoints import uploads
+        from api.tasks import upload_run as upload_task
+
+        bundle = io.BytesIO()
+        with tarfile.open(fileobj=bundle, mode="w:gz") as tar:
+            info = tarfile.TarInfo("HG002_R001/HG002.gvcf.gz")
+            info.size = 4
+            tar.addfile(info, io.BytesIO(b"gvcf"))
+
+        with patch.object(upload_task, "LAB_RUN_DIR", self.tmp_path / "lab_runs"), \
+                patch.object(uploads.run_catalog, "refresh_run", lambda run_name: None):
+            response = self.client.post(
+                "/api/v1/upload/runs",
+                data={"sample": "HG002", "benchmarking": "happy"},
+                files={"file": ("HG002_R001.tar.gz", bundle.getvalue(), "application/gzip")},
+            )
+
+        self.assertEqual(response.status_code, 200, response.text)
+        body = response.json()
+        self.assertTrue(body["extracted"])
+        self.assertEqual(body["run_name"], "HG002_R001")
+        self.assertEqual((self.tmp_path / "lab_runs" / "HG002_R001" / "HG002.gvcf.gz").read_bytes(), b"gvcf")
+        self.assertEqual(list((self.tmp_path / "uploads").iterdir()), [])
+
+        self.assertEqual(job_service.get_job(self.db, body["job_id"]).status, models.TransferJobStatus.COMPLETED)
+        pipeline_job = job_service.list_jobs(self.db, job_type=models.TransferJobType.PIPELINE)[0]
+        self.assertEqual(pipeline_job.subject_id, "HG002_R001")
+        self.assertEqual(pipeline_job.metadata_json["benchmarking"], "happy")
+
+    def test_lab_run_upload_is_queued_for_extraction_by_a_worker(self):
+        from api.app.api_v1.endpoints import runs
+        from api.tasks import upload_run as upload_task
+        from api.tasks import worker
+
+        bundle = io.BytesIO()
+        with tarfile.open(fileobj=bundle, mode="w:gz") as tar:
+            info = tarfile.TarInfo("HG002_R001/HG002.gvcf.gz")
+            info.size = 4
+            tar.addfile(info, io.BytesIO(b"gvcf"))
+
+        with patch.object(runs, "UPLOAD_DIR", self.tmp_path / "uploads"):
+            response = self.client.post(
+                "/api/v1/runs/upload",
+                files={"file": ("HG002_R001.tar.gz", bundle.getvalue(), "application/gzip")},
+            )
+
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["status"], models.RunStatus.PENDING_PROCESSING.value)
+        self.assertFalse((self.tmp_path / "lab_runs" / "HG002_R001").exists())
+        job = job_service.list_jobs(self.db, job_type=models.TransferJobType.UPLOAD_ZIP)[0]
+        self.assertEqual(job.status, models.TransferJobStatus.QUEUED)
+        self.assertEqual(job.metadata_json["lab_run_id"], response.json()["id"])
+
+        with patch.object(upload_task, "LAB_RUN_DIR", self.tmp_path / "lab_runs"), \
+                patch.object(worker.run_catalog, "refresh_run", lambda run_name: None):
+            self.assertTrue(worker.run_next_job("test-worker", session_factory=self.Session))
+
+        self.db.expire_all()
+        self.assertEqual(job_service.get_job(self.db, job.id).status, models.TransferJobStatus.COMPLETED)
+        lab_run = crud.get_lab_run(self.db, response.json()["id"])
+        self.assertEqual(lab_run.run_name, "HG002_R001")
+        self.assertEqual(lab_run.status, models.RunStatus.AWAITING_APPROVAL)
+        self.assertEqual((self.tmp_path / "lab_runs" / "HG002_R001" / "HG002.gvcf.gz").read_bytes(), b"gvcf")
+
+    def test_upload_is_parsed_and_extracted_off_the_event_loop_in_batches(self):
+        from api.app import multipart_upload
+        from api.app.api_v1.endpoints import uploads
+        from api.tasks import upload_run as upload_task
+
+        data = bytes(range(256)) * 1024
+        bundle = io.BytesIO()
+        with tarfile.open(fileobj=bundle, mode="w") as tar:
+            info = tarfile.TarInfo("HG002_R002/HG002.gvcf.gz")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        feed = multipart_upload._FormReceiver.feed
+        on_loop = []
+
+        def recording_feed(receiver, batch, *args):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return feed(receiver, batch, *args)
+
+        with patch.object(upload_task, "LAB_RUN_DIR", self.tmp_path / "lab_runs"), \
+                patch.object(uploads.run_catalog, "refresh_run", lambda run_name: None), \
+                patch.object(multipart_upload._FormReceiver, "feed", recording_feed):
+            response = self.client.post(
+                "/api/v1/upload/runs",
+                data={"sample": "HG002"},
+                files={"file": ("HG002_R002.tar", bundle.getvalue(), "application/x-tar")},
+            )
+
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertTrue(response.json()["extracted"])
+        self.assertEqual((self.tmp_path / "lab_runs" / "HG002_R002" / "HG002.gvcf.gz").read_bytes(), data)
+        self.assertEqual(on_loop, [False])
+
+        class StreamedRequest:
+            async def stream(self):
+                for _ in range(10):
+                    yield b"x" * 1000
+                yield b""
+
+        batches = []
+        asyncio.run(multipart_upload.stream_to_thread(StreamedRequest(), lambda batch: batches.append(len(batch)), 3000))
+        self.assertEqual(batches, [3000, 3000, 3000, 1000])
+
+    def test_resumable_upload_accepts_chunks_in_any_order(self):
+        payload = bytes(range(256)) * 10 + b"tail"
+        with patch.object(settings, "UPLOAD_CHUNK_BYTES", 1000):
+            response = self.client.post(
+                "/api/v1/upload/sessions",
+                json={"filename": "HG002_R001.zip", "size": len(payload), "sample": "HG002", "benchmarking": "csv"},
+            )
+        self.assertEqual(response.status_code, 200, response.text)
+        session = response.json()
+        self.assertEqual((session["chunk_count"], session["received"]), (3, []))
+        sessions_url = f"/api/v1/upload/sessions/{session['job_id']}"
+
+        def put_chunk(index, data=None, checksum=None):
+            data = payload[index * 1000:(index + 1) * 1000] if data is None else data
+            headers = {"X-Chunk-SHA256": checksum or hashlib.sha256(data).hexdigest()}
+            return self.client.put(f"{sessions_url}/chunks/{index}", content=data, headers=headers)
+
+        self.assertEqual(put_chunk(2).status_code, 200)
+        self.assertEqual(put_chunk(0, checksum="0" * 64).status_code, 400)
+        self.assertEqual(put_chunk(1, data=b"short").status_code, 400)
+        self.assertEqual(put_chunk(0).json()["bytes_received"], 1000 + len(payload) - 2000)
+
+        # A client coming back after a dropped connection only sends what is missing
+        status = self.client.get(sessions_url).json()
+        self.assertEqual(status["received"], [0, 2])
+        self.assertEqual(self.client.post(f"{sessions_url}/complete").status_code, 409)
+        self.assertEqual(put_chunk(1).status_code, 200)
+
+        response = self.client.post(f"{sessions_url}/complete")
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["run_name"], "HG002_R001")
+        self.assertEqual(list((self.tmp_path / "uploads").iterdir()), [self.tmp_path / "uploads" / "HG002_R001.zip"])
+        self.assertEqual((self.tmp_path / "uploads" / "HG002_R001.zip").read_bytes(), payload)
+
+        job = job_service.get_job(self.db, session["job_id"])
+        self.assertEqual(job.status, models.TransferJobStatus.QUEUED)
+        self.assertEqual(job.phase, models.TransferJobPhase.EXTRACT)
+        self.assertEqual(job.bytes_done, len(payload))
+        self.assertEqual(job.metadata_json["benchmarking"], "csv")
+        self.assertEqual(put_chunk(1).status_code, 409)
+        self.assertEqual(self.client.get(sessions_url).json()["received"], [0, 1, 2])
+
+    def test_resent_chunk_that_drops_is_no_longer_received(self):
+        from api.tasks.chunked_upload import ChunkedUpload, UploadChecksumError
+
+        payload = bytes(range(256)) * 8
+        upload = ChunkedUpload(self.tmp_path / "HG002_R001.zip", len(payload), 1024)
+        upload.create()
+        for index in range(2):
+            writer = upload.open_chunk(index)
+            writer.write(payload[index * 1024:(index + 1) * 1024])
+            writer.commit()
+        self.assertEqual(upload.received(), [0, 1])
+
+        writer = upload.open_chunk(1)
+        writer.write(b"\xff" * 100)
+        writer.close()  # connection dropped
+        self.assertEqual(upload.received(), [0])
+        with self.assertRaises(ValueError):
+            upload.finalize()
+
+        writer = upload.open_chunk(1)
+        writer.write(payload[1024:])
+        writer.commit()
+        with self.assertRaises(UploadChecksumError):
+            upload.finalize(expected_sha256="0" * 64)
+        hexdigests = upload.finalize(expected_sha256=hashlib.sha256(payload).hexdigest())
+        self.assertEqual(upload.dest.read_bytes(), payload)
+        self.assertEqual(digests.lookup(upload.dest, "md5"), hexdigests["md5"])
+
+    def test_upload_session_with_wrong_checksum_or_left_idle_fails(self):
+        from api.tasks import chunked_upload
+
+        payload = b"x" * 100
+        sessions = []
+        for sha256 in ("0" * 64, None):
+            response = self.client.post(
+                "/api/v1/upload/sessions",
+                json={"filename": "HG002_R001.zip", "size": len(payload), "sample": "HG002", "sha256": sha256},
+            )
+            sessions.append(response.json()["job_id"])
+        self.assertEqual(self.client.put(f"/api/v1/upload/sessions/{sessions[0]}/chunks/0", content=payload).status_code, 200)
+
+        response = self.client.post(f"/api/v1/upload/sessions/{sessions[0]}/complete")
+        self.assertEqual(response.status_code, 422)
+        job = job_service.get_job(self.db, sessions[0])
+        self.assertEqual((job.status, job.error_code), (models.TransferJobStatus.FAILED, "upload_corrupt"))
+
+        self.assertEqual(chunked_upload.expire_sessions(self.db, max_idle_seconds=3600), [])
+        self.assertEqual(chunked_upload.expire_sessions(self.db, max_idle_seconds=0), [sessions[1]])
+        self.db.expire_all()
+        self.assertEqual(job_service.get_job(self.db, sessions[1]).error_code, "upload_expired")
+        self.assertEqual(list((self.tmp_path / "uploads").iterdir()), [])
+
+    def test_aws_batch_import_starts_samples_together(self):
+        from api.app.api_v1.endpoints import uploads
+
+        calls = []
+
+        async def fake_import(sample_id, benchmarking_options="", job_id=None):
+            calls.append(("start", sample_id, job_id))
+            await asyncio.sleep(0)
+            calls.append(("end", sample_id, job_id))
+
+        with patch.object(uploads, "process_aws_run_background", fake_import), \
+                patch.object(uploads.s3_download, "available", lambda: True):
+            response = self.client.post(
+                "/api/v1/upload/aws/batch",
+                json={"sample_ids": ["HG002", " NA24143 ", "", "HG002"], "benchmarking": "csv"},
+            )
+
+        self.assertEqual(response.status_code, 200, response.text)
+        imports = response.json()["imports"]
+        self.assertEqual([item["sample_id"] for item in imports], ["HG002", "NA24143"])
+        job_ids = [item["job_id"] for item in imports]
+        self.assertEqual(
+            [call[0] for call in calls], ["start", "start", "end", "end"],
+        )
+        self.assertEqual({call[2] for call in calls}, set(job_ids))
+        for job_id in job_ids:
+            job = job_service.get_job(self.db, job_id)
+            self.assertEqual(job.type, models.TransferJobType.AWS_IMPORT)
+            self.assertEqual(job.metadata_json["benchmarking"], "csv")
+
+        response = self.client.post("/api/v1/upload/aws/batch", json={"sample_ids": [" "]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_manual_benchmarking_queues_pipeline_job_for_workers(self):
+        from api.tasks import worker
+
         response = self.client.post(
             "/api/v1/runs/HG002_R001/benchmarking",
             params={"benchmarking": "csv,truvari"},
@@ -121,9 +399,67 @@ class TransferCommandApiTest(unittest.TestCase):
 
         job = job_service.get_job(self.db, body["job_id"])
         self.assertEqual(job.type, models.TransferJobType.PIPELINE)
+        self.assertEqual(job.status, models.TransferJobStatus.QUEUED)
+
+        calls = []
+        worker.run_pipeline = lambda *args, **kwargs: calls.append((args, kwargs))
+        self.assertTrue(worker.run_next_job("test-worker", session_factory=self.Session))
+        self.assertFalse(worker.run_next_job("test-worker", session_factory=self.Session))
+
+        self.db.expire_all()
+        job = job_service.get_job(self.db, body["job_id"])
         self.assertEqual(job.status, models.TransferJobStatus.COMPLETED)
         self.assertEqual(job.phase, models.TransferJobPhase.COMPLETE)
+        self.assertEqual(job.metadata_json["worker_id"], "test-worker")
+        self.assertEqual(calls[0][0], ("HG002", "R001"))
+        self.assertTrue(calls[0][1]["truvari"])
+        self.assertFalse(calls[0][1]["happy"])
+
+    def test_job_of_a_dead_worker_is_requeued_then_failed(self):
+        from api.app import crud
+        from api.tasks import worker
+
+        job_id = self.client.post("/api/v1/runs/HG002_R001/benchmarking", params={"benchmarking": "csv"}).json()["job_id"]
+        lab_run = crud.get_lab_run_by_name(self.db, "HG002_R001")
+
+        def claim_and_die():
+            job = job_service.claim_job(self.db, worker.WORKER_JOB_TYPES, worker_id="dead-worker")
+            self.assertEqual((job.id, job.worker_id), (job_id, "dead-worker"))
+            crud.update_lab_run_status(self.db, lab_run.id, models.RunStatus.PROCESSING)
+            crud.update_transfer_job(self.db, job_id, heartbeat_at=datetime.utcnow() - timedelta(hours=1))
+
+        claim_and_die()
+        worker.run_maintenance("test-worker", session_factory=self.Session)
+        self.db.expire_all()
+        job = job_service.get_job(self.db, job_id)
+        self.assertEqual((job.status, job.worker_id), (models.TransferJobStatus.QUEUED, None))
+        self.assertEqual(crud.get_lab_run(self.db, lab_run.id).status, models.RunStatus.PENDING_PROCESSING)
+        self.assertFalse(job_service.heartbeat(self.db, job_id, "dead-worker"))
+
+        claim_and_die()
+        with patch.object(settings, "JOB_MAX_RECOVERIES", 1):
+            worker.run_maintenance("test-worker", session_factory=self.Session)
+        self.db.expire_all()
+        job = job_service.get_job(self.db, job_id)
+        self.assertEqual((job.status, job.error_code), (models.TransferJobStatus.FAILED, "worker_lost"))
+        self.assertEqual(crud.get_lab_run(self.db, lab_run.id).status, models.RunStatus.FAILED)
+
+        # Failed jobs are not recovered again
+        self.assertEqual(job_service.recover_expired_jobs(self.db, worker.WORKER_JOB_TYPES), ([], []))
+
+    def test_canceled_queued_job_is_not_claimed(self):
+        from api.tasks import worker
+
+        response = self.client.post(
+            "/api/v1/runs/HG002_R001/benchmarking",
+            params={"benchmarking": "csv"},
+        )
+        job_id = response.json()["job_id"]
+        job_service.request_cancel(self.db, job_id)
 
+        self.assertFalse(worker.run_next_job("test-worker", session_factory=self.Session))
+        self.db.expire_all()
+        self.assertEqual(job_service.get_job(self.db, job_id).status, models.TransferJobStatus.CANCELED)
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,7 @@
 import tempfile
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -90,6 +91,59 @@ class TransferJobServiceTest(unittest.TestCase):
         self.assertEqual(summary["total_rate_bps"], 100)
         self.assertGreater(summary["disk_free_bytes"], 0)
 
+    def test_progress_writes_are_coalesced(self):
+        from api.app import job_service
+
+        job = job_service.create_job(
+            self.db,
+            job_type=models.TransferJobType.UPLOAD_ZIP,
+            subject_id="big_run.zip",
+            phase=models.TransferJobPhase.UPLOAD,
+            bytes_total=10_000,
+        )
+        clock = iter(i * 0.5 for i in range(100))
+        step = 10  # bytes per 0.5 s tick: 20 B/s, far below 5% per write
+        with patch.object(job_service, "_clock", lambda: next(clock)), \
+                patch.object(job_service.settings, "JOB_PROGRESS_FLUSH_SECONDS", 2):
+            written = [
+                job_service.update_progress(self.db, job.id, bytes_done=step * i)
+                for i in range(1, 10)
+            ]
+            final = job_service.update_progress(self.db, job.id, bytes_done=10_000)
+
+        # First call, then every 2 s (4 ticks), then the final byte count
+        self.assertEqual([i for i, updated in enumerate(written) if updated is not None], [0, 4, 8])
+        self.assertEqual(final.bytes_done, 10_000)
+        events = [e for e in job_service.list_events(self.db, job.id) if e.level == models.TransferEventLevel.PROGRESS]
+        self.assertEqual(len(events), 4)
+        self.assertEqual(events[1].metadata_json["series"], [[0.5, 20], [1.0, 30], [1.5, 40], [2.0, 50]])
+        self.assertEqual(events[1].rate_bps, 20)
+        self.assertEqual(job_service.get_job(self.db, job.id).eta_seconds, 0)
+
+    def test_append_events_allocates_sequences_from_the_job_counter(self):
+        from api.app import job_service
+
+        job = job_service.enqueue_job(
+            self.db,
+            job_type=models.TransferJobType.AWS_IMPORT,
+            subject_id="NA24143",
+            phase=models.TransferJobPhase.DOWNLOAD,
+        )
+        lines = [{"message": f"line {i}"} for i in range(3)]
+        lines[1]["level"] = models.TransferEventLevel.WARNING
+        self.assertEqual(job_service.append_events(self.db, job.id, lines), 3)
+        job_service.append_event(self.db, job.id, "done")
+        self.assertEqual(job_service.append_events(self.db, job.id, []), 0)
+
+        events = job_service.list_events(self.db, job.id)
+        self.assertEqual([e.sequence for e in events], [1, 2, 3, 4, 5])
+        self.assertEqual([e.message for e in events[1:]], ["line 0", "line 1", "line 2", "done"])
+        self.assertEqual(events[2].level, models.TransferEventLevel.WARNING)
+        self.assertEqual(job_service.get_job(self.db, job.id).last_event_sequence, 5)
+
+        with self.assertRaises(ValueError):
+            job_service.append_events(self.db, "missing-job", lines)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,119 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from api.app import settings
+from api.tasks import process_run, sharding
+from api.tasks.parsers import parse_truvari_summary
+
+# summary.json of truvari bench over chr1, chr2 and chrY separately, and over all three at once
+SHARD_SUMMARIES = {
+    "chr1": {
+        "TP-base": 4012, "TP-comp": 4009, "FP": 288, "FN": 517,
+        "precision": 0.9329764952292297, "recall": 0.8858467652903511, "f1": 0.9088010125344934,
+        "base cnt": 4529, "comp cnt": 4297,
+        "TP-comp_TP-gt": 3861, "TP-comp_FP-gt": 148, "TP-base_TP-gt": 3866, "TP-base_FP-gt": 146,
+        "gt_concordance": 0.963083063108007,
+        "gt_matrix": {"(0, 1)": {"(0, 1)": 2300, "(1, 1)": 90}, "(1, 1)": {"(1, 1)": 1566, "(0, 1)": 56}},
+    },
+    "chr2": {
+        "TP-base": 3187, "TP-comp": 3190, "FP": 241, "FN": 402,
+        "precision": 0.9297580880209851, "recall": 0.8879910838673726, "f1": 0.9083947390370954,
+        "base cnt": 3589, "comp cnt": 3431,
+        "TP-comp_TP-gt": 3072, "TP-comp_FP-gt": 118, "TP-base_TP-gt": 3069, "TP-base_FP-gt": 118,
+        "gt_concordance": 0.9630094043887147,
+        "gt_matrix": {"(0, 1)": {"(0, 1)": 1850, "(1, 1)": 70}, "(1, 1)": {"(1, 1)": 1219, "(0, 1)": 48}},
+    },
+    # No calls on either side: truvari leaves the statistics unset
+    "chrY": {
+        "TP-base": 0, "TP-comp": 0, "FP": 0, "FN": 0,
+        "precision": None, "recall": None, "f1": None,
+        "base cnt": 0, "comp cnt": 0,
+        "TP-comp_TP-gt": 0, "TP-comp_FP-gt": 0, "TP-base_TP-gt": 0, "TP-base_FP-gt": 0,
+        "gt_concordance": None,
+        "gt_matrix": {},
+    },
+}
+WHOLE_GENOME_SUMMARY = {
+    "TP-base": 7199, "TP-comp": 7199, "FP": 529, "FN": 919,
+    "precision": 0.9315476190476191, "recall": 0.8867947770386795, "f1": 0.9086204720434179,
+    "base cnt": 8118, "comp cnt": 7728,
+    "TP-comp_TP-gt": 6933, "TP-comp_FP-gt": 266, "TP-base_TP-gt": 6935, "TP-base_FP-gt": 264,
+    "gt_concordance": 0.9630504236699542,
+    "gt_matrix": {"(0, 1)": {"(0, 1)": 4150, "(1, 1)": 160}, "(1, 1)": {"(1, 1)": 2785, "(0, 1)": 104}},
+}
+
+
+class TruvariShardingTest(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmpdir.name)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _write(self, path, summary):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(summary, indent=4))
+        return path
+
+    def assertSummaryEqual(self, merged, expected):
+        self.assertEqual(list(merged), list(expected))
+        for field, value in expected.items():
+            if isinstance(value, float):
+                self.assertAlmostEqual(merged[field], value, places=12, msg=field)
+            else:
+                self.assertEqual(merged[field], value, msg=field)
+
+    def test_merged_summary_matches_a_whole_genome_run(self):
+        paths = [self._write(self.root / contig / "summary.json", summary) for contig, summary in SHARD_SUMMARIES.items()]
+        merged = sharding.merge_truvari_summaries(paths, self.root / "summary.json")
+
+        self.assertSummaryEqual(merged, WHOLE_GENOME_SUMMARY)
+        self.assertEqual(json.loads((self.root / "summary.json").read_text()), merged)
+        whole = self._write(self.root / "whole" / "summary.json", WHOLE_GENOME_SUMMARY)
+        self.assertEqual(parse_truvari_summary(self.root / "summary.json"), parse_truvari_summary(whole))
+
+    def test_fields_that_are_not_counters_are_refused(self):
+        odd = dict(SHARD_SUMMARIES["chr2"], weighted={"precision": 0.93})
+        paths = [self._write(self.root / "a.json", SHARD_SUMMARIES["chr1"]), self._write(self.root / "b.json", odd)]
+        with self.assertRaisesRegex(ValueError, "weighted.precision"):
+            sharding.merge_truvari_summaries(paths, self.root / "summary.json")
+        self.assertFalse((self.root / "summary.json").exists())
+
+    def test_sharded_run_benches_each_contig_group_separately(self):
+        include_bed = self.root / "include.bed"
+        include_bed.write_text("chr1\t0\t9000\nchr2\t0\t5000\nchrY\t100\t1100\n")
+        truvari_dir = self.root / "processed" / "truvari"
+        calls = []
+
+        def fake_run(cmd, **kwargs):
+            cmd = [str(arg) for arg in cmd]
+            if cmd[0] == "bcftools":
+                Path(cmd[cmd.index("-o") + 1]).write_text(cmd[cmd.index("-r") + 1])
+            elif cmd[0] == "truvari.sh":
+                local = lambda path: self.root / Path(path).relative_to("/wgs")
+                out_dir = local(cmd[4])
+                self.assertFalse(out_dir.exists())
+                contigs = local(cmd[2]).read_text().split(",")
+                self.assertEqual({line.split("\t")[0] for line in local(cmd[3]).read_text().splitlines()}, set(contigs))
+                calls.append((contigs, kwargs["env"]["TRUVARI_LOG"]))
+                self._write(out_dir / "summary.json", SHARD_SUMMARIES[contigs[0]])
+
+        cmd = ["truvari.sh", "/wgs/truth.vcf.gz", "/wgs/run.vcf.gz", "/wgs/include.bed", "/wgs/processed/truvari"]
+        with patch.object(process_run, "PROJECT_ROOT", self.root), \
+                patch.object(process_run.subprocess, "run", fake_run), \
+                patch.object(settings, "PIPELINE_CPUS", 4):
+            merged = process_run.run_truvari_shards(
+                cmd, self.root / "truth.vcf.gz", self.root / "run.vcf.gz", include_bed, truvari_dir, 3)
+
+        self.assertCountEqual([contigs for contigs, _ in calls], [["chr1"], ["chr2"], ["chrY"]])
+        self.assertEqual(len({log for _, log in calls}), 3)
+        self.assertSummaryEqual(merged, WHOLE_GENOME_SUMMARY)
+        self.assertTrue((truvari_dir / "summary.json").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import hashlib
+import importlib.util
+import io
+import os
+import stat
+import tarfile
+import tempfile
+import time
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+from api.tasks import digests, upload_run
+
+
+class UploadRunTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmpdir.name)
+        self.upload_dir = self.tmp_path / "uploads"
+        self.lab_runs_dir = self.tmp_path / "lab_runs"
+        self.upload_dir.mkdir()
+        self._patches = [
+            patch.object(upload_run, "TEMP_RUN_DIR", self.upload_dir),
+            patch.object(upload_run, "LAB_RUN_DIR", self.lab_runs_dir),
+            patch.object(digests, "CACHE_PATH", self.tmp_path / "digests.json"),
+        ]
+        for p in self._patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+        self._tmpdir.cleanup()
+
+    def _zip(self, members, compression=zipfile.ZIP_DEFLATED):
+        zip_path = self.upload_dir / "HG002_R001.zip"
+        with zipfile.ZipFile(zip_path, "w", compression=compression) as archive:
+            for name, content in members.items():
+                archive.writestr(name, content)
+        return zip_path
+
+
+class UploadRunExtractionTest(UploadRunTestCase):
+    def test_members_are_extracted_in_parallel_into_the_run_directory(self):
+        members = {f"HG002_R001/HG002.chr{i}.gvcf.gz": os.urandom(64 * 1024) for i in range(1, 9)}
+        members["HG002_R001/HG002.mapping_metrics.csv"] = b"a,b\n"
+        members["HG002_R001/logs/nested.txt"] = b"not a run file"
+        run_dir = self.lab_runs_dir / "HG002_R001"
+        run_dir.mkdir(parents=True)
+        (run_dir / "HG002.mapping_metrics.csv").write_bytes(b"kept")
+
+        with patch.object(upload_run.settings, "EXTRACT_WORKERS", 4):
+            self.assertEqual(upload_run.upload_run(self._zip(members)), ("HG002", "R001"))
+
+        self.assertEqual(
+            sorted(path.name for path in run_dir.iterdir()),
+            sorted(["HG002.mapping_metrics.csv", *(Path(name).name for name in members if name.endswith(".gvcf.gz"))]),
+        )
+        self.assertEqual((run_dir / "HG002.mapping_metrics.csv").read_bytes(), b"kept")
+        self.assertEqual((run_dir / "HG002.chr3.gvcf.gz").read_bytes(), members["HG002_R001/HG002.chr3.gvcf.gz"])
+        self.assertIsNotNone(digests.lookup(run_dir / "HG002.chr3.gvcf.gz", "sha256"))
+        self.assertFalse((self.upload_dir / "HG002_R001.zip").exists())
+
+    def test_failed_member_leaves_no_files_behind(self):
+        members = {
+            "HG002_R001/HG002.gvcf.gz": b"A" * 100_000,
+            "HG002_R001/HG002.sv.vcf.gz": b"corrupt-me" * 1000,
+        }
+        zip_path = self._zip(members, compression=zipfile.ZIP_STORED)
+        data = zip_path.read_bytes()
+        zip_path.write_bytes(data.replace(b"corrupt-me", b"corrupt-ME", 1))
+
+        with self.assertRaises(zipfile.BadZipFile):
+            upload_run.upload_run(zip_path)
+        self.assertFalse((self.lab_runs_dir / "HG002_R001").exists())
+
+    def test_unsafe_members_are_rejected_before_extraction(self):
+        for name in ["HG002_R001/../escape.txt", "/HG002_R001/abs.txt", "HG002_R001\\win.txt"]:
+            with self.subTest(name=name):
+                with self.assertRaises(upload_run.UnsafeArchiveError):
+                    upload_run.upload_run(self._zip({name: b"x"}))
+
+        zip_path = self.upload_dir / "HG002_R001.zip"
+        with zipfile.ZipFile(zip_path, "w") as archive:
+            link = zipfile.ZipInfo("HG002_R001/link")
+            link.external_attr = (stat.S_IFLNK | 0o777) << 16
+            archive.writestr(link, "/etc/passwd")
+        with self.assertRaises(upload_run.UnsafeArchiveError):
+            upload_run.upload_run(zip_path)
+
+        with patch.object(upload_run.settings, "MAX_EXTRACTED_BYTES", 10):
+            with self.assertRaises(upload_run.UnsafeArchiveError):
+                upload_run.upload_run(self._zip({"HG002_R001/HG002.gvcf.gz": b"x" * 11}))
+        self.assertFalse(self.lab_runs_dir.exists())
+
+
+class TarBundleTest(UploadRunTestCase):
+    def _tar(self, members, mode="w:gz", name="HG002_R001.tar.gz"):
+        bundle = self.upload_dir / name
+        with tarfile.open(bundle, mode) as tar:
+            for member_name, content in members.items():
+                info = tarfile.TarInfo(member_name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        return bundle
+
+    def test_tar_bundle_is_extracted_like_a_zip(self):
+        gvcf = os.urandom(100_000)
+        bundle = self._tar({
+            "HG002_R001/HG002.gvcf.gz": gvcf,
+            "HG002_R001/HG002.mapping_metrics.csv": b"a,b\n",
+            "HG002_R001/logs/nested.txt": b"skipped",
+        })
+
+        self.assertEqual(upload_run.upload_run(bundle), ("HG002", "R001"))
+
+        run_dir = self.lab_runs_dir / "HG002_R001"
+        self.assertEqual(sorted(path.name for path in run_dir.iterdir()), ["HG002.gvcf.gz", "HG002.mapping_metrics.csv"])
+        self.assertEqual(digests.lookup(run_dir / "HG002.gvcf.gz", "md5"), hashlib.md5(gvcf).hexdigest())
+        self.assertFalse(bundle.exists())
+
+    def test_unsafe_tar_members_are_rejected(self):
+        bundle = self.upload_dir / "HG002_R001.tar"
+        with tarfile.open(bundle, "w") as tar:
+            tar.addfile(tarfile.TarInfo("HG002_R001/HG002.csv"), io.BytesIO(b""))
+            link = tarfile.TarInfo("HG002_R001/link")
+            link.type = tarfile.SYMTYPE
+            link.linkname = "/etc/passwd"
+            tar.addfile(link)
+        with self.assertRaises(upload_run.UnsafeArchiveError):
+            upload_run.upload_run(bundle)
+        self.assertFalse((self.lab_runs_dir / "HG002_R001").exists())
+
+        with self.assertRaises(ValueError):
+            upload_run.upload_run(self._tar({"HG002_R001/a.csv": b"a", "HG003_R001/b.csv": b"b"}))
+        self.assertFalse((self.lab_runs_dir / "HG002_R001").exists())
+
+    def test_growing_upload_is_extracted_before_it_ends(self):
+        gvcf = os.urandom(200_000)
+        data = self._tar({"HG002_R001/HG002.gvcf.gz": gvcf, "HG002_R001/HG002.sv.vcf.gz": b"sv"}, mode="w").read_bytes()
+        partial = self.upload_dir / "upload.tar"
+        growing = upload_run.GrowingFile(partial)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            extraction = pool.submit(upload_run.extract_tar_stream, growing, partial.name)
+            # Up to the last member's data: the padding and end-of-archive blocks are still to come
+            cut = len(data.rstrip(b"\0"))
+            with open(partial, "wb") as out:
+                out.write(data[:cut])
+            growing.advance(cut)
+            run_dir = self.lab_runs_dir / "HG002_R001"
+            for _ in range(200):
+                parts = [path for path in run_dir.glob(".*.part")] if run_dir.exists() else []
+                if len(parts) == 2 and sum(path.stat().st_size for path in parts) == len(gvcf) + 2:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(len(parts), 2)
+            self.assertFalse(extraction.done())
+
+            with open(partial, "ab") as out:
+                out.write(data[cut:])
+            growing.advance(len(data))
+            growing.finish()
+            self.assertEqual(extraction.result(timeout=10), ("HG002", "R001"))
+        self.assertEqual((run_dir / "HG002.gvcf.gz").read_bytes(), gvcf)
+
+    @unittest.skipUnless(importlib.util.find_spec("zstandard"), "needs zstandard")
+    def test_zstd_bundle(self):
+        import zstandard
+
+        raw = self._tar({"HG002_R001/HG002.gvcf.gz": b"zstd"}, mode="w", name="raw.tar")
+        bundle = self.upload_dir / "HG002_R001.tar.zst"
+        bundle.write_bytes(zstandard.ZstdCompressor().compress(raw.read_bytes()))
+        self.assertEqual(upload_run.upload_run(bundle), ("HG002", "R001"))
+        self.assertEqual((self.lab_runs_dir / "HG002_R001" / "HG002.gvcf.gz").read_bytes(), b"zstd")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,27 +3,49 @@ WebSocket manager for real-time log streaming during AWS downloads and processin
 
 This module provides:
 - WebSocket endpoints for real-time log streaming
-- In-memory log storage for HTTP polling fallback
-- Log management by sample_id
+- A bounded in-memory log buffer per sample_id for HTTP polling fallback
+- Relay of logs between API workers, so any worker serves any sample
+
+Each sample keeps its last LOG_BUFFER_LINES entries in a ring buffer. Log
+indexes stay absolute, so polling with `since` keeps working once old lines
+are evicted. Broadcasting never waits on a client: every connection has its
+own send queue drained by its own task, and a client that falls behind has
+its oldest queued lines dropped or is disconnected (LOG_SLOW_CONSUMER_POLICY).
+
+With the "postgres" backend, lines and status changes are also published on
+LOG_CHANNEL by a background thread, and every worker applies the ones of
+other workers. Finished samples are dropped automatically
+LOG_RETENTION_HOURS after their last update.
 """
 
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List, Set
-from datetime import datetime, timedelta
 import asyncio
+import json
 import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 
-logger = logging.getLogger(__name__)
+from fastapi import WebSocket, WebSocketDisconnect
+from sqlalchemy import text
+
+from api.app import settings
 
-# Log storage structure
-# {sample_id: {"logs": [{"timestamp": ..., "message": ..., "level": ...}], "status": "running|completed|error"}}
-log_store: Dict[str, Dict] = {}
+logger = logging.getLogger(__name__)
 
-# Active WebSocket connections per sample_id
-active_connections: Dict[str, Set[WebSocket]] = {}
+# Postgres channel relaying log lines between API workers
+LOG_CHANNEL = "vcbench_logs"
 
-# Cleanup threshold (logs older than 1 hour are removed)
+# Cleanup threshold (finished samples idle for 1 hour are removed)
 LOG_RETENTION_HOURS = 1
+CLEANUP_INTERVAL_SECONDS = 60
+
+# NOTIFY payloads are limited to 8000 bytes
+MAX_RELAYED_MESSAGE_CHARS = 4000
+PUBLISH_BATCH = 200
 
 
 class LogLevel:
@@ -43,217 +65,383 @@ class DownloadStatus:
     ERROR = "error"
 
 
+class _Subject:
+    """Logs, status and connected clients of one sample."""
+
+    def __init__(self, buffer_lines: int):
+        now = datetime.now()
+        self.logs: deque = deque(maxlen=buffer_lines)
+        self.evicted = 0
+        self.status = DownloadStatus.PENDING
+        self.started_at = now
+        self.updated_at = now
+        self.connections: set = set()
+
+    @property
+    def log_count(self) -> int:
+        return self.evicted + len(self.logs)
+
+    def append(self, entry: Dict) -> None:
+        if len(self.logs) == self.logs.maxlen:
+            self.evicted += 1
+        self.logs.append(entry)
+        self.updated_at = datetime.now()
+
+
+class _Connection:
+    """One WebSocket client: its send queue and the task draining it."""
+
+    def __init__(self, websocket: WebSocket, queue_size: int, policy: str):
+        self.websocket = websocket
+        self.loop = asyncio.get_running_loop()
+        self.queue_size = queue_size
+        self.policy = policy
+        self.pending: deque = deque()
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, entry) -> None:
+        """Queue an entry (a log dict, or text); runs on the connection's loop."""
+        if self.closed:
+            return
+        if len(self.pending) >= self.queue_size:
+            if self.policy == "disconnect":
+                self.close()
+                return
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append(entry)
+        self.ready.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self.ready.set()
+
+    async def run(self) -> None:
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.pending and not self.closed:
+                    if self.dropped:
+                        dropped, self.dropped = self.dropped, 0
+                        await self.websocket.send_json({
+                            "timestamp": datetime.now().isoformat(),
+                            "message": f"{dropped} log lines skipped: connection too slow",
+                            "level": LogLevel.WARNING,
+                        })
+                    entry = self.pending.popleft()
+                    if isinstance(entry, str):
+                        await self.websocket.send_text(entry)
+                    else:
+                        await self.websocket.send_json(entry)
+                if self.closed:
+                    # 1013: try again later; the client reconnects and gets the buffer
+                    await self.websocket.close(code=1013)
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"WebSocket send failed: {e}")
+            self.closed = True
+
+
+class LogHub:
+    def __init__(
+        self,
+        buffer_lines: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        policy: Optional[str] = None,
+        backend: Optional[str] = None,
+    ):
+        self.buffer_lines = buffer_lines or settings.LOG_BUFFER_LINES
+        self.queue_size = queue_size or settings.LOG_SEND_QUEUE_SIZE
+        self.policy = policy or settings.LOG_SLOW_CONSUMER_POLICY
+        self.backend = backend or settings.LOG_HUB_BACKEND
+        self.origin = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        self._subjects: Dict[str, _Subject] = {}
+        self._cleaned_at = time.monotonic()
+        self._outbox: queue.SimpleQueue = queue.SimpleQueue()
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    # Local state
+
+    def subject(self, sample_id: str) -> _Subject:
+        with self._lock:
+            subject = self._subjects.get(sample_id)
+            if subject is None:
+                subject = self._subjects[sample_id] = _Subject(self.buffer_lines)
+            return subject
+
+    def add(self, sample_id: str, message: str, level: str) -> Dict:
+        entry = {"timestamp": datetime.now().isoformat(), "message": message, "level": level}
+        self._apply(sample_id, "log", entry)
+        self._publish(sample_id, "log", entry)
+        return entry
+
+    def set_status(self, sample_id: str, status: str) -> None:
+        self._apply(sample_id, "status", status)
+        self._publish(sample_id, "status", status)
+
+    def _apply(self, sample_id: str, kind: str, value) -> None:
+        with self._lock:
+            subject = self.subject(sample_id)
+            if kind == "status":
+                subject.status = value
+                subject.updated_at = datetime.now()
+                connections = []
+            else:
+                subject.append(value)
+                connections = list(subject.connections)
+            if time.monotonic() - self._cleaned_at >= CLEANUP_INTERVAL_SECONDS:
+                self.cleanup()
+        for connection in connections:
+            try:
+                connection.loop.call_soon_threadsafe(connection.offer, value)
+            except RuntimeError:
+                # Loop already closed: the connection is gone
+                connection.closed = True
+
+    def get_logs(self, sample_id: str, since: int = 0) -> List[Dict]:
+        with self._lock:
+            subject = self._subjects.get(sample_id)
+            if subject is None:
+                return []
+            return list(subject.logs)[max(since - subject.evicted, 0):]
+
+    def get_status(self, sample_id: str) -> Dict:
+        with self._lock:
+            subject = self._subjects.get(sample_id)
+            if subject is None:
+                return {
+                    "sample_id": sample_id,
+                    "status": DownloadStatus.PENDING,
+                    "log_count": 0,
+                    "started_at": None,
+                    "updated_at": None
+                }
+            return {
+                "sample_id": sample_id,
+                "status": subject.status,
+                "log_count": subject.log_count,
+                "started_at": subject.started_at.isoformat(),
+                "updated_at": subject.updated_at.isoformat()
+            }
+
+    def cleanup(self) -> None:
+        """Drop finished samples idle for LOG_RETENTION_HOURS that nobody is watching."""
+        cutoff_time = datetime.now() - timedelta(hours=LOG_RETENTION_HOURS)
+        with self._lock:
+            self._cleaned_at = time.monotonic()
+            for sample_id, subject in list(self._subjects.items()):
+                if (
+                    subject.status in (DownloadStatus.COMPLETED, DownloadStatus.ERROR)
+                    and subject.updated_at < cutoff_time
+                    and not subject.connections
+                ):
+                    logger.info(f"Cleaning up old logs for {sample_id}")
+                    del self._subjects[sample_id]
+
+    # Connections
+
+    def connect(self, websocket: WebSocket, sample_id: str) -> _Connection:
+        """Register a client; the buffered lines are queued to it first."""
+        self.start()
+        connection = _Connection(websocket, self.queue_size, self.policy)
+        with self._lock:
+            subject = self.subject(sample_id)
+            connection.pending.extend(subject.logs)
+            subject.connections.add(connection)
+        connection.ready.set()
+        return connection
+
+    def disconnect(self, connection: _Connection, sample_id: str) -> None:
+        connection.close()
+        with self._lock:
+            subject = self._subjects.get(sample_id)
+            if subject is not None:
+                subject.connections.discard(connection)
+
+    # Relay between workers
+
+    def relayed(self) -> bool:
+        if self.backend == "auto":
+            from api.app.database import engine
+
+            self.backend = "postgres" if engine.dialect.name == "postgresql" else "local"
+        return self.backend == "postgres"
+
+    def _publish(self, sample_id: str, kind: str, value) -> None:
+        if not self.relayed():
+            return
+        self.start()
+        if kind == "log" and len(value["message"]) > MAX_RELAYED_MESSAGE_CHARS:
+            value = {**value, "message": value["message"][:MAX_RELAYED_MESSAGE_CHARS] + "…"}
+        self._outbox.put(json.dumps({"origin": self.origin, "sample_id": sample_id, "kind": kind, "value": value}))
+
+    def receive(self, payload: str) -> None:
+        """Apply a line or status published by another worker."""
+        data = json.loads(payload)
+        if data.get("origin") != self.origin:
+            self._apply(data["sample_id"], data["kind"], data["value"])
+
+    def start(self) -> None:
+        if not self.relayed():
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._run_publisher, name="log-hub-publisher", daemon=True),
+                threading.Thread(target=self._run_listener, name="log-hub-listener", daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _run_publisher(self) -> None:
+        from api.app.database import engine
+
+        while not self._stop.is_set():
+            try:
+                batch = [self._outbox.get(timeout=1)]
+            except queue.Empty:
+                continue
+            while len(batch) < PUBLISH_BATCH:
+                try:
+                    batch.append(self._outbox.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with engine.begin() as connection:
+                    for payload in batch:
+                        connection.execute(
+                            text("SELECT pg_notify(:channel, :payload)"),
+                            {"channel": LOG_CHANNEL, "payload": payload},
+                        )
+            except Exception as e:
+                logger.warning(f"Could not relay {len(batch)} log lines to other workers: {e}")
+
+    def _run_listener(self) -> None:
+        from api.app.database import iter_notifications
+
+        while not self._stop.is_set():
+            try:
+                for payloads in iter_notifications(LOG_CHANNEL, 5, self._stop):
+                    for payload in payloads:
+                        self.receive(payload)
+            except Exception as e:
+                logger.warning(f"Log relay listener error, retrying: {e}")
+                self._stop.wait(5)
+
+
+hub = LogHub()
+
+
 def init_log_store(sample_id: str):
     """Initialize log storage for a sample"""
-    if sample_id not in log_store:
-        log_store[sample_id] = {
-            "logs": [],
-            "status": DownloadStatus.PENDING,
-            "started_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }
-        active_connections[sample_id] = set()
+    hub.subject(sample_id)
 
 
 def add_log(sample_id: str, message: str, level: str = LogLevel.INFO):
     """
-    Add a log entry for a sample.
-    
+    Add a log entry for a sample and queue it to the connected clients.
+
     Args:
         sample_id: Sample identifier
         message: Log message
         level: Log level (info, success, warning, error, progress)
     """
-    init_log_store(sample_id)
-    
-    log_entry = {
-        "timestamp": datetime.now().isoformat(),
-        "message": message,
-        "level": level
-    }
-    
-    log_store[sample_id]["logs"].append(log_entry)
-    log_store[sample_id]["updated_at"] = datetime.now().isoformat()
-    
+    hub.add(sample_id, message, level)
     logger.info(f"[{sample_id}] {level.upper()}: {message}")
 
 
 def set_status(sample_id: str, status: str):
     """
     Set the status for a sample download/processing.
-    
+
     Args:
         sample_id: Sample identifier
         status: Status (pending, running, completed, error)
     """
-    init_log_store(sample_id)
-    log_store[sample_id]["status"] = status
-    log_store[sample_id]["updated_at"] = datetime.now().isoformat()
+    hub.set_status(sample_id, status)
 
 
 def get_logs(sample_id: str, since: int = 0) -> List[Dict]:
     """
     Get logs for a sample.
-    
+
     Args:
         sample_id: Sample identifier
         since: Index to get logs from (for incremental updates)
-        
+
     Returns:
-        List of log entries
+        List of log entries still in the buffer
     """
-    if sample_id not in log_store:
-        return []
-    
-    logs = log_store[sample_id]["logs"]
-    if since > 0:
-        return logs[since:]
-    return logs
+    return hub.get_logs(sample_id, since=since)
 
 
 def get_status(sample_id: str) -> Dict:
     """
     Get status information for a sample.
-    
+
     Args:
         sample_id: Sample identifier
-        
+
     Returns:
         Dictionary with status, log count, timestamps
     """
-    if sample_id not in log_store:
-        return {
-            "sample_id": sample_id,
-            "status": DownloadStatus.PENDING,
-            "log_count": 0,
-            "started_at": None,
-            "updated_at": None
-        }
-    
-    data = log_store[sample_id]
-    return {
-        "sample_id": sample_id,
-        "status": data["status"],
-        "log_count": len(data["logs"]),
-        "started_at": data.get("started_at"),
-        "updated_at": data.get("updated_at")
-    }
+    return hub.get_status(sample_id)
 
 
 def cleanup_old_logs():
-    """Remove logs older than LOG_RETENTION_HOURS"""
-    cutoff_time = datetime.now() - timedelta(hours=LOG_RETENTION_HOURS)
-    
-    samples_to_remove = []
-    for sample_id, data in log_store.items():
-        # Only cleanup completed or errored downloads
-        if data["status"] in [DownloadStatus.COMPLETED, DownloadStatus.ERROR]:
-            updated_at = datetime.fromisoformat(data["updated_at"])
-            if updated_at < cutoff_time:
-                samples_to_remove.append(sample_id)
-    
-    for sample_id in samples_to_remove:
-        logger.info(f"Cleaning up old logs for {sample_id}")
-        del log_store[sample_id]
-        if sample_id in active_connections:
-            del active_connections[sample_id]
-
-
-async def connect_websocket(websocket: WebSocket, sample_id: str):
-    """
-    Handle WebSocket connection for a sample.
-    
-    Args:
-        websocket: WebSocket connection
-        sample_id: Sample identifier
-    """
-    await websocket.accept()
-    
-    init_log_store(sample_id)
-    active_connections[sample_id].add(websocket)
-    
-    logger.info(f"WebSocket connected for {sample_id}")
-    
-    # Send existing logs to the new connection
-    existing_logs = get_logs(sample_id)
-    for log_entry in existing_logs:
-        try:
-            await websocket.send_json(log_entry)
-        except Exception as e:
-            logger.error(f"Error sending existing logs: {e}")
-            break
-
-
-async def disconnect_websocket(websocket: WebSocket, sample_id: str):
-    """
-    Handle WebSocket disconnection.
-    
-    Args:
-        websocket: WebSocket connection
-        sample_id: Sample identifier
-    """
-    if sample_id in active_connections:
-        active_connections[sample_id].discard(websocket)
-    
-    logger.info(f"WebSocket disconnected for {sample_id}")
+    """Remove finished samples idle for LOG_RETENTION_HOURS (also done automatically)"""
+    hub.cleanup()
 
 
 async def broadcast_log(sample_id: str, message: str, level: str = LogLevel.INFO):
     """
     Broadcast a log message to all connected WebSocket clients for a sample.
-    
+    Returns at once: each client is sent its lines by its own task.
+
     Args:
         sample_id: Sample identifier
         message: Log message
         level: Log level
     """
-    # Store the log
     add_log(sample_id, message, level)
-    
-    # Broadcast to WebSocket connections
-    if sample_id in active_connections:
-        log_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "message": message,
-            "level": level
-        }
-        
-        disconnected = set()
-        for websocket in active_connections[sample_id]:
-            try:
-                await websocket.send_json(log_entry)
-            except Exception as e:
-                logger.error(f"Error broadcasting to WebSocket: {e}")
-                disconnected.add(websocket)
-        
-        # Remove disconnected clients
-        for websocket in disconnected:
-            active_connections[sample_id].discard(websocket)
 
 
 async def websocket_endpoint(websocket: WebSocket, sample_id: str):
     """
     WebSocket endpoint handler.
-    
+
     Args:
         websocket: WebSocket connection
         sample_id: Sample identifier
     """
-    await connect_websocket(websocket, sample_id)
-    
+    await websocket.accept()
+    connection = hub.connect(websocket, sample_id)
+    sender = asyncio.create_task(connection.run())
+    logger.info(f"WebSocket connected for {sample_id}")
+
     try:
         # Keep the connection alive
         while True:
             # Wait for any client messages (ping/pong)
             data = await websocket.receive_text()
-            
+
             # Echo back for keep-alive
             if data == "ping":
-                await websocket.send_text("pong")
-                
+                connection.offer("pong")
+
     except WebSocketDisconnect:
-        await disconnect_websocket(websocket, sample_id)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error for {sample_id}: {e}")
-        await disconnect_websocket(websocket, sample_id)
-
+    finally:
+        hub.disconnect(connection, sample_id)
+        sender.cancel()
+        logger.info(f"WebSocket disconnected for {sample_id}")
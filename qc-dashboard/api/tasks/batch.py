@@ -0,0 +1,184 @@
+"""
+Batch (backfill) benchmarking of many runs across a process pool.
+
+The work forms a small DAG:
+
+    reference preparation (once per GIAB base sample)
+        -> run_pipeline for each run of that sample
+           (gVCF filter -> hap.py || Truvari -> metric ingest)
+
+Reference preparation (truth-set download, SDF, normalized Truvari truth
+files) is submitted once per base sample, and a run is submitted as soon as
+its base sample is ready, so runs of one sample start while another sample's
+references are still being prepared.
+
+Usage (from the qc-dashboard directory):
+    python -m api.tasks.process_run --runs 'HG002_*' NA24143_Lib3_Rep1_R001 --happy --truvari --workers 4
+"""
+
+import fnmatch
+import logging
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from api.app import crud, models, schemas, settings
+from api.app.database import SessionLocal
+from api.tasks.process_run import prepare_references, run_pipeline
+from api.tasks.setup_reference import extract_base_sample
+from api.tasks.utils import split_run_name
+
+logger = logging.getLogger(__name__)
+
+LAB_RUN_DIR = settings.LAB_RUNS_DIR
+
+
+@dataclass
+class RunResult:
+    run_name: str
+    ok: bool
+    seconds: float
+    input_bytes: int = 0
+    error: str = ""
+
+
+@dataclass
+class BatchSummary:
+    results: list[RunResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def succeeded(self) -> list[RunResult]:
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self) -> list[RunResult]:
+        return [result for result in self.results if not result.ok]
+
+    def format(self) -> str:
+        hours = self.seconds / 3600 or 1e-9
+        processed_gb = sum(result.input_bytes for result in self.succeeded) / 1024 ** 3
+        mean_seconds = sum(result.seconds for result in self.results) / len(self.results) if self.results else 0
+        lines = [
+            "Batch summary",
+            f"  runs:        {len(self.results)} ({len(self.succeeded)} succeeded, {len(self.failed)} failed)",
+            f"  wall time:   {self.seconds / 60:.1f} min",
+            f"  throughput:  {len(self.succeeded) / hours:.1f} runs/h, {processed_gb / hours:.1f} GB of variant files/h",
+            f"  mean run:    {mean_seconds / 60:.1f} min",
+        ]
+        for result in self.failed:
+            lines.append(f"  {result.run_name} FAILED: {result.error}")
+        return "\n".join(lines)
+
+
+def resolve_runs(patterns: list[str]) -> list[str]:
+    """
+    Expand run names and glob patterns against the directories of
+    data/lab_runs. Names that are not valid sample_run names are skipped.
+    """
+    available = sorted(path.name for path in LAB_RUN_DIR.iterdir() if path.is_dir()) if LAB_RUN_DIR.exists() else []
+    run_names = []
+    for pattern in patterns:
+        matches = fnmatch.filter(available, pattern)
+        if not matches:
+            logger.warning(f"No run under {LAB_RUN_DIR} matches {pattern}")
+        for run_name in matches:
+            try:
+                split_run_name(run_name)
+            except ValueError:
+                logger.warning(f"Skipping {run_name}: not a sample_run name")
+                continue
+            if run_name not in run_names:
+                run_names.append(run_name)
+    return run_names
+
+
+def _benchmark_run(run_name: str, options: dict) -> RunResult:
+    """Benchmark one run in a pool process and record its lab run status."""
+    started = time.monotonic()
+    sample, run = split_run_name(run_name)
+    input_bytes = sum(path.stat().st_size for path in (LAB_RUN_DIR / run_name).glob("*.vcf.gz"))
+    db = SessionLocal()
+    try:
+        lab_run = crud.get_lab_run_by_name(db, run_name)
+        if lab_run is None:
+            lab_run = crud.create_lab_run(
+                db, schemas.LabRunCreate(run_name=run_name, status=models.RunStatus.PENDING_PROCESSING)
+            )
+        crud.update_lab_run_status(db, lab_run.id, models.RunStatus.PROCESSING)
+        try:
+            run_pipeline(sample, run, **options)
+        except Exception as e:
+            logger.exception(f"Benchmarking failed for {run_name}")
+            db.rollback()
+            crud.update_lab_run_status(db, lab_run.id, models.RunStatus.FAILED, error_message=str(e))
+            return RunResult(run_name, False, time.monotonic() - started, input_bytes, str(e))
+        crud.update_lab_run_status(db, lab_run.id, models.RunStatus.AWAITING_APPROVAL)
+        return RunResult(run_name, True, time.monotonic() - started, input_bytes)
+    finally:
+        db.close()
+
+
+def run_batch(
+    run_names: list[str],
+    workers: int = settings.PIPELINE_WORKERS,
+    happy: bool = False,
+    stratified: bool = False,
+    truvari: bool = False,
+    csv_reformat: bool = False,
+    force: bool = False,
+) -> BatchSummary:
+    """
+    Benchmark run_names across a pool of worker processes.
+
+    Each worker runs one run_pipeline at a time with the full HAPPY_CPUS /
+    HAPPY_MEMORY budget, so size workers * HAPPY_CPUS to the host.
+    """
+    options = {
+        "happy": happy,
+        "stratified": stratified,
+        "truvari": truvari,
+        "csv_reformat": csv_reformat,
+        "force": force,
+    }
+    by_base_sample: dict[str, list[str]] = {}
+    for run_name in run_names:
+        sample, _run = split_run_name(run_name)
+        by_base_sample.setdefault(extract_base_sample(sample), []).append(run_name)
+
+    summary = BatchSummary()
+    started = time.monotonic()
+    # spawn gives each worker its own SQLAlchemy engine, as in api.tasks.worker.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(workers, 1), mp_context=context) as pool:
+        pending = {}
+        for base_sample, names in by_base_sample.items():
+            sample, _run = split_run_name(names[0])
+            pending[pool.submit(prepare_references, sample, happy, truvari)] = ("reference", base_sample)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, key = pending.pop(future)
+                if kind == "reference":
+                    error = future.exception()
+                    if error is not None:
+                        logger.error(f"Reference preparation failed for {key}: {error}")
+                        summary.results.extend(
+                            RunResult(run_name, False, 0.0, error=f"references for {key}: {error}")
+                            for run_name in by_base_sample[key]
+                        )
+                        continue
+                    logger.info(f"References ready for {key}; queueing {len(by_base_sample[key])} run(s)")
+                    for run_name in by_base_sample[key]:
+                        pending[pool.submit(_benchmark_run, run_name, options)] = ("run", run_name)
+                else:
+                    error = future.exception()
+                    result = RunResult(key, False, 0.0, error=str(error)) if error else future.result()
+                    summary.results.append(result)
+                    logger.info(
+                        f"[{len(summary.results)}/{len(run_names)}] {key} "
+                        f"{'done' if result.ok else 'FAILED'} in {result.seconds / 60:.1f} min"
+                    )
+    summary.seconds = time.monotonic() - started
+    return summary
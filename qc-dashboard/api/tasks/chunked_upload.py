@@ -0,0 +1,216 @@
+"""
+Storage for resumable uploads sent as numbered chunks.
+
+An upload session preallocates {archive}.part at its final size. Chunk i
+covers bytes [i * chunk_size, (i + 1) * chunk_size) and is written at that
+offset as it arrives, so chunks can come in any order, over parallel
+requests, and finalizing is a rename: the archive is never copied or
+concatenated.
+
+Received chunks are recorded in {archive}.part.chunks, one byte per chunk,
+set only once the chunk's bytes and checksum are verified and on disk.
+Each chunk marks its own byte, so parallel requests (even from different
+API processes) never overwrite each other's state, and a session resumed
+after a dropped connection only has to send the chunks that are not marked.
+A chunk sent again is unmarked before its first byte is overwritten.
+
+Finalizing hashes the whole archive once, checks it against the client's
+SHA-256 when one was given and caches the digests (api.tasks.digests).
+Sessions idle for UPLOAD_SESSION_TTL_SECONDS are failed and their files
+removed by expire_sessions, which the pipeline workers run periodically.
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from api.app import job_service, models, settings
+from api.tasks import digests
+
+logger = logging.getLogger(__name__)
+
+RECEIVED = b"\x01"
+MISSING = b"\0"
+
+
+class UploadChecksumError(ValueError):
+    """The assembled archive does not match the checksum the client announced."""
+
+
+class ChunkedUpload:
+    """The .part file and chunk bitmap of one upload session."""
+
+    def __init__(self, dest: Path, size: int, chunk_size: int):
+        self.dest = Path(dest)
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunk_count = -(-size // chunk_size)
+        self.part_path = self.dest.with_name(f"{self.dest.name}.part")
+        self.bitmap_path = self.dest.with_name(f"{self.dest.name}.part.chunks")
+
+    def chunk_range(self, index: int) -> tuple[int, int]:
+        """Offset and length of chunk index."""
+        if not 0 <= index < self.chunk_count:
+            raise ValueError(f"Chunk {index} is out of range (0-{self.chunk_count - 1})")
+        offset = index * self.chunk_size
+        return offset, min(self.chunk_size, self.size - offset)
+
+    def create(self) -> None:
+        """Preallocate the .part file, so a full disk shows up now rather than mid-upload."""
+        with open(self.part_path, "wb") as f:
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(f.fileno(), 0, self.size)
+                except OSError as e:
+                    # Not supported by this filesystem
+                    if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                        raise
+                    f.truncate(self.size)
+            else:
+                f.truncate(self.size)
+        with open(self.bitmap_path, "wb") as f:
+            f.write(b"\0" * self.chunk_count)
+
+    def exists(self) -> bool:
+        return self.part_path.is_file() and self.bitmap_path.is_file()
+
+    def received(self) -> list[int]:
+        bitmap = self.bitmap_path.read_bytes()
+        return [index for index, mark in enumerate(bitmap[:self.chunk_count]) if mark == RECEIVED[0]]
+
+    def bytes_received(self, received: Optional[list[int]] = None) -> int:
+        indexes = self.received() if received is None else received
+        return sum(self.chunk_range(index)[1] for index in indexes)
+
+    def last_activity(self) -> Optional[float]:
+        """Time of the last chunk written (mtime of the session files), None if they are gone."""
+        mtimes = []
+        for path in (self.part_path, self.bitmap_path):
+            try:
+                mtimes.append(path.stat().st_mtime)
+            except FileNotFoundError:
+                pass
+        return max(mtimes, default=None)
+
+    def mark(self, index: int, mark: bytes) -> None:
+        """Set the bitmap byte of chunk index and flush it to disk."""
+        bitmap_fd = os.open(self.bitmap_path, os.O_WRONLY)
+        try:
+            os.pwrite(bitmap_fd, mark, index)
+            os.fsync(bitmap_fd)
+        finally:
+            os.close(bitmap_fd)
+
+    def open_chunk(self, index: int) -> "ChunkWriter":
+        return ChunkWriter(self, index)
+
+    def finalize(self, expected_sha256: Optional[str] = None) -> dict[str, str]:
+        """
+        Check the .part file and move it into place. Raises ValueError if
+        chunks are missing and UploadChecksumError if its SHA-256 is not
+        expected_sha256. Returns its digests, which are also cached.
+        """
+        missing = self.chunk_count - len(self.received())
+        if missing:
+            raise ValueError(f"{missing} of {self.chunk_count} chunks have not been received")
+        hexdigests = digests.hash_file(self.part_path)
+        if expected_sha256 and expected_sha256.lower() != hexdigests["sha256"]:
+            raise UploadChecksumError(f"Upload SHA-256 {hexdigests['sha256']} does not match {expected_sha256}")
+        os.replace(self.part_path, self.dest)
+        self.bitmap_path.unlink(missing_ok=True)
+        try:
+            digests.store(self.dest, hexdigests)
+        except OSError as e:
+            logger.warning(f"Could not cache digests for {self.dest}: {e}")
+        return hexdigests
+
+    def discard(self) -> None:
+        self.part_path.unlink(missing_ok=True)
+        self.bitmap_path.unlink(missing_ok=True)
+
+
+class ChunkWriter:
+    """Writes one chunk at its offset as its bytes arrive, then verifies and marks it."""
+
+    def __init__(self, upload: ChunkedUpload, index: int):
+        self.upload = upload
+        self.index = index
+        self.offset, self.length = upload.chunk_range(index)
+        self.written = 0
+        self.sha256 = hashlib.sha256()
+        self.unmarked = False
+        self.fd: Optional[int] = os.open(upload.part_path, os.O_WRONLY)
+
+    def write(self, data: bytes) -> None:
+        if self.written + len(data) > self.length:
+            raise ValueError(f"Chunk {self.index} is longer than its {self.length} bytes")
+        if not self.unmarked:
+            # A re-sent chunk stops counting as received before its bytes start changing
+            self.upload.mark(self.index, MISSING)
+            self.unmarked = True
+        self.sha256.update(data)
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, self.offset + self.written)
+            view = view[written:]
+            self.written += written
+
+    def commit(self, expected_sha256: Optional[str] = None) -> str:
+        """Check the chunk, flush it to disk and mark it received. Returns its SHA-256."""
+        if self.written != self.length:
+            raise ValueError(f"Chunk {self.index} has {self.written} bytes, expected {self.length}")
+        hexdigest = self.sha256.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != hexdigest:
+            raise ValueError(f"Chunk {self.index} SHA-256 {hexdigest} does not match {expected_sha256}")
+        os.fsync(self.fd)
+        self.close()
+        self.upload.mark(self.index, RECEIVED)
+        return hexdigest
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def upload_of(job: models.TransferJob) -> Optional[ChunkedUpload]:
+    """The ChunkedUpload of an upload session job, None for other jobs."""
+    chunk_size = (job.metadata_json or {}).get("chunk_size")
+    if not chunk_size or not job.destination_path or not job.bytes_total:
+        return None
+    return ChunkedUpload(Path(job.destination_path), job.bytes_total, chunk_size)
+
+
+def expire_sessions(db: Session, max_idle_seconds: Optional[int] = None) -> list[str]:
+    """
+    Fail the upload sessions that received no chunk for max_idle_seconds
+    (UPLOAD_SESSION_TTL_SECONDS by default) and free their preallocated
+    .part files. Returns the ids of the expired jobs.
+    """
+    max_idle_seconds = settings.UPLOAD_SESSION_TTL_SECONDS if max_idle_seconds is None else max_idle_seconds
+    now = time.time()
+    expired = []
+    running = job_service.list_jobs(
+        db, status=models.TransferJobStatus.RUNNING, job_type=models.TransferJobType.UPLOAD_ZIP, limit=10_000
+    )
+    for job in running:
+        upload = upload_of(job)
+        if upload is None or job.phase != models.TransferJobPhase.UPLOAD:
+            continue
+        last_activity = upload.last_activity()
+        if last_activity is not None and now - last_activity < max_idle_seconds:
+            continue
+        upload.discard()
+        job_service.fail_job(
+            db, job.id, f"Upload session expired after {max_idle_seconds} s without chunks", error_code="upload_expired"
+        )
+        expired.append(job.id)
+    if expired:
+        logger.info(f"Expired {len(expired)} idle upload sessions")
+    return expired
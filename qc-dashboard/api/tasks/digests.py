@@ -0,0 +1,188 @@
+"""
+On-disk digest cache for run and reference files.
+
+Digests (MD5 for DRAGEN .md5sum verification, SHA-256 for the reference
+cache and stage fingerprints) are stored in DIGEST_CACHE_PATH, keyed by
+resolved path and validated against the file's size and mtime. Writers that
+already stream a file (ZIP extraction, AWS import) hash it on the way in with
+HashingWriter, so the pipeline's later verification is a lookup. Cache misses
+are hashed in one read pass for all algorithms, with reads overlapping
+hashing, and can be pushed to a background pool with digest_async.
+Entries of deleted or moved files are dropped by prune(), which the
+workers' maintenance pass calls, rather than on every store().
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from api.app import settings
+from api.tasks import utils
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = settings.DIGEST_CACHE_PATH
+ALGORITHMS = ("md5", "sha256")
+CHUNK_SIZE = 8 * 1024 * 1024
+
+_executor = ThreadPoolExecutor(max_workers=max(settings.DIGEST_WORKERS, 1), thread_name_prefix="digest")
+_pending: dict[str, Future] = {}
+_pending_lock = threading.Lock()
+
+
+class HashingWriter:
+    """Binary file wrapper that hashes every chunk written through it."""
+
+    def __init__(self, fileobj, algorithms=ALGORITHMS):
+        self._fileobj = fileobj
+        self._hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+
+    def write(self, data) -> int:
+        for digest in self._hashes.values():
+            digest.update(data)
+        return self._fileobj.write(data)
+
+    def hexdigests(self) -> dict[str, str]:
+        return {algorithm: digest.hexdigest() for algorithm, digest in self._hashes.items()}
+
+
+def _key(path: Path) -> str:
+    return str(Path(path).resolve())
+
+
+def _read_cache() -> dict:
+    try:
+        with open(CACHE_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def lookup(path: Path, algorithm: str = "md5") -> str | None:
+    """Return the cached digest of path if the file is unchanged since it was hashed."""
+    stat = Path(path).stat()
+    entry = _read_cache().get(_key(path))
+    if not entry or entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+        return None
+    return entry.get(algorithm)
+
+
+def _write_cache(cache: dict) -> None:
+    tmp_path = CACHE_PATH.with_name(f".{CACHE_PATH.name}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, CACHE_PATH)
+
+
+def _cache_lock():
+    return utils.file_lock(CACHE_PATH.with_name(f"{CACHE_PATH.name}.lock"))
+
+
+def store(path: Path, hexdigests: dict[str, str]) -> None:
+    """Record digests for the current content of path."""
+    stat = Path(path).stat()
+    with _cache_lock():
+        cache = _read_cache()
+        cache[_key(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, **hexdigests}
+        _write_cache(cache)
+
+
+def prune() -> int:
+    """Drop the entries of files that were deleted or moved since. Returns how many."""
+    with _cache_lock():
+        cache = _read_cache()
+        kept = {key: entry for key, entry in cache.items() if os.path.exists(key)}
+        if len(kept) != len(cache):
+            _write_cache(kept)
+    return len(cache) - len(kept)
+
+
+def compute(path: Path) -> dict[str, str]:
+    """Hash path with every algorithm in a single pass and cache the result."""
+    hexdigests = hash_file(path)
+    store(path, hexdigests)
+    return hexdigests
+
+
+def hash_file(path: Path) -> dict[str, str]:
+    """
+    Hash path with every algorithm in a single pass, without caching.
+    hashlib releases the GIL on large buffers, so the next chunk is read
+    while the previous one is being hashed.
+    """
+    hashes = [hashlib.new(algorithm) for algorithm in ALGORITHMS]
+
+    def update(chunk):
+        for digest in hashes:
+            digest.update(chunk)
+
+    with open(path, "rb") as f, ThreadPoolExecutor(max_workers=1) as hasher:
+        pending = None
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            if pending is not None:
+                pending.result()
+            pending = hasher.submit(update, chunk)
+        if pending is not None:
+            pending.result()
+    return {algorithm: digest.hexdigest() for algorithm, digest in zip(ALGORITHMS, hashes)}
+
+
+def digest(path: Path, algorithm: str = "md5") -> str:
+    """Return the digest of path, from the cache when the file is unchanged."""
+    if algorithm not in ALGORITHMS:
+        return utils.file_digest(path, algorithm)
+    cached = lookup(path, algorithm)
+    if cached is not None:
+        return cached
+    logger.info(f"Computing digests of {path}")
+    return compute(path)[algorithm]
+
+
+def digest_async(path: Path, algorithm: str = "md5") -> Future:
+    """
+    Return a future for the digest of path. Cached digests resolve
+    immediately; concurrent requests for the same file share one hash pass.
+    """
+    key = _key(path)
+    with _pending_lock:
+        future = _pending.get(key)
+        submitted = future is None
+        if submitted:
+            future = _executor.submit(compute_if_missing, Path(path))
+            _pending[key] = future
+    if submitted:
+        # Outside the lock: a future that is already done runs the callback inline
+        future.add_done_callback(lambda done: _forget(key, done))
+    result = Future()
+
+    def _resolve(done):
+        if done.exception() is not None:
+            result.set_exception(done.exception())
+        else:
+            result.set_result(done.result()[algorithm])
+
+    future.add_done_callback(_resolve)
+    return result
+
+
+def compute_if_missing(path: Path) -> dict[str, str]:
+    """Return all cached digests of path, hashing it only if needed."""
+    cached = {algorithm: lookup(path, algorithm) for algorithm in ALGORITHMS}
+    if all(cached.values()):
+        return cached
+    return compute(path)
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    """Run fn in the digest pool, e.g. a checksum verification that should overlap other setup."""
+    return _executor.submit(fn, *args, **kwargs)
+
+
+def _forget(key: str, future: Future) -> None:
+    with _pending_lock:
+        if _pending.get(key) is future:
+            del _pending[key]
@@ -0,0 +1,123 @@
+"""
+Per-stage fingerprints for incremental pipeline runs.
+
+Each stage of run_pipeline (gVCF filtering, hap.py, Truvari, CSV reformat)
+records a fingerprint of what it consumed: the digest of every input file,
+the Docker image and wrapper script it ran, and its parameters. Fingerprints
+are stored in <processed run dir>/.fingerprints.json. When a stage is about
+to run again with an identical fingerprint and its outputs are still on disk,
+it is skipped and its stored results are reused.
+"""
+
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+
+from api.tasks import digests, utils
+
+FINGERPRINT_FILE = ".fingerprints.json"
+
+
+def script_image(script: Path, variable: str) -> str:
+    """
+    Return the Docker image a wrapper script runs, honouring the same
+    environment override as the script (e.g. HAPPY_IMAGE in happy.sh).
+    """
+    if os.getenv(variable):
+        return os.environ[variable]
+    match = re.search(rf'{variable}="\$\{{{variable}:-([^}}]+)\}}"', Path(script).read_text())
+    return match.group(1) if match else "unknown"
+
+
+def tool_fingerprint(script: Path, image_variable: str) -> dict:
+    """Describe a wrapper script: its image tag and a digest of its CLI parameters."""
+    return {
+        "image": script_image(script, image_variable),
+        "script_sha256": utils.file_digest(script, "sha256"),
+    }
+
+
+def _input_info(path: Path) -> dict:
+    stat = path.stat()
+    # The digest cache avoids rehashing multi-GB gVCFs on every run.
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digests.digest(path, "sha256")}
+
+
+def read(out_dir: Path) -> dict:
+    try:
+        with open(Path(out_dir) / FINGERPRINT_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def compute(inputs: list[Path], tool: dict, params: dict) -> dict:
+    """
+    Build the fingerprint of a stage.
+
+    Args:
+        inputs: Files the stage reads
+        tool: Tool description (see tool_fingerprint)
+        params: Parameters that affect the stage's results
+
+    Returns:
+        {"key": ..., "inputs": ..., "tool": ..., "params": ...}
+    """
+    input_infos = {str(path): _input_info(Path(path)) for path in inputs}
+    payload = json.dumps(
+        {
+            "inputs": [info["sha256"] for info in input_infos.values()],
+            "tool": tool,
+            "params": params,
+        },
+        sort_keys=True,
+    )
+    return {
+        "key": hashlib.sha256(payload.encode()).hexdigest(),
+        "inputs": input_infos,
+        "tool": tool,
+        "params": params,
+    }
+
+
+def is_current(out_dir: Path, stage: str, fingerprint: dict) -> bool:
+    """True if the stage last ran with this fingerprint and its outputs still exist."""
+    stored = read(out_dir).get(stage)
+    if not stored or stored.get("key") != fingerprint["key"]:
+        return False
+    return all(Path(output).exists() for output in stored.get("outputs", []))
+
+
+def _update(out_dir: Path, stage: str, entry: dict | None) -> None:
+    out_dir = Path(out_dir)
+    path = out_dir / FINGERPRINT_FILE
+    # hap.py and Truvari run concurrently and share the file.
+    with utils.file_lock(out_dir / f"{FINGERPRINT_FILE}.lock"):
+        fingerprints = read(out_dir)
+        if entry is None:
+            if fingerprints.pop(stage, None) is None:
+                return
+        else:
+            fingerprints[stage] = entry
+        tmp_path = path.with_name(f"{FINGERPRINT_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(fingerprints, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def record(out_dir: Path, stage: str, fingerprint: dict, outputs: list[Path]) -> None:
+    """Store the fingerprint and outputs of a stage that completed successfully."""
+    _update(out_dir, stage, {
+        **fingerprint,
+        "outputs": [str(output) for output in outputs],
+        "completed_at": datetime.now().isoformat(),
+    })
+
+
+def invalidate(out_dir: Path, stage: str) -> None:
+    """Forget a stage's fingerprint before its outputs are rewritten."""
+    if (Path(out_dir) / FINGERPRINT_FILE).exists():
+        _update(out_dir, stage, None)
@@ -0,0 +1,465 @@
+"""
+In-process contig filter for bgzipped, tabix-indexed VCF/gVCF files.
+
+process_happy only needs the records on the contigs of the reference FASTA.
+Because a sorted VCF stores each contig as one contiguous run of records,
+the .tbi index tells exactly which byte range of the uncompressed stream
+belongs to each contig. filter_contigs copies the BGZF blocks that lie
+entirely inside a wanted range as raw compressed bytes (copy_file_range,
+no decompression), recompresses only the partial blocks at range
+boundaries, and writes the output's .tbi in the same pass by translating
+the virtual offsets of the input index.
+"""
+
+import gzip
+import os
+import struct
+import zlib
+from pathlib import Path
+
+# BGZF constants (SAM/BAM specification, section 4.1)
+BGZF_HEADER = struct.Struct("<4BI2BH")
+BGZF_MAX_BLOCK = 0xFF00
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+# Tabix constants
+TBI_MAGIC = b"TBI\x01"
+TBI_VCF_FORMAT = 2
+PSEUDO_BIN = 37450
+LINEAR_SHIFT = 14
+BIN_LEVELS = 5
+# htslib moves a bin into its parent when its chunks span fewer compressed bytes
+MIN_MARKER_DIST = 0x10000
+
+
+class BGZFError(ValueError):
+    pass
+
+
+def compress_block(data: bytes, level: int = 6) -> bytes:
+    """Compress at most BGZF_MAX_BLOCK bytes into one BGZF block."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    payload = compressor.compress(data) + compressor.flush()
+    if len(payload) > 0xFFFF - 26:
+        # Incompressible data: store it instead.
+        compressor = zlib.compressobj(0, zlib.DEFLATED, -15)
+        payload = compressor.compress(data) + compressor.flush()
+    header = struct.pack("<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(payload) + 25)
+    footer = struct.pack("<II", zlib.crc32(data) & 0xFFFFFFFF, len(data))
+    return header + payload + footer
+
+
+def read_block(f, offset: int) -> tuple[bytes, int]:
+    """Read the BGZF block at a compressed offset. Returns (data, compressed size)."""
+    f.seek(offset)
+    header = f.read(BGZF_HEADER.size)
+    if len(header) < BGZF_HEADER.size:
+        return b"", 0
+    id1, id2, _cm, flags, _mtime, _xfl, _os, xlen = BGZF_HEADER.unpack(header)
+    if id1 != 31 or id2 != 139 or not flags & 4:
+        raise BGZFError(f"Not a BGZF block at offset {offset}")
+    extra = f.read(xlen)
+    block_size = None
+    position = 0
+    while position + 4 <= len(extra):
+        si1, si2, slen = struct.unpack_from("<2BH", extra, position)
+        if si1 == 66 and si2 == 67 and slen == 2:
+            block_size = struct.unpack_from("<H", extra, position + 4)[0] + 1
+        position += 4 + slen
+    if block_size is None:
+        raise BGZFError(f"Missing BGZF block size at offset {offset}")
+    payload = f.read(block_size - BGZF_HEADER.size - xlen - 8)
+    f.read(8)
+    return zlib.decompress(payload, -15), block_size
+
+
+class TabixIndex:
+    """Parsed .tbi index: header fields plus, per reference, its bins and linear index."""
+
+    def __init__(self, fmt=TBI_VCF_FORMAT, col_seq=1, col_beg=2, col_end=0, meta=ord("#"), skip=0):
+        self.fmt, self.col_seq, self.col_beg, self.col_end = fmt, col_seq, col_beg, col_end
+        self.meta, self.skip = meta, skip
+        self.names: list[str] = []
+        self.bins: list[dict[int, list[tuple[int, int]]]] = []
+        self.linear: list[list[int]] = []
+        self.n_no_coor: int | None = None
+
+    @classmethod
+    def read(cls, path: Path) -> "TabixIndex":
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+        if data[:4] != TBI_MAGIC:
+            raise BGZFError(f"{path} is not a tabix index")
+        n_ref, fmt, col_seq, col_beg, col_end, meta, skip, l_nm = struct.unpack_from("<8i", data, 4)
+        index = cls(fmt, col_seq, col_beg, col_end, meta, skip)
+        position = 36
+        index.names = [name.decode() for name in data[position:position + l_nm].split(b"\0")[:n_ref]]
+        position += l_nm
+        for _ in range(n_ref):
+            (n_bin,) = struct.unpack_from("<i", data, position)
+            position += 4
+            bins = {}
+            for _ in range(n_bin):
+                bin_id, n_chunk = struct.unpack_from("<Ii", data, position)
+                position += 8
+                chunks = struct.unpack_from(f"<{2 * n_chunk}Q", data, position)
+                position += 16 * n_chunk
+                bins[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+            (n_intv,) = struct.unpack_from("<i", data, position)
+            position += 4
+            index.linear.append(list(struct.unpack_from(f"<{n_intv}Q", data, position)))
+            position += 8 * n_intv
+            index.bins.append(bins)
+        if position + 8 <= len(data):
+            (index.n_no_coor,) = struct.unpack_from("<Q", data, position)
+        return index
+
+    def write(self, path: Path) -> None:
+        names = b"".join(name.encode() + b"\0" for name in self.names)
+        parts = [TBI_MAGIC, struct.pack(
+            "<8i", len(self.names), self.fmt, self.col_seq, self.col_beg,
+            self.col_end, self.meta, self.skip, len(names),
+        ), names]
+        for bins, linear in zip(self.bins, self.linear):
+            parts.append(struct.pack("<i", len(bins)))
+            for bin_id in sorted(bins):
+                chunks = bins[bin_id]
+                parts.append(struct.pack("<Ii", bin_id, len(chunks)))
+                parts.append(struct.pack(f"<{2 * len(chunks)}Q", *(v for chunk in chunks for v in chunk)))
+            parts.append(struct.pack(f"<i{len(linear)}Q", len(linear), *linear))
+        if self.n_no_coor is not None:
+            parts.append(struct.pack("<Q", self.n_no_coor))
+        data = b"".join(parts)
+        with open(path, "wb") as f:
+            for start in range(0, len(data), BGZF_MAX_BLOCK):
+                f.write(compress_block(data[start:start + BGZF_MAX_BLOCK]))
+            f.write(BGZF_EOF)
+
+    def virtual_offsets(self, ref: int) -> list[int]:
+        """All virtual offsets the index stores for a reference."""
+        offsets = list(self.linear[ref])
+        for bin_id, chunks in self.bins[ref].items():
+            # The pseudo-bin's second "chunk" holds record counts, not offsets.
+            for chunk in chunks[:1] if bin_id == PSEUDO_BIN else chunks:
+                offsets.extend(chunk)
+        return offsets
+
+    def span(self, ref: int) -> tuple[int, int]:
+        """Virtual offsets of the first record and of the end of the last record."""
+        chunks = [chunk for bin_id, bin_chunks in self.bins[ref].items()
+                  if bin_id != PSEUDO_BIN for chunk in bin_chunks]
+        return min(beg for beg, _ in chunks), max(end for _, end in chunks)
+
+
+class _Position:
+    """Output virtual offset, resolved once the bytes around it are written."""
+
+    __slots__ = ("voffset",)
+
+    def __init__(self, voffset=None):
+        self.voffset = voffset
+
+
+class _BlockWriter:
+    """BGZF writer mixing raw block copies with recompressed data."""
+
+    def __init__(self, f):
+        self.f = f
+        self.offset = 0
+        self.buffer = bytearray()
+        self.marks: list[tuple[int, _Position]] = []
+
+    def mark(self, position: int | None = None) -> _Position:
+        """Position of uncompressed byte `position` of the buffer (default: its end)."""
+        mark = _Position()
+        self.marks.append((len(self.buffer) if position is None else position, mark))
+        return mark
+
+    def write(self, data: bytes, positions: dict[int, int] | None = None) -> dict[int, _Position]:
+        """Buffer uncompressed data; positions maps keys to offsets within data to mark."""
+        start = len(self.buffer)
+        marks = {key: self.mark(start + offset) for key, offset in (positions or {}).items()}
+        self.buffer += data
+        while len(self.buffer) >= BGZF_MAX_BLOCK:
+            self._emit(BGZF_MAX_BLOCK)
+        return marks
+
+    def copy(self, src, start: int, end: int) -> int:
+        """Append compressed bytes [start, end) of src; returns their output offset."""
+        self.flush()
+        self.f.flush()
+        out_start = self.offset
+        while self.offset < out_start + end - start:
+            src_offset = start + self.offset - out_start
+            remaining = end - src_offset
+            try:
+                # Kernel-side copy: the blocks never enter user space.
+                copied = os.copy_file_range(src.fileno(), self.f.fileno(), remaining, src_offset, self.offset)
+            except (AttributeError, OSError):
+                src.seek(src_offset)
+                chunk = src.read(min(remaining, 8 * 1024 * 1024))
+                self.f.seek(self.offset)
+                self.f.write(chunk)
+                self.f.flush()
+                copied = len(chunk)
+            if copied <= 0:
+                raise BGZFError("Unexpected end of input while copying blocks")
+            self.offset += copied
+        return out_start
+
+    def flush(self) -> None:
+        while self.buffer:
+            self._emit(min(len(self.buffer), BGZF_MAX_BLOCK))
+        for _position, mark in self.marks:
+            mark.voffset = self.offset << 16
+        self.marks = []
+
+    def close(self) -> None:
+        self.flush()
+        self.f.seek(self.offset)
+        self.f.write(BGZF_EOF)
+
+    def _emit(self, size: int) -> None:
+        block = compress_block(bytes(self.buffer[:size]))
+        # copy_file_range writes at explicit offsets, not at the file position.
+        self.f.seek(self.offset)
+        self.f.write(block)
+        remaining = []
+        for position, mark in self.marks:
+            if position < size:
+                mark.voffset = (self.offset << 16) | position
+            else:
+                remaining.append((position - size, mark))
+        self.marks = remaining
+        del self.buffer[:size]
+        self.offset += len(block)
+
+
+def _merge_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _copy_range(src, writer: _BlockWriter, start: int, end: int, offsets: list[int]) -> dict[int, _Position]:
+    """
+    Copy the uncompressed byte range [start, end) of src, given as virtual
+    offsets, and return the output position of each virtual offset in
+    offsets (all within [start, end]).
+    """
+    positions = {}
+    block, within = start >> 16, start & 0xFFFF
+    end_block, end_within = end >> 16, end & 0xFFFF
+    pending = sorted(set(offsets))
+
+    def take(lo: int, hi: int) -> list[int]:
+        taken = [v for v in pending if lo <= v < hi]
+        del pending[:len(taken)]
+        return taken
+
+    if within:
+        # Partial first block: recompress its tail (or the whole range).
+        data, size = read_block(src, block)
+        stop = end_within if block == end_block else len(data)
+        wanted = take(start, (block << 16) | stop)
+        positions.update(writer.write(data[within:stop], {v: (v & 0xFFFF) - within for v in wanted}))
+        if block == end_block:
+            positions.update({v: writer.mark() for v in take(end, end + 1)})
+            return positions
+        block += size
+    if block < end_block:
+        # Whole blocks are copied as compressed bytes.
+        wanted = take(block << 16, end_block << 16)
+        out_start = writer.copy(src, block, end_block)
+        positions.update({v: _Position((((v >> 16) - block + out_start) << 16) | (v & 0xFFFF)) for v in wanted})
+    if end_within:
+        data, _size = read_block(src, end_block)
+        wanted = take(end_block << 16, end)
+        positions.update(writer.write(data[:end_within], {v: v & 0xFFFF for v in wanted}))
+    positions.update({v: writer.mark() for v in take(end, end + 1)})
+    if pending:
+        raise BGZFError(f"Index offsets outside of the copied range: {pending[:3]}")
+    return positions
+
+
+def filter_contigs(src_path: Path, dest_path: Path, contigs, index_path: Path | None = None) -> Path:
+    """
+    Write dest_path (and dest_path.tbi) with the header and the records of
+    src_path on the given contigs, in their original order.
+
+    Args:
+        src_path: bgzipped, coordinate-sorted VCF/gVCF
+        dest_path: Output file
+        contigs: Contig names to keep (e.g. those of the reference .fai)
+        index_path: Tabix index of src_path (default: src_path + ".tbi")
+
+    Returns:
+        dest_path
+    """
+    src_path, dest_path = Path(src_path), Path(dest_path)
+    index = TabixIndex.read(Path(index_path or f"{src_path}.tbi"))
+    contigs = set(contigs)
+    refs = [ref for ref in range(len(index.names)) if index.bins[ref]]
+    spans = {ref: index.span(ref) for ref in refs}
+    if not spans:
+        raise BGZFError(f"{src_path} index has no records")
+    header_end = min(start for start, _ in spans.values())
+    kept = [ref for ref in refs if index.names[ref] in contigs]
+    ranges = _merge_ranges([(0, header_end)] + [spans[ref] for ref in kept])
+    offsets = [v for ref in kept for v in index.virtual_offsets(ref)]
+
+    tmp_path = dest_path.with_name(f".{dest_path.name}.tmp")
+    tmp_index_path = dest_path.with_name(f".{dest_path.name}.tbi.tmp")
+    try:
+        positions = {}
+        with open(src_path, "rb") as src, open(tmp_path, "wb") as dest:
+            writer = _BlockWriter(dest)
+            for start, end in ranges:
+                in_range = [v for v in offsets if start <= v <= end]
+                positions.update(_copy_range(src, writer, start, end, in_range))
+            writer.close()
+
+        out_index = TabixIndex(index.fmt, index.col_seq, index.col_beg, index.col_end, index.meta, index.skip)
+        out_index.n_no_coor = index.n_no_coor
+        for ref in sorted(kept, key=lambda ref: spans[ref]):
+            out_index.names.append(index.names[ref])
+            out_index.linear.append([positions[v].voffset for v in index.linear[ref]])
+            bins = {}
+            for bin_id, chunks in index.bins[ref].items():
+                if bin_id == PSEUDO_BIN:
+                    (beg, end), counts = chunks[0], chunks[1:]
+                    bins[bin_id] = [(positions[beg].voffset, positions[end].voffset)] + counts
+                else:
+                    bins[bin_id] = [(positions[beg].voffset, positions[end].voffset) for beg, end in chunks]
+            # Blocks recompressed at range boundaries can bring chunks closer together
+            compress_bins(bins)
+            out_index.bins.append(bins)
+        out_index.write(tmp_index_path)
+        os.replace(tmp_path, dest_path)
+        os.replace(tmp_index_path, f"{dest_path}.tbi")
+    finally:
+        for path in (tmp_path, tmp_index_path):
+            if path.exists():
+                path.unlink()
+    return dest_path
+
+
+def compress_bins(bins: dict[int, list[tuple[int, int]]]) -> None:
+    """
+    Shrink a reference's binning index in place as htslib does when it
+    finishes an index (compress_binning), so the .tbi is the one tabix
+    writes: bins whose chunks span less than MIN_MARKER_DIST compressed
+    bytes are moved into their parent, deepest level first, then chunks
+    that meet in the same BGZF block are merged.
+    """
+    for level in range(BIN_LEVELS, 0, -1):
+        first = ((1 << (3 * level)) - 1) // 7
+        for bin_id in [bin_id for bin_id in bins if first <= bin_id < PSEUDO_BIN]:
+            chunks = bins[bin_id]
+            if level < BIN_LEVELS:
+                chunks.sort()
+            parent = (bin_id - 1) >> 3
+            if parent in bins and (chunks[-1][1] >> 16) - (chunks[0][0] >> 16) < MIN_MARKER_DIST:
+                bins[parent].extend(bins.pop(bin_id))
+    if 0 in bins:
+        bins[0].sort()
+    for bin_id, chunks in bins.items():
+        if bin_id == PSEUDO_BIN:
+            continue
+        merged = [chunks[0]]
+        for beg, end in chunks[1:]:
+            if merged[-1][1] >> 16 >= beg >> 16:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((beg, end))
+        bins[bin_id] = merged
+
+
+def _reg2bin(beg: int, end: int) -> int:
+    end -= 1
+    for shift, offset in ((14, 4681), (17, 585), (20, 73), (23, 9), (26, 1)):
+        if beg >> shift == end >> shift:
+            return offset + (beg >> shift)
+    return 0
+
+
+def _iter_lines(f):
+    """Yield (virtual offset, end virtual offset, line) for every line of a BGZF file."""
+    offset, pending, start = 0, b"", None
+    while True:
+        data, size = read_block(f, offset)
+        if not size:
+            break
+        next_offset = offset + size
+        position = 0
+        while position < len(data):
+            if start is None:
+                start = (offset << 16) | position
+            begin = position
+            newline = data.find(b"\n", begin)
+            if newline < 0:
+                pending += data[begin:]
+                break
+            position = newline + 1
+            # Offsets at the end of a block point to the next block, as in htslib.
+            end = (offset << 16) | position if position < len(data) else next_offset << 16
+            yield start, end, pending + data[begin:position]
+            pending, start = b"", None
+        offset = next_offset
+    if pending:
+        yield start, offset << 16, pending
+
+
+def index_vcf(path: Path) -> Path:
+    """
+    Build a tabix (-p vcf) index for a bgzipped VCF, with the bins and
+    linear index tabix writes. Used when the tabix binary is not installed;
+    gVCF reference blocks span up to their INFO END.
+    """
+    path = Path(path)
+    index = TabixIndex()
+    with open(path, "rb") as f:
+        for start, record_end, line in _iter_lines(f):
+            if line.startswith(b"#"):
+                continue
+            fields = line.rstrip(b"\r\n").split(b"\t", 8)
+            chrom = fields[0].decode()
+            beg = int(fields[1]) - 1
+            end = beg + len(fields[3])
+            for entry in fields[7].split(b";") if len(fields) > 7 else []:
+                if entry.startswith(b"END="):
+                    end = max(int(entry[4:]), beg + 1)
+            if not index.names or index.names[-1] != chrom:
+                if chrom in index.names:
+                    raise BGZFError(f"{path} is not sorted: {chrom} appears twice")
+                index.names.append(chrom)
+                index.bins.append({PSEUDO_BIN: [(start, record_end), (0, 0)]})
+                index.linear.append([])
+            bins, linear = index.bins[-1], index.linear[-1]
+            chunks = bins.setdefault(_reg2bin(beg, end), [])
+            if chunks and chunks[-1][1] == start:
+                chunks[-1] = (chunks[-1][0], record_end)
+            else:
+                chunks.append((start, record_end))
+            last_window = (end - 1) >> LINEAR_SHIFT
+            if len(linear) <= last_window:
+                linear.extend([None] * (last_window + 1 - len(linear)))
+            for window in range(beg >> LINEAR_SHIFT, last_window + 1):
+                if linear[window] is None:
+                    linear[window] = start
+            (ref_start, _), (mapped, unmapped) = bins[PSEUDO_BIN]
+            bins[PSEUDO_BIN] = [(ref_start, record_end), (mapped + 1, unmapped)]
+    for bins, linear in zip(index.bins, index.linear):
+        # Empty windows point at the previous record (or the contig start).
+        previous = bins[PSEUDO_BIN][0][0]
+        for window, value in enumerate(linear):
+            linear[window] = previous = value if value is not None else previous
+        compress_bins(bins)
+    index.n_no_coor = 0
+    index_path = Path(f"{path}.tbi")
+    index.write(index_path)
+    return index_path
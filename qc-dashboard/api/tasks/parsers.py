@@ -40,6 +40,7 @@ def get_file_format(formats_file, input_filepath):
                 return {}
             current_file = {
                 "filename": filename,
+                "suffix": lines[i],
                 "format": lines[i+1].split(","),
                 "lines_count": lines[i+2]
             }
@@ -91,6 +92,83 @@ def parse_summary(input_filepath):
                 return row
     return None
 
+def parse_qc_metrics(input_filepath, file_type: str) -> list[dict]:
+    """
+    Parse a reformatted DRAGEN CSV into long-format qc_metrics rows
+    (section, parameter, value, percentage). Columns are read the way
+    read_metrics_csv reads them: 'parameter' and 'value' when present,
+    otherwise the first and second columns. Non-numeric values become None.
+    """
+    df = pd.read_csv(input_filepath, dtype=str, keep_default_na=False)
+    if df.empty or len(df.columns) < 2:
+        return []
+    name_column = "parameter" if "parameter" in df.columns else df.columns[0]
+    value_column = "value" if "value" in df.columns else df.columns[1]
+    rows = pd.DataFrame({
+        "metric_name": df[name_column],
+        "metric_value": pd.to_numeric(df[value_column], errors="coerce"),
+        "percentage": pd.to_numeric(df["percentage"], errors="coerce") if "percentage" in df.columns else float("nan"),
+        "section": df["type"].replace("", None) if "type" in df.columns else None,
+    })
+    rows["file_type"] = file_type
+    rows["file_source"] = os.path.basename(input_filepath)
+    rows = rows.astype(object).where(rows.notna(), None)
+    return rows.to_dict("records")
+
+
+# hap.py summary.csv / extended.csv columns -> happy_stratified_metrics columns
+HAPPY_TABLE_LABELS = {
+    "Type": "type",
+    "Subtype": "subtype",
+    "Subset": "subset",
+    "Filter": "filter",
+    "Genotype": "genotype",
+}
+HAPPY_TABLE_COUNTS = {
+    "TRUTH.TOTAL": "truth_total",
+    "TRUTH.TP": "truth_tp",
+    "TRUTH.FN": "truth_fn",
+    "QUERY.TOTAL": "query_total",
+    "QUERY.FP": "query_fp",
+    "QUERY.UNK": "query_unk",
+    "Subset.Size": "subset_size",
+    "Subset.IS_CONF.Size": "subset_is_conf_size",
+}
+HAPPY_TABLE_VALUES = {
+    "FP.gt": "fp_gt",
+    "FP.al": "fp_al",
+    "METRIC.Recall": "metric_recall",
+    "METRIC.Precision": "metric_precision",
+    "METRIC.Frac_NA": "metric_frac_na",
+    "METRIC.F1_Score": "metric_f1_score",
+    "TRUTH.TOTAL.TiTv_ratio": "truth_titv_ratio",
+    "QUERY.TOTAL.TiTv_ratio": "query_titv_ratio",
+    "TRUTH.TOTAL.het_hom_ratio": "truth_het_hom_ratio",
+    "QUERY.TOTAL.het_hom_ratio": "query_het_hom_ratio",
+}
+
+
+def parse_happy_table(input_filepath, source: str) -> list[dict]:
+    """
+    Parse every row of a hap.py summary.csv or extended.csv into
+    happy_stratified_metrics rows. Columns are converted as whole pandas
+    columns; labels missing from summary.csv default to "*" and empty or
+    non-numeric values become None.
+    """
+    columns = {**HAPPY_TABLE_LABELS, **HAPPY_TABLE_COUNTS, **HAPPY_TABLE_VALUES}
+    df = pd.read_csv(input_filepath, usecols=lambda column: column in columns, dtype=str, keep_default_na=False)
+    df = df.rename(columns=columns)
+    for column in HAPPY_TABLE_LABELS.values():
+        df[column] = df[column].replace("", "*") if column in df else "*"
+    for column in HAPPY_TABLE_COUNTS.values():
+        values = pd.to_numeric(df[column], errors="coerce") if column in df else pd.Series(float("nan"), index=df.index)
+        df[column] = values.round().astype("Int64")
+    for column in HAPPY_TABLE_VALUES.values():
+        df[column] = pd.to_numeric(df[column], errors="coerce") if column in df else float("nan")
+    df["source"] = source
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict("records")
+
 def read_metrics_csv(path_metrics: str) -> pd.Series:
     """
     Lit un fichier *_sv_metrics.csv (colonnes 'parameter', 'value', 'percentage')
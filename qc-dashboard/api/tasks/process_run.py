@@ -1,14 +1,18 @@
 import os
+import shutil
 import subprocess
 from pathlib import Path
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-from api.app import crud, schemas, settings
+from api.app import crud, metrics_matrix, schemas, settings
 from api.app.database import SessionLocal
-from api.tasks.parsers import reformat_csv, parse_summary, parse_truvari_summary
-from api.tasks import utils
-from api.tasks.setup_reference import ensure_references
+from api.tasks.parsers import (format_csv, get_file_format, reformat_csv, parse_happy_table, parse_qc_metrics,
+                               parse_summary, parse_truvari_summary)
+from api.tasks import digests, fingerprints, gvcf_filter, reference_cache, run_catalog, sharding, utils
+from api.tasks.setup_reference import ensure_references, extract_base_sample
+from api.tasks.scheduler import run_stages, shard_budget, stage_budget
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,37 +23,94 @@ LAB_RUN_DIR = settings.LAB_RUNS_DIR
 PROCESSED_DIR = settings.PROCESSED_DIR
 REFERENCE_DIR = settings.REFERENCE_DIR
 
+# Truth SV set preparation for Truvari: drop records without ALT and map
+# GIAB contig names (1->chr1, 2->chr2, etc.) onto the GRCh38 FASTA.
+TRUTH_SV_EXCLUDE = 'ALT="."'
+CHROM_MAP = "\n".join([f"{i} chr{i}" for i in range(1, 23)] + ["X chrX", "Y chrY"])
+# Run SV calls excluded before Truvari
+RUN_SV_EXCLUDE = 'ALT="<DUP:TANDEM>"'
+
 # Main wrapper function to run the processing script
 def main():
     args = parse_arguments()
+    if args.runs:
+        from api.tasks.batch import resolve_runs, run_batch
+        run_names = resolve_runs(args.runs)
+        if not run_names:
+            raise SystemExit(f"No runs found under {LAB_RUN_DIR} for: {' '.join(args.runs)}")
+        print(f"Benchmarking {len(run_names)} run(s) with {args.workers} worker(s)")
+        summary = run_batch(
+            run_names,
+            workers=args.workers,
+            happy=args.happy,
+            stratified=args.stratified,
+            truvari=args.truvari,
+            csv_reformat=args.csv_reformat,
+            force=args.force,
+        )
+        print(summary.format())
+        raise SystemExit(1 if summary.failed else 0)
     sample = args.sample
     run = args.run
-    run_pipeline(sample, run, args.happy, args.stratified, args.csv_reformat, args.truvari)
+    run_pipeline(
+        sample, run,
+        happy=args.happy,
+        stratified=args.stratified,
+        truvari=args.truvari,
+        csv_reformat=args.csv_reformat,
+        force=args.force,
+    )
         
-def run_pipeline(sample, run, happy=False, stratified=False, truvari=False, csv_reformat=False):
-    """ Run the processing pipeline for a given sample / run and options. """
+def run_pipeline(sample, run, happy=False, stratified=False, truvari=False, csv_reformat=False, force=False):
+    """
+    Run the processing pipeline for a given sample / run and options.
+    hap.py and Truvari are independent and run concurrently.
+    Stages whose inputs, tool image and parameters are unchanged since their
+    last successful run are skipped unless force is set.
+    """
+    stages = {}
     if happy:
-        process_happy(sample, run, stratified)
+        stages["happy"] = lambda env: process_happy(sample, run, stratified, env=env, force=force)
     if truvari:
-        process_truvari(sample, run)
-    if csv_reformat:
-        process_csv_files(f"{sample}_{run}")
+        stages["truvari"] = lambda env: process_truvari(sample, run, env=env, force=force)
+    if len(stages) > 1:
+        # Resolve shared prerequisites once so the stages don't race on them.
+        ready, message = ensure_references(sample, auto_download=True)
+        if not ready:
+            raise FileNotFoundError(f"Required reference files not found for {sample}. {message}")
+        prepare_output_dir(sample, run)
+    try:
+        run_stages(stages)
+        if csv_reformat:
+            process_csv_files(f"{sample}_{run}", force=force)
+    finally:
+        metrics_matrix.touch()
+        run_catalog.refresh_run(f"{sample}_{run}")
         
 
 def parse_arguments():
     """
     Parse command line arguments.
     """
-    parser = argparse.ArgumentParser(description="Process a sequencing run.")
-    # Required arguments
-    parser.add_argument('--sample', required=True, help='Sample name')
-    parser.add_argument('--run', required=True, help='Run name')
+    parser = argparse.ArgumentParser(description="Process a sequencing run, or a batch of runs.")
+    # Single run
+    parser.add_argument('--sample', help='Sample name')
+    parser.add_argument('--run', help='Run name')
+    # Batch mode
+    parser.add_argument('--runs', nargs='+', metavar='RUN',
+                        help='Batch mode: run names or glob patterns under data/lab_runs (e.g. "HG002_*")')
+    parser.add_argument('--workers', type=int, default=settings.PIPELINE_WORKERS,
+                        help='Batch mode: number of runs benchmarked in parallel')
     # Optional flags
     parser.add_argument('--happy', action='store_true', help='Enable hap.py processing')
     parser.add_argument('--stratified', action='store_true', help='Enable hap.py stratified mode')
     parser.add_argument('--csv-reformat', action='store_true', help='Reformat CSV files')
     parser.add_argument('--truvari', action='store_true', help='Enable truvari processing')
-    return parser.parse_args()
+    parser.add_argument('--force', action='store_true', help='Rerun stages even if their inputs are unchanged')
+    args = parser.parse_args()
+    if not args.runs and not (args.sample and args.run):
+        parser.error('--sample and --run are required unless --runs is given')
+    return args
 
 def is_processed(sample, run):
     """
@@ -64,14 +125,75 @@ def is_processed(sample, run):
             return True
     return False
 
-def process_happy(sample, run, stratified=False):
+def find_output_dir(run_name):
+    """
+    Find the processed directory of a run, with or without the date prefix,
+    by the precedence the run catalog uses (run_catalog.find_processed_dir).
+    """
+    return run_catalog.find_processed_dir(run_name, PROCESSED_DIR)
+
+def prepare_output_dir(sample, run):
+    """
+    Create the dated output directory ({gvcf date}_{sample}_{run}) that
+    process_happy writes to, so concurrent stages agree on it.
+    """
+    run_name = f"{sample}_{run}"
+    existing = find_output_dir(run_name)
+    if existing is not None:
+        return existing
+    run_gvcf = next((LAB_RUN_DIR / run_name).glob('*.gvcf.gz'), None)
+    if run_gvcf is None:
+        return None
+    try:
+        out_dir_path = PROCESSED_DIR / f"{utils.get_gvcf_date(run_gvcf)}_{run_name}"
+    except Exception as e:
+        logger.warning(f"Could not determine output directory for {run_name}: {e}")
+        return None
+    out_dir_path.mkdir(parents=True, exist_ok=True)
+    return out_dir_path
+
+def stage_is_current(out_dir_path, stage, fingerprint, force=False):
+    """
+    Return True if the stage can be skipped. Otherwise forget its previous
+    fingerprint so an interrupted rerun is never mistaken for a complete one.
+    """
+    if not force and fingerprints.is_current(out_dir_path, stage, fingerprint):
+        logger.info(f"{stage}: inputs unchanged for {out_dir_path.name}, reusing stored results")
+        return True
+    fingerprints.invalidate(out_dir_path, stage)
+    return False
+
+def stratification_fingerprint(strat_tsv):
+    """
+    Describe a hap.py stratification set: a digest of the TSV and the size and
+    mtime of every BED it lists (paths are relative to the TSV). The BEDs are
+    not hashed; there are hundreds of them.
+    """
+    strat_tsv = Path(strat_tsv)
+    if not strat_tsv.is_file():
+        raise FileNotFoundError(f"Stratification TSV not found: {strat_tsv}")
+    beds = {}
+    for line in strat_tsv.read_text().splitlines():
+        fields = line.split('\t')
+        if len(fields) < 2 or line.startswith('#'):
+            continue
+        bed = strat_tsv.parent / fields[1].strip()
+        try:
+            stat = bed.stat()
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"Stratification BED listed in {strat_tsv.name} not found: {bed}") from e
+        beds[fields[1].strip()] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return {"tsv_sha256": digests.digest(strat_tsv, "sha256"), "beds": beds}
+
+def process_happy(sample, run, stratified=False, env=None, force=False):
     """
     Process hap.py for a given reference and run.
     """
     # Extract base sample name (e.g., NA24143_Lib3_Rep1 -> NA24143)
-    from api.tasks.setup_reference import extract_base_sample
     base_sample = extract_base_sample(sample)
     logger.info(f"Processing hap.py for sample={sample}, base_sample={base_sample}, run={run}")
+    # Verify the gVCF checksum in the background while references are checked
+    checksum_result = digests.submit(utils.checksum, sample, run)
     
     # Ensure reference files are available before processing
     logger.info(f"Checking reference files for base sample: {base_sample}")
@@ -135,70 +257,11 @@ def process_happy(sample, run, stratified=False):
             "\n".join(f"- {f}" for f in missing_files)
         )
     
-    ref_sdf_list = list(REFERENCE_DIR.glob('*.sdf'))
-    if not ref_sdf_list:
-        # Try to create SDF if RTG Tools is available (locally or via Docker)
-        logger.warning(f"SDF file not found. Attempting to create it from FASTA...")
-        sdf_path = REFERENCE_DIR / 'GRCh38.sdf'
-        sdf_created = False
-        
-        # Try local RTG Tools first
-        try:
-            rtg_check = subprocess.run(['rtg', 'version'], capture_output=True, text=True, timeout=5)
-            if rtg_check.returncode == 0:
-                logger.info("RTG Tools found locally. Creating SDF format...")
-                rtg_cmd = ['rtg', 'format', '-o', str(sdf_path), str(ref_fasta)]
-                result = subprocess.run(rtg_cmd, capture_output=True, text=True, cwd=REFERENCE_DIR, timeout=3600)
-                if result.returncode == 0:
-                    logger.info("SDF format created successfully using local RTG Tools")
-                    ref_sdf = sdf_path
-                    sdf_created = True
-                else:
-                    logger.warning(f"Local RTG Tools failed: {result.stderr}")
-        except (FileNotFoundError, subprocess.TimeoutExpired):
-            logger.info("RTG Tools not found locally, trying Docker...")
-        
-        # If local RTG Tools failed or not available, try Docker
-        if not sdf_created:
-            try:
-                logger.info("Attempting to create SDF using Docker hap.py container...")
-                docker_fasta = f'/wgs/data/reference/{ref_fasta.name}'
-                docker_sdf = '/wgs/data/reference/GRCh38.sdf'
-                # RTG Tools is located at /opt/hap.py/libexec/rtg-tools-install/rtg in the container
-                docker_cmd = [
-                    'docker', 'run', '--rm',
-                    '-v', f'{PROJECT_ROOT}:/wgs',
-                    'pkrusche/hap.py:latest',
-                    '/opt/hap.py/libexec/rtg-tools-install/rtg', 'format', '-o', docker_sdf, docker_fasta
-                ]
-                result = subprocess.run(docker_cmd, capture_output=True, text=True, cwd=PROJECT_ROOT, timeout=3600)
-                if result.returncode == 0 and sdf_path.exists():
-                    logger.info("SDF format created successfully using Docker")
-                    ref_sdf = sdf_path
-                    sdf_created = True
-                else:
-                    logger.warning(f"Docker RTG Tools failed: {result.stderr}")
-            except (FileNotFoundError, subprocess.TimeoutExpired) as e:
-                logger.warning(f"Docker not available or timed out: {e}")
-        
-        # If SDF creation failed, raise informative error
-        if not sdf_created:
-            raise FileNotFoundError(
-                f"SDF format is required for hap.py but could not be created automatically.\n\n"
-                f"Please create it manually using one of these methods:\n\n"
-                f"1. Using local RTG Tools:\n"
-                f"   rtg format -o {REFERENCE_DIR}/GRCh38.sdf {ref_fasta}\n\n"
-                f"2. Using Docker:\n"
-                f"   docker run --rm -v {PROJECT_ROOT}:/wgs pkrusche/hap.py:latest /opt/hap.py/libexec/rtg-tools-install/rtg format -o /wgs/data/reference/GRCh38.sdf /wgs/data/reference/{ref_fasta.name}\n\n"
-                f"3. Using setup script:\n"
-                f"   {PROJECT_ROOT}/script/setup_reference.sh {sample}\n"
-            )
-    else:
-        ref_sdf = ref_sdf_list[0]
+    ref_sdf = ensure_sdf(ref_fasta, sample)
     
     # Checksum for the gvcf file (optional - skipped if MD5 file not found)
     try:
-        utils.checksum(sample, run)
+        checksum_result.result()
     except FileNotFoundError as e:
         raise FileNotFoundError(f"GVCF file not found: {e}")
     except ValueError as e:
@@ -220,8 +283,8 @@ def process_happy(sample, run, stratified=False):
         run_sample_name = utils.get_sample_name(run_gvcf)
     except Exception as e:
         raise ValueError(f"Error getting sample names: {e}")
-    # Get regions from reference FASTA index
-    regions = ",".join(line.split('\t')[0] for line in open(ref_fai))
+    # Get contigs from reference FASTA index
+    contigs = [line.split('\t')[0] for line in open(ref_fai)]
     
     # Check if GVCF file is already "hard-filtered" (from DRAGEN)
     if 'hard-filtered' in run_gvcf.name:
@@ -229,24 +292,17 @@ def process_happy(sample, run, stratified=False):
         filtered_gvcf = run_gvcf
         
         # Ensure the index exists
-        filtered_gvcf_tbi = Path(str(filtered_gvcf) + '.tbi')
-        if not filtered_gvcf_tbi.exists():
-            logger.info("Creating tabix index for GVCF...")
-            tabix_cmd = ['tabix', '-p', 'vcf', str(filtered_gvcf)]
-            try:
-                subprocess.run(tabix_cmd, check=True)
-                logger.info("Tabix index created successfully")
-            except Exception as e:
-                raise RuntimeError(f"Failed to create tabix index: {e}")
+        ensure_tabix_index(filtered_gvcf)
     else:
-        # Filter gvcf with bcftools
+        # Keep only the reference contigs
         filtered_gvcf_name = run_gvcf.name.replace('.gvcf.gz', '.filtered.gvcf.gz')
         filtered_gvcf = run_dir_path / filtered_gvcf_name
         filtered_gvcf_tbi = Path(str(filtered_gvcf) + '.tbi')
+        filter_fingerprint = fingerprints.compute([run_gvcf, ref_fai], {"tool": "gvcf_filter.filter_contigs"}, {})
         
-        # Check if filtered GVCF already exists and is valid
-        if filtered_gvcf.exists() and filtered_gvcf_tbi.exists():
-            logger.info(f"Filtered GVCF already exists: {filtered_gvcf.name}, skipping filtering step")
+        # Skip filtering if the filtered GVCF was built from the same inputs
+        if stage_is_current(out_dir_path, "gvcf_filter", filter_fingerprint, force):
+            logger.info(f"Filtered GVCF is up to date: {filtered_gvcf.name}, skipping filtering step")
         else:
             # Remove old files if they exist but are incomplete
             if filtered_gvcf.exists():
@@ -254,31 +310,42 @@ def process_happy(sample, run, stratified=False):
             if filtered_gvcf_tbi.exists():
                 filtered_gvcf_tbi.unlink()
             
-            # Filter GVCF
-            logger.info(f"Filtering GVCF with bcftools to regions: {len(regions.split(','))} chromosomes")
-            bcftools_cmd = [
-                'bcftools', 'view',
-                '--regions', f'{regions}',
-                '-O', 'z',
-                '-o', f"{filtered_gvcf}",
-                f"{run_gvcf}",
-            ]
-            tabix_cmd = ['tabix', '-p', 'vcf', str(filtered_gvcf)]
+            # Filter GVCF: whole BGZF blocks are copied, only boundary
+            # blocks are recompressed, and the .tbi is written alongside.
+            logger.info(f"Filtering GVCF to {len(contigs)} reference contigs")
+            ensure_tabix_index(run_gvcf)
             try:
-                subprocess.run(bcftools_cmd, check=True)
-                subprocess.run(tabix_cmd, check=True)
+                gvcf_filter.filter_contigs(run_gvcf, filtered_gvcf, contigs)
                 logger.info("GVCF filtering completed successfully")
             except Exception as e:
-                raise RuntimeError(f"bcftools failed to filter gvcf: {e}")
+                raise RuntimeError(f"Failed to filter gvcf: {e}")
+            fingerprints.record(out_dir_path, "gvcf_filter", filter_fingerprint, [filtered_gvcf, filtered_gvcf_tbi])
     # Prepare Docker-internal paths (use base_sample for reference paths)
     docker_ref_vcf = f'/wgs/data/reference/{base_sample}/{ref_vcf.name}'
-    docker_ref_sdf = f'/wgs/data/reference/{ref_sdf.name}'
+    docker_ref_sdf = to_container(ref_sdf)
     docker_run_gvcf = f'/wgs/data/lab_runs/{sample}_{run}/{filtered_gvcf.name}'
     docker_ref_bed = f'/wgs/data/reference/{base_sample}/{ref_bed.name}'
     docker_ref_fasta = f'/wgs/data/reference/{ref_fasta.name}'
     docker_out_dir = f'/wgs/data/processed/{run_dir_name}/{sample}_{run}'
     docker_logfile = f'/wgs/data/processed/{run_dir_name}/happy.{sample}.{run}.log'
     happy_script = PROJECT_ROOT / 'pipeline' / 'happy.sh'
+    summary_csv = out_dir_path / f"{sample}_{run}.summary.csv"
+
+    strat_tsv = ref_dir_path / 'GRCh38_strat' / 'GRCh38-all-stratifications.tsv'
+
+    happy_params = {"stratified": stratified, "sdf": str(ref_sdf)}
+    if stratified:
+        happy_params["stratification"] = stratification_fingerprint(strat_tsv)
+    happy_fingerprint = fingerprints.compute(
+        [run_gvcf, ref_vcf, ref_bed, ref_fasta],
+        fingerprints.tool_fingerprint(happy_script, "HAPPY_IMAGE"),
+        happy_params,
+    )
+    if stage_is_current(out_dir_path, "happy", happy_fingerprint, force):
+        # Metrics are only ingested again if they are missing from the db.
+        if not has_happy_metrics(f"{sample}_{run}"):
+            post_happy_metrics(sample, run, out_dir_path)
+        return
     
     logger.info(f"Running hap.py with reference from {base_sample}")
     cmd = [
@@ -295,30 +362,227 @@ def process_happy(sample, run, stratified=False):
     if stratified:
         cmd.extend([
             '--stratification',
-            f'/wgs/data/reference/{base_sample}/GRCh38_strat/GRCh38-all-stratifications.tsv'
+            f'/wgs/data/reference/{base_sample}/GRCh38_strat/{strat_tsv.name}'
         ])
-    # Execute the command
+    # Execute the command, over groups of contigs in parallel if configured
+    shard_count = min(settings.HAPPY_SHARDS, len(contigs))
     try:
-        subprocess.run(cmd, check=True, cwd=PROJECT_ROOT)
+        if shard_count > 1:
+            run_happy_shards(cmd, ref_bed, ref_fai, out_dir_path / f"{sample}_{run}", shard_count, env)
+        else:
+            subprocess.run(cmd, check=True, cwd=PROJECT_ROOT, env={**os.environ, **(env or {})})
         print(f"Successfully processed {run} for reference {sample}.")
     except subprocess.CalledProcessError as e:
         raise RuntimeError(f"hap.py failed for {run} with error: {e}")
     # Store summary data in db
     post_happy_metrics(sample, run, out_dir_path)
+    fingerprints.record(out_dir_path, "happy", happy_fingerprint, [summary_csv])
+
+def run_happy_shards(cmd, ref_bed, ref_fai, out_prefix, shard_count, env=None):
+    """
+    Run hap.py as parallel invocations over groups of whole contigs and merge
+    their summary.csv/extended.csv into {out_prefix}.summary.csv/.extended.csv.
+    cmd is the whole-genome happy.sh command; each shard gets the confident
+    regions of its contigs, its own output prefix and log, and -R restricting
+    truth and query to its contigs. Shard outputs stay in happy_shards/.
+    """
+    lengths = sharding.read_fai(ref_fai)
+    bases = sharding.confident_bases(ref_bed)
+    shards = sharding.plan_shards({contig: bases.get(contig, 0) for contig in lengths}, shard_count)
+    parallel, shard_env = shard_budget("happy", env, len(shards))
+    shard_root = out_prefix.parent / "happy_shards"
+    if shard_root.exists():
+        shutil.rmtree(shard_root)
+
+    prefixes, commands = [], []
+    for index, contigs in enumerate(shards):
+        shard_dir = shard_root / f"shard{index:03d}"
+        confident_bed, region_bed = sharding.write_shard_beds(contigs, lengths, ref_bed, shard_dir)
+        prefix = shard_dir / out_prefix.name
+        # happy.sh positional arguments: 4 = confident BED, 6 = output prefix, 7 = log file
+        shard_cmd = list(cmd)
+        shard_cmd[4] = to_container(confident_bed)
+        shard_cmd[6] = to_container(prefix)
+        shard_cmd[7] = to_container(shard_dir / "happy.log")
+        commands.append(shard_cmd + ["-R", to_container(region_bed)])
+        prefixes.append(prefix)
+
+    logger.info(f"Running hap.py over {len(shards)} contig shards, {parallel} at a time")
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="happy-shard") as executor:
+        futures = [
+            executor.submit(subprocess.run, shard_cmd, check=True, cwd=PROJECT_ROOT, env={**os.environ, **shard_env})
+            for shard_cmd in commands
+        ]
+    for future in futures:
+        future.result()
+    return sharding.merge_happy_outputs(prefixes, out_prefix)
+
+def run_truvari_shards(cmd, base_vcf, comp_vcf, include_bed, truvari_dir, shard_count, env=None):
+    """
+    Run truvari bench as parallel invocations over groups of whole contigs and
+    merge their summary.json into {truvari_dir}/summary.json. cmd is the
+    whole-genome truvari.sh command; each shard benches its contigs' records
+    of the base and comp VCFs (bcftools view -r) within its part of the
+    include BED. Contigs outside the include BED are never compared, so they
+    are left out. Shard inputs and outputs stay in {truvari_dir}/shards/.
+    """
+    shards = sharding.plan_shards(sharding.confident_bases(include_bed), shard_count)
+    parallel, shard_env = shard_budget("truvari", env, len(shards))
+    shard_root = truvari_dir / "shards"
+    shard_root.mkdir(parents=True, exist_ok=True)
+
+    def run_shard(index, contigs):
+        shard_dir = shard_root / f"shard{index:03d}"
+        shard_dir.mkdir()
+        shard_bed = sharding.subset_bed(include_bed, contigs, shard_dir / "include.bed")
+        shard_vcfs = []
+        for name, vcf in (("base", base_vcf), ("comp", comp_vcf)):
+            shard_vcf = shard_dir / f"{name}.vcf.gz"
+            subprocess.run(["bcftools", "view", "-r", ",".join(contigs), "-Oz", "-o", shard_vcf, vcf], check=True)
+            subprocess.run(["tabix", "-p", "vcf", shard_vcf], check=True)
+            shard_vcfs.append(shard_vcf)
+        # truvari.sh positional arguments: base VCF, comp VCF, include BED, output directory
+        shard_cmd = [cmd[0], *(to_container(path) for path in shard_vcfs), to_container(shard_bed),
+                     to_container(shard_dir / "bench")]
+        subprocess.run(shard_cmd, check=True, cwd=PROJECT_ROOT,
+                       env={**os.environ, **shard_env, "TRUVARI_LOG": str(shard_dir / "truvari.log")})
+        return shard_dir / "bench" / "summary.json"
+
+    logger.info(f"Running Truvari over {len(shards)} contig shards, {parallel} at a time")
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="truvari-shard") as executor:
+        futures = [executor.submit(run_shard, index, contigs) for index, contigs in enumerate(shards)]
+    summaries = [future.result() for future in futures]
+    return sharding.merge_truvari_summaries(summaries, truvari_dir / "summary.json")
+
+def ensure_tabix_index(vcf_path):
+    """
+    Create the .tbi index of a bgzipped VCF if it is missing or older than
+    the VCF. Uses tabix when installed, the native indexer otherwise.
+    """
+    tbi_path = Path(f"{vcf_path}.tbi")
+    if tbi_path.exists() and tbi_path.stat().st_mtime >= Path(vcf_path).stat().st_mtime:
+        return tbi_path
+    logger.info(f"Creating tabix index for {Path(vcf_path).name}...")
+    try:
+        if shutil.which('tabix'):
+            subprocess.run(['tabix', '-f', '-p', 'vcf', str(vcf_path)], check=True)
+        else:
+            gvcf_filter.index_vcf(vcf_path)
+        logger.info("Tabix index created successfully")
+    except Exception as e:
+        raise RuntimeError(f"Failed to create tabix index: {e}")
+    return tbi_path
+
+def has_happy_metrics(run_name):
+    """
+    Check whether hap.py metrics, including the summary/extended rows, were
+    already stored for a run.
+    """
+    db = SessionLocal()
+    try:
+        run_id = utils.get_run_id(run_name)
+        return bool(crud.get_happy_metrics(db, run_id)) and bool(
+            crud.get_happy_stratified_metrics(db, run_id, source="summary")
+        )
+    finally:
+        db.close()
+
+def prepare_references(sample, happy=False, truvari=False):
+    """
+    Verify (and download) the references of a sample and build the derived
+    artifacts its stages need. Runs of the same GIAB base sample share them.
+    """
+    ready, message = ensure_references(sample, auto_download=True)
+    if not ready:
+        raise FileNotFoundError(f"Required reference files not found for {sample}. {message}")
+    if happy:
+        ref_fasta = next(REFERENCE_DIR.glob('*.fasta'), None)
+        if ref_fasta is not None:
+            ensure_sdf(ref_fasta, sample)
+    if truvari:
+        truvari_truth_files(extract_base_sample(sample))
+
+def ensure_sdf(ref_fasta, sample):
+    """
+    Return the RTG SDF for the reference FASTA from the reference artifact
+    cache, building it on first use (and whenever the FASTA changes).
+    """
+    try:
+        return reference_cache.ensure_artifact(
+            'GRCh38.sdf',
+            [ref_fasta],
+            {"tool": "rtg format"},
+            lambda sdf_path: build_sdf(ref_fasta, sdf_path),
+        )
+    except RuntimeError as e:
+        # Fall back to a manually created SDF (see script/setup_reference.sh).
+        legacy_sdf = next(REFERENCE_DIR.glob('*.sdf'), None)
+        if legacy_sdf is not None:
+            logger.warning(f"{e}. Using existing SDF {legacy_sdf} without verification.")
+            return legacy_sdf
+        raise FileNotFoundError(
+            f"SDF format is required for hap.py but could not be created automatically.\n\n"
+            f"Please create it manually using one of these methods:\n\n"
+            f"1. Using local RTG Tools:\n"
+            f"   rtg format -o {REFERENCE_DIR}/GRCh38.sdf {ref_fasta}\n\n"
+            f"2. Using Docker:\n"
+            f"   docker run --rm -v {PROJECT_ROOT}:/wgs pkrusche/hap.py:latest /opt/hap.py/libexec/rtg-tools-install/rtg format -o /wgs/data/reference/GRCh38.sdf /wgs/data/reference/{ref_fasta.name}\n\n"
+            f"3. Using setup script:\n"
+            f"   {PROJECT_ROOT}/script/setup_reference.sh {sample}\n"
+        ) from e
+
+def build_sdf(ref_fasta, sdf_path):
+    """
+    Create an SDF from the FASTA with local RTG Tools, or the copy shipped
+    in the hap.py Docker image.
+    """
+    # Try local RTG Tools first
+    try:
+        rtg_check = subprocess.run(['rtg', 'version'], capture_output=True, text=True, timeout=5)
+        if rtg_check.returncode == 0:
+            logger.info("RTG Tools found locally. Creating SDF format...")
+            rtg_cmd = ['rtg', 'format', '-o', str(sdf_path), str(ref_fasta)]
+            result = subprocess.run(rtg_cmd, capture_output=True, text=True, cwd=REFERENCE_DIR, timeout=3600)
+            if result.returncode == 0:
+                logger.info("SDF format created successfully using local RTG Tools")
+                return
+            logger.warning(f"Local RTG Tools failed: {result.stderr}")
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        logger.info("RTG Tools not found locally, trying Docker...")
+
+    # If local RTG Tools failed or not available, try Docker
+    try:
+        logger.info("Attempting to create SDF using Docker hap.py container...")
+        # RTG Tools is located at /opt/hap.py/libexec/rtg-tools-install/rtg in the container
+        docker_cmd = [
+            'docker', 'run', '--rm',
+            '-v', f'{PROJECT_ROOT}:/wgs',
+            'pkrusche/hap.py:latest',
+            '/opt/hap.py/libexec/rtg-tools-install/rtg', 'format',
+            '-o', to_container(sdf_path), to_container(ref_fasta)
+        ]
+        result = subprocess.run(docker_cmd, capture_output=True, text=True, cwd=PROJECT_ROOT, timeout=3600)
+        if result.returncode == 0 and sdf_path.exists():
+            logger.info("SDF format created successfully using Docker")
+            return
+        logger.warning(f"Docker RTG Tools failed: {result.stderr}")
+    except (FileNotFoundError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Docker not available or timed out: {e}")
+    raise RuntimeError("SDF could not be created with local or Docker RTG Tools")
 
 def post_happy_metrics(sample, run, out_dir_path):
     # Search for summary file
     summary_file = next(out_dir_path.glob('*.summary.csv'), None)
     if not summary_file:
         raise FileNotFoundError(f"No summary file found in {out_dir_path}")
+    run_name = f"{sample}_{run}"
+    post_happy_stratified_metrics(run_name, summary_file)
     # Parse summary file
     print(f"Parsing summary file: {summary_file}") #debug ************
     summary_metrics = parse_summary(summary_file)
     if not summary_metrics:
         print("No summary metrics found.")
         return
-    run_name = f"{sample}_{run}"
-    run_id = utils.get_run_id(run_name)
     # Map CSV keys to schema keys
     key_map = {
         "Type": "type",
@@ -354,13 +618,12 @@ def post_happy_metrics(sample, run, out_dir_path):
             metric_data[schema_key] = int(float(val))
         else:
             metric_data[schema_key] = float(val)
-    metric_data["run_id"] = run_id
     # Validate and send
     try:
-        validated_metrics = schemas.HappyMetricCreate(**metric_data)
+        validated_metrics = schemas.HappyMetricBase(**metric_data)
         db = SessionLocal()
         try:
-            crud.create_happy_metric(db, validated_metrics)
+            crud.bulk_create_happy_metrics(db, [{"run_name": run_name, **validated_metrics.model_dump()}])
         finally:
             db.close()
         print(f"Successfully posted happy metric for {run_name}.")
@@ -368,9 +631,24 @@ def post_happy_metrics(sample, run, out_dir_path):
         print(f"Validation error: {e}")
         raise
     
-def process_truvari(sample, run):
+def post_happy_stratified_metrics(run_name, summary_file):
+    """
+    Store every row of the hap.py summary.csv and of the extended.csv next to
+    it (per-region stratification) in happy_stratified_metrics.
+    """
+    rows = parse_happy_table(summary_file, "summary")
+    extended_file = summary_file.with_name(summary_file.name.replace(".summary.csv", ".extended.csv"))
+    if extended_file.exists():
+        rows += parse_happy_table(extended_file, "extended")
+    db = SessionLocal()
+    try:
+        count = crud.bulk_create_happy_stratified_metrics(db, [{"run_name": run_name, **row} for row in rows])
+    finally:
+        db.close()
+    print(f"Stored {count} hap.py summary/extended rows for {run_name}.")
+
+def process_truvari(sample, run, env=None, force=False):
     # Extract base sample name (e.g., NA24143_Lib3_Rep1 -> NA24143)
-    from api.tasks.setup_reference import extract_base_sample
     base_sample = extract_base_sample(sample)
     logger.info(f"Processing Truvari for sample={sample}, base_sample={base_sample}, run={run}")
     
@@ -386,81 +664,45 @@ def process_truvari(sample, run):
     logger.info(f"Reference files verified for Truvari: {base_sample}")
     
     # Paths to working directories
-    # Use base_sample for reference directory, full sample for run directory
-    ref_dir_path = REFERENCE_DIR / base_sample / "stvar"
     run_dir_path = LAB_RUN_DIR / f"{sample}_{run}"
     
-    # Get the reference and run files (use base files, not normalized ones)
+    # Get the run files
     try:
-        # Get the base truth VCF (not normalized)
-        base_ref_vcfs = [f for f in ref_dir_path.glob('*.vcf.gz') if 'normalized' not in f.name and 'filtered' not in f.name]
-        if not base_ref_vcfs:
-            raise FileNotFoundError("No base reference VCF found")
-        ref_vcf = base_ref_vcfs[0]
-        
-        # Get the base BED file (not normalized)
-        base_beds = [f for f in ref_dir_path.glob('*.bed') if 'normalized' not in f.name]
-        if not base_beds:
-            raise FileNotFoundError("No base BED file found")
-        ref_bed = base_beds[0]
-        
         run_vcf = next(run_dir_path.glob('*.sv.vcf.gz'))
         ref_fasta = next(REFERENCE_DIR.glob('*.fasta'))
     except StopIteration:
         raise FileNotFoundError("Required files not found in reference or run directories.")
     # Find output directory or create if it doesnt exist
     PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
-    output_path = None
-    for name in os.listdir(PROCESSED_DIR):
-        if run in name:
-            output_path = PROCESSED_DIR / name
-            break
+    output_path = find_output_dir(f"{sample}_{run}")
     if output_path is None:
         # Create output directory without date prefix
         output_path = PROCESSED_DIR / run
         output_path.mkdir(parents=True, exist_ok=True)
         print(f"No output path found for {run} in {PROCESSED_DIR}.\nCreating directory.")
-    # Filter VCFs with bcftools
-    filtered_ref_vcf = ref_dir_path / ref_vcf.name.replace('.vcf.gz', '.filtered.vcf.gz')
-    normalized_ref_vcf = ref_dir_path / ref_vcf.name.replace('.vcf.gz', '.normalized.vcf.gz')
+    normalized_ref_vcf, normalized_bed = truvari_truth_files(base_sample)
     filtered_run_vcf = run_dir_path / run_vcf.name.replace('.vcf.gz', '.filtered.vcf.gz')
-    
-    # Ref VCF filter - add chr prefix to chromosome names
-    if not normalized_ref_vcf.exists():
-        # First filter out missing variants
-        bcftools_cmd = [
-            "bcftools", "view",
-            "-e", 'ALT="."',
-            "-Oz",
-            "-o", filtered_ref_vcf,
-            ref_vcf
-        ]
-        tabix_cmd = ['tabix', '-p', 'vcf', filtered_ref_vcf]
-        try:
-            subprocess.run(bcftools_cmd, check=True)
-            subprocess.run(tabix_cmd, check=True)
-        except Exception as e:
-            raise RuntimeError(f"bcftools failed to filter reference vcf: {e}") from e
-            
-        # Then normalize chromosome names (add "chr" prefix)
-        annotate_cmd = [
-            "bcftools", "annotate",
-            "--rename-chrs", "/dev/stdin",
-            "-Oz",
-            "-o", normalized_ref_vcf,
-            filtered_ref_vcf
-        ]
-        # Create chromosome mapping (1->chr1, 2->chr2, etc.)
-        chrom_map = "\n".join([f"{i} chr{i}" for i in range(1, 23)] + ["X chrX", "Y chrY"])
-        try:
-            subprocess.run(annotate_cmd, input=chrom_map.encode(), check=True)
-            subprocess.run(['tabix', '-p', 'vcf', normalized_ref_vcf], check=True)
-        except Exception as e:
-            raise RuntimeError(f"bcftools failed to normalize chromosome names: {e}") from e
+    truvari_script = PROJECT_ROOT / 'pipeline' / 'truvari.sh'
+    truvari_dir = output_path / 'truvari'
+    summary_json = truvari_dir / 'summary.json'
+
+    truvari_fingerprint = fingerprints.compute(
+        [run_vcf, normalized_ref_vcf, normalized_bed],
+        fingerprints.tool_fingerprint(truvari_script, "TRUVARI_IMAGE"),
+        {"exclude": RUN_SV_EXCLUDE},
+    )
+    if stage_is_current(output_path, "truvari", truvari_fingerprint, force):
+        # create_truvari_metric upserts, so re-posting the stored summary is safe.
+        post_truvari_metrics(sample, run, summary_json)
+        return
+    # truvari bench refuses to write into an existing output directory
+    if truvari_dir.exists():
+        shutil.rmtree(truvari_dir)
+
     # Run VCF filter
     bcftools_cmd = [
         "bcftools", "view",
-        "-e", 'ALT="<DUP:TANDEM>"',
+        "-e", RUN_SV_EXCLUDE,
         "-Oz",
         "-o", filtered_run_vcf,
         run_vcf
@@ -471,46 +713,119 @@ def process_truvari(sample, run):
         subprocess.run(tabix_cmd, check=True)
     except Exception as e:
         raise RuntimeError(f"bcftools failed to filter run vcf: {e}") from e
-    # Normalize BED file chromosome names (add chr prefix)
-    normalized_bed = ref_dir_path / ref_bed.name.replace('.bed', '.normalized.bed')
-    if not normalized_bed.exists():
-        try:
-            with open(ref_bed, 'r') as f_in, open(normalized_bed, 'w') as f_out:
-                for line in f_in:
-                    if line.startswith('#'):
-                        f_out.write(line)
-                    else:
-                        fields = line.strip().split('\t')
-                        # Add chr prefix if not present
-                        if not fields[0].startswith('chr'):
-                            fields[0] = f'chr{fields[0]}'
-                        f_out.write('\t'.join(fields) + '\n')
-        except Exception as e:
-            raise RuntimeError(f"Failed to normalize BED file: {e}") from e
-    
     # Run Truvari
-    truvari_script = PROJECT_ROOT / 'pipeline' / 'truvari.sh'
     cmd = [
         str(truvari_script),
         to_container(normalized_ref_vcf),  # Use normalized reference VCF
         to_container(filtered_run_vcf),
         to_container(normalized_bed),  # Use normalized BED file
-        to_container(output_path / 'truvari')
+        to_container(truvari_dir)
     ]
     try:
-        subprocess.run(cmd, check=True, cwd=PROJECT_ROOT)
+        shard_count = min(settings.TRUVARI_SHARDS, len(sharding.confident_bases(normalized_bed)))
+        if shard_count > 1:
+            run_truvari_shards(cmd, normalized_ref_vcf, filtered_run_vcf, normalized_bed, truvari_dir,
+                               shard_count, env)
+        else:
+            # truvari.sh leaves Docker unlimited unless it is given a budget
+            subprocess.run(cmd, check=True, cwd=PROJECT_ROOT,
+                           env={**os.environ, **(env or stage_budget(["truvari"])["truvari"])})
         print(f"Successfully processed truvari for {sample} {run}")
         
         # Parse and store Truvari metrics
-        summary_json = output_path / 'truvari' / 'summary.json'
         if summary_json.exists():
             post_truvari_metrics(sample, run, summary_json)
+            fingerprints.record(output_path, "truvari", truvari_fingerprint, [summary_json])
         else:
             print(f"Warning: Truvari summary.json not found at {summary_json}")
             
     except subprocess.CalledProcessError as e:
         raise RuntimeError(f"Truvari failed for {sample} {run} with error: {e}")
 
+def truvari_truth_files(base_sample):
+    """
+    Return the normalized truth VCF and BED for Truvari. They come from the
+    reference artifact cache, keyed by the digest of the GIAB files they are
+    built from.
+    """
+    ref_dir_path = REFERENCE_DIR / base_sample / "stvar"
+    # Get the base truth VCF (not normalized)
+    base_ref_vcfs = [f for f in ref_dir_path.glob('*.vcf.gz') if 'normalized' not in f.name and 'filtered' not in f.name]
+    if not base_ref_vcfs:
+        raise FileNotFoundError("No base reference VCF found")
+    ref_vcf = base_ref_vcfs[0]
+    # Get the base BED file (not normalized)
+    base_beds = [f for f in ref_dir_path.glob('*.bed') if 'normalized' not in f.name]
+    if not base_beds:
+        raise FileNotFoundError("No base BED file found")
+    ref_bed = base_beds[0]
+
+    normalized_ref_vcf = reference_cache.ensure_artifact(
+        ref_vcf.name.replace('.vcf.gz', '.normalized.vcf.gz'),
+        [ref_vcf],
+        {"exclude": TRUTH_SV_EXCLUDE, "rename_chrs": CHROM_MAP},
+        lambda out_path: build_normalized_truth_vcf(ref_vcf, out_path),
+    )
+    normalized_bed = reference_cache.ensure_artifact(
+        ref_bed.name.replace('.bed', '.normalized.bed'),
+        [ref_bed],
+        {"rename_chrs": CHROM_MAP},
+        lambda out_path: build_normalized_bed(ref_bed, out_path),
+    )
+    return normalized_ref_vcf, normalized_bed
+
+def build_normalized_truth_vcf(ref_vcf, normalized_ref_vcf):
+    """
+    Drop truth records without ALT and add the chr prefix to contig names.
+    """
+    filtered_ref_vcf = normalized_ref_vcf.with_name(normalized_ref_vcf.name.replace('.normalized.', '.filtered.'))
+    # First filter out missing variants
+    bcftools_cmd = [
+        "bcftools", "view",
+        "-e", TRUTH_SV_EXCLUDE,
+        "-Oz",
+        "-o", filtered_ref_vcf,
+        ref_vcf
+    ]
+    tabix_cmd = ['tabix', '-p', 'vcf', filtered_ref_vcf]
+    try:
+        subprocess.run(bcftools_cmd, check=True)
+        subprocess.run(tabix_cmd, check=True)
+    except Exception as e:
+        raise RuntimeError(f"bcftools failed to filter reference vcf: {e}") from e
+
+    # Then normalize chromosome names (add "chr" prefix)
+    annotate_cmd = [
+        "bcftools", "annotate",
+        "--rename-chrs", "/dev/stdin",
+        "-Oz",
+        "-o", normalized_ref_vcf,
+        filtered_ref_vcf
+    ]
+    try:
+        subprocess.run(annotate_cmd, input=CHROM_MAP.encode(), check=True)
+        subprocess.run(['tabix', '-p', 'vcf', normalized_ref_vcf], check=True)
+    except Exception as e:
+        raise RuntimeError(f"bcftools failed to normalize chromosome names: {e}") from e
+
+def build_normalized_bed(ref_bed, normalized_bed):
+    """
+    Add the chr prefix to BED contig names.
+    """
+    try:
+        with open(ref_bed, 'r') as f_in, open(normalized_bed, 'w') as f_out:
+            for line in f_in:
+                if line.startswith('#'):
+                    f_out.write(line)
+                else:
+                    fields = line.strip().split('\t')
+                    # Add chr prefix if not present
+                    if not fields[0].startswith('chr'):
+                        fields[0] = f'chr{fields[0]}'
+                    f_out.write('\t'.join(fields) + '\n')
+    except Exception as e:
+        raise RuntimeError(f"Failed to normalize BED file: {e}") from e
+
 def post_truvari_metrics(sample, run, summary_json_path):
     """Parse Truvari summary.json and post metrics to API"""
     # Parse summary file
@@ -521,15 +836,13 @@ def post_truvari_metrics(sample, run, summary_json_path):
         return
     
     run_name = f"{sample}_{run}"
-    run_id = utils.get_run_id(run_name)
-    truvari_metrics["run_id"] = run_id
     
     # Validate and send
     try:
-        validated_metrics = schemas.TruvariMetricCreate(**truvari_metrics)
+        validated_metrics = schemas.TruvariMetricBase(**truvari_metrics)
         db = SessionLocal()
         try:
-            crud.create_truvari_metric(db, validated_metrics)
+            crud.bulk_create_truvari_metrics(db, [{"run_name": run_name, **validated_metrics.model_dump()}])
         finally:
             db.close()
         print(f"Successfully posted Truvari metric for {run_name}.")
@@ -541,7 +854,7 @@ def to_container(p: Path) -> str:
     root = PROJECT_ROOT.resolve()
     return f"/wgs/{p.resolve().relative_to(root).as_posix()}"        
 
-def process_csv_files(run):
+def process_csv_files(run, force=False):
     # Paths to input and output directories
     input_dir = LAB_RUN_DIR / run
     PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
@@ -561,40 +874,39 @@ def process_csv_files(run):
     if not csv_files:
         print(f"No CSV files found in {input_dir}.")
         return
+    csv_fingerprint = fingerprints.compute(sorted(csv_files) + [Path(format_csv)], {"tool": "reformat_csv"}, {})
+    if stage_is_current(output_path, "csv_reformat", csv_fingerprint, force):
+        return
+    outputs = []
     for csv_file in csv_files:
         output_file = output_path / csv_file.name
         reformat_csv(csv_file, output_file)
-        post_qc_metrics(output_file, run)
+        if output_file.exists():
+            outputs.append(output_file)
+    post_qc_metrics([output_path / csv_file.name for csv_file in csv_files], run)
+    fingerprints.record(output_path, "csv_reformat", csv_fingerprint, outputs)
 
-def post_qc_metrics(output_file, run_name):
+def post_qc_metrics(output_files, run_name):
     """
-    Post a QC metric to the API.
+    Parse a run's reformatted CSV files into long-format QC metric rows and
+    post them in one transaction, replacing the rows of any previous ingest.
     """
-    try:
-        id = utils.get_run_id(run_name)
-    except Exception as e:
-        print(f"Error getting run ID for {run_name}: {e}")
-        raise
-    # Create qc metric from schema
-    try:
-        qc_metric = schemas.QCMetricCreate(
-            metric_name=None,
-            metric_value=None,
-            file_source=output_file.name,
-            run_id=id
-        )
-    except Exception as e:
-        print(f"Error creating QC metric for {output_file}: {e}")
-        raise
+    rows = []
+    for output_file in output_files:
+        file_format = get_file_format(format_csv, output_file)
+        if not file_format or not output_file.exists():
+            continue
+        file_type = file_format["suffix"].removesuffix(".csv")
+        rows.extend({"run_name": run_name, **row} for row in parse_qc_metrics(output_file, file_type))
     try:
         db = SessionLocal()
         try:
-            crud.create_qc_metric(db, qc_metric)
+            crud.bulk_create_qc_metrics(db, rows, replace=True)
         finally:
             db.close()
-        print(f"Successfully posted QC metric for {run_name}.")
+        print(f"Successfully posted {len(rows)} QC metric(s) for {run_name}.")
     except Exception as e:
-        print(f"Error posting QC metric for {run_name}: {e}")
+        print(f"Error posting QC metrics for {run_name}: {e}")
         raise
 
 
@@ -0,0 +1,131 @@
+"""
+Content-addressed cache for artifacts derived from reference files.
+
+Derived truth-set files (filtered/normalized VCFs, chr-prefixed BEDs) and
+the RTG SDF are stored under REFERENCE_CACHE_DIR/<key>/ where key is a hash
+of the source file digests and the transformation parameters. Changing a
+GIAB truth set or a transformation therefore produces a new key and a
+rebuild, never a stale reuse.
+
+Artifacts are built into a temporary directory and published with an atomic
+rename while holding a per-key file lock, so concurrent workers build each
+artifact exactly once and never observe a half-written file. Every published
+artifact is recorded in REFERENCE_CACHE_DIR/manifest.json.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from api.app import settings
+from api.tasks import digests, utils
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = settings.REFERENCE_CACHE_DIR
+MANIFEST_NAME = "manifest.json"
+
+
+def _source_info(path: Path) -> dict:
+    stat = path.stat()
+    # The digest cache avoids rehashing multi-GB FASTA/VCF files on every run.
+    return {
+        "path": str(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": digests.digest(path, "sha256"),
+    }
+
+
+def artifact_key(sources: list[dict], params: dict) -> str:
+    """Hash source digests and transformation parameters into a cache key."""
+    payload = json.dumps(
+        {"sources": [source["sha256"] for source in sources], "params": params},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def read_manifest() -> dict:
+    manifest_path = CACHE_DIR / MANIFEST_NAME
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _record(key: str, entry: dict) -> None:
+    manifest_path = CACHE_DIR / MANIFEST_NAME
+    with utils.file_lock(CACHE_DIR / f"{MANIFEST_NAME}.lock"):
+        manifest = read_manifest()
+        manifest[key] = entry
+        tmp_path = manifest_path.with_name(f".{MANIFEST_NAME}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+
+
+def ensure_artifact(
+    name: str,
+    sources: list[Path],
+    params: dict,
+    build: Callable[[Path], None],
+) -> Path:
+    """
+    Return the cached artifact derived from sources, building it if needed.
+
+    Args:
+        name: File (or directory) name of the artifact, e.g. "GRCh38.sdf"
+        sources: Input files the artifact is derived from
+        params: Transformation parameters; any change triggers a rebuild
+        build: Callable receiving the output path inside a temporary
+            directory. It must create that path and may write companion files
+            (e.g. a .tbi index) next to it.
+
+    Returns:
+        Path of the published artifact
+    """
+    source_infos = [_source_info(Path(source)) for source in sources]
+    key = artifact_key(source_infos, params)
+    artifact_dir = CACHE_DIR / key
+    artifact_path = artifact_dir / name
+    if artifact_path.exists():
+        return artifact_path
+
+    with utils.file_lock(CACHE_DIR / f"{key}.lock"):
+        # Another worker may have published it while we waited for the lock.
+        if artifact_path.exists():
+            return artifact_path
+
+        logger.info(f"Building reference artifact {name} ({key[:12]})")
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{key[:12]}.", dir=CACHE_DIR))
+        try:
+            # Docker tools may run as another user; mkdtemp defaults to 0700.
+            os.chmod(tmp_dir, 0o755)
+            build(tmp_dir / name)
+            if not (tmp_dir / name).exists():
+                raise RuntimeError(f"Artifact build did not produce {name}")
+            if artifact_dir.exists():
+                # Leftover from an interrupted publish without the artifact.
+                shutil.rmtree(artifact_dir)
+            os.replace(tmp_dir, artifact_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    _record(key, {
+        "name": name,
+        "path": str(artifact_path),
+        "params": params,
+        "sources": source_infos,
+        "created_at": datetime.now().isoformat(),
+    })
+    logger.info(f"Published reference artifact {artifact_path}")
+    return artifact_path
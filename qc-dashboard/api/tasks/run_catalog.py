@@ -0,0 +1,256 @@
+"""
+Catalog of run directories, stored in the run_catalog table.
+
+For each run it records the lab run directory (data/lab_runs/{run}), the
+processed directory (data/processed/[{date}_]{run}), its date prefix and
+which benchmark outputs exist, so GET /runs and GET /runs/{run}/benchmarking
+are table reads instead of directory walks.
+
+The catalog is kept current by:
+- the pipeline and the upload/import paths, which call refresh_run() for the
+  run they touched;
+- a watcher (watchfiles) on data/lab_runs and data/processed, for
+  directories created or removed by hand, started by start_app.sh;
+- a full rescan, to rebuild it from scratch or catch up after downtime;
+- when the watcher is not running, GET /runs rescans if either data
+  directory changed after the last scan (catalog_is_stale), and a run's
+  lookup re-scans it if its directories did (entry_is_stale).
+
+Usage (from the qc-dashboard directory):
+    python -m api.tasks.run_catalog rescan
+    python -m api.tasks.run_catalog watch
+"""
+
+import argparse
+import logging
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from api.app import crud, models, settings
+from api.app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+LAB_RUNS_DIR = settings.LAB_RUNS_DIR
+PROCESSED_DIR = settings.PROCESSED_DIR
+
+DATE_PREFIX = re.compile(r"^(\d{8})_(.+)$")
+# Coarse (1-2 s) mtimes and NFS server clocks: a change this close to a scan counts as after it
+MTIME_SLACK = timedelta(seconds=2)
+
+
+def split_processed_dir_name(name: str) -> tuple[Optional[str], str]:
+    """'20250101_HG002_R001' -> ('20250101', 'HG002_R001'); names without a date prefix are run names."""
+    match = DATE_PREFIX.match(name)
+    if match:
+        return match.group(1), match.group(2)
+    return None, name
+
+
+def benchmark_artifacts(processed_dir: Optional[Path]) -> dict:
+    """Which benchmark outputs a processed run directory holds."""
+    if processed_dir is None:
+        return {"has_happy": False, "has_stratified": False, "has_truvari": False, "has_csv": False}
+    return {
+        "has_happy": any(processed_dir.rglob("*.summary.csv")),
+        "has_stratified": any(processed_dir.glob("*.extended.csv")),
+        "has_truvari": any(processed_dir.rglob("summary.json")),
+        "has_csv": any(processed_dir.glob("*.csv")),
+    }
+
+
+def _entry(run_name: str, lab_dir: Optional[Path], processed_dir: Optional[Path]) -> dict:
+    date_prefix = split_processed_dir_name(processed_dir.name)[0] if processed_dir else None
+    return {
+        "run_name": run_name,
+        "lab_dir": str(lab_dir) if lab_dir else None,
+        "processed_dir": str(processed_dir) if processed_dir else None,
+        "date_prefix": date_prefix,
+        **benchmark_artifacts(processed_dir),
+    }
+
+
+def processed_dir_rank(path: Path) -> tuple:
+    """
+    Precedence among the processed directories of one run, lowest first: the
+    dated {date}_{run} directories the pipeline creates, earliest date first,
+    then a {run} directory without a date.
+    """
+    return split_processed_dir_name(path.name)[0] is None, path.name
+
+
+def find_processed_dir(run_name: str, processed_root: Optional[Path] = None) -> Optional[Path]:
+    """
+    The processed directory of one run, by processed_dir_rank. The pipeline
+    (process_run.find_output_dir) and the catalog both use it.
+    """
+    processed_root = processed_root or PROCESSED_DIR
+    if not processed_root.exists():
+        return None
+    candidates = [
+        path for path in [processed_root / run_name, *processed_root.glob(f"*_{run_name}")]
+        if path.is_dir() and split_processed_dir_name(path.name)[1] == run_name
+    ]
+    return min(candidates, key=processed_dir_rank, default=None)
+
+
+def scan_run(run_name: str) -> Optional[dict]:
+    """Catalog entry of one run from the filesystem, or None if it has no directory."""
+    lab_dir = LAB_RUNS_DIR / run_name
+    lab_dir = lab_dir if lab_dir.is_dir() else None
+    processed_dir = find_processed_dir(run_name)
+    if lab_dir is None and processed_dir is None:
+        return None
+    return _entry(run_name, lab_dir, processed_dir)
+
+
+def scan_all() -> dict[str, dict]:
+    """Catalog entries of every run, with a single listing of each data directory."""
+    lab_dirs = {}
+    if LAB_RUNS_DIR.exists():
+        lab_dirs = {path.name: path for path in LAB_RUNS_DIR.iterdir() if path.is_dir()}
+    processed_dirs = {}
+    if PROCESSED_DIR.exists():
+        for path in sorted(PROCESSED_DIR.iterdir()):
+            if not path.is_dir():
+                continue
+            run_name = split_processed_dir_name(path.name)[1]
+            # The same precedence as find_processed_dir
+            if run_name not in processed_dirs or processed_dir_rank(path) < processed_dir_rank(processed_dirs[run_name]):
+                processed_dirs[run_name] = path
+    return {
+        run_name: _entry(run_name, lab_dirs.get(run_name), processed_dirs.get(run_name))
+        for run_name in sorted(lab_dirs.keys() | processed_dirs.keys())
+    }
+
+
+def _changed_since(paths, scanned_at: Optional[datetime]) -> bool:
+    """Whether any existing directory of paths was modified after scanned_at (UTC)."""
+    for path in paths:
+        try:
+            mtime = Path(path).stat().st_mtime
+        except OSError:
+            continue
+        if scanned_at is None or datetime.utcfromtimestamp(mtime) + MTIME_SLACK >= scanned_at:
+            return True
+    return False
+
+
+def catalog_is_stale(db: Session) -> bool:
+    """
+    Whether a run directory was added to or removed from data/lab_runs or
+    data/processed after the last full rescan (or there never was one): two
+    stats, for when the watcher is not running. Single-run refreshes don't
+    count, as they don't look for other runs.
+    """
+    return _changed_since([LAB_RUNS_DIR, PROCESSED_DIR], crud.last_run_catalog_rescan(db))
+
+
+def entry_is_stale(entry: models.RunCatalogEntry) -> bool:
+    """Whether files were added to or removed from a run's directories after it was scanned."""
+    return _changed_since([path for path in (entry.lab_dir, entry.processed_dir) if path], entry.scanned_at)
+
+
+def refresh(db: Session, run_name: str) -> Optional[models.RunCatalogEntry]:
+    """Re-scan one run and update (or drop) its catalog entry."""
+    scanned_at = datetime.utcnow()
+    entry = scan_run(run_name)
+    if entry is None:
+        crud.delete_run_catalog_entries(db, [run_name])
+        return None
+    crud.upsert_run_catalog_entries(db, [entry], scanned_at)
+    return crud.get_run_catalog_entry(db, run_name)
+
+
+def rescan(db: Session) -> int:
+    """Rebuild the whole catalog from the filesystem. Returns the number of runs found."""
+    scanned_at = datetime.utcnow()
+    entries = scan_all()
+    stale = {row.run_name for row in crud.get_run_catalog(db)} - entries.keys()
+    crud.upsert_run_catalog_entries(db, list(entries.values()), scanned_at)
+    crud.delete_run_catalog_entries(db, stale)
+    crud.record_run_catalog_rescan(db, scanned_at)
+    logger.info(f"Run catalog rescanned: {len(entries)} runs, {len(stale)} stale entries removed")
+    return len(entries)
+
+
+def refresh_run(run_name: str, session_factory=SessionLocal) -> None:
+    """
+    refresh() in its own session, for the pipeline and upload hooks. Errors are
+    logged, not raised: the catalog must never fail the work that touched the run.
+    """
+    db = session_factory()
+    try:
+        refresh(db, run_name)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Could not update the run catalog for {run_name}: {e}")
+    finally:
+        db.close()
+
+
+def run_names_for_changes(changes) -> set[str]:
+    """Run names touched by a batch of watchfiles (change, path) pairs."""
+    lab_root, processed_root = LAB_RUNS_DIR.resolve(), PROCESSED_DIR.resolve()
+    run_names = set()
+    for _change, path in changes:
+        path = Path(path)
+        for root in (lab_root, processed_root):
+            try:
+                top = path.relative_to(root).parts[0]
+            except (ValueError, IndexError):
+                continue
+            run_names.add(top if root == lab_root else split_processed_dir_name(top)[1])
+    return run_names
+
+
+def watch(stop_event=None, force_polling: Optional[bool] = None, session_factory=SessionLocal) -> None:
+    """
+    Keep the catalog current from filesystem events until stop_event is set.
+    watchfiles uses inotify where available; set VCBENCH_CATALOG_WATCH_POLLING
+    for NFS mounts, where remote writes raise no inotify events.
+    """
+    try:
+        from watchfiles import watch as watch_paths
+    except ImportError as e:
+        raise RuntimeError("The run catalog watcher needs watchfiles (pip install watchfiles)") from e
+
+    LAB_RUNS_DIR.mkdir(parents=True, exist_ok=True)
+    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+    if force_polling is None:
+        force_polling = settings.CATALOG_WATCH_POLLING
+    db = session_factory()
+    try:
+        rescan(db)
+        for changes in watch_paths(LAB_RUNS_DIR, PROCESSED_DIR, stop_event=stop_event, force_polling=force_polling):
+            for run_name in sorted(run_names_for_changes(changes)):
+                try:
+                    refresh(db, run_name)
+                except Exception as e:
+                    db.rollback()
+                    logger.warning(f"Could not update the run catalog for {run_name}: {e}")
+    finally:
+        db.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Maintain the run catalog.")
+    parser.add_argument("command", choices=["rescan", "watch"], help="rescan once, or rescan then follow filesystem events")
+    args = parser.parse_args()
+    if args.command == "watch":
+        watch()
+        return
+    db = SessionLocal()
+    try:
+        rescan(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+Native S3 download of a sample's DRAGEN outputs, in place of
+script/aws_download_gvcf.sh.
+
+Files are selected as the script selects them (gVCF, SV VCF and metric CSVs
+under {base}/{sample}/vcf/dragen/{id}/varcaller/, renamed {sample}_R001.*)
+and fetched as ranged GETs of S3_PART_SIZE bytes over S3_DOWNLOAD_WORKERS
+threads, each part written at its offset in a preallocated {file}.part.
+Finished parts are recorded in {file}.part.json, so an interrupted download
+resumes with the missing parts only, as long as the object's ETag is
+unchanged.
+
+Every download in the process shares one TransferGovernor: at most
+S3_MAX_CONCURRENT_OBJECTS objects are in flight at once and the aggregate
+rate is capped at S3_MAX_BYTES_PER_SECOND, so concurrent and batch imports
+keep the link busy without starving the API host. The objects of one sample
+are fetched one after the other, each over all its part threads.
+
+MD5 and SHA-256 are computed during the download: leading parts are hashed
+as soon as they are complete, while they are still in the page cache, so the
+digest cache (api.tasks.digests) is filled when the file lands. Single-part
+ETags are checked against the MD5, unless the object is encrypted with
+SSE-KMS or SSE-C: its ETag is then not an MD5 of the content either.
+
+boto3 is optional; available() tells whether this path can be used.
+"""
+
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Callable, Optional
+
+from api.app import job_service, settings
+from api.app.database import SessionLocal
+from api.tasks import digests
+
+logger = logging.getLogger(__name__)
+
+LAB_RUNS_DIR = settings.LAB_RUNS_DIR
+VARIANT_SUFFIXES = (".gvcf.gz", ".sv.vcf.gz")
+CSV_PATTERNS = (
+    "*sv_metrics.csv",
+    "*roh_metrics.csv",
+    "*ploidy_estimation_metrics.csv",
+    "*cnv_metrics.csv",
+    "*bed_coverage_metrics.csv",
+    "*wgs_contig_mean_cov.csv",
+    "*vc_metrics.csv",
+    "*vc_hethom_ratio_metrics.csv",
+    "*mapping_metrics.csv",
+)
+READ_SIZE = 1024 * 1024
+PART_ATTEMPTS = 3
+# Bytes that may go out ahead of the rate limit after an idle period
+BURST_SECONDS = 0.5
+
+
+def available() -> bool:
+    return importlib.util.find_spec("boto3") is not None
+
+
+def make_client():
+    try:
+        import boto3
+    except ImportError as e:
+        raise RuntimeError("Native AWS downloads need boto3: pip install boto3") from e
+    session = boto3.session.Session(profile_name=settings.AWS_PROFILE or None)
+    return session.client("s3", endpoint_url=settings.S3_ENDPOINT_URL)
+
+
+def is_wanted(file_name: str) -> bool:
+    if file_name.endswith(VARIANT_SUFFIXES):
+        return True
+    return any(fnmatch(file_name, pattern) for pattern in CSV_PATTERNS)
+
+
+def local_name(file_name: str, sample_id: str) -> str:
+    """Rename {sample}.* to {sample}_R001.*, as the download script does."""
+    if file_name.startswith(f"{sample_id}."):
+        return f"{sample_id}_R001.{file_name[len(sample_id) + 1:]}"
+    return file_name
+
+
+class TransferGovernor:
+    """Process-wide limits on S3 downloads: objects in flight and aggregate bytes per second."""
+
+    def __init__(self, max_objects: int, max_bytes_per_second: int = 0):
+        self.max_objects = max(max_objects, 1)
+        self.max_bytes_per_second = max_bytes_per_second
+        self._objects = threading.Semaphore(self.max_objects)
+        self._lock = threading.Lock()
+        self._free_at = 0.0
+
+    @contextmanager
+    def object_slot(self):
+        self._objects.acquire()
+        try:
+            yield
+        finally:
+            self._objects.release()
+
+    def throttle(self, count: int) -> None:
+        """Account for count bytes received, sleeping while the aggregate rate is over the limit."""
+        if not self.max_bytes_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._free_at = max(self._free_at, now - BURST_SECONDS) + count / self.max_bytes_per_second
+            delay = self._free_at - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+governor = TransferGovernor(settings.S3_MAX_CONCURRENT_OBJECTS, settings.S3_MAX_BYTES_PER_SECOND)
+
+
+@dataclass
+class S3Object:
+    key: str
+    size: int
+    etag: str
+    dest: Path
+
+
+def list_sample_objects(client, sample_id: str, dest_dir: Path, bucket: Optional[str] = None) -> list[S3Object]:
+    bucket = bucket or settings.AWS_BUCKET
+    prefix = f"{settings.AWS_BASE_PATH}/{sample_id}/vcf/dragen/"
+    objects = []
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get("Contents", []):
+            # {id}/varcaller/{file}
+            parts = item["Key"][len(prefix):].split("/")
+            if len(parts) != 3 or parts[1] != "varcaller" or not is_wanted(parts[2]):
+                continue
+            objects.append(S3Object(item["Key"], item["Size"], item["ETag"], dest_dir / local_name(parts[2], sample_id)))
+    return objects
+
+
+class _FileDownload:
+    """One object being written part by part into its .part file."""
+
+    def __init__(self, obj: S3Object, part_size: int):
+        self.obj = obj
+        self.part_size = part_size
+        self.part_count = -(-obj.size // part_size)
+        self.part_path = obj.dest.with_name(f"{obj.dest.name}.part")
+        self.state_path = obj.dest.with_name(f"{obj.dest.name}.part.json")
+        self.done: set[int] = set()
+        self.hashed = 0
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in digests.ALGORITHMS}
+        self.lock = threading.Lock()
+        self.fd: Optional[int] = None
+        # ServerSideEncryption and SSECustomerAlgorithm of a GET or HEAD response
+        self.encryption: Optional[dict] = None
+
+    def _state(self) -> dict:
+        return {"etag": self.obj.etag, "size": self.obj.size, "part_size": self.part_size}
+
+    def open(self) -> list[int]:
+        """Open the .part file, resuming it if it matches the object. Returns the parts to fetch."""
+        try:
+            state = json.loads(self.state_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        if (
+            {key: state.get(key) for key in ("etag", "size", "part_size")} == self._state()
+            and self.part_path.exists()
+            and self.part_path.stat().st_size == self.obj.size
+        ):
+            self.done = {index for index in state.get("done", []) if 0 <= index < self.part_count}
+        else:
+            self.done = set()
+            with open(self.part_path, "wb") as f:
+                f.truncate(self.obj.size)
+            self._save_state()
+        self.fd = os.open(self.part_path, os.O_RDWR)
+        return [index for index in range(self.part_count) if index not in self.done]
+
+    @property
+    def resumed_bytes(self) -> int:
+        return sum(self.part_range(index)[1] - self.part_range(index)[0] + 1 for index in self.done)
+
+    def part_range(self, index: int) -> tuple[int, int]:
+        start = index * self.part_size
+        return start, min(start + self.part_size, self.obj.size) - 1
+
+    def write(self, offset: int, data: bytes) -> None:
+        while data:
+            written = os.pwrite(self.fd, data, offset)
+            data, offset = data[written:], offset + written
+
+    def part_done(self, index: int) -> bool:
+        """Record a finished part and hash what became contiguous. Returns True when all parts are in."""
+        with self.lock:
+            self.done.add(index)
+            self._save_state()
+            self._hash_ready()
+            return len(self.done) == self.part_count
+
+    def _save_state(self) -> None:
+        tmp_path = self.state_path.with_name(f"{self.state_path.name}.tmp")
+        tmp_path.write_text(json.dumps({**self._state(), "done": sorted(self.done)}))
+        os.replace(tmp_path, self.state_path)
+
+    def _hash_ready(self) -> None:
+        while self.hashed in self.done:
+            offset, end = self.part_range(self.hashed)
+            while offset <= end:
+                data = os.pread(self.fd, min(digests.CHUNK_SIZE, end + 1 - offset), offset)
+                if not data:
+                    raise IOError(f"{self.part_path} is shorter than expected")
+                for digest in self.hashes.values():
+                    digest.update(data)
+                offset += len(data)
+            self.hashed += 1
+
+    def note_encryption(self, response: dict) -> None:
+        self.encryption = {key: response.get(key) for key in ("ServerSideEncryption", "SSECustomerAlgorithm")}
+
+    def _unchecked_etag_reason(self) -> Optional[str]:
+        if "-" in self.obj.etag:
+            return "multipart"
+        if str(self.encryption.get("ServerSideEncryption") or "").startswith("aws:kms"):
+            return "SSE-KMS"
+        if self.encryption.get("SSECustomerAlgorithm"):
+            return "SSE-C"
+        return None
+
+    def finish(self) -> None:
+        """Check the file against its ETag, move it into place and cache its digests."""
+        with self.lock:
+            self._hash_ready()
+            if self.hashed != self.part_count:
+                raise IOError(f"{self.obj.key}: {self.part_count - self.hashed} parts missing")
+            os.fsync(self.fd)
+            self.close()
+            hexdigests = {algorithm: digest.hexdigest() for algorithm, digest in self.hashes.items()}
+            etag = self.obj.etag.strip('"')
+            # Multipart, SSE-KMS and SSE-C ETags are not an MD5 of the content; only plain ones can be checked.
+            reason = self._unchecked_etag_reason()
+            if reason is None and etag != hexdigests["md5"]:
+                raise IOError(f"{self.obj.key}: MD5 {hexdigests['md5']} does not match ETag {etag}")
+            if reason in ("SSE-KMS", "SSE-C"):
+                logger.info(f"{self.obj.key}: ETag of an {reason} object is not an MD5, not checked")
+            os.replace(self.part_path, self.obj.dest)
+            self.state_path.unlink(missing_ok=True)
+        try:
+            digests.store(self.obj.dest, hexdigests)
+        except OSError as e:
+            logger.warning(f"Could not cache digests for {self.obj.dest}: {e}")
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class _Progress:
+    """Thread-safe byte counter feeding job_service.update_progress."""
+
+    def __init__(self, job_id: Optional[str], bytes_total: int, session_factory):
+        self.job_id = job_id
+        self.bytes_total = bytes_total
+        self.bytes_done = 0
+        self._lock = threading.Lock()
+        self._db = session_factory() if job_id else None
+
+    def add(self, count: int) -> None:
+        with self._lock:
+            self.bytes_done += count
+            if self._db is not None:
+                job_service.update_progress(
+                    self._db, self.job_id, bytes_done=self.bytes_done, bytes_total=self.bytes_total
+                )
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+
+
+def _fetch_part(
+    client, bucket: str, download: _FileDownload, index: int, progress: _Progress, governor: TransferGovernor
+) -> bool:
+    start, end = download.part_range(index)
+    for attempt in range(1, PART_ATTEMPTS + 1):
+        offset = start
+        try:
+            response = client.get_object(
+                Bucket=bucket, Key=download.obj.key, Range=f"bytes={start}-{end}", IfMatch=download.obj.etag
+            )
+            if download.encryption is None:
+                download.note_encryption(response)
+            body = response["Body"]
+            for chunk in iter(lambda: body.read(READ_SIZE), b""):
+                download.write(offset, chunk)
+                offset += len(chunk)
+                progress.add(len(chunk))
+                governor.throttle(len(chunk))
+            if offset != end + 1:
+                raise IOError(f"{download.obj.key}: part {index} ended at byte {offset}, expected {end + 1}")
+            return download.part_done(index)
+        except Exception as e:
+            progress.add(start - offset)
+            if attempt == PART_ATTEMPTS:
+                raise
+            logger.warning(f"{download.obj.key}: part {index} failed ({e}), retrying")
+    return False
+
+
+def _download_file(client, bucket, download: _FileDownload, pool, progress, governor, log) -> None:
+    missing = download.open()
+    if download.done:
+        log(f"Resuming {download.obj.dest.name}: {len(download.done)}/{download.part_count} parts on disk", "info")
+        progress.add(download.resumed_bytes)
+    else:
+        log(f"Downloading {download.obj.dest.name} ({download.obj.size} bytes)", "info")
+    futures = [pool.submit(_fetch_part, client, bucket, download, index, progress, governor) for index in missing]
+    try:
+        for future in as_completed(futures):
+            future.result()
+    except BaseException:
+        # Queued parts are dropped; finished ones stay recorded for a resume.
+        for future in futures:
+            future.cancel()
+        raise
+    if download.encryption is None:
+        # Nothing fetched in this run: resumed from parts on disk, or empty
+        download.note_encryption(client.head_object(Bucket=bucket, Key=download.obj.key, IfMatch=download.obj.etag))
+    download.finish()
+    log(f"{download.obj.dest.name} downloaded", "success")
+
+
+def download_sample(
+    sample_id: str,
+    client=None,
+    dest_dir: Optional[Path] = None,
+    job_id: Optional[str] = None,
+    log: Optional[Callable[[str, str], None]] = None,
+    workers: Optional[int] = None,
+    part_size: Optional[int] = None,
+    bucket: Optional[str] = None,
+    session_factory=SessionLocal,
+) -> list[Path]:
+    """
+    Download a sample's files into dest_dir (lab_runs/{sample}_R001 by default).
+
+    Files already present with the object's size are skipped. log(message,
+    level) receives one line per file, level being "info", "success" or
+    "warning". Returns the local paths of every selected file.
+    """
+    client = client or make_client()
+    bucket = bucket or settings.AWS_BUCKET
+    dest_dir = dest_dir or LAB_RUNS_DIR / f"{sample_id}_R001"
+    log = log or (lambda message, level="info": logger.info(message))
+    part_size = part_size or settings.S3_PART_SIZE
+
+    objects = list_sample_objects(client, sample_id, dest_dir, bucket=bucket)
+    if not objects:
+        raise FileNotFoundError(
+            f"No gVCF, SV VCF or metrics CSV for {sample_id} under s3://{bucket}/{settings.AWS_BASE_PATH}/{sample_id}/"
+        )
+    dest_dir.mkdir(parents=True, exist_ok=True)
+
+    pending = []
+    for obj in objects:
+        if obj.dest.exists() and obj.dest.stat().st_size == obj.size:
+            log(f"{obj.dest.name} already present, skipped", "warning")
+        else:
+            pending.append(_FileDownload(obj, part_size))
+
+    progress = _Progress(job_id, sum(download.obj.size for download in pending), session_factory)
+    pool = ThreadPoolExecutor(max_workers=max(workers or settings.S3_DOWNLOAD_WORKERS, 1), thread_name_prefix="s3-part")
+    try:
+        for download in pending:
+            with governor.object_slot():
+                _download_file(client, bucket, download, pool, progress, governor, log)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        for download in pending:
+            download.close()
+        progress.close()
+    return [obj.dest for obj in objects]
@@ -0,0 +1,127 @@
+"""
+Stage scheduler for run_pipeline.
+
+hap.py and Truvari read different inputs and write to different output
+directories, so they can run side by side. The scheduler splits a single
+CPU/memory budget (HAPPY_CPUS / HAPPY_MEMORY, the same knobs used by
+pipeline/happy.sh) between the stages that run concurrently and passes each
+stage its share as environment variables for the Docker wrappers.
+"""
+
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from api.app import settings
+
+logger = logging.getLogger(__name__)
+
+_MEMORY_UNITS = {"": 1 / (1024 * 1024), "k": 1 / 1024, "m": 1, "g": 1024, "t": 1024 * 1024}
+
+
+def parse_memory_mb(value: str) -> int:
+    """Parse a Docker-style memory size ("48g", "512m") into MiB."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)b?\s*", str(value).lower())
+    if not match:
+        raise ValueError(f"Invalid memory size: {value}")
+    return int(float(match.group(1)) * _MEMORY_UNITS[match.group(2)])
+
+
+def stage_budget(stages: list[str]) -> dict[str, dict[str, str]]:
+    """
+    Split the pipeline CPU/memory budget between the given stages.
+
+    Truvari is effectively single-threaded, so it gets a small fixed share
+    (TRUVARI_CPUS / TRUVARI_MEMORY) and hap.py gets the rest. A stage that
+    runs alone gets the whole budget.
+
+    Returns:
+        {stage_name: {ENV_VAR: value}} to merge into each stage's environment
+    """
+    total_cpus = max(settings.PIPELINE_CPUS, 1)
+    total_mb = parse_memory_mb(settings.PIPELINE_MEMORY)
+    truvari_cpus = min(settings.TRUVARI_CPUS, total_cpus)
+    truvari_mb = min(parse_memory_mb(settings.TRUVARI_MEMORY), total_mb)
+
+    happy_cpus, happy_mb = total_cpus, total_mb
+    if "happy" in stages and "truvari" in stages:
+        happy_cpus = max(total_cpus - truvari_cpus, 1)
+        happy_mb = max(total_mb - truvari_mb, 1024)
+    elif "truvari" in stages:
+        truvari_cpus, truvari_mb = total_cpus, total_mb
+
+    budget = {}
+    if "happy" in stages:
+        budget["happy"] = {
+            "HAPPY_CPUS": str(happy_cpus),
+            "HAPPY_MEMORY": f"{happy_mb}m",
+            # Keep the same swap headroom ratio as the happy.sh defaults (56g / 48g).
+            "HAPPY_MEMORY_SWAP": f"{happy_mb * 7 // 6}m",
+        }
+    if "truvari" in stages:
+        budget["truvari"] = {
+            "TRUVARI_CPUS": str(truvari_cpus),
+            "TRUVARI_MEMORY": f"{truvari_mb}m",
+        }
+    return budget
+
+
+def shard_budget(stage: str, env: dict | None, shard_count: int) -> tuple[int, dict[str, str]]:
+    """
+    Split a stage's share of the budget between parallel shards of that
+    stage (e.g. hap.py over groups of contigs). Each shard needs at least
+    one CPU, so at most that many shards run at once.
+
+    Args:
+        stage: "happy" or "truvari"
+        env: the stage's share as passed by run_stages; the whole budget if empty
+        shard_count: number of shards
+
+    Returns:
+        (shards to run at once, environment of each shard)
+    """
+    env = dict(env or stage_budget([stage])[stage])
+    prefix = stage.upper()
+    cpus = int(env[f"{prefix}_CPUS"])
+    memory_mb = parse_memory_mb(env[f"{prefix}_MEMORY"])
+    parallel = max(1, min(shard_count, cpus))
+    shard_mb = max(memory_mb // parallel, 1)
+    env[f"{prefix}_CPUS"] = str(max(cpus // parallel, 1))
+    env[f"{prefix}_MEMORY"] = f"{shard_mb}m"
+    if f"{prefix}_MEMORY_SWAP" in env:
+        env[f"{prefix}_MEMORY_SWAP"] = f"{shard_mb * 7 // 6}m"
+    return parallel, env
+
+
+def run_stages(stages: dict) -> None:
+    """
+    Run independent pipeline stages concurrently within the resource budget.
+
+    Args:
+        stages: {stage_name: callable(env)} where env is the stage's share of
+            the budget as environment variables
+
+    Raises:
+        RuntimeError: if any stage failed (after all stages have finished)
+    """
+    if not stages:
+        return
+    budget = stage_budget(list(stages))
+    if len(stages) == 1:
+        name, stage = next(iter(stages.items()))
+        stage(budget.get(name, {}))
+        return
+
+    logger.info(f"Running stages concurrently: {', '.join(stages)}")
+    with ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="stage") as executor:
+        futures = {name: executor.submit(stage, budget.get(name, {})) for name, stage in stages.items()}
+    errors = {}
+    for name, future in futures.items():
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Stage {name} failed: {error}")
+            errors[name] = error
+    if len(errors) == 1:
+        raise next(iter(errors.values()))
+    if errors:
+        raise RuntimeError("; ".join(f"{name}: {error}" for name, error in errors.items()))
@@ -0,0 +1,346 @@
+"""
+Contig sharding of benchmark runs and exact merging of their outputs.
+
+A shard is a group of whole contigs, so no variant (or comparison window)
+spans two shards and every record is counted by exactly one of them.
+plan_shards balances the groups by confident bases, the work hap.py
+actually does, and contigs without confident regions still belong to a
+shard so their calls keep being counted.
+
+hap.py reports counts and ratios derived from them. merge_happy_outputs
+adds up the counts of the shards' summary.csv/extended.csv and recomputes
+every ratio from the merged counts with hap.py's formulas, so the result
+matches a single run over the whole genome; rows are written in key order.
+The TiTv and het/hom ratios of
+summary.csv are taken from the matching extended.csv row, which carries
+their ti/tv and het/homalt inputs.
+
+Truvari's summary.json is merged the same way: TP/FP/FN, record counts,
+genotype counters and the genotype matrix are added up and precision,
+recall, F1 and GT concordance recomputed as truvari bench computes them.
+
+Shards run elsewhere (e.g. on other worker hosts) can be merged with
+python -m api.tasks.sharding {happy,truvari} OUT SHARD...
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Row identity in hap.py tables; everything else is a count or derived from counts
+HAPPY_KEY_COLUMNS = ("Type", "Subtype", "Subset", "Filter", "Genotype", "QQ.Field", "QQ")
+# Region sizes, and whether a shard restricts them: the stratification BED
+# is not cut by -R, so every shard reports the whole Subset.Size, while its
+# intersection with the confident regions (-f, cut per shard) adds up.
+HAPPY_REGION_COLUMNS = {"Subset.Size": False, "Subset.IS_CONF.Size": True}
+# Percentages whose numerator is not in the table; merged weighted by their denominator
+HAPPY_WEIGHTED_COLUMNS = {"PCT.FP.ma": "QUERY.FP"}
+# summary.json fields truvari bench derives from its counters
+TRUVARI_DERIVED_FIELDS = ("precision", "recall", "f1", "gt_concordance")
+
+
+def read_fai(fai_path: Path) -> dict[str, int]:
+    """Contig lengths from a FASTA index, in reference order."""
+    lengths = {}
+    with open(fai_path) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 2 and fields[0]:
+                lengths[fields[0]] = int(fields[1])
+    return lengths
+
+
+def confident_bases(bed_path: Path) -> dict[str, int]:
+    """Bases covered by a BED file, per contig."""
+    bases: dict[str, int] = {}
+    with open(bed_path) as f:
+        for line in f:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            contig, start, end = line.split("\t")[:3]
+            bases[contig] = bases.get(contig, 0) + int(end) - int(start)
+    return bases
+
+
+def plan_shards(weights: dict[str, int], shard_count: int) -> list[list[str]]:
+    """
+    Split contigs into at most shard_count groups of similar total weight
+    (largest contigs first, each into the lightest group). Contigs keep
+    their reference order within a group; empty groups are dropped.
+    """
+    shard_count = max(1, min(shard_count, len(weights)))
+    order = {contig: index for index, contig in enumerate(weights)}
+    loads = [0] * shard_count
+    groups: list[list[str]] = [[] for _ in range(shard_count)]
+    for contig in sorted(weights, key=lambda contig: (-weights[contig], order[contig])):
+        lightest = loads.index(min(loads))
+        groups[lightest].append(contig)
+        loads[lightest] += weights[contig]
+    return [sorted(group, key=order.get) for group in groups if group]
+
+
+def subset_bed(bed_path: Path, contigs: list[str], out_path: Path) -> Path:
+    """Write the lines of bed_path on the given contigs to out_path."""
+    wanted = set(contigs)
+    with open(bed_path) as src, open(out_path, "w") as out:
+        for line in src:
+            if line.split("\t", 1)[0] in wanted:
+                out.write(line)
+    return out_path
+
+
+def write_shard_beds(contigs: list[str], lengths: dict[str, int], bed_path: Path, shard_dir: Path) -> tuple[Path, Path]:
+    """
+    Write the confident regions of a shard (bed_path restricted to its
+    contigs) and its whole contigs as BED files in shard_dir.
+
+    Returns:
+        (confident_bed, region_bed)
+    """
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    confident_bed = subset_bed(bed_path, contigs, shard_dir / "confident.bed")
+    region_bed = shard_dir / "regions.bed"
+    with open(region_bed, "w") as out:
+        for contig in contigs:
+            out.write(f"{contig}\t0\t{lengths[contig]}\n")
+    return confident_bed, region_bed
+
+
+def _read_table(path: Path) -> tuple[list[str], list[dict[str, str]]]:
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        return list(reader.fieldnames or []), list(reader)
+
+
+def _count(value: str, column: str, path: Path) -> int:
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError(f"{path}: {column} is not a count ({value})")
+    return int(number)
+
+
+def _ratio(numerator: Optional[float], denominator: Optional[float]) -> Optional[float]:
+    if numerator is None or not denominator:
+        return None
+    return numerator / denominator
+
+
+def _is_derived(column: str) -> bool:
+    return column.startswith(("METRIC.", "PCT.")) or column.endswith(("_ratio",))
+
+
+def happy_metrics(counts: dict[str, int]) -> dict[str, Optional[float]]:
+    """
+    hap.py's derived metrics from merged counts. QUERY.TP, absent from
+    summary.csv, is QUERY.TOTAL - QUERY.FP - QUERY.UNK.
+    """
+    query_tp = counts.get("QUERY.TP")
+    if query_tp is None and all(column in counts for column in ("QUERY.TOTAL", "QUERY.FP", "QUERY.UNK")):
+        query_tp = counts["QUERY.TOTAL"] - counts["QUERY.FP"] - counts["QUERY.UNK"]
+    truth_tp, truth_fn = counts.get("TRUTH.TP"), counts.get("TRUTH.FN")
+    recall = _ratio(truth_tp, truth_tp + truth_fn) if truth_tp is not None and truth_fn is not None else None
+    query_fp = counts.get("QUERY.FP")
+    precision = _ratio(query_tp, query_tp + query_fp) if query_tp is not None and query_fp is not None else None
+    metrics = {
+        "METRIC.Recall": recall,
+        "METRIC.Precision": precision,
+        "METRIC.Frac_NA": _ratio(counts.get("QUERY.UNK"), counts.get("QUERY.TOTAL")),
+        "METRIC.F1_Score": (
+            2 * recall * precision / (recall + precision)
+            if recall is not None and precision is not None and recall + precision else None
+        ),
+    }
+    for column in counts:
+        prefix, _, kind = column.rpartition(".")
+        if kind == "ti":
+            metrics[f"{prefix}.TiTv_ratio"] = _ratio(counts[column], counts.get(f"{prefix}.tv"))
+        elif kind == "het":
+            metrics[f"{prefix}.het_hom_ratio"] = _ratio(counts[column], counts.get(f"{prefix}.homalt"))
+    return metrics
+
+
+def _format(value) -> str:
+    if value is None:
+        return ""
+    return str(value)
+
+
+def merge_happy_table(
+    paths: list[Path],
+    out_path: Path,
+    ratios_from: Optional[dict[tuple, dict]] = None,
+) -> list[dict]:
+    """
+    Merge the same hap.py table (summary.csv or extended.csv) of every shard
+    into out_path, in key order. Derived columns are recomputed from the
+    merged counts; ratios whose inputs are not in the table are looked up in
+    ratios_from by (Type, Filter). Returns the merged rows: labels, counts
+    and metrics.
+    """
+    tables = [(path, *_read_table(path)) for path in paths]
+    columns = tables[0][1]
+    for path, shard_columns, _ in tables[1:]:
+        if shard_columns != columns:
+            raise ValueError(f"{path} does not have the columns of {tables[0][0]}")
+    key_columns = [column for column in columns if column in HAPPY_KEY_COLUMNS]
+
+    merged: dict[tuple, dict] = {}
+    for path, _, rows in tables:
+        for row in rows:
+            key = tuple(row[column] for column in key_columns)
+            entry = merged.setdefault(key, {"counts": {}, "regions": {}, "weighted": {}, "derived": set()})
+            for column in columns:
+                value = row[column]
+                if column in key_columns or value == "":
+                    continue
+                if column in HAPPY_REGION_COLUMNS and not HAPPY_REGION_COLUMNS[column]:
+                    size = _count(value, column, path)
+                    if entry["regions"].setdefault(column, size) != size:
+                        raise ValueError(
+                            f"{path}: {column} of {dict(zip(key_columns, key))} is {size}, "
+                            f"{entry['regions'][column]} in another shard"
+                        )
+                elif column in HAPPY_WEIGHTED_COLUMNS:
+                    weight = _count(row.get(HAPPY_WEIGHTED_COLUMNS[column]) or "0", column, path)
+                    totals = entry["weighted"].setdefault(column, [0.0, 0])
+                    totals[0] += float(value) * weight
+                    totals[1] += weight
+                elif _is_derived(column):
+                    entry["derived"].add(column)
+                else:
+                    entry["counts"][column] = entry["counts"].get(column, 0) + _count(value, column, path)
+
+    results = []
+    tmp_path = out_path.with_name(f".{out_path.name}.tmp")
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(columns)
+        for key, entry in sorted(merged.items()):
+            labels = dict(zip(key_columns, key))
+            metrics = happy_metrics(entry["counts"])
+            metrics.update(entry["regions"])
+            for column, (total, weight) in entry["weighted"].items():
+                metrics[column] = _ratio(total, weight)
+            lookup = (ratios_from or {}).get((labels.get("Type"), labels.get("Filter")), {})
+            out_row = []
+            for column in columns:
+                if column in key_columns:
+                    out_row.append(labels[column])
+                elif column in entry["counts"]:
+                    out_row.append(entry["counts"][column])
+                elif column in metrics:
+                    out_row.append(_format(metrics[column]))
+                elif column in entry["derived"]:
+                    # A shard reported it, so the merged row must have it too
+                    if column not in lookup:
+                        raise ValueError(f"{out_path.name}: cannot recompute {column} from the merged counts")
+                    out_row.append(_format(lookup[column]))
+                else:
+                    out_row.append("")
+            writer.writerow(out_row)
+            results.append({**labels, **entry["counts"], **metrics})
+    os.replace(tmp_path, out_path)
+    return results
+
+
+def merge_happy_outputs(shard_prefixes: list[Path], out_prefix: Path) -> Path:
+    """
+    Merge {prefix}.extended.csv and {prefix}.summary.csv of every shard into
+    {out_prefix}.extended.csv and {out_prefix}.summary.csv. Returns the
+    merged summary.csv.
+    """
+    out_prefix = Path(out_prefix)
+    ratios = {}
+    extended = [Path(f"{prefix}.extended.csv") for prefix in shard_prefixes]
+    if all(path.exists() for path in extended):
+        for row in merge_happy_table(extended, Path(f"{out_prefix}.extended.csv")):
+            # The whole-variant-type rows are the ones summary.csv reports
+            if all(row.get(column, "*") == "*" for column in ("Subtype", "Subset", "Genotype", "QQ")):
+                ratios[(row["Type"], row["Filter"])] = row
+    summary = Path(f"{out_prefix}.summary.csv")
+    merge_happy_table([Path(f"{prefix}.summary.csv") for prefix in shard_prefixes], summary, ratios_from=ratios)
+    logger.info(f"Merged hap.py outputs of {len(shard_prefixes)} shards into {summary}")
+    return summary
+
+
+def _add_counters(total, value, field: str, path: Path):
+    if total is None:
+        total = 0 if isinstance(value, int) else {} if isinstance(value, dict) else None
+    if isinstance(value, int) and not isinstance(value, bool) and isinstance(total, int):
+        return total + value
+    if isinstance(value, dict) and isinstance(total, dict):
+        for key, item in value.items():
+            total[key] = _add_counters(total.get(key), item, f"{field}.{key}", path)
+        return total
+    raise ValueError(f"{path}: cannot merge {field} ({value!r}), it is not a counter")
+
+
+def truvari_metrics(counts: dict) -> dict:
+    """
+    truvari bench's derived statistics from merged counters. Precision,
+    recall and GT concordance stay unset (None) when the base or comp side
+    has no calls, and F1 when precision + recall is 0, as truvari leaves them.
+    """
+    metrics = {field: None for field in TRUVARI_DERIVED_FIELDS}
+    tp_base, tp_comp = counts.get("TP-base", 0), counts.get("TP-comp", 0)
+    fp, fn = counts.get("FP", 0), counts.get("FN", 0)
+    if (tp_base or fn) and (tp_comp or fp):
+        metrics["precision"] = float(tp_comp) / (tp_comp + fp)
+        metrics["recall"] = float(tp_base) / (tp_base + fn)
+        gt_total = counts.get("TP-comp_TP-gt", 0) + counts.get("TP-comp_FP-gt", 0)
+        if gt_total:
+            metrics["gt_concordance"] = float(counts.get("TP-comp_TP-gt", 0)) / gt_total
+        denominator = metrics["recall"] + metrics["precision"]
+        if denominator:
+            metrics["f1"] = 2 * (metrics["recall"] * metrics["precision"] / denominator)
+    return metrics
+
+
+def merge_truvari_summaries(paths: list[Path], out_path: Path) -> dict:
+    """
+    Merge the summary.json of every truvari bench shard into out_path, in the
+    layout of the first one, so parsers.parse_truvari_summary reads it as a
+    whole-genome summary. Returns the merged summary.
+    """
+    summaries = []
+    for path in paths:
+        with open(path) as f:
+            summaries.append((path, json.load(f)))
+    counts: dict = {}
+    for path, summary in summaries:
+        for field, value in summary.items():
+            if field not in TRUVARI_DERIVED_FIELDS:
+                counts[field] = _add_counters(counts.get(field), value, field, path)
+    metrics = truvari_metrics(counts)
+    fields = list(summaries[0][1]) + [field for field in TRUVARI_DERIVED_FIELDS if field not in summaries[0][1]]
+    merged = {field: metrics[field] if field in metrics else counts[field] for field in fields}
+
+    tmp_path = out_path.with_name(f".{out_path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(merged, f, indent=4)
+    os.replace(tmp_path, out_path)
+    logger.info(f"Merged Truvari summaries of {len(paths)} shards into {out_path}")
+    return merged
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Merge the outputs of benchmark shards.")
+    parser.add_argument("tool", choices=["happy", "truvari"], help="tool whose shard outputs are merged")
+    parser.add_argument("out", type=Path, help="hap.py output prefix, or Truvari summary.json")
+    parser.add_argument("shards", type=Path, nargs="+", help="output prefix or summary.json of each shard")
+    args = parser.parse_args()
+    if args.tool == "truvari":
+        merge_truvari_summaries(args.shards, args.out)
+    else:
+        merge_happy_outputs(args.shards, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,32 @@
 from __future__ import annotations
 
+import io
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path, PurePosixPath
 from shutil import copyfileobj, rmtree
 import stat
+import tarfile
+import threading
+from typing import Callable
+import uuid
 import zipfile
 
 from api.app import settings
+from api.tasks import digests
 from api.tasks.utils import split_run_name
 
 
 PROJECT_ROOT = settings.PROJECT_ROOT
 TEMP_RUN_DIR = settings.UPLOAD_DIR
 LAB_RUN_DIR = settings.LAB_RUNS_DIR
+# Variant files are hashed while they are extracted so the pipeline's
+# checksum verification is a digest cache lookup.
+DIGEST_SUFFIXES = (".gvcf.gz", ".vcf.gz")
+# Tar bundles can be extracted while they are read, so uploads of them are
+# extracted as they arrive (see extract_tar_stream and GrowingFile).
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tar.zst")
+ARCHIVE_SUFFIXES = (".zip", *TAR_SUFFIXES)
 
 
 class UnsafeArchiveError(ValueError):
@@ -21,89 +35,325 @@ class UnsafeArchiveError(ValueError):
 
 def upload_run(zip_path: Path | None = None) -> tuple[str, str]:
     """
-    Extract a sequencing run archive and move the validated run files into
-    data/lab_runs/{sample}_{run}.
+    Extract the run files of a sequencing run archive (ZIP or tar bundle)
+    straight into data/lab_runs/{sample}_{run}.
     """
     TEMP_RUN_DIR.mkdir(parents=True, exist_ok=True)
     zip_path = zip_path or next(TEMP_RUN_DIR.glob("*.zip"), None)
     if zip_path is None:
         raise FileNotFoundError("No ZIP archive found for upload.")
 
-    staging_dir = TEMP_RUN_DIR / f"{zip_path.stem}.extract"
-    if staging_dir.exists():
-        rmtree(staging_dir)
-    staging_dir.mkdir(parents=True)
-
     try:
-        safe_extract_zip(zip_path, staging_dir)
-        run_dirs = [item for item in staging_dir.iterdir() if item.is_dir()]
+        if is_tar_bundle(zip_path.name):
+            with open(zip_path, "rb") as fileobj:
+                return extract_tar_stream(fileobj, zip_path.name)
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            members = check_zip_members(zip_ref)
+        run_dirs = {
+            PurePosixPath(member.filename).parts[0]
+            for member in members
+            if member.is_dir() or len(PurePosixPath(member.filename).parts) > 1
+        }
         if len(run_dirs) != 1:
             raise ValueError("Archive must contain exactly one top-level run directory.")
+        run_dir = run_dirs.pop()
+
+        sample, run = get_run_info(Path(run_dir))
+        dest_dir = LAB_RUN_DIR / f"{sample}_{run}"
 
-        sample, run = get_run_info(run_dirs[0])
-        move_lab_runs(sample, run, run_dirs[0])
+        def select(member_path: PurePosixPath) -> str | None:
+            # Only the files directly in the run directory are kept, and
+            # files already in the lab run directory are left as they are.
+            if len(member_path.parts) == 2 and member_path.parts[0] == run_dir:
+                if not (dest_dir / member_path.name).exists():
+                    return member_path.name
+            return None
+
+        file_digests = extract_members(zip_path, members, dest_dir, select)
+        for target, hexdigests in file_digests.items():
+            digests.store(target, hexdigests)
         return sample, run
     finally:
-        delete_temp_dir(staging_dir)
         if zip_path.exists():
             zip_path.unlink()
 
 
-def safe_extract_zip(zip_path: Path, dest_dir: Path) -> None:
+def check_zip_members(zip_ref: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    """Validate every member of an archive (paths, symlinks, count and size limits)."""
     extracted_bytes = 0
-    with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        members = zip_ref.infolist()
-        if len(members) > settings.MAX_ZIP_MEMBERS:
-            raise UnsafeArchiveError("Archive contains too many files.")
+    members = zip_ref.infolist()
+    if len(members) > settings.MAX_ZIP_MEMBERS:
+        raise UnsafeArchiveError("Archive contains too many files.")
 
-        for member in members:
-            member_path = PurePosixPath(member.filename)
-            if not member.filename or "\\" in member.filename:
-                raise UnsafeArchiveError(f"Unsafe archive path: {member.filename}")
-            if member_path.is_absolute() or ".." in member_path.parts:
-                raise UnsafeArchiveError(f"Unsafe archive path: {member.filename}")
+    for member in members:
+        _check_member_name(member.filename)
 
-            mode = member.external_attr >> 16
-            if stat.S_ISLNK(mode):
-                raise UnsafeArchiveError(f"Symlinks are not allowed in uploads: {member.filename}")
+        mode = member.external_attr >> 16
+        if stat.S_ISLNK(mode):
+            raise UnsafeArchiveError(f"Symlinks are not allowed in uploads: {member.filename}")
 
-            extracted_bytes += member.file_size
-            if extracted_bytes > settings.MAX_EXTRACTED_BYTES:
-                raise UnsafeArchiveError("Archive extracted size exceeds configured limit.")
+        extracted_bytes += member.file_size
+        if extracted_bytes > settings.MAX_EXTRACTED_BYTES:
+            raise UnsafeArchiveError("Archive extracted size exceeds configured limit.")
+    return members
 
-        dest_root = dest_dir.resolve()
-        for member in members:
-            target_path = (dest_dir / member.filename).resolve()
-            if target_path != dest_root and not str(target_path).startswith(f"{dest_root}{os.sep}"):
-                raise UnsafeArchiveError(f"Unsafe archive path: {member.filename}")
 
-            if member.is_dir():
-                target_path.mkdir(parents=True, exist_ok=True)
-                continue
+def _check_member_name(name: str) -> PurePosixPath:
+    member_path = PurePosixPath(name)
+    if not name or "\\" in name:
+        raise UnsafeArchiveError(f"Unsafe archive path: {name}")
+    if member_path.is_absolute() or ".." in member_path.parts:
+        raise UnsafeArchiveError(f"Unsafe archive path: {name}")
+    return member_path
 
-            target_path.parent.mkdir(parents=True, exist_ok=True)
-            with zip_ref.open(member) as source, open(target_path, "wb") as target:
-                copyfileobj(source, target, length=1024 * 1024)
 
+def _is_within(path: Path, root: Path) -> bool:
+    return path == root or str(path).startswith(f"{root}{os.sep}")
 
-def get_run_info(item: Path) -> tuple[str, str]:
+
+def safe_extract_zip(zip_path: Path, dest_dir: Path) -> dict[Path, dict[str, str]]:
     """
-    Extract sample and run information from a top-level directory.
-    Expected format: sample_run_part1_part2, with sample in the first segment.
+    Extract a ZIP archive after validating every member.
+    Returns the digests of extracted variant files, keyed by resolved path.
     """
-    return split_run_name(item.name)
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        members = check_zip_members(zip_ref)
+    return extract_members(zip_path, members, dest_dir)
 
 
-def move_lab_runs(sample: str, run: str, src_dir: Path) -> None:
-    dest_dir = LAB_RUN_DIR / f"{sample}_{run}"
+def extract_members(
+    zip_path: Path,
+    members: list[zipfile.ZipInfo],
+    dest_dir: Path,
+    select: Callable[[PurePosixPath], str | None] | None = None,
+    workers: int | None = None,
+) -> dict[Path, dict[str, str]]:
+    """
+    Extract validated members into dest_dir, select(member_path) giving each
+    one's path there (None skips it; by default the archive layout is kept).
+
+    Members are decompressed in parallel over EXTRACT_WORKERS threads (zlib
+    releases the GIL), each into a temporary name next to its target. Only
+    once all of them are complete are they renamed into place, so a failed
+    extraction leaves no partial run files behind. Returns the digests of
+    variant files, keyed by resolved path.
+    """
+    created = not dest_dir.exists()
     dest_dir.mkdir(parents=True, exist_ok=True)
-    for item in src_dir.iterdir():
-        if item.is_dir():
+    dest_root = dest_dir.resolve()
+    plan = []
+    for member in members:
+        name = member.filename if select is None else select(PurePosixPath(member.filename))
+        if name is None:
             continue
-        target_path = dest_dir / item.name
-        if target_path.exists():
+        target_path = (dest_dir / name).resolve()
+        if not _is_within(target_path, dest_root):
+            raise UnsafeArchiveError(f"Unsafe archive path: {member.filename}")
+
+        if member.is_dir():
+            target_path.mkdir(parents=True, exist_ok=True)
             continue
-        item.rename(target_path)
+        tmp_path = target_path.with_name(f".{target_path.name}.{uuid.uuid4().hex}.part")
+        plan.append((member, target_path, tmp_path))
+
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def extract(member: zipfile.ZipInfo, tmp_path: Path, hashed: bool) -> dict[str, str] | None:
+        # ZipFile objects share one file position; each thread reads through its own.
+        zip_ref = getattr(local, "zip_ref", None)
+        if zip_ref is None:
+            zip_ref = local.zip_ref = zipfile.ZipFile(zip_path, "r")
+            with handles_lock:
+                handles.append(zip_ref)
+        tmp_path.parent.mkdir(parents=True, exist_ok=True)
+        with zip_ref.open(member) as source, open(tmp_path, "wb") as target:
+            if hashed:
+                writer = digests.HashingWriter(target)
+                copyfileobj(source, writer, length=1024 * 1024)
+                return writer.hexdigests()
+            copyfileobj(source, target, length=1024 * 1024)
+        return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(workers or settings.EXTRACT_WORKERS, 1)) as pool:
+            futures = [
+                pool.submit(extract, member, tmp_path, target_path.name.endswith(DIGEST_SUFFIXES))
+                for member, target_path, tmp_path in plan
+            ]
+            try:
+                results = [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        file_digests = {}
+        for (_member, target_path, tmp_path), hexdigests in zip(plan, results):
+            os.replace(tmp_path, target_path)
+            if hexdigests is not None:
+                file_digests[target_path] = hexdigests
+        return file_digests
+    except BaseException:
+        for _member, _target, tmp_path in plan:
+            tmp_path.unlink(missing_ok=True)
+        if created:
+            rmtree(dest_dir, ignore_errors=True)
+        raise
+    finally:
+        for zip_ref in handles:
+            zip_ref.close()
+
+
+def open_tar_stream(fileobj, filename: str) -> tarfile.TarFile:
+    """Open a tar bundle for one forward pass (no seeking), decompressing by suffix."""
+    if filename.lower().endswith(".tar.zst"):
+        try:
+            import zstandard
+        except ImportError as e:
+            raise RuntimeError(".tar.zst bundles need zstandard: pip install zstandard") from e
+        return tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(fileobj), mode="r|")
+    if filename.lower().endswith(".tar.gz"):
+        return tarfile.open(fileobj=fileobj, mode="r|gz")
+    return tarfile.open(fileobj=fileobj, mode="r|")
+
+
+def extract_tar_stream(fileobj, filename: str) -> tuple[str, str]:
+    """
+    Extract a tar bundle member by member as it is read, with the checks of
+    check_zip_members applied to each header as it arrives. Links and special
+    files are refused. The first top-level directory names the run; its files
+    go to temporary names in data/lab_runs/{sample}_{run} and are renamed into
+    place once the bundle ends cleanly.
+    """
+    member_count = 0
+    extracted_bytes = 0
+    run_dir: str | None = None
+    dest_dir: Path | None = None
+    created = False
+    pending: list[tuple[Path, Path, dict[str, str] | None]] = []
+    try:
+        with open_tar_stream(fileobj, filename) as tar:
+            for member in tar:
+                member_count += 1
+                if member_count > settings.MAX_ZIP_MEMBERS:
+                    raise UnsafeArchiveError("Archive contains too many files.")
+                member_path = _check_member_name(member.name)
+                if member.issym() or member.islnk():
+                    raise UnsafeArchiveError(f"Links are not allowed in uploads: {member.name}")
+                if not (member.isfile() or member.isdir()):
+                    raise UnsafeArchiveError(f"Unsupported archive member: {member.name}")
+                extracted_bytes += member.size
+                if extracted_bytes > settings.MAX_EXTRACTED_BYTES:
+                    raise UnsafeArchiveError("Archive extracted size exceeds configured limit.")
+
+                parts = member_path.parts
+                if not parts or (member.isfile() and len(parts) == 1):
+                    continue
+                if run_dir is None:
+                    run_dir = parts[0]
+                    sample, run = get_run_info(Path(run_dir))
+                    dest_dir = LAB_RUN_DIR / f"{sample}_{run}"
+                    created = not dest_dir.exists()
+                    dest_dir.mkdir(parents=True, exist_ok=True)
+                elif parts[0] != run_dir:
+                    raise ValueError("Archive must contain exactly one top-level run directory.")
+
+                # As for ZIPs: only files directly in the run directory, existing files kept
+                if not member.isfile() or len(parts) != 2 or (dest_dir / parts[1]).exists():
+                    continue
+                target_path = (dest_dir / parts[1]).resolve()
+                if not _is_within(target_path, dest_dir.resolve()):
+                    raise UnsafeArchiveError(f"Unsafe archive path: {member.name}")
+                tmp_path = target_path.with_name(f".{target_path.name}.{uuid.uuid4().hex}.part")
+                pending.append((target_path, tmp_path, None))
+                with tar.extractfile(member) as source, open(tmp_path, "wb") as target:
+                    if target_path.name.endswith(DIGEST_SUFFIXES):
+                        writer = digests.HashingWriter(target)
+                        copyfileobj(source, writer, length=1024 * 1024)
+                        pending[-1] = (target_path, tmp_path, writer.hexdigests())
+                    else:
+                        copyfileobj(source, target, length=1024 * 1024)
+
+        if run_dir is None:
+            raise ValueError("Archive must contain exactly one top-level run directory.")
+        for target_path, tmp_path, _hexdigests in pending:
+            os.replace(tmp_path, target_path)
+    except BaseException:
+        for _target, tmp_path, _hexdigests in pending:
+            tmp_path.unlink(missing_ok=True)
+        if created:
+            rmtree(dest_dir, ignore_errors=True)
+        raise
+
+    for target_path, _tmp_path, hexdigests in pending:
+        if hexdigests is not None:
+            digests.store(target_path, hexdigests)
+    return sample, run
+
+
+class GrowingFile(io.RawIOBase):
+    """
+    Read side of a file that is still being written (an upload in progress).
+    The writer reports flushed sizes with advance(); reads wait for more
+    bytes until finish(), or fail after abort().
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+        self._position = 0
+        self._size = 0
+        self._finished = False
+        self._aborted = False
+        self._condition = threading.Condition()
+
+    def readable(self) -> bool:
+        return True
+
+    def advance(self, size: int) -> None:
+        with self._condition:
+            self._size = max(self._size, size)
+            self._condition.notify_all()
+
+    def finish(self) -> None:
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def abort(self) -> None:
+        with self._condition:
+            self._aborted = True
+            self._condition.notify_all()
+
+    def readinto(self, buffer) -> int:
+        with self._condition:
+            while self._position >= self._size and not self._finished and not self._aborted:
+                self._condition.wait()
+            if self._aborted:
+                raise IOError("Upload aborted before the archive was complete")
+            count = min(len(buffer), self._size - self._position)
+        if count <= 0:
+            return 0
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        read = self._file.readinto(memoryview(buffer)[:count])
+        self._position += read
+        return read
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+def get_run_info(item: Path) -> tuple[str, str]:
+    """
+    Extract sample and run information from a top-level directory.
+    Expected format: sample_run_part1_part2, with sample in the first segment.
+    """
+    return split_run_name(item.name)
 
 
 def delete_temp_dir(temp_dir: Path) -> None:
@@ -113,21 +363,38 @@ def delete_temp_dir(temp_dir: Path) -> None:
 
 def sanitize_upload_filename(filename: str) -> str:
     name = Path(filename or "").name
-    if not name or name != filename or not name.lower().endswith(".zip"):
-        raise ValueError("Expected a local .zip filename without path components.")
+    if not name or name != filename or not name.lower().endswith(ARCHIVE_SUFFIXES):
+        raise ValueError("Expected a local .zip, .tar, .tar.gz or .tar.zst filename without path components.")
     return name
 
 
+def is_tar_bundle(filename: str) -> bool:
+    return filename.lower().endswith(TAR_SUFFIXES)
+
+
+def archive_stem(filename: str) -> str:
+    """File name without its archive suffix (run.tar.zst -> run)."""
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if filename.lower().endswith(suffix):
+            return filename[:-len(suffix)]
+    return Path(filename).stem
+
+
+def _upload_path_taken(path: Path) -> bool:
+    # A chunked upload in progress holds its name through its .part file
+    return path.exists() or path.with_name(f"{path.name}.part").exists()
+
+
 def unique_upload_path(filename: str) -> Path:
     TEMP_RUN_DIR.mkdir(parents=True, exist_ok=True)
     safe_name = sanitize_upload_filename(filename)
     candidate = TEMP_RUN_DIR / safe_name
-    if not candidate.exists():
+    if not _upload_path_taken(candidate):
         return candidate
-    stem = candidate.stem
-    suffix = candidate.suffix
+    stem = archive_stem(safe_name)
+    suffix = safe_name[len(stem):]
     for index in range(1, 10_000):
         candidate = TEMP_RUN_DIR / f"{stem}-{index}{suffix}"
-        if not candidate.exists():
+        if not _upload_path_taken(candidate):
             return candidate
     raise FileExistsError("Could not allocate a unique upload filename.")
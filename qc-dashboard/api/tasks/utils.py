@@ -1,6 +1,8 @@
+import fcntl
 import hashlib
 import re
 import csv
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 import subprocess
@@ -29,10 +31,38 @@ def get_run_id(run_name) -> int:
     finally:
         db.close()
 
+@contextmanager
+def file_lock(lock_path):
+    """
+    Hold an exclusive flock on lock_path (created if missing). Works across
+    threads and worker processes on the same host.
+    """
+    lock_path = Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def file_digest(path, algorithm="sha256") -> str:
+    """
+    Compute the hex digest of a file, streaming it in 8 MB chunks.
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def checksum(sample, run):
     """
     Verify the MD5 checksum of the gvcf file for a given reference and run.
+    The digest comes from the digest cache when the file was already hashed
+    (e.g. while it was extracted or downloaded).
     """
+    from api.tasks import digests
     run_path = LAB_RUN_DIR / f"{sample}_{run}"
     gvcf_files = list(run_path.glob("*.gvcf.gz"))
     if not gvcf_files:
@@ -52,11 +82,7 @@ def checksum(sample, run):
     with open(md5_path, 'r') as f:
         expected_md5 = f.read().strip().split()[0]
 
-    digest = hashlib.md5()
-    with open(gvcf_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
-            digest.update(chunk)
-    file_md5 = digest.hexdigest()
+    file_md5 = digests.digest(gvcf_path, "md5")
     if file_md5 != expected_md5:
         raise ValueError(f"MD5 checksum mismatch for {gvcf_path.name}. Expected: {expected_md5}, Got: {file_md5}")
 
@@ -0,0 +1,295 @@
+"""
+Worker pool that executes queued pipeline jobs outside the API process.
+
+Jobs are rows of the transfer_jobs table created with status QUEUED by the
+API (see job_service.enqueue_job). Each worker process claims one job at a
+time with SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers (on
+one or several hosts) can share the same queue.
+
+A claimed job is leased: its worker heartbeats it while it runs, and the
+workers' periodic maintenance requeues RUNNING jobs whose heartbeat stopped
+(worker OOM-killed, host restarted), so no job stays RUNNING forever.
+
+Usage (from the qc-dashboard directory):
+    python -m api.tasks.worker --concurrency 4
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+from api.app import crud, job_service, models, schemas, settings
+from api.app.database import SessionLocal
+from api.tasks import chunked_upload, digests, run_catalog
+from api.tasks.process_run import run_pipeline
+from api.tasks.upload_run import upload_run
+from api.tasks.utils import split_run_name
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WORKER_JOB_TYPES = [
+    models.TransferJobType.PIPELINE,
+    models.TransferJobType.UPLOAD_ZIP,
+]
+
+
+def pipeline_options(metadata: dict) -> dict:
+    """Translate job metadata (comma-separated benchmarking string, force) into run_pipeline flags."""
+    benchmarking = metadata.get("benchmarking") or ""
+    return {
+        "happy": "happy" in benchmarking,
+        "stratified": "stratified" in benchmarking,
+        "truvari": "truvari" in benchmarking,
+        "csv_reformat": "csv" in benchmarking,
+        "force": bool(metadata.get("force")),
+    }
+
+
+def _get_or_create_lab_run(db: Session, run_name: str, lab_run_id: int | None = None) -> models.LabRun:
+    lab_run = crud.get_lab_run(db, lab_run_id) if lab_run_id else None
+    if lab_run is None:
+        lab_run = crud.get_lab_run_by_name(db, run_name)
+    if lab_run is None:
+        lab_run = crud.create_lab_run(
+            db,
+            schemas.LabRunCreate(run_name=run_name, status=models.RunStatus.PENDING_PROCESSING),
+        )
+    return lab_run
+
+
+def run_pipeline_job(db: Session, job: models.TransferJob) -> None:
+    """Benchmark an already extracted run (job.subject_id is the run name)."""
+    metadata = job.metadata_json or {}
+    sample, run = split_run_name(job.subject_id)
+    lab_run = _get_or_create_lab_run(db, job.subject_id, metadata.get("lab_run_id"))
+    crud.update_lab_run_status(db, lab_run.id, models.RunStatus.PROCESSING)
+    job_service.mark_phase(db, job.id, models.TransferJobPhase.PROCESS, f"Starting benchmarking for {job.subject_id}")
+    run_pipeline(sample, run, **pipeline_options(metadata))
+    crud.update_lab_run_status(db, lab_run.id, models.RunStatus.AWAITING_APPROVAL)
+    job_service.complete_job(db, job.id, "Benchmarking completed successfully")
+
+
+def run_upload_job(db: Session, job: models.TransferJob) -> None:
+    """
+    Extract an uploaded ZIP archive, then benchmark the extracted run. A job
+    requeued after its archive was extracted (and removed) only benchmarks.
+    """
+    metadata = job.metadata_json or {}
+    zip_path = Path(job.destination_path or "")
+    lab_run = _get_or_create_lab_run(db, job.subject_id, metadata.get("lab_run_id"))
+    if metadata.get("extracted_run") and not zip_path.is_file():
+        sample, run = split_run_name(metadata["extracted_run"])
+        crud.update_lab_run_status(db, lab_run.id, models.RunStatus.PROCESSING)
+    else:
+        if not zip_path.is_file():
+            raise FileNotFoundError(f"Uploaded archive not found: {zip_path}")
+        job_service.mark_phase(db, job.id, models.TransferJobPhase.EXTRACT, "Extracting uploaded archive")
+        crud.update_lab_run_status(db, lab_run.id, models.RunStatus.PROCESSING)
+        sample, run = upload_run(zip_path)
+        crud.update_lab_run_name(db, lab_run.id, f"{sample}_{run}")
+        crud.update_transfer_job(db, job.id, metadata_json={**metadata, "extracted_run": f"{sample}_{run}"})
+        run_catalog.refresh_run(f"{sample}_{run}")
+
+    job_service.mark_phase(db, job.id, models.TransferJobPhase.PROCESS, "Starting benchmarking pipeline")
+    run_pipeline(sample, run, **pipeline_options(metadata))
+    crud.update_lab_run_status(db, lab_run.id, models.RunStatus.AWAITING_APPROVAL)
+    job_service.complete_job(db, job.id, "Upload processing completed")
+
+
+JOB_HANDLERS = {
+    models.TransferJobType.PIPELINE: (run_pipeline_job, "pipeline_failed"),
+    models.TransferJobType.UPLOAD_ZIP: (run_upload_job, "upload_processing_failed"),
+}
+
+
+def _set_lab_run_status(db: Session, job: models.TransferJob, status: models.RunStatus, error_message=None) -> None:
+    metadata = job.metadata_json or {}
+    lab_run_id = metadata.get("lab_run_id")
+    try:
+        lab_run = crud.get_lab_run(db, lab_run_id) if lab_run_id else None
+        if lab_run is None:
+            lab_run = crud.get_lab_run_by_name(db, metadata.get("extracted_run") or job.subject_id)
+        if lab_run:
+            crud.update_lab_run_status(db, lab_run.id, status, error_message=error_message)
+    except Exception:
+        db.rollback()
+
+
+def _fail(db: Session, job: models.TransferJob, error: Exception, error_code: str) -> None:
+    db.rollback()
+    _set_lab_run_status(db, job, models.RunStatus.FAILED, error_message=str(error))
+    try:
+        job_service.fail_job(db, job.id, str(error), error_code=error_code)
+    except Exception:
+        db.rollback()
+
+
+def _heartbeat(job_id: str, worker_id: str, stop_event: threading.Event, session_factory) -> None:
+    """Extend the job's lease every JOB_HEARTBEAT_SECONDS until stop_event is set."""
+    while not stop_event.wait(settings.JOB_HEARTBEAT_SECONDS):
+        db = session_factory()
+        try:
+            if not job_service.heartbeat(db, job_id, worker_id):
+                logger.warning(f"[{worker_id}] Job {job_id} was recovered by another worker")
+                return
+        except Exception:
+            logger.exception(f"[{worker_id}] Could not heartbeat job {job_id}")
+        finally:
+            db.close()
+
+
+def run_next_job(worker_id: str, session_factory=SessionLocal) -> bool:
+    """Claim and execute a single queued job. Returns False when the queue is empty."""
+    db = session_factory()
+    try:
+        job = job_service.claim_job(db, WORKER_JOB_TYPES, worker_id=worker_id)
+        if job is None:
+            return False
+        handler, error_code = JOB_HANDLERS[job.type]
+        logger.info(f"[{worker_id}] Running {job.type.value} job {job.id} for {job.subject_id}")
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(job.id, worker_id, stop_heartbeat, session_factory), daemon=True
+        )
+        heartbeat.start()
+        try:
+            handler(db, job)
+        except Exception as e:
+            logger.exception(f"[{worker_id}] Job {job.id} failed")
+            _fail(db, job, e, error_code)
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+        return True
+    finally:
+        db.close()
+
+
+def recover_expired_jobs(worker_id: str, db: Session) -> None:
+    """Requeue (or fail) the jobs of workers that stopped heartbeating, and reset their lab runs."""
+    requeued, failed = job_service.recover_expired_jobs(db, WORKER_JOB_TYPES)
+    for job in requeued:
+        logger.warning(f"[{worker_id}] Requeued job {job.id} ({job.subject_id}): its worker stopped responding")
+        _set_lab_run_status(db, job, models.RunStatus.PENDING_PROCESSING)
+    for job in failed:
+        logger.error(f"[{worker_id}] Failed job {job.id} ({job.subject_id}): {job.error_message}")
+        _set_lab_run_status(db, job, models.RunStatus.FAILED, error_message=job.error_message)
+
+
+def run_maintenance(worker_id: str, session_factory=SessionLocal) -> None:
+    """
+    Housekeeping shared by the workers: recover the jobs of dead workers,
+    expire upload sessions left idle and drop the digests of deleted files.
+    """
+    db = session_factory()
+    try:
+        try:
+            recover_expired_jobs(worker_id, db)
+        except Exception:
+            db.rollback()
+            logger.exception(f"[{worker_id}] Could not recover expired jobs")
+        try:
+            chunked_upload.expire_sessions(db)
+        except Exception:
+            db.rollback()
+            logger.exception(f"[{worker_id}] Could not expire upload sessions")
+    finally:
+        db.close()
+    try:
+        pruned = digests.prune()
+        if pruned:
+            logger.info(f"[{worker_id}] Dropped {pruned} digest cache entries of deleted files")
+    except OSError:
+        logger.exception(f"[{worker_id}] Could not prune the digest cache")
+
+
+def worker_loop(
+    worker_id: str,
+    poll_seconds: float = settings.WORKER_POLL_SECONDS,
+    stop_event: threading.Event | None = None,
+    once: bool = False,
+) -> None:
+    """
+    Process jobs until stopped; sleeps poll_seconds whenever the queue is
+    empty. Runs run_maintenance at start and every WORKER_MAINTENANCE_SECONDS.
+    """
+    stop_event = stop_event or threading.Event()
+    next_maintenance = 0.0
+    while not stop_event.is_set():
+        if time.monotonic() >= next_maintenance:
+            run_maintenance(worker_id)
+            next_maintenance = time.monotonic() + settings.WORKER_MAINTENANCE_SECONDS
+        try:
+            processed = run_next_job(worker_id)
+        except Exception:
+            logger.exception(f"[{worker_id}] Could not claim a job")
+            processed = False
+        if once and not processed:
+            return
+        if not processed:
+            stop_event.wait(poll_seconds)
+
+
+def _worker_process(worker_id: str, poll_seconds: float) -> None:
+    stop_event = threading.Event()
+    # Finish the current job on SIGTERM/SIGINT instead of dying mid-pipeline.
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    logger.info(f"[{worker_id}] Worker started")
+    worker_loop(worker_id, poll_seconds, stop_event)
+    logger.info(f"[{worker_id}] Worker stopped")
+
+
+def run_pool(concurrency: int, poll_seconds: float) -> None:
+    """Start concurrency worker processes and wait for them to exit."""
+    # spawn gives each worker its own SQLAlchemy engine and connection pool.
+    context = multiprocessing.get_context("spawn")
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    processes = [
+        context.Process(target=_worker_process, args=(f"{prefix}-{index}", poll_seconds), daemon=False)
+        for index in range(max(concurrency, 1))
+    ]
+    for process in processes:
+        process.start()
+
+    def _stop(*_):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    for process in processes:
+        process.join()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Run VCBench pipeline workers.")
+    parser.add_argument('--concurrency', type=int, default=settings.PIPELINE_WORKERS,
+                        help='Number of worker processes (default: VCBENCH_PIPELINE_WORKERS)')
+    parser.add_argument('--poll-interval', type=float, default=settings.WORKER_POLL_SECONDS,
+                        help='Seconds to wait between polls when the queue is empty')
+    parser.add_argument('--once', action='store_true',
+                        help='Drain the queue in this process, then exit')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.once:
+        worker_loop(f"{socket.gethostname()}-{os.getpid()}", args.poll_interval, once=True)
+        return
+    run_pool(args.concurrency, args.poll_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
-from dash import dcc, html, callback, Input, Output
+from dash import dcc, html, callback, ctx, Input, Output, State
 import requests
 
 from ..config import API_BASE_URL
 
+RUNS_PAGE_SIZE = 10
 
 NAV_ACTIONS = [
     {
@@ -125,6 +126,17 @@ def create_index_layout():
                                 className="runs-panel-head",
                             ),
                             html.Div(id="runs-table"),
+                            html.Div(
+                                [
+                                    html.Button("← Newer", id="runs-prev", className="btn btn-ghost", disabled=True),
+                                    html.Span(id="runs-page-label", className="runs-page-label"),
+                                    html.Button("Older →", id="runs-next", className="btn btn-ghost", disabled=True),
+                                ],
+                                className="runs-pager",
+                            ),
+                            # Cursor of each page visited so far; page 0 has none.
+                            dcc.Store(id="runs-cursors", data=[None]),
+                            dcc.Store(id="runs-page", data=0),
                         ],
                         className="runs-panel",
                     ),
@@ -160,29 +172,51 @@ def _format_run_row(run):
 
 @callback(
     Output("runs-table", "children"),
-    Input("runs-table", "id"),
+    Output("runs-cursors", "data"),
+    Output("runs-page", "data"),
+    Output("runs-prev", "disabled"),
+    Output("runs-next", "disabled"),
+    Output("runs-page-label", "children"),
+    Input("runs-prev", "n_clicks"),
+    Input("runs-next", "n_clicks"),
+    State("runs-cursors", "data"),
+    State("runs-page", "data"),
 )
-def load_runs_table(_):
-    """Load runs list. Errors render as inline state, never as raw exception text."""
+def load_runs_table(_prev, _next, cursors, page):
+    """
+    Load one page of runs. The API pages by cursor (X-Next-Cursor), so the
+    cursors of visited pages are kept to step back. Errors render as inline
+    state, never as raw exception text.
+    """
+    cursors = cursors or [None]
+    page = page or 0
+    if ctx.triggered_id == "runs-next" and page + 1 < len(cursors):
+        page += 1
+    elif ctx.triggered_id == "runs-prev" and page > 0:
+        page -= 1
+
+    params = {"limit": RUNS_PAGE_SIZE}
+    if cursors[page]:
+        params["cursor"] = cursors[page]
     try:
-        response = requests.get(f"{API_BASE_URL}/runs", timeout=4)
+        response = requests.get(f"{API_BASE_URL}/runs", params=params, timeout=4)
         response.raise_for_status()
         runs = response.json()
     except requests.exceptions.RequestException:
-        return html.Div(
-            "Couldn't reach the API. Check that the FastAPI server is running.",
-            className="error-state",
+        return (
+            html.Div("Couldn't reach the API. Check that the FastAPI server is running.", className="error-state"),
+            [None], 0, True, True, "",
         )
     except ValueError:
-        return html.Div(
-            "Invalid response from API.",
-            className="error-state",
-        )
+        return html.Div("Invalid response from API.", className="error-state"), [None], 0, True, True, ""
 
+    next_cursor = response.headers.get("X-Next-Cursor")
+    cursors = cursors[: page + 1] + ([next_cursor] if next_cursor else [])
     if not runs:
-        return html.Div(
-            "No runs yet. Upload your first DRAGEN run from the Pipeline page.",
-            className="empty-state",
+        return (
+            html.Div("No runs yet. Upload your first DRAGEN run from the Pipeline page.", className="empty-state"),
+            cursors, page, True, True, "",
         )
 
-    return [_format_run_row(run) for run in runs]
+    label = f"Page {page + 1}" if page or next_cursor else ""
+    return [_format_run_row(run) for run in runs], cursors, page, page == 0, not next_cursor, label
@@ -1,8 +1,13 @@
-from dash import dcc, html, callback, Input, Output
+from dash import dcc, html, callback, clientside_callback, ctx, no_update, Input, Output, State
 import requests
 
 from ..config import API_BASE_URL
 
+# Server-sent events of job changes (api/app/job_feed.py), opened by the browser
+JOB_FEED_PATH = "/api/v1/jobs/feed"
+JOB_LIST_LIMIT = 100
+JOB_LOG_LINES = 80
+
 
 JOB_TYPES = [
     {"label": "All types", "value": ""},
@@ -71,7 +76,12 @@ def create_monitoring_layout():
                                     ),
                                 ]
                             ),
-                            dcc.Interval(id="monitoring-refresh", interval=3000, n_intervals=0),
+                            html.Span(id="monitoring-feed-status", className="monitoring-feed-status"),
+                            dcc.Store(id="monitoring-feed-url", data=JOB_FEED_PATH),
+                            # Batches of feed deltas, written by the EventSource below
+                            dcc.Store(id="monitoring-feed"),
+                            dcc.Store(id="monitoring-jobs", data=[]),
+                            dcc.Store(id="monitoring-job-state"),
                         ],
                         className="monitoring-head",
                     ),
@@ -127,17 +137,75 @@ def create_monitoring_layout():
     )
 
 
+# One EventSource per tab. Deltas are batched for a second before they are
+# handed to Dash, and the stream is closed once the page is left.
+clientside_callback(
+    """
+    function (url) {
+        if (window.vcbenchJobFeed) {
+            return window.dash_clientside.no_update;
+        }
+        var batch = {deltas: [], summary: null, seq: 0, timer: null};
+        var source = new EventSource(url);
+        window.vcbenchJobFeed = source;
+        function flush() {
+            batch.timer = null;
+            if (!document.getElementById("monitoring-feed")) {
+                source.close();
+                window.vcbenchJobFeed = null;
+                return;
+            }
+            batch.seq += 1;
+            window.dash_clientside.set_props("monitoring-feed", {
+                data: {seq: batch.seq, deltas: batch.deltas, summary: batch.summary}
+            });
+            batch.deltas = [];
+            batch.summary = null;
+        }
+        function schedule() {
+            if (!batch.timer) {
+                batch.timer = setTimeout(flush, 1000);
+            }
+        }
+        function status(text) {
+            if (document.getElementById("monitoring-feed-status")) {
+                window.dash_clientside.set_props("monitoring-feed-status", {children: text});
+            }
+        }
+        source.addEventListener("job", function (e) {
+            batch.deltas.push(JSON.parse(e.data));
+            schedule();
+        });
+        source.addEventListener("summary", function (e) {
+            batch.summary = JSON.parse(e.data);
+            schedule();
+        });
+        source.onopen = function () { status("Live"); };
+        source.onerror = function () { status("Reconnecting…"); };
+        return "Connecting…";
+    }
+    """,
+    Output("monitoring-feed-status", "children"),
+    Input("monitoring-feed-url", "data"),
+)
+
+
 @callback(
     Output("monitoring-summary", "children"),
-    Input("monitoring-refresh", "n_intervals"),
+    Input("monitoring-feed", "data"),
 )
-def load_monitoring_summary(_):
-    try:
-        response = requests.get(f"{API_BASE_URL}/jobs/summary", timeout=4)
-        response.raise_for_status()
-        summary = response.json()
-    except requests.exceptions.RequestException:
-        return html.Div("Monitoring API is unavailable.", className="error-state")
+def load_monitoring_summary(feed):
+    if feed:
+        if not feed.get("summary"):
+            return no_update
+        summary = feed["summary"]
+    else:
+        try:
+            response = requests.get(f"{API_BASE_URL}/jobs/summary", timeout=4)
+            response.raise_for_status()
+            summary = response.json()
+        except requests.exceptions.RequestException:
+            return html.Div("Monitoring API is unavailable.", className="error-state")
 
     return [
         _summary_card("Active", summary.get("active_jobs", 0), "running jobs", "running"),
@@ -150,27 +218,42 @@ def load_monitoring_summary(_):
 
 @callback(
     [Output("monitoring-job-table", "children"),
-     Output("monitoring-job-select", "options")],
-    [Input("monitoring-refresh", "n_intervals"),
+     Output("monitoring-job-select", "options"),
+     Output("monitoring-jobs", "data")],
+    [Input("monitoring-feed", "data"),
      Input("monitoring-type-filter", "value"),
      Input("monitoring-status-filter", "value")],
+    State("monitoring-jobs", "data"),
 )
-def load_monitoring_jobs(_, job_type, status):
-    params = {}
-    if job_type:
-        params["type"] = job_type
-    if status:
-        params["status"] = status
-
-    try:
-        response = requests.get(f"{API_BASE_URL}/jobs", params=params, timeout=4)
-        response.raise_for_status()
-        jobs = response.json()
-    except requests.exceptions.RequestException:
-        return html.Div("Could not load transfer jobs.", className="error-state"), []
+def load_monitoring_jobs(feed, job_type, status, jobs):
+    if ctx.triggered_id == "monitoring-feed" and feed:
+        # Merge the jobs of the feed deltas into the listed jobs, no API call
+        changed = {delta["job"]["id"]: delta["job"] for delta in feed.get("deltas", []) if delta.get("job")}
+        if not changed:
+            return no_update, no_update, no_update
+        jobs = [job for job in jobs or [] if job["id"] not in changed]
+        jobs += [
+            job for job in changed.values()
+            if (not job_type or job["type"] == job_type) and (not status or job["status"] == status)
+        ]
+        jobs.sort(key=lambda job: (job.get("updated_at") or "", job.get("started_at") or ""), reverse=True)
+        jobs = jobs[:JOB_LIST_LIMIT]
+    else:
+        params = {"limit": JOB_LIST_LIMIT}
+        if job_type:
+            params["type"] = job_type
+        if status:
+            params["status"] = status
+
+        try:
+            response = requests.get(f"{API_BASE_URL}/jobs", params=params, timeout=4)
+            response.raise_for_status()
+            jobs = response.json()
+        except requests.exceptions.RequestException:
+            return html.Div("Could not load transfer jobs.", className="error-state"), [], []
 
     if not jobs:
-        return html.Div("No transfer jobs match these filters.", className="empty-state"), []
+        return html.Div("No transfer jobs match these filters.", className="empty-state"), [], []
 
     options = [
         {"label": f"{job['subject_id']} ({job['status']})", "value": job["id"]}
@@ -192,28 +275,46 @@ def load_monitoring_jobs(_, job_type, status):
         ),
         html.Tbody([_job_row(job) for job in jobs]),
     ]
-    return html.Table(rows, className="monitoring-table"), options
+    return html.Table(rows, className="monitoring-table"), options, jobs
 
 
 @callback(
-    Output("monitoring-job-detail", "children"),
+    [Output("monitoring-job-detail", "children"),
+     Output("monitoring-job-state", "data")],
     [Input("monitoring-job-select", "value"),
-     Input("monitoring-refresh", "n_intervals")],
+     Input("monitoring-feed", "data")],
+    State("monitoring-job-state", "data"),
 )
-def load_job_detail(job_id, _):
+def load_job_detail(job_id, feed, state):
     if not job_id:
-        return html.Div("Choose a job to inspect events and diagnostics.", className="empty-state")
-
-    try:
-        job_response = requests.get(f"{API_BASE_URL}/jobs/{job_id}", timeout=4)
-        job_response.raise_for_status()
-        events_response = requests.get(f"{API_BASE_URL}/jobs/{job_id}/events", timeout=4)
-        events_response.raise_for_status()
-        job = job_response.json()
-        events = events_response.json().get("events", [])
-    except requests.exceptions.RequestException:
-        return html.Div("Could not load job detail.", className="error-state")
-
+        return html.Div("Choose a job to inspect events and diagnostics.", className="empty-state"), None
+
+    if ctx.triggered_id == "monitoring-feed" and state and state["job"].get("id") == job_id:
+        # Apply the feed deltas of the selected job, no API call
+        deltas = [delta for delta in (feed or {}).get("deltas", []) if delta["event"]["job_id"] == job_id]
+        if not deltas:
+            return no_update, no_update
+        job = deltas[-1]["job"] or state["job"]
+        seen = {event["sequence"] for event in state["events"]}
+        events = state["events"] + [delta["event"] for delta in deltas if delta["event"]["sequence"] not in seen]
+    elif ctx.triggered_id == "monitoring-feed" and state:
+        return no_update, no_update
+    else:
+        try:
+            job_response = requests.get(f"{API_BASE_URL}/jobs/{job_id}", timeout=4)
+            job_response.raise_for_status()
+            events_response = requests.get(f"{API_BASE_URL}/jobs/{job_id}/events", timeout=4)
+            events_response.raise_for_status()
+            job = job_response.json()
+            events = events_response.json().get("events", [])
+        except requests.exceptions.RequestException:
+            return html.Div("Could not load job detail.", className="error-state"), None
+
+    events = events[-JOB_LOG_LINES:]
+    return _job_detail(job, events), {"job": job, "events": events}
+
+
+def _job_detail(job, events):
     return html.Div(
         [
             html.Div(
@@ -239,7 +340,7 @@ def load_job_detail(job_id, _):
                 ],
                 className="monitoring-detail-grid",
             ),
-            html.Div([_event_line(event) for event in events[-80:]], className="monitoring-log"),
+            html.Div([_event_line(event) for event in events], className="monitoring-log"),
         ]
     )
 
@@ -3,6 +3,9 @@ import requests
 
 from ..config import API_BASE_URL
 
+# Runs listed in the dropdown; typing narrows them with a server-side prefix search
+RUN_DROPDOWN_LIMIT = 50
+
 
 def _site_header():
     return html.Header(
@@ -309,28 +312,33 @@ def create_launch_layout():
     )
 
 
-# Callback to load all runs into dropdown
+# Callback to load runs into the dropdown, searched server-side by name prefix
 @callback(
     Output("run-dropdown", "options"),
-    Input("run-dropdown", "id")
+    Input("run-dropdown", "search_value"),
+    State("run-dropdown", "value"),
 )
-def load_all_runs(_):
-    """Load all available runs from the API"""
-    print("load_all_runs")
+def load_all_runs(search_value, selected_run):
+    """Load the latest runs, or the runs whose name starts with the typed text"""
+    params = {"limit": RUN_DROPDOWN_LIMIT}
+    if search_value:
+        params["sample_prefix"] = search_value
     try:
-        # Call your API to get all runs
-        response = requests.get(f"{API_BASE_URL}/runs", timeout=4)
+        response = requests.get(f"{API_BASE_URL}/runs", params=params, timeout=4)
         response.raise_for_status()
         runs = response.json()
-        
-        if runs:
-            return [
-                {"label": f"{run['run_name']} ({run.get('status', 'Unknown')})", "value": run["run_name"]} 
-                for run in runs
-            ]
-        else:
-            return [{"label": "No runs available", "value": "", "disabled": True}]
-            
+
+        options = [
+            {"label": f"{run['run_name']} ({run.get('status', 'Unknown')})", "value": run["run_name"]}
+            for run in runs
+        ]
+        # Keep the selected run in the options, or the dropdown would clear it
+        if selected_run and selected_run not in {option["value"] for option in options}:
+            options.insert(0, {"label": selected_run, "value": selected_run})
+        if options:
+            return options
+        return [{"label": "No runs available", "value": "", "disabled": True}]
+
     except Exception as e:
         print(f"Error loading runs: {e}")
         return [{"label": "Error loading runs", "value": "", "disabled": True}]
@@ -497,8 +505,9 @@ def launch_benchmarking(n_clicks, selected_run, selected_benchmarking):
             
             if response.status_code == 200:
                 benchmarking_list = ', '.join(selected_benchmarking)
+                job_id = response.json().get("job_id", "not available")
                 return html.Div(
-                    f"Launched benchmarking for '{selected_run}': {benchmarking_list}.",
+                    f"Queued benchmarking for '{selected_run}': {benchmarking_list} (job {job_id}).",
                     className="alert alert-success",
                 )
             return html.Div(
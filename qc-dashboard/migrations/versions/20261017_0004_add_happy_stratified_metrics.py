@@ -0,0 +1,68 @@
+"""add happy stratified metrics
+
+Revision ID: 20261017_0004
+Revises: 20260527_0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "20261017_0004"
+down_revision = "20260527_0003"
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table_name: str) -> bool:
+    bind = op.get_bind()
+    return inspect(bind).has_table(table_name)
+
+
+def upgrade() -> None:
+    if _has_table("happy_stratified_metrics"):
+        return
+
+    op.create_table(
+        "happy_stratified_metrics",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("source", sa.String(), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("subtype", sa.String(), nullable=False),
+        sa.Column("subset", sa.String(), nullable=False),
+        sa.Column("filter", sa.String(), nullable=False),
+        sa.Column("genotype", sa.String(), nullable=False),
+        sa.Column("truth_total", sa.BigInteger(), nullable=True),
+        sa.Column("truth_tp", sa.BigInteger(), nullable=True),
+        sa.Column("truth_fn", sa.BigInteger(), nullable=True),
+        sa.Column("query_total", sa.BigInteger(), nullable=True),
+        sa.Column("query_fp", sa.BigInteger(), nullable=True),
+        sa.Column("query_unk", sa.BigInteger(), nullable=True),
+        sa.Column("fp_gt", sa.Float(), nullable=True),
+        sa.Column("fp_al", sa.Float(), nullable=True),
+        sa.Column("metric_recall", sa.Float(), nullable=True),
+        sa.Column("metric_precision", sa.Float(), nullable=True),
+        sa.Column("metric_frac_na", sa.Float(), nullable=True),
+        sa.Column("metric_f1_score", sa.Float(), nullable=True),
+        sa.Column("truth_titv_ratio", sa.Float(), nullable=True),
+        sa.Column("query_titv_ratio", sa.Float(), nullable=True),
+        sa.Column("truth_het_hom_ratio", sa.Float(), nullable=True),
+        sa.Column("query_het_hom_ratio", sa.Float(), nullable=True),
+        sa.Column("subset_size", sa.BigInteger(), nullable=True),
+        sa.Column("subset_is_conf_size", sa.BigInteger(), nullable=True),
+        sa.Column("run_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["run_id"], ["lab_runs.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_happy_stratified_metrics_id", "happy_stratified_metrics", ["id"])
+    op.create_index(
+        "ix_happy_stratified_metrics_lookup",
+        "happy_stratified_metrics",
+        ["run_id", "type", "filter", "subset"],
+    )
+
+
+def downgrade() -> None:
+    if _has_table("happy_stratified_metrics"):
+        op.drop_table("happy_stratified_metrics")
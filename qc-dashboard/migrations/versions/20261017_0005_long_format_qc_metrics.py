@@ -0,0 +1,53 @@
+"""long format qc metrics
+
+Revision ID: 20261017_0005
+Revises: 20261017_0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "20261017_0005"
+down_revision = "20261017_0004"
+branch_labels = None
+depends_on = None
+
+
+def _columns(table_name: str) -> set[str]:
+    bind = op.get_bind()
+    return {column["name"] for column in inspect(bind).get_columns(table_name)}
+
+
+def _indexes(table_name: str) -> set[str]:
+    bind = op.get_bind()
+    return {index["name"] for index in inspect(bind).get_indexes(table_name)}
+
+
+def _add_column_if_missing(table_name: str, column: sa.Column) -> None:
+    if column.name not in _columns(table_name):
+        op.add_column(table_name, column)
+
+
+def upgrade() -> None:
+    _add_column_if_missing("qc_metrics", sa.Column("percentage", sa.Float(), nullable=True))
+    _add_column_if_missing("qc_metrics", sa.Column("section", sa.String(), nullable=True))
+    _add_column_if_missing("qc_metrics", sa.Column("file_type", sa.String(), nullable=True))
+    indexes = _indexes("qc_metrics")
+    if "ix_qc_metrics_file_type" not in indexes:
+        op.create_index("ix_qc_metrics_file_type", "qc_metrics", ["file_type"])
+    if "ix_qc_metrics_lookup" not in indexes:
+        op.create_index("ix_qc_metrics_lookup", "qc_metrics", ["run_id", "file_type", "metric_name"])
+
+
+def downgrade() -> None:
+    indexes = _indexes("qc_metrics")
+    if "ix_qc_metrics_lookup" in indexes:
+        op.drop_index("ix_qc_metrics_lookup", table_name="qc_metrics")
+    if "ix_qc_metrics_file_type" in indexes:
+        op.drop_index("ix_qc_metrics_file_type", table_name="qc_metrics")
+    columns = _columns("qc_metrics")
+    for column in ("file_type", "section", "percentage"):
+        if column in columns:
+            op.drop_column("qc_metrics", column)
@@ -0,0 +1,47 @@
+"""add run catalog
+
+Revision ID: 20261017_0006
+Revises: 20261017_0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "20261017_0006"
+down_revision = "20261017_0005"
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table_name: str) -> bool:
+    bind = op.get_bind()
+    return inspect(bind).has_table(table_name)
+
+
+def upgrade() -> None:
+    if _has_table("run_catalog"):
+        return
+
+    op.create_table(
+        "run_catalog",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("run_name", sa.String(), nullable=False),
+        sa.Column("lab_dir", sa.String(), nullable=True),
+        sa.Column("processed_dir", sa.String(), nullable=True),
+        sa.Column("date_prefix", sa.String(), nullable=True),
+        sa.Column("has_happy", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("has_stratified", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("has_truvari", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("has_csv", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("scanned_at", sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_run_catalog_id", "run_catalog", ["id"])
+    op.create_index("ix_run_catalog_run_name", "run_catalog", ["run_name"], unique=True)
+
+
+def downgrade() -> None:
+    if _has_table("run_catalog"):
+        op.drop_table("run_catalog")
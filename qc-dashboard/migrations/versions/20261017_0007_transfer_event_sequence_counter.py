@@ -0,0 +1,44 @@
+"""transfer event sequence counter
+
+Revision ID: 20261017_0007
+Revises: 20261017_0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "20261017_0007"
+down_revision = "20261017_0006"
+branch_labels = None
+depends_on = None
+
+
+def _columns(table_name: str) -> set[str]:
+    bind = op.get_bind()
+    return {column["name"] for column in inspect(bind).get_columns(table_name)}
+
+
+def upgrade() -> None:
+    if "last_event_sequence" in _columns("transfer_jobs"):
+        return
+    op.add_column(
+        "transfer_jobs",
+        sa.Column("last_event_sequence", sa.Integer(), nullable=False, server_default="0"),
+    )
+    # Start each counter after the job's existing events
+    op.execute(
+        """
+        UPDATE transfer_jobs
+        SET last_event_sequence = COALESCE(
+            (SELECT MAX(sequence) FROM transfer_events WHERE transfer_events.job_id = transfer_jobs.id),
+            0
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    if "last_event_sequence" in _columns("transfer_jobs"):
+        op.drop_column("transfer_jobs", "last_event_sequence")
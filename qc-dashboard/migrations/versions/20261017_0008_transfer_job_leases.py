@@ -0,0 +1,38 @@
+"""transfer job worker leases
+
+Revision ID: 20261017_0008
+Revises: 20261017_0007
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "20261017_0008"
+down_revision = "20261017_0007"
+branch_labels = None
+depends_on = None
+
+
+def _columns(table_name: str) -> set[str]:
+    bind = op.get_bind()
+    return {column["name"] for column in inspect(bind).get_columns(table_name)}
+
+
+def upgrade() -> None:
+    columns = _columns("transfer_jobs")
+    if "worker_id" not in columns:
+        op.add_column("transfer_jobs", sa.Column("worker_id", sa.String(), nullable=True))
+        op.create_index("ix_transfer_jobs_worker_id", "transfer_jobs", ["worker_id"])
+    if "heartbeat_at" not in columns:
+        op.add_column("transfer_jobs", sa.Column("heartbeat_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    columns = _columns("transfer_jobs")
+    if "heartbeat_at" in columns:
+        op.drop_column("transfer_jobs", "heartbeat_at")
+    if "worker_id" in columns:
+        op.drop_index("ix_transfer_jobs_worker_id", table_name="transfer_jobs")
+        op.drop_column("transfer_jobs", "worker_id")
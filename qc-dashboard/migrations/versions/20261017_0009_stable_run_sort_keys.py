@@ -0,0 +1,52 @@
+"""stable run listing sort keys
+
+Revision ID: 20261017_0009
+Revises: 20261017_0008
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "20261017_0009"
+down_revision = "20261017_0008"
+branch_labels = None
+depends_on = None
+
+
+def _columns(table_name: str) -> set[str]:
+    bind = op.get_bind()
+    return {column["name"] for column in inspect(bind).get_columns(table_name)}
+
+
+def _indexes(table_name: str) -> set[str]:
+    bind = op.get_bind()
+    return {index["name"] for index in inspect(bind).get_indexes(table_name)}
+
+
+def upgrade() -> None:
+    # GET /runs now sorts lab runs on created_at alone
+    op.execute("UPDATE lab_runs SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP) WHERE created_at IS NULL")
+    if "ix_lab_runs_created_at_run_name" not in _indexes("lab_runs"):
+        op.create_index("ix_lab_runs_created_at_run_name", "lab_runs", ["created_at", "run_name"])
+
+    if "discovered_at" not in _columns("run_catalog"):
+        op.add_column("run_catalog", sa.Column("discovered_at", sa.DateTime(), nullable=True))
+        op.execute("UPDATE run_catalog SET discovered_at = COALESCE(scanned_at, CURRENT_TIMESTAMP)")
+        with op.batch_alter_table("run_catalog") as batch:
+            batch.alter_column(
+                "discovered_at", existing_type=sa.DateTime(), nullable=False, server_default=sa.func.now()
+            )
+    if "ix_run_catalog_discovered_at_run_name" not in _indexes("run_catalog"):
+        op.create_index("ix_run_catalog_discovered_at_run_name", "run_catalog", ["discovered_at", "run_name"])
+
+
+def downgrade() -> None:
+    if "ix_run_catalog_discovered_at_run_name" in _indexes("run_catalog"):
+        op.drop_index("ix_run_catalog_discovered_at_run_name", table_name="run_catalog")
+    if "discovered_at" in _columns("run_catalog"):
+        with op.batch_alter_table("run_catalog") as batch:
+            batch.drop_column("discovered_at")
+    if "ix_lab_runs_created_at_run_name" in _indexes("lab_runs"):
+        op.drop_index("ix_lab_runs_created_at_run_name", table_name="lab_runs")
@@ -0,0 +1,36 @@
+"""time of the last full run catalog rescan
+
+Revision ID: 20261017_0010
+Revises: 20261017_0009
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "20261017_0010"
+down_revision = "20261017_0009"
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table_name: str) -> bool:
+    bind = op.get_bind()
+    return inspect(bind).has_table(table_name)
+
+
+def upgrade() -> None:
+    # No row yet: the first GET /runs rescans, as on an empty catalog
+    if not _has_table("run_catalog_rescan"):
+        op.create_table(
+            "run_catalog_rescan",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("rescanned_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+
+def downgrade() -> None:
+    if _has_table("run_catalog_rescan"):
+        op.drop_table("run_catalog_rescan")
@@ -34,4 +34,22 @@ if [[ ! -x "$PYTHON_BIN" ]]; then
 fi
 
 cd "$SCRIPT_DIR"
-exec "$PYTHON_BIN" -m uvicorn api.app.main:app --host "$HOST" --port "$PORT" $RELOAD_FLAG
+
+BACKGROUND_PIDS=()
+trap 'if (( ${#BACKGROUND_PIDS[@]} )); then kill "${BACKGROUND_PIDS[@]}" 2>/dev/null; wait "${BACKGROUND_PIDS[@]}" 2>/dev/null; fi' EXIT
+
+# Pipeline workers run outside uvicorn so benchmarking jobs survive reloads.
+# Set START_WORKERS=0 when workers are managed separately.
+if [[ "${START_WORKERS:-1}" == "1" ]]; then
+    "$PYTHON_BIN" -m api.tasks.worker --concurrency "${VCBENCH_PIPELINE_WORKERS:-2}" &
+    BACKGROUND_PIDS+=($!)
+fi
+
+# The run catalog watcher picks up run directories created or removed by hand.
+# Set START_CATALOG_WATCHER=0 when it is managed separately.
+if [[ "${START_CATALOG_WATCHER:-1}" == "1" ]]; then
+    "$PYTHON_BIN" -m api.tasks.run_catalog watch &
+    BACKGROUND_PIDS+=($!)
+fi
+
+"$PYTHON_BIN" -m uvicorn api.app.main:app --host "$HOST" --port "$PORT" $RELOAD_FLAG